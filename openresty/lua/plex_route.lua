@@ -1,9 +1,7 @@
 local http = require "resty.http"
-local redis = require "resty.redis"
+local route_cache = require "route_cache"
 local route_common = require "common_route"
 
-local REDIS_HOST = route_common.getenv("REDIS_HOST", "127.0.0.1")
-local REDIS_PORT = tonumber(route_common.getenv("REDIS_PORT", "6379"))
 local PLEX_SERVER = route_common.getenv("PLEX_LOCAL_ORIGIN", "http://127.0.0.1:32400")
 local PLEX_PUBLIC_HOST = route_common.getenv("PLEX_PUBLIC_HOST", "plex.misaya.org")
 local PLEX_ADMIN_TOKEN = route_common.getenv("PLEX_API_TOKEN", "")
@@ -72,38 +70,8 @@ local function parse_xml_attributes(attr_text)
     return attrs
 end
 
-local function connect_redis()
-    local red = redis:new()
-    red:set_timeout(1000)
-
-    local ok, err = red:connect(REDIS_HOST, REDIS_PORT)
-    if not ok then
-        ngx.log(ngx.ERR, "[Plex] Redis 连接失败: ", err)
-        return nil
-    end
-
-    return red
-end
-
-local function read_route_target_from_redis(key)
-    local red = connect_redis()
-    if not red then
-        return nil
-    end
-
-    local target, err = red:get(key)
-    red:set_keepalive(10000, 100)
-
-    if err then
-        ngx.log(ngx.ERR, "[Plex] 读取 Redis 失败 key=", key, " error=", err)
-        return nil
-    end
-
-    if not target or target == ngx.null or target == "" then
-        return nil
-    end
-
-    return tostring(target)
+local function read_route_target(key)
+    return route_cache.get(key, "[Plex]")
 end
 
 local function get_plex_request_token()
@@ -373,7 +341,7 @@ local function find_route_target_by_identity(identity)
     end
 
     local key = "plex_email:" .. normalized_identity
-    local target = read_route_target_from_redis(key)
+    local target = read_route_target(key)
     if target then
         ngx.log(ngx.INFO, "[Plex] 标识 ", normalized_identity, " -> ", target)
     end
@@ -387,7 +355,7 @@ local function find_route_target_by_account_id(account_id)
     end
 
     local key = "plex_id:" .. normalized_account_id
-    local target = read_route_target_from_redis(key)
+    local target = read_route_target(key)
     if target then
         ngx.log(ngx.INFO, "[Plex] account_id ", normalized_account_id, " -> ", target)
     end
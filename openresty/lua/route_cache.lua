@@ -0,0 +1,211 @@
+local cjson = require "cjson.safe"
+local redis = require "resty.redis"
+local route_common = require "common_route"
+
+-- 路由键缓存在 ngx.shared.media_route_cache 中，大部分媒体请求不再访问 Redis。
+-- Python 侧 RedisLineSync 修改路由键后会在 ROUTE_CHANNEL 上发布
+-- {"version": n, "keys": [...]}，由 worker 0 的订阅协程失效对应的键。
+-- 版本号不连续（漏收事件、Redis 重启）或订阅断开时清空整个缓存；
+-- 订阅未就绪时直接读 Redis 且不写缓存，避免读到无法失效的旧路由。
+
+local REDIS_HOST = route_common.getenv("REDIS_HOST", "127.0.0.1")
+local REDIS_PORT = tonumber(route_common.getenv("REDIS_PORT", "6379"))
+local CACHE_TTL = tonumber(route_common.getenv("MEDIA_ROUTE_CACHE_TTL", "300")) or 300
+
+local ROUTE_CHANNEL = "media_route:changes"
+local ROUTE_VERSION_KEY = "media_route:version"
+
+local VERSION_FIELD = "__route_version"
+local READY_FIELD = "__subscriber_ready"
+local READ_TIMEOUT_MS = 10000
+local READY_TTL = 30
+local RETRY_DELAY = 2
+-- 缓存“没有路由”的结果，Plex 每个请求会查多个标识
+local EMPTY = ""
+
+local cache = ngx.shared.media_route_cache
+
+local M = {}
+
+function M.connect_redis(log_tag)
+    local red = redis:new()
+    red:set_timeout(1000)
+
+    local ok, err = red:connect(REDIS_HOST, REDIS_PORT)
+    if not ok then
+        ngx.log(ngx.ERR, log_tag or "[Route]", " Redis 连接失败: ", err)
+        return nil
+    end
+
+    return red
+end
+
+local function read_from_redis(key, log_tag)
+    local red = M.connect_redis(log_tag)
+    if not red then
+        return nil, "connect"
+    end
+
+    local target, err = red:get(key)
+    red:set_keepalive(10000, 100)
+
+    if err then
+        ngx.log(ngx.ERR, log_tag or "[Route]", " 读取 Redis 失败 key=", key, " error=", err)
+        return nil, err
+    end
+
+    if not target or target == ngx.null or target == "" then
+        return EMPTY
+    end
+
+    return tostring(target)
+end
+
+function M.get(key, log_tag)
+    local ready = cache and cache:get(READY_FIELD)
+    if ready then
+        local cached = cache:get(key)
+        if cached ~= nil then
+            if cached == EMPTY then
+                return nil
+            end
+            return cached
+        end
+    end
+
+    local version = ready and cache:get(VERSION_FIELD)
+    local target, err = read_from_redis(key, log_tag)
+    if err then
+        return nil
+    end
+
+    -- 读取期间收到了变更事件时不写缓存，避免旧值覆盖失效结果
+    if ready and cache:get(READY_FIELD) and cache:get(VERSION_FIELD) == version then
+        cache:set(key, target, CACHE_TTL)
+    end
+
+    if target == EMPTY then
+        return nil
+    end
+    return target
+end
+
+local function reset_cache(version)
+    cache:flush_all()
+    cache:set(VERSION_FIELD, version)
+end
+
+local function handle_message(payload)
+    local event = cjson.decode(payload)
+    local version = type(event) == "table" and tonumber(event.version)
+    if not version then
+        ngx.log(ngx.WARN, "[Route] 无法解析路由变更事件，清空缓存: ", payload)
+        reset_cache(cache:get(VERSION_FIELD) or 0)
+        return
+    end
+
+    local last_version = cache:get(VERSION_FIELD)
+    if last_version and version ~= last_version + 1 then
+        ngx.log(
+            ngx.WARN,
+            "[Route] 路由版本不连续 ",
+            last_version,
+            " -> ",
+            version,
+            "，清空缓存"
+        )
+        reset_cache(version)
+        return
+    end
+
+    if type(event.keys) == "table" then
+        for _, key in ipairs(event.keys) do
+            cache:delete(key)
+        end
+    end
+    cache:set(VERSION_FIELD, version)
+end
+
+local subscribe_loop
+
+local function retry_later()
+    cache:delete(READY_FIELD)
+    if not ngx.worker.exiting() then
+        local ok, err = ngx.timer.at(RETRY_DELAY, subscribe_loop)
+        if not ok then
+            ngx.log(ngx.ERR, "[Route] 创建路由订阅定时器失败: ", err)
+        end
+    end
+end
+
+subscribe_loop = function(premature)
+    if premature then
+        return
+    end
+
+    local red = redis:new()
+    red:set_timeouts(1000, 1000, READ_TIMEOUT_MS)
+
+    local ok, err = red:connect(REDIS_HOST, REDIS_PORT)
+    if not ok then
+        ngx.log(ngx.ERR, "[Route] 路由订阅连接 Redis 失败: ", err)
+        return retry_later()
+    end
+
+    -- 先读当前版本再订阅，两者之间的事件会表现为版本不连续并触发清空
+    local version
+    version, err = red:get(ROUTE_VERSION_KEY)
+    if err then
+        ngx.log(ngx.ERR, "[Route] 读取路由版本失败: ", err)
+        red:close()
+        return retry_later()
+    end
+
+    ok, err = red:subscribe(ROUTE_CHANNEL)
+    if not ok then
+        ngx.log(ngx.ERR, "[Route] 订阅路由变更失败: ", err)
+        red:close()
+        return retry_later()
+    end
+
+    -- 断开期间的变更无法得知，从空缓存开始
+    reset_cache(tonumber(version) or 0)
+    cache:set(READY_FIELD, true, READY_TTL)
+    ngx.log(ngx.INFO, "[Route] 已订阅路由变更，当前版本 ", tonumber(version) or 0)
+
+    while not ngx.worker.exiting() do
+        local res
+        res, err = red:read_reply()
+        if res then
+            if res[1] == "message" then
+                handle_message(res[3])
+            end
+        elseif err ~= "timeout" then
+            ngx.log(ngx.ERR, "[Route] 路由订阅连接断开: ", err)
+            break
+        end
+        cache:set(READY_FIELD, true, READY_TTL)
+    end
+
+    red:close()
+    return retry_later()
+end
+
+function M.start_subscriber()
+    if not cache then
+        ngx.log(ngx.ERR, "[Route] 未配置 lua_shared_dict media_route_cache，路由缓存已禁用")
+        return
+    end
+
+    -- 共享字典由所有 worker 共用，只需要一个订阅者
+    if ngx.worker.id() ~= 0 then
+        return
+    end
+
+    local ok, err = ngx.timer.at(0, subscribe_loop)
+    if not ok then
+        ngx.log(ngx.ERR, "[Route] 创建路由订阅定时器失败: ", err)
+    end
+end
+
+return M
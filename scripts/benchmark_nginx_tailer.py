@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Nginx 日志补采读取基准测试
+
+生成指定大小的 Emby access log（多数为小请求/非 2xx，少量为视频分片），对比：
+- 逐行读取: 文本模式 readline() 后逐行正则解析（改造前）
+- 分块读取: _read_new_log_lines 按块读取二进制内容，字节预过滤后再解析（改造后）
+
+用法:
+    python scripts/benchmark_nginx_tailer.py --size-mb 2048
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+from app.update_db import (
+    _parse_nginx_access_log_line,
+    _prefilter_access_log_line,
+    _read_new_log_lines,
+)
+
+_SAMPLE_LINES = [
+    # 视频分片（需要统计）
+    '{ip} - - [04/Apr/2026:10:00:{sec:02d} +0800] "GET /emby/videos/{item}/hls1/main/{seg}.ts?PlaySessionId=s{item} HTTP/2.0" 206 {size} "-" "Emby/4.8"\n',
+    # API / 图片请求（字节数小）
+    '{ip} - - [04/Apr/2026:10:00:{sec:02d} +0800] "GET /emby/Users/u{item}/Items?Limit=50 HTTP/2.0" 200 {small} "-" "Emby/4.8"\n',
+    '{ip} - - [04/Apr/2026:10:00:{sec:02d} +0800] "GET /emby/Items/{item}/Images/Primary HTTP/2.0" 304 0 "-" "Mozilla/5.0"\n',
+    '{ip} - - [04/Apr/2026:10:00:{sec:02d} +0800] "POST /emby/Sessions/Playing/Progress HTTP/2.0" 204 0 "-" "Emby/4.8"\n',
+]
+
+
+def generate_log(path: Path, size_mb: int, stream_ratio: float) -> int:
+    """生成合成日志，返回行数"""
+    rng = random.Random(42)
+    block_lines = []
+    for _ in range(4096):
+        template = (
+            _SAMPLE_LINES[0]
+            if rng.random() < stream_ratio
+            else rng.choice(_SAMPLE_LINES[1:])
+        )
+        block_lines.append(
+            template.format(
+                ip=f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                sec=rng.randint(0, 59),
+                item=rng.randint(1, 99999),
+                seg=rng.randint(0, 2000),
+                size=rng.randint(200_000, 4_000_000),
+                small=rng.randint(100, 900),
+            )
+        )
+    block = "".join(block_lines).encode("utf-8")
+
+    target = size_mb * 1024 * 1024
+    written = 0
+    lines = 0
+    with open(path, "wb") as handle:
+        while written < target:
+            handle.write(block)
+            written += len(block)
+            lines += len(block_lines)
+    return lines
+
+
+def legacy_read(path: Path) -> int:
+    """改造前：文本模式逐行读取并逐行解析"""
+    records = 0
+    with open(path, "r", encoding="utf-8", errors="ignore") as handle:
+        while True:
+            line = handle.readline()
+            if not line:
+                break
+            text = line.strip()
+            if not text:
+                continue
+            parsed = _parse_nginx_access_log_line(text, service="emby")
+            if parsed and 200 <= parsed["status"] < 300 and parsed["bytes_sent"] >= 1024:
+                records += 1
+    return records
+
+
+def chunked_read(path: Path, batch_records: int) -> int:
+    """改造后：按块读取、字节预过滤，按批次推进偏移"""
+    records = 0
+    state: dict = {}
+    size = path.stat().st_size
+    while int(state.get("offset") or 0) < size:
+        lines, state = _read_new_log_lines(
+            path,
+            state,
+            limit=batch_records,
+            prefilter=_prefilter_access_log_line,
+            max_bytes=size,
+        )
+        for line in lines:
+            parsed = _parse_nginx_access_log_line(line, service="emby")
+            if parsed and 200 <= parsed["status"] < 300 and parsed["bytes_sent"] >= 1024:
+                records += 1
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Nginx 日志补采读取基准测试")
+    parser.add_argument("--size-mb", type=int, default=2048, help="合成日志大小（MB）")
+    parser.add_argument(
+        "--stream-ratio", type=float, default=0.2, help="视频分片请求占比"
+    )
+    parser.add_argument(
+        "--batch-records", type=int, default=100_000, help="分块读取每批最多返回的记录数"
+    )
+    parser.add_argument("--dir", type=str, default=None, help="合成日志存放目录")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmpdir:
+        path = Path(tmpdir) / "emby_access.log"
+        print(f"生成 {args.size_mb}MB 合成日志...")
+        total_lines = generate_log(path, args.size_mb, args.stream_ratio)
+        print(f"共 {total_lines} 行")
+
+        results = {}
+        for label, func in (
+            ("逐行读取", lambda: legacy_read(path)),
+            ("分块读取", lambda: chunked_read(path, args.batch_records)),
+        ):
+            start = time.perf_counter()
+            records = func()
+            elapsed = time.perf_counter() - start
+            results[label] = records
+            print(
+                f"{label}: {elapsed:8.2f}s  {total_lines / elapsed:12,.0f} 行/秒  "
+                f"有效记录 {records}"
+            )
+
+        if len(set(results.values())) != 1:
+            print("警告: 两种方式得到的有效记录数不一致")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+RedisCache 容量淘汰基准测试
+
+对比开启 capacity / cache_usage_track 时：
+- 旧实现: get 为 GET + 刷新 pipeline；put 为 ZCARD、ZRANGE、淘汰 pipeline、写入 pipeline
+- Lua 脚本: get / put 各为一次 EVALSHA
+
+并发写入测试中多个线程同时写入不同的键，检查结束后缓存条目数是否超出容量。
+需要可访问的 Redis（读取 REDIS_HOST / REDIS_PORT / REDIS_PASSWORD 配置）。
+
+用法:
+    python scripts/benchmark_redis_cache.py --ops 20000 --capacity 1000 --threads 8
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+from app.cache import RedisCache
+
+
+class LegacyRedisCache(RedisCache):
+    """改造前的 get / put 实现"""
+
+    def get(self, key):
+        cache_key = self._get_cache_key(key)
+        value = self.redis_client.get(cache_key)
+        if value is not None:
+            pipeline = self.redis_client.pipeline()
+            if self._cache_usage_key:
+                pipeline.zadd(self._cache_usage_key, {key: time.time()})
+            if self.ttl_seconds:
+                pipeline.expire(cache_key, self.ttl_seconds)
+            pipeline.execute()
+        return value
+
+    def put(self, key, value):
+        if self.capacity > 0 and self._cache_usage_key:
+            current_size = self.redis_client.zcard(self._cache_usage_key)
+            if current_size >= self.capacity:
+                oldest_items = self.redis_client.zrange(
+                    self._cache_usage_key, 0, current_size - self.capacity
+                )
+                if oldest_items:
+                    pipeline = self.redis_client.pipeline()
+                    for old_key in oldest_items:
+                        pipeline.delete(self._get_cache_key(old_key))
+                        pipeline.zrem(self._cache_usage_key, old_key)
+                    pipeline.execute()
+        cache_key = self._get_cache_key(key)
+        pipeline = self.redis_client.pipeline()
+        pipeline.set(cache_key, value, ex=self.ttl_seconds)
+        if self._cache_usage_key:
+            pipeline.zadd(self._cache_usage_key, {key: time.time()})
+        pipeline.execute()
+
+
+def _make_cache(cls, args, label):
+    return cls(
+        db=args.db,
+        capacity=args.capacity,
+        ttl_seconds=3600,
+        cache_key_prefix=f"benchmark_{label}:",
+        cache_usage_track=True,
+    )
+
+
+def run_sequential(cache: RedisCache, ops: int) -> tuple[float, float]:
+    start = time.perf_counter()
+    for i in range(ops):
+        cache.put(f"k{i}", "v")
+    put_rate = ops / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for i in range(ops):
+        cache.get(f"k{ops - 1 - (i % cache.capacity)}")
+    get_rate = ops / (time.perf_counter() - start)
+    return put_rate, get_rate
+
+
+def run_concurrent(cache: RedisCache, ops: int, threads: int) -> tuple[float, int, int]:
+    def worker(worker_id: int):
+        for i in range(ops // threads):
+            cache.put(f"t{worker_id}:{i}", "v")
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    rate = ops / (time.perf_counter() - start)
+    entries = sum(
+        1 for _ in cache.redis_client.scan_iter(match=f"{cache._cache_key_prefix}*")
+    )
+    return rate, cache.redis_client.zcard(cache._cache_usage_key), entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RedisCache 容量淘汰基准测试")
+    parser.add_argument("--ops", type=int, default=20000, help="每项测试的操作次数")
+    parser.add_argument("--capacity", type=int, default=1000, help="缓存容量")
+    parser.add_argument("--threads", type=int, default=8, help="并发写入线程数")
+    parser.add_argument("--db", type=int, default=9, help="使用的 Redis db")
+    args = parser.parse_args()
+
+    for label, cls in (("旧实现", LegacyRedisCache), ("Lua 脚本", RedisCache)):
+        cache = _make_cache(cls, args, "legacy" if cls is LegacyRedisCache else "lua")
+        cache.clear()
+        try:
+            put_rate, get_rate = run_sequential(cache, args.ops)
+            cache.clear()
+            concurrent_rate, usage_size, entries = run_concurrent(
+                cache, args.ops, args.threads
+            )
+            print(
+                f"{label:<8} put {put_rate:10,.0f} ops/s  get {get_rate:10,.0f} ops/s  "
+                f"并发 put {concurrent_rate:10,.0f} ops/s  "
+                f"结束时条目 {entries} / 使用记录 {usage_size} (容量 {args.capacity})"
+            )
+        finally:
+            cache.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+流量记录按用户名查询基准测试
+
+在临时数据库中生成流量记录，对比：
+- 旧查询: 单表、ISO 字符串时间，WHERE LOWER(username) = ? / 按 LOWER() 关联用户表后再聚合
+- 新查询: 按月分区、Unix 秒时间，WHERE username_norm = LOWER(?) / 先按 username_norm 聚合再关联用户表
+
+同时输出两种查询的 EXPLAIN QUERY PLAN，确认新查询使用了索引。
+
+用法:
+    python scripts/benchmark_traffic_lookup.py --rows 2000000 --users 2000 --repeat 20
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+from app.config import settings
+from app.db import DB
+
+LEGACY_TABLE_SQL = """
+CREATE TABLE legacy_traffic_stats(
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    line TEXT NOT NULL,
+    send_bytes INTEGER NOT NULL,
+    service TEXT NOT NULL,
+    username TEXT NOT NULL,
+    user_id TEXT DEFAULT NULL,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX idx_legacy_traffic_service_timestamp ON legacy_traffic_stats(service, timestamp);
+"""
+
+LEGACY_DAILY_SQL = """
+SELECT SUM(send_bytes) FROM legacy_traffic_stats
+WHERE LOWER(username) = ? AND service = ? AND timestamp >= ? AND timestamp <= ?
+"""
+
+# {source} 为范围内月度分区组成的子查询，与 DB 中的查询方式相同
+NORM_DAILY_SQL = """
+SELECT SUM(send_bytes) FROM {source}
+WHERE username_norm = LOWER(?) AND service = ? AND ts >= ? AND ts <= ?
+"""
+
+LEGACY_RANK_SQL = """
+SELECT u.plex_username, lts.user_id, SUM(lts.send_bytes) as total_traffic,
+       COALESCE(u.is_premium, 0) as is_premium, u.tg_id
+FROM legacy_traffic_stats lts
+LEFT JOIN user u ON LOWER(lts.username) = LOWER(u.plex_username)
+WHERE lts.service = 'plex' AND lts.timestamp >= ? AND lts.timestamp <= ?
+    AND lts.username IS NOT NULL AND lts.username != ''
+GROUP BY LOWER(lts.username), lts.user_id, u.is_premium, u.tg_id
+ORDER BY total_traffic DESC
+LIMIT 50
+"""
+
+NORM_RANK_SQL = """
+SELECT u.plex_username, t.user_id, t.total_traffic,
+       COALESCE(u.is_premium, 0) as is_premium, u.tg_id
+FROM (
+    SELECT username_norm AS username_key, user_id, SUM(send_bytes) AS total_traffic
+    FROM {source}
+    WHERE service = 'plex' AND ts >= ? AND ts <= ? AND username_norm != ''
+    GROUP BY username_key, user_id
+) t
+LEFT JOIN user u ON LOWER(u.plex_username) = +t.username_key
+ORDER BY t.total_traffic DESC
+LIMIT 50
+"""
+
+
+def populate(db: DB, rows: int, users: int, days: int) -> list[str]:
+    """写入用户和流量记录（分区表和旧格式单表各一份），返回用户名列表（大小写与流量记录中的不同）"""
+    usernames = [f"User{i:05d}" for i in range(users)]
+    db.cur.executemany(
+        "INSERT INTO user (plex_id, tg_id, plex_username, plex_email) VALUES (?, ?, ?, ?)",
+        [(i + 1, 100000 + i, name, f"{name}@example.com") for i, name in enumerate(usernames)],
+    )
+    db.cur.executescript(LEGACY_TABLE_SQL)
+    now = datetime.now(settings.TZ)
+    start = now - timedelta(days=days)
+    span = int((now - start).total_seconds())
+    rng = random.Random(42)
+    batch = []
+    for index in range(rows):
+        name = rng.choice(usernames)
+        batch.append(
+            (
+                f"line{rng.randint(1, 8)}",
+                rng.randint(1, 50_000_000),
+                rng.choice(("plex", "emby")),
+                name.upper() if index % 3 == 0 else name.lower(),
+                str(rng.randint(1, 5)),
+                (start + timedelta(seconds=rng.randint(0, span))).isoformat(),
+            )
+        )
+        if len(batch) >= 50000:
+            write_batch(db, batch)
+            batch = []
+    if batch:
+        write_batch(db, batch)
+    db.cur.execute("ANALYZE")
+    db.con.commit()
+    return usernames
+
+
+def write_batch(db: DB, rows: list[tuple]) -> None:
+    db.create_line_traffic_entries(rows)
+    db.cur.executemany(
+        "INSERT INTO legacy_traffic_stats (line, send_bytes, service, username, user_id, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+        rows,
+    )
+    db.con.commit()
+
+
+def measure(db: DB, sql: str, params_list: list[tuple]) -> float:
+    started = time.perf_counter()
+    for params in params_list:
+        db.cur.execute(sql, params).fetchall()
+    return (time.perf_counter() - started) / len(params_list) * 1000
+
+
+def print_plan(db: DB, title: str, sql: str, params: tuple) -> None:
+    print(f"  {title}:")
+    for row in db.cur.execute(f"EXPLAIN QUERY PLAN {sql}", params):
+        print(f"    {row[-1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="流量记录按用户名查询基准测试")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="流量记录条数")
+    parser.add_argument("--users", type=int, default=2000, help="用户数")
+    parser.add_argument("--days", type=int, default=30, help="流量记录覆盖的天数")
+    parser.add_argument("--repeat", type=int, default=20, help="每种查询执行次数")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        db = DB(Path(temp_dir) / "benchmark.db")
+        try:
+            print(f"生成 {args.rows} 条流量记录 ...")
+            started = time.perf_counter()
+            usernames = populate(db, args.rows, args.users, args.days)
+            print(f"  耗时 {time.perf_counter() - started:.1f}s")
+
+            now = datetime.now(settings.TZ)
+            day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            rng = random.Random(7)
+            week_start = now - timedelta(days=7)
+            names = [rng.choice(usernames) for _ in range(args.repeat)]
+            legacy_daily = [(name, "plex", day_start.isoformat(), now.isoformat()) for name in names]
+            daily = [(name, "plex", int(day_start.timestamp()), int(now.timestamp())) for name in names]
+            rank_repeat = max(1, args.repeat // 4)
+            legacy_rank = [(week_start.isoformat(), now.isoformat())] * rank_repeat
+            rank = [(int(week_start.timestamp()), int(now.timestamp()))] * rank_repeat
+            daily_sql = NORM_DAILY_SQL.format(
+                source=db._traffic_source(
+                    "send_bytes, service, username_norm, ts, line", *daily[0][2:]
+                )
+            )
+            rank_sql = NORM_RANK_SQL.format(
+                source=db._traffic_source(
+                    "service, ts, username_norm, user_id, send_bytes", *rank[0]
+                )
+            )
+
+            print("\n单个用户当日流量 (ms/次):")
+            print(f"  LOWER(username):  {measure(db, LEGACY_DAILY_SQL, legacy_daily):8.2f}")
+            print(f"  username_norm:    {measure(db, daily_sql, daily):8.2f}")
+            print("\n近 7 天 Plex 流量排行 (ms/次):")
+            print(f"  LOWER() 关联:     {measure(db, LEGACY_RANK_SQL, legacy_rank):8.2f}")
+            print(f"  先聚合再关联:     {measure(db, rank_sql, rank):8.2f}")
+
+            print("\n查询计划:")
+            print_plan(db, "旧当日流量", LEGACY_DAILY_SQL, legacy_daily[0])
+            print_plan(db, "新当日流量", daily_sql, daily[0])
+            print_plan(db, "旧流量排行", LEGACY_RANK_SQL, legacy_rank[0])
+            print_plan(db, "新流量排行", rank_sql, rank[0])
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+WebApp 并发延迟基准测试
+
+在后台线程中用 uvicorn 运行真实的 app.webapp:app，连接一个预先填充用户数据的临时数据库，
+对比路由中 run_db 两种执行方式下排行榜和仪表盘接口的 p50/p99 延迟：
+- 改造前: run_db 直接在事件循环上执行同步函数（等同于在 async 路由里直接查询 SQLite）
+- 改造后: run_db 在数据库线程池中执行
+
+测试库中有大量 Plex/Emby 账号，只有少数绑定了 Telegram。压测期间另有若干并发连接
+持续请求一个慢查询接口（默认 /api/system/stats，对全部账号做 UNION 去重计数），
+模拟同一进程中其他请求的慢查询。不启动 Redis，排行榜和仪表盘排名走数据库回退路径。
+
+请求使用 TG_API_TOKEN 签名的 initData，走与线上相同的 Telegram 认证流程。
+
+用法:
+    python scripts/benchmark_webapp_latency.py --accounts 300000 --tg-users 500 --concurrency 2
+"""
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from pathlib import Path
+
+import httpx
+import uvicorn
+
+# 添加项目路径
+sys.path.insert(0, str(Path(__file__).parents[1] / "src"))
+
+TARGETS = (
+    "/api/rankings/donation",
+    "/api/rankings/credits",
+    "/api/user/dashboard",
+)
+
+
+def seed_database(db_path: Path, accounts: int, tg_users: int):
+    """创建测试数据库：accounts 个 Plex 和 Emby 账号，其中前 tg_users 个绑定了 Telegram"""
+    from app.db import DB
+
+    db = DB(db=db_path)
+    try:
+        con = db.con
+        con.executemany(
+            "INSERT INTO statistics (tg_id, credits, donation) VALUES (?, ?, ?)",
+            [
+                (tg_id, tg_id % 997, tg_id % 50 if tg_id % 7 == 0 else 0)
+                for tg_id in range(1, tg_users + 1)
+            ],
+        )
+        con.executemany(
+            "INSERT INTO user (plex_id, tg_id, plex_username, watched_time) VALUES (?, ?, ?, ?)",
+            (
+                (i, i if i <= tg_users else None, f"user{i}", i % 300)
+                for i in range(1, accounts + 1)
+            ),
+        )
+        con.executemany(
+            "INSERT INTO emby_user (emby_id, tg_id, emby_username, emby_watched_time) VALUES (?, ?, ?, ?)",
+            (
+                (f"emby-{i}", i if i <= tg_users else None, f"emby{i}", i % 200)
+                for i in range(1, accounts + 1)
+            ),
+        )
+        con.commit()
+    finally:
+        db.close()
+
+
+def signed_init_data(token: str, user_id: int) -> str:
+    """按 Telegram WebApp 规则用机器人 token 签名 initData"""
+    data = {
+        "auth_date": str(int(time.time())),
+        "user": json.dumps({"id": user_id, "first_name": f"bench{user_id}"}),
+    }
+    data_check_string = "\n".join(f"{k}={data[k]}" for k in sorted(data))
+    secret_key = hmac.new(b"WebAppData", token.encode(), digestmod=hashlib.sha256).digest()
+    data["hash"] = hmac.new(
+        secret_key, data_check_string.encode(), digestmod=hashlib.sha256
+    ).hexdigest()
+    return urllib.parse.urlencode(data)
+
+
+async def _run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+
+def use_inline_db(enabled: bool):
+    """把各路由模块中的 run_db 替换为在事件循环上直接执行，或恢复为线程池版本"""
+    from app import executors
+
+    replacement = _run_inline if enabled else executors.run_db
+    for name, module in list(sys.modules.items()):
+        if name.startswith("app.webapp.routers") and hasattr(module, "run_db"):
+            module.run_db = replacement
+
+
+def percentile(samples: list[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class BackgroundServer:
+    """在后台线程中运行 uvicorn，压测客户端与服务端事件循环相互独立"""
+
+    def __init__(self, app, port: int):
+        self.server = uvicorn.Server(
+            uvicorn.Config(
+                app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"
+            )
+        )
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        self.server.should_exit = True
+        self.thread.join()
+
+
+async def run_round(
+    base_url: str,
+    headers: dict,
+    requests: int,
+    concurrency: int,
+    slow_path: str,
+    slow_concurrency: int,
+):
+    latencies = {target: [] for target in TARGETS}
+    slow_latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    done = asyncio.Event()
+    limits = httpx.Limits(max_connections=concurrency + slow_concurrency)
+
+    async with httpx.AsyncClient(
+        base_url=base_url, headers=headers, limits=limits, timeout=120
+    ) as client:
+
+        async def one(target: str):
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(target)
+                response.raise_for_status()
+                latencies[target].append((time.perf_counter() - start) * 1000)
+
+        async def slow_worker():
+            while not done.is_set():
+                start = time.perf_counter()
+                response = await client.get(slow_path)
+                response.raise_for_status()
+                slow_latencies.append((time.perf_counter() - start) * 1000)
+
+        slow_tasks = [asyncio.create_task(slow_worker()) for _ in range(slow_concurrency)]
+        start = time.perf_counter()
+        await asyncio.gather(*(one(TARGETS[i % len(TARGETS)]) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*slow_tasks)
+
+    latencies[slow_path] = slow_latencies
+    return latencies, elapsed
+
+
+def report(label: str, latencies: dict, elapsed: float):
+    for target, samples in latencies.items():
+        print(
+            f"{label:<6} {target:<24} n={len(samples):<5} "
+            f"p50={statistics.median(samples):8.1f}ms "
+            f"p99={percentile(samples, 99):8.1f}ms"
+        )
+    print(f"{label:<6} 总耗时 {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="WebApp 并发延迟基准测试")
+    parser.add_argument("--accounts", type=int, default=300000, help="Plex/Emby 账号数")
+    parser.add_argument("--tg-users", type=int, default=500, help="绑定 Telegram 的用户数")
+    parser.add_argument("--requests", type=int, default=300, help="排行榜/仪表盘请求总数")
+    parser.add_argument("--concurrency", type=int, default=2, help="排行榜/仪表盘并发数")
+    parser.add_argument(
+        "--slow-path", default="/api/system/stats", help="并发请求的慢查询接口"
+    )
+    parser.add_argument("--slow-concurrency", type=int, default=1, help="慢查询并发数")
+    parser.add_argument("--port", type=int, default=18080, help="压测服务监听端口")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # 配置在导入 app 时读取，需先指向临时数据目录
+        os.environ["DATA_DIR"] = tmpdir
+        os.environ.setdefault("TG_API_TOKEN", "123456:benchmark")
+
+        from app.config import settings
+        from app.db import close_pools, get_pool
+        from app.executors import shutdown_executors
+        from app.webapp import app
+
+        seed_database(settings.DATA_PATH / "data.db", args.accounts, args.tg_users)
+        get_pool()
+        headers = {"X-Telegram-Init-Data": signed_init_data(settings.TG_API_TOKEN, 1)}
+
+        with BackgroundServer(app, args.port):
+            # 路由每次请求都会打日志（uvicorn 启动时会重置其日志级别），压测时只保留错误
+            for name in ("", "uvicorn"):
+                logging.getLogger(name).setLevel(logging.ERROR)
+            base_url = f"http://127.0.0.1:{args.port}"
+            for label, inline in (("改造前", True), ("改造后", False)):
+                use_inline_db(inline)
+                latencies, elapsed = asyncio.run(
+                    run_round(
+                        base_url,
+                        headers,
+                        args.requests,
+                        args.concurrency,
+                        args.slow_path,
+                        args.slow_concurrency,
+                    )
+                )
+                report(label, latencies, elapsed)
+
+        shutdown_executors()
+        close_pools()
+
+
+if __name__ == "__main__":
+    main()
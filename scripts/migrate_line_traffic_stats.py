@@ -47,14 +47,14 @@ def migrate_historical_traffic_data(
         # 如果没有指定开始月份，自动检测数据库中最早的月份
         if start_month is None:
             earliest_record = _db.cur.execute(
-                "SELECT MIN(timestamp) FROM line_traffic_stats"
+                "SELECT MIN(ts) FROM line_traffic_stats"
             ).fetchone()[0]
 
             if not earliest_record:
                 logger.warning("未找到任何流量数据")
                 return results
 
-            earliest_date = datetime.fromisoformat(earliest_record)
+            earliest_date = datetime.fromtimestamp(earliest_record, settings.TZ)
             start_month = earliest_date.strftime("%Y-%m")
 
         # 验证月份格式
@@ -126,15 +126,12 @@ def migrate_historical_traffic_data(
                 else:
                     next_month_start = month_start.replace(month=month_start.month + 1)
 
-                month_start_str = month_start.isoformat()
-                next_month_start_str = next_month_start.isoformat()
-
                 original_count = _db.cur.execute(
                     """
                     SELECT COUNT(*) FROM line_traffic_stats 
-                    WHERE timestamp >= ? AND timestamp < ?
+                    WHERE ts >= ? AND ts < ?
                 """,
-                    (month_start_str, next_month_start_str),
+                    (int(month_start.timestamp()), int(next_month_start.timestamp())),
                 ).fetchone()[0]
 
                 if original_count == 0:
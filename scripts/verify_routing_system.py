@@ -246,7 +246,7 @@ class RoutingSystemVerifier:
                 "line_switch_history",
             ]
 
-            cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
+            cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view')")
             existing_tables = set(row[0] for row in cursor.fetchall())
 
             all_exist = True
@@ -1,10 +1,70 @@
 import time
 import traceback
-from typing import Optional
+from typing import Iterable, Optional
 
 from app.log import logger
 from app.redis_client import Redis
 
+# 批量操作时每个 MGET / pipeline 最多包含的键数量，避免单次请求过大
+_BATCH_CHUNK_SIZE = 1000
+# 记录已完成 SCAN 迁移的命名空间（field 为缓存键前缀）
+_INDEX_MIGRATED_KEY = "cache_index:migrated"
+
+
+def _chunked(items: list, size: int = _BATCH_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+# 读取并刷新访问时间 / 过期时间
+# KEYS[1]: 缓存键  KEYS[2]: 使用记录 ZSET（可选）
+# ARGV[1]: 成员名  ARGV[2]: 当前时间  ARGV[3]: 过期秒数（0 表示不刷新）
+_TOUCH_SCRIPT = """
+local value = redis.call('GET', KEYS[1])
+if value then
+    if KEYS[2] then
+        redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1])
+    end
+    if tonumber(ARGV[3]) > 0 then
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+    end
+end
+return value
+"""
+
+# 按容量淘汰最久未使用的条目并写入新值，返回淘汰数量
+# 被淘汰的键由脚本根据前缀拼出，不在 KEYS 中声明，因此不适用于 Redis Cluster
+# KEYS[1]: 缓存键  KEYS[2]: 使用记录 ZSET  KEYS[3]: 成员索引 SET（可选）
+# ARGV[1]: 成员名  ARGV[2]: 值  ARGV[3]: 过期秒数（0 表示不过期）
+# ARGV[4]: 容量  ARGV[5]: 当前时间  ARGV[6]: 缓存键前缀
+_PUT_SCRIPT = """
+local evicted = 0
+local capacity = tonumber(ARGV[4])
+if capacity > 0 and not redis.call('ZSCORE', KEYS[2], ARGV[1]) then
+    local overflow = redis.call('ZCARD', KEYS[2]) - capacity + 1
+    if overflow > 0 then
+        for _, member in ipairs(redis.call('ZRANGE', KEYS[2], 0, overflow - 1)) do
+            redis.call('DEL', ARGV[6] .. member)
+            redis.call('ZREM', KEYS[2], member)
+            if KEYS[3] then
+                redis.call('SREM', KEYS[3], member)
+            end
+            evicted = evicted + 1
+        end
+    end
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+redis.call('ZADD', KEYS[2], ARGV[5], ARGV[1])
+if KEYS[3] then
+    redis.call('SADD', KEYS[3], ARGV[1])
+end
+return evicted
+"""
+
 
 class RedisCache:
     def __init__(
@@ -14,6 +74,7 @@ class RedisCache:
         ttl_seconds: int = None,
         cache_key_prefix: str = "cache:",
         cache_usage_track: bool = False,
+        indexed: bool = True,
     ):
         """
         初始化基于Redis的缓存
@@ -21,8 +82,11 @@ class RedisCache:
         Args:
             capacity: 缓存容量
             ttl_seconds: 缓存条目的存活时间（秒）
+            indexed: 是否维护成员索引；只按键读写、从不枚举的命名空间设为 False，
+                带过期时间的键不会在索引中堆积，枚举时退回 SCAN
         """
         self.capacity = capacity
+        self.indexed = indexed
         self.ttl_seconds = ttl_seconds
         self.redis_client = Redis(db=db).get_connection()
         self._cache_key_prefix = cache_key_prefix  # Redis键的前缀
@@ -31,22 +95,103 @@ class RedisCache:
             if cache_usage_track
             else None
         )
+        # 命名空间成员索引，枚举和统计时不再扫描整个 db
+        self._cache_index_key = f"cache_index:{self._cache_key_prefix}"
+        self._index_ready = False
+        self._scripts_client = None
+        self._touch_script = None
+        self._put_script = None
+
+    def _register_scripts(self):
+        """注册 Lua 脚本，调用时使用 EVALSHA，服务端缺失脚本时自动重新加载"""
+        if self._scripts_client is not self.redis_client:
+            self._touch_script = self.redis_client.register_script(_TOUCH_SCRIPT)
+            self._put_script = self.redis_client.register_script(_PUT_SCRIPT)
+            self._scripts_client = self.redis_client
+
+    def _touch_keys(self, cache_key: str) -> list:
+        keys = [cache_key]
+        if self._cache_usage_key:
+            keys.append(self._cache_usage_key)
+        return keys
+
+    def _put_with_script(self, key: str, value, ttl_seconds: Optional[int], client=None):
+        """原子地淘汰并写入，client 为 pipeline 时只排队不执行"""
+        self._register_scripts()
+        keys = [self._get_cache_key(key), self._cache_usage_key]
+        if self.indexed:
+            keys.append(self._cache_index_key)
+        return self._put_script(
+            keys=keys,
+            args=[
+                key,
+                value,
+                ttl_seconds or 0,
+                self.capacity,
+                time.time(),
+                self._cache_key_prefix,
+            ],
+            client=client,
+        )
 
     def _get_cache_key(self, key: str) -> str:
         """获取缓存键的完整Redis键名"""
         return f"{self._cache_key_prefix}{key}"
 
+    def _ensure_index(self):
+        """首次使用时用 SCAN 把已有的键导入成员索引，之后只读索引"""
+        if self._index_ready:
+            return
+        if not self.redis_client.hexists(_INDEX_MIGRATED_KEY, self._cache_key_prefix):
+            members = [
+                key.removeprefix(self._cache_key_prefix)
+                for key in self.redis_client.scan_iter(
+                    match=f"{self._cache_key_prefix}*", count=1000, _type="string"
+                )
+            ]
+            for chunk in _chunked(members):
+                self.redis_client.sadd(self._cache_index_key, *chunk)
+            self.redis_client.hset(
+                _INDEX_MIGRATED_KEY, self._cache_key_prefix, int(time.time())
+            )
+            logger.info(
+                f"Indexed {len(members)} existing keys for cache: {self._cache_key_prefix}"
+            )
+        self._index_ready = True
+
+    def _members(self) -> list:
+        """列出命名空间内的成员名，未维护索引时使用 SCAN"""
+        if not self.indexed:
+            return [
+                key.removeprefix(self._cache_key_prefix)
+                for key in self.redis_client.scan_iter(
+                    match=f"{self._cache_key_prefix}*", count=1000, _type="string"
+                )
+            ]
+        self._ensure_index()
+        return list(self.redis_client.smembers(self._cache_index_key))
+
+    def _indexed_key_values(self) -> dict:
+        """读取索引中全部成员的值，顺带移除已过期或被外部删除的成员"""
+        members = self._members()
+        key_values = {}
+        stale = []
+        for chunk in _chunked(members):
+            values = self.redis_client.mget([self._get_cache_key(key) for key in chunk])
+            for key, value in zip(chunk, values):
+                if value is None:
+                    stale.append(key)
+                else:
+                    key_values[key] = value
+        for chunk in _chunked(stale):
+            self.redis_client.srem(self._cache_index_key, *chunk)
+        return key_values
+
     def get_all(self) -> list:
         """
         获取所有缓存值
         """
-        values = []
-        pipeline = self.redis_client.pipeline()
-        for key in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"):
-            pipeline.get(key)
-        results = pipeline.execute()
-        values = [val for val in results if val is not None]
-        return values
+        return list(self._indexed_key_values().values())
 
     def get_all_key_values(self) -> dict:
         """
@@ -55,21 +200,7 @@ class RedisCache:
         Returns:
             包含所有缓存键值对的字典
         """
-        key_values = {}
-        pipeline = self.redis_client.pipeline()
-        for key in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"):
-            pipeline.get(key)
-        results = pipeline.execute()
-
-        for key, value in zip(
-            self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*"), results
-        ):
-            if value is not None:
-                key_values[key.removeprefix(self._cache_key_prefix)] = value.decode(
-                    "utf-8"
-                )
-
-        return key_values
+        return self._indexed_key_values()
 
     def get(self, key: str) -> Optional[str]:
         """
@@ -82,18 +213,15 @@ class RedisCache:
             缓存的值，如果不存在或已过期则返回 None
         """
         cache_key = self._get_cache_key(key)
-        value = self.redis_client.get(cache_key)
-
-        if value is not None:
-            # 更新访问时间
-            pipeline = self.redis_client.pipeline()
-            if self._cache_usage_key:
-                pipeline.zadd(self._cache_usage_key, {key: time.time()})
-            if self.ttl_seconds:
-                pipeline.expire(cache_key, self.ttl_seconds)  # 重置过期时间
-            pipeline.execute()
-
-        return value
+        if not (self._cache_usage_key or self.ttl_seconds):
+            return self.redis_client.get(cache_key)
+
+        # 读取、更新访问时间和重置过期时间在一次往返中完成
+        self._register_scripts()
+        return self._touch_script(
+            keys=self._touch_keys(cache_key),
+            args=[key, time.time(), self.ttl_seconds or 0],
+        )
 
     def put(self, key: str, value: str):
         """
@@ -104,61 +232,136 @@ class RedisCache:
             value: 缓存值
         """
         try:
-            # 检查容量并清理过期项
-            if self.capacity > 0 and self._cache_usage_key:
-                current_size = self.redis_client.zcard(self._cache_usage_key)
-                if current_size >= self.capacity:
-                    # 获取最旧的项并删除
-                    oldest_items = self.redis_client.zrange(
-                        self._cache_usage_key, 0, current_size - self.capacity
-                    )
-                    if oldest_items:
-                        pipeline = self.redis_client.pipeline()
-                        for old_key in oldest_items:
-                            pipeline.delete(self._get_cache_key(old_key))
-                            pipeline.zrem(self._cache_usage_key, old_key)
-                        pipeline.execute()
-
-            # 添加新项
-            cache_key = self._get_cache_key(key)
-            pipeline = self.redis_client.pipeline()
-            pipeline.set(cache_key, value, ex=self.ttl_seconds)
             if self._cache_usage_key:
-                pipeline.zadd(self._cache_usage_key, {key: time.time()})
-            pipeline.execute()
+                # 容量淘汰和写入由 Lua 脚本原子完成，并发写入也不会超出容量
+                self._put_with_script(key, value, self.ttl_seconds)
+            else:
+                pipeline = self.redis_client.pipeline(transaction=False)
+                pipeline.set(self._get_cache_key(key), value, ex=self.ttl_seconds)
+                if self.indexed:
+                    pipeline.sadd(self._cache_index_key, key)
+                pipeline.execute()
 
             logger.debug(f"Added key to cache: {key}")
         except Exception as e:
             logger.error(f"Failed to add key to cache: {key}, error: {e}")
             logger.exception(traceback.format_exc())
 
-    def delete(self, key: str):
-        """删除缓存条目"""
-        cache_key = self._get_cache_key(key)
+    def get_many(self, keys: Iterable[str]) -> dict:
+        """
+        批量获取缓存值
 
-        if self.redis_client.exists(cache_key):
-            pipeline = self.redis_client.pipeline()
-            pipeline.delete(cache_key)
+        不需要刷新访问记录时使用 MGET 读取；否则每个键通过 Lua 脚本读取并刷新，
+        按块放入 pipeline 发送，读取与刷新之间不会被并发淘汰打断
 
+        Args:
+            keys: 缓存键列表
+
+        Returns:
+            命中的 {键: 值}，未命中的键不包含在结果中
+        """
+        keys = list(dict.fromkeys(keys))
+        touch = bool(self._cache_usage_key or self.ttl_seconds)
+        if touch:
+            self._register_scripts()
+        found = {}
+        for chunk in _chunked(keys):
+            cache_keys = [self._get_cache_key(key) for key in chunk]
+            if touch:
+                now = time.time()
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for key, cache_key in zip(chunk, cache_keys):
+                    self._touch_script(
+                        keys=self._touch_keys(cache_key),
+                        args=[key, now, self.ttl_seconds or 0],
+                        client=pipeline,
+                    )
+                values = pipeline.execute()
+            else:
+                values = self.redis_client.mget(cache_keys)
+            found.update(
+                (key, value) for key, value in zip(chunk, values) if value is not None
+            )
+        return found
+
+    def put_many(
+        self, items: dict, ttl_seconds: Optional[int] = None, raise_errors: bool = False
+    ):
+        """
+        批量添加或更新缓存条目
+
+        每个键单独 SET 并带上各自的过期时间（MSET 不支持过期时间），
+        按块放入 pipeline 发送；开启使用记录时每个键通过 Lua 脚本淘汰并写入
+
+        Args:
+            items: {键: 值}
+            ttl_seconds: 本次写入的过期时间，默认使用缓存的 ttl_seconds
+            raise_errors: 写入失败时向调用方抛出异常，默认只记录日志
+        """
+        if not items:
+            return
+        ttl_seconds = ttl_seconds or self.ttl_seconds
+        try:
+            for chunk in _chunked(list(items.items())):
+                pipeline = self.redis_client.pipeline(transaction=False)
+                for key, value in chunk:
+                    if self._cache_usage_key:
+                        self._put_with_script(key, value, ttl_seconds, client=pipeline)
+                    else:
+                        pipeline.set(self._get_cache_key(key), value, ex=ttl_seconds)
+                if self.indexed and not self._cache_usage_key:
+                    pipeline.sadd(self._cache_index_key, *[key for key, _ in chunk])
+                pipeline.execute()
+
+            logger.debug(f"Added {len(items)} keys to cache")
+        except Exception as e:
+            if raise_errors:
+                raise
+            logger.error(f"Failed to add {len(items)} keys to cache, error: {e}")
+            logger.exception(traceback.format_exc())
+
+    def delete_many(self, keys: Iterable[str]) -> int:
+        """
+        批量删除缓存条目
+
+        Returns:
+            实际删除的键数量
+        """
+        keys = list(dict.fromkeys(keys))
+        deleted = 0
+        for chunk in _chunked(keys):
+            pipeline = self.redis_client.pipeline(transaction=False)
+            pipeline.delete(*[self._get_cache_key(key) for key in chunk])
+            pipeline.srem(self._cache_index_key, *chunk)
             if self._cache_usage_key:
-                pipeline.zrem(self._cache_usage_key, key)
+                pipeline.zrem(self._cache_usage_key, *chunk)
+            deleted += pipeline.execute()[0]
+        if deleted:
+            logger.info(f"Deleted {deleted} keys from cache")
+        return deleted
 
-            pipeline.execute()
+    def delete(self, key: str):
+        """删除缓存条目"""
+        # 键已过期时也要清理索引和使用记录中的成员
+        pipeline = self.redis_client.pipeline()
+        pipeline.delete(self._get_cache_key(key))
+        pipeline.srem(self._cache_index_key, key)
+        if self._cache_usage_key:
+            pipeline.zrem(self._cache_usage_key, key)
 
+        if pipeline.execute()[0]:
             logger.info(f"Deleted key from cache: {key}")
         else:
             logger.info(f"Key not found in cache: {key}")
 
     def clear(self):
         """清空缓存"""
-        # 获取所有缓存键
-        keys_pattern = f"{self._cache_key_prefix}*"
-
+        members = self._members()
+        for chunk in _chunked(members):
+            self.redis_client.delete(*[self._get_cache_key(key) for key in chunk])
+        # 清除索引和使用记录
         pipeline = self.redis_client.pipeline()
-        # 删除所有缓存键
-        for key in self.redis_client.scan_iter(match=keys_pattern):
-            pipeline.delete(key)
-        # 清除使用记录
+        pipeline.delete(self._cache_index_key)
         if self._cache_usage_key:
             pipeline.delete(self._cache_usage_key)
         pipeline.execute()
@@ -172,10 +375,8 @@ class RedisCache:
         Returns:
             包含缓存统计信息的字典
         """
-        # 获取未过期的键数量
-        active_keys = sum(
-            1 for _ in self.redis_client.scan_iter(match=f"{self._cache_key_prefix}*")
-        )
+        # 获取未过期的键数量（同时清理索引中已过期的成员）
+        active_keys = len(self._indexed_key_values())
         # 获取当前缓存大小
         current_size = (
             self.redis_client.zcard(self._cache_usage_key)
@@ -241,6 +442,24 @@ def get_line_tags(line_name: str) -> list[str]:
         return []
 
 
+def get_lines_tags(line_names: Iterable[str]) -> dict[str, list[str]]:
+    """批量获取多条线路的标签信息，一次 MGET 读取"""
+    line_names = list(line_names)
+    try:
+        tags_by_line = line_tags_cache.get_many(line_names)
+    except Exception as e:
+        logger.error(f"批量获取线路标签失败: {str(e)}")
+        tags_by_line = {}
+    return {
+        line_name: [
+            tag.strip()
+            for tag in (tags_by_line.get(line_name) or "").split(",")
+            if tag.strip()
+        ]
+        for line_name in line_names
+    }
+
+
 # 幸运大转盘缓存
 lucky_wheel_config_cache = RedisCache(
     db=0,
@@ -292,4 +511,5 @@ blackjack_game_state_cache = RedisCache(
     db=0,
     cache_key_prefix="blackjack:game:",
     ttl_seconds=1800,  # 游戏状态保存30分钟
+    indexed=False,  # 只按游戏 ID 读写，不维护成员索引
 )
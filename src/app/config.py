@@ -25,6 +25,7 @@ class Settings(BaseSettings):
     PLEX_ADMIN_EMAIL: str = ""
     PLEX_PUBLIC_HOST: str = "plex.misaya.org"
     PLEX_ORIGIN_HOST: str = "plex-origin.misaya.org"
+    PLEX_USER_DIRECTORY_TTL: int = 300  # Plex 用户列表缓存有效期（秒）
 
     # Overseerr
     OVERSEERR_BASE_URL: str = ""
@@ -49,6 +50,16 @@ class Settings(BaseSettings):
     PREMIUM_STREAM_BACKEND: list = []
     PREMIUM_FREE: bool = False
     REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE: int = 100
+    REDIS_LINE_TRAFFIC_DEAD_LETTER_LIMIT: int = 10000  # 死信队列最多保留的流量日志条数
+    NGINX_TRAFFIC_FALLBACK_ENABLED: bool = True  # Redis 队列为空时从 Nginx 日志补采
+    NGINX_TRAFFIC_LOG_DIR: str = "/var/log/nginx"
+    TRAFFIC_CONSUMER_ENABLED: bool = True  # 常驻消费流量日志队列，关闭时回退为每分钟定时任务
+    TRAFFIC_CONSUMER_BATCH_SIZE: int = 500  # 每批最多处理的流量日志条数
+    TRAFFIC_CONSUMER_BLOCK_TIMEOUT: int = 5  # 阻塞等待队列数据的超时（秒）
+    TRAFFIC_CONSUMER_ID: str = ""  # 消费者 ID，需在容器重建后保持不变，留空时使用主机名
+    TRAFFIC_IDENTITY_CACHE_SIZE: int = 10000  # 流量归属身份缓存条数上限
+    TRAFFIC_IDENTITY_CACHE_TTL: int = 600  # 身份缓存有效期（秒）
+    TRAFFIC_IDENTITY_CACHE_NEGATIVE_TTL: int = 60  # 解析失败结果的缓存有效期（秒）
 
     CREDITS_TRANSFER_ENABLED: bool = True  # 积分转移功能开关
 
@@ -56,6 +67,9 @@ class Settings(BaseSettings):
     CHECKIN_ENABLED: bool = True            # 是否开启每日签到
     CHECKIN_MONTHLY_TOP3_REWARD: float = 20.0  # 月度签到前三名奖励积分
 
+    # 排行榜
+    LEADERBOARD_SIZE: int = 100  # 排行榜页面与捐赠榜命令展示的最大人数
+
     # 换绑欠积分
     DEBT_MAX_MONTHS: int = 3                # 欠积分最多允许多少个月
 
@@ -65,6 +79,14 @@ class Settings(BaseSettings):
     TG_PRIVILEGED_USERS: list[int] = []  # 特权用户列表（不受群组离开限制）
     TG_GROUP: str = ""
     TG_CHANNEL: str = ""  # 可选的通知频道链接，如果不设置将使用群组链接
+    TG_API_RATE_LIMIT: int = 20  # 每个 Bot API 主机每秒最多请求数
+    TG_USER_INFO_REFRESH_CONCURRENCY: int = 8  # 刷新 TG 用户信息的并发 worker 数
+    TG_USER_INFO_REFRESH_BATCH_SIZE: int = 100  # 刷新 TG 用户信息时每批写回缓存的用户数
+    TG_NOTIFY_RATE_LIMIT: int = 25  # 通知队列每秒最多发送的消息数（Telegram 全局上限 30 条/秒）
+    TG_NOTIFY_CHAT_INTERVAL: int = 1  # 同一会话两条消息之间的最小间隔（秒）
+    TG_NOTIFY_MAX_ATTEMPTS: int = 5  # 通知发送失败的最大重试次数
+    GROUP_MEMBER_RECHECK_HOURS: int = 24  # 群组成员状态超过该时长未确认时由对账任务复核
+    GROUP_MEMBER_CHECK_CONCURRENCY: int = 5  # 对账任务调用 getChatMember 的并发数
 
     # WebApp
     WEBAPP_ENABLE: bool = True  # 是否启用 WebApp
@@ -97,6 +119,10 @@ class Settings(BaseSettings):
     EMBY_ORIGIN_HOST: str = "emby-origin.misaya.org"
 
 
+    # database
+    DB_POOL_SIZE: int = 8  # 每个进程的 SQLite 连接池大小，同时也是数据库线程池大小
+    MEDIA_HTTP_WORKERS: int = 16  # WebApp 调用 Emby/Plex 等同步接口的线程池大小
+
     # redis
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
@@ -133,6 +159,18 @@ class Settings(BaseSettings):
     def TG_USER_INFO_CACHE_PATH(self):
         return self.DATA_PATH / "tg_user_info.cache"
 
+    @property
+    def EMBY_USER_INFO_CACHE_PATH(self):
+        return self.DATA_PATH / "emby_user_info.db"
+
+    @property
+    def NGINX_TRAFFIC_STATE_PATH(self):
+        return self.DATA_PATH / "nginx_traffic_state.db"
+
+    @property
+    def NOTIFICATION_QUEUE_PATH(self):
+        return self.DATA_PATH / "notification_queue.db"
+
     @property
     def TG_USER_PROFILE_CACHE_PATH(self):
         path = Path(self.DATA_PATH) / "pics"
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""每日积分结算引擎
+
+旧实现对每个用户分别查询用户行、绑定关系、勋章倍率和 statistics 积分，再逐条 UPDATE。
+结算引擎改为：
+
+1. 用少量批量查询加载观看时长以外的全部数据（用户、绑定关系、勋章倍率、积分余额）
+2. 在内存中计算每个账号的积分变化，Plex 与 Emby 共享同一份 TG 积分余额
+3. 在一个事务中用 executemany 写回；dry_run 模式只输出变化表，不写库也不发通知
+"""
+
+from dataclasses import dataclass, field
+from typing import Optional
+
+from app.config import settings
+from app.credits_cache import publish_user_credits
+from app.db import DB
+from app.leaderboard import EMBY_WATCHED_TIME, PLEX_WATCHED_TIME, refresh_members
+from app.log import logger
+
+
+def _build_credit_bonus_lines(dual_bind_multiplier: float, medal_multiplier: float):
+    bonus_lines = []
+    if dual_bind_multiplier > 1.0:
+        bonus_lines.append(f"   🎁  双账号加成：×{dual_bind_multiplier:.2f}")
+    if medal_multiplier > 1.0:
+        bonus_lines.append(f"   🏅  勋章加成：×{medal_multiplier:.2f}")
+    return "\n".join(bonus_lines) + ("\n" if bonus_lines else "")
+
+
+def _build_daily_report(
+    service_label: str,
+    icon: str,
+    watch_hours: float,
+    base_credits: float,
+    credits_inc: float,
+    dual_bind_multiplier: float,
+    medal_multiplier: float,
+    credits: float,
+    total_watched: float,
+) -> str:
+    bonus_line = _build_credit_bonus_lines(dual_bind_multiplier, medal_multiplier)
+    return f"""
+╭━━━━━━━━━━━━━━━━━━━━━━━━━╮
+┃  {icon} {service_label} 每日观影报告  ┃
+╰━━━━━━━━━━━━━━━━━━━━━━━━━╯
+
+🌟 今日观看收益
+━━━━━━━━━━━━━━━━━
+   ⏱️  观看时长：{watch_hours:.2f} 小时
+   💎  基础积分：+{base_credits:.2f}
+{bonus_line}   ✨  实际获得：+{credits_inc:.2f}
+
+━━━━━━━━━━━━━━━━━━━━━━━━━
+
+💰 当前总积分：{credits:.2f}
+🎞️  总观看时长：{total_watched:.2f} 小时
+
+━━━━━━━━━━━━━━━━━━━━━━━━━
+💜 MisayaMedia · 享受观影时光"""
+
+
+@dataclass
+class CreditDelta:
+    """单个媒体账号的结算结果"""
+
+    service: str
+    account_id: str
+    username: Optional[str]
+    tg_id: Optional[int]
+    watch_hours: float
+    base_credits: float
+    multiplier: float
+    credits_inc: float
+    credits_after: float
+    is_abusive: bool
+
+
+@dataclass
+class _PendingWrites:
+    plex_users: list = field(default_factory=list)
+    plex_watched: list = field(default_factory=list)
+    emby_users: list = field(default_factory=list)
+    emby_watched: list = field(default_factory=list)
+    emby_credits_reset: list = field(default_factory=list)
+    stats_inserts: dict = field(default_factory=dict)
+    stats_touched: set = field(default_factory=set)
+
+
+class CreditSettlement:
+    """Plex / Emby 每日积分结算"""
+
+    def __init__(self, db: DB, *, dry_run: bool = False) -> None:
+        self.db = db
+        self.dry_run = dry_run
+        self.deltas: list[CreditDelta] = []
+        self.notifications: list[tuple] = []
+        self._writes = _PendingWrites()
+        self._load()
+
+    def _load(self) -> None:
+        """批量加载结算所需数据"""
+        cur = self.db.cur
+        self.balances: dict = {}
+        for tg_id, credits in cur.execute("SELECT tg_id, credits FROM statistics"):
+            self.balances.setdefault(tg_id, credits or 0.0)
+
+        self.plex_users = cur.execute(
+            "SELECT plex_id, credits, watched_time, tg_id, plex_username FROM user"
+        ).fetchall()
+        self.emby_users = cur.execute(
+            "SELECT emby_id, tg_id, emby_watched_time, emby_credits, emby_username FROM emby_user"
+        ).fetchall()
+        self.plex_tg_ids = {row[3] for row in self.plex_users if row[3]}
+        self.emby_tg_ids = {row[1] for row in self.emby_users if row[1]}
+
+        self.medal_multipliers: dict = {}
+        for tg_id, multiplier in cur.execute(
+            """
+            SELECT um.tg_id, c.multiplier
+            FROM user_medals um
+            JOIN medal_catalog c ON c.code = um.medal_code
+            WHERE um.is_active = 1 AND c.is_active = 1
+            """
+        ):
+            self.medal_multipliers[tg_id] = self.medal_multipliers.get(tg_id, 1.0) * float(
+                multiplier or 1.0
+            )
+
+    def _snapshot(self) -> tuple:
+        writes = self._writes
+        return (
+            dict(self.balances),
+            len(self.deltas),
+            len(self.notifications),
+            {name: len(value) for name, value in vars(writes).items() if isinstance(value, list)},
+            dict(writes.stats_inserts),
+            set(writes.stats_touched),
+        )
+
+    def _restore(self, snapshot: tuple) -> None:
+        """单个服务结算失败时撤销它在内存中的改动，与旧实现按服务回滚一致"""
+        balances, deltas, notifications, list_sizes, stats_inserts, stats_touched = snapshot
+        self.balances = balances
+        del self.deltas[deltas:]
+        del self.notifications[notifications:]
+        for name, size in list_sizes.items():
+            del getattr(self._writes, name)[size:]
+        self._writes.stats_inserts = stats_inserts
+        self._writes.stats_touched = stats_touched
+
+    def settle(self, service: str, duration: dict) -> None:
+        """结算单个服务，失败时撤销该服务的全部改动"""
+        settle_func = {"plex": self._settle_plex, "emby": self._settle_emby}[service]
+        snapshot = self._snapshot()
+        try:
+            settle_func(duration)
+        except Exception:
+            self._restore(snapshot)
+            raise
+
+    def _multipliers(self, tg_id, other_service_tg_ids: set) -> tuple[float, float]:
+        if not tg_id:
+            return 1.0, 1.0
+        dual_bind_multiplier = (
+            settings.DUAL_BIND_MULTIPLIER if tg_id in other_service_tg_ids else 1.0
+        )
+        medal_multiplier = round(self.medal_multipliers.get(tg_id, 1.0), 4)
+        return dual_bind_multiplier, medal_multiplier
+
+    def _abuse_notifications(
+        self, service_label: str, username, tg_id, watch_hours: float, user_text: str
+    ) -> None:
+        self.notifications.append((tg_id, user_text))
+        for chat_id in settings.TG_ADMIN_CHAT_ID:
+            self.notifications.append(
+                (
+                    chat_id,
+                    f"🚨 异常观看告警：{service_label} 用户 {username} (TG: {tg_id}) 今日观看 {watch_hours:.1f}h，超过阈值 {settings.ABUSE_WATCH_THRESHOLD}h",
+                )
+            )
+
+    def _settle_plex(self, duration: dict) -> None:
+        """根据 Tautulli 当日观看时长结算 Plex 积分"""
+        threshold = settings.ABUSE_WATCH_THRESHOLD
+        for plex_id, credits_init, watched_time_init, tg_id, plex_username in self.plex_users:
+            play_duration = round(min(float(duration.get(plex_id, 0)), 24), 2)
+            if play_duration == 0:
+                continue
+
+            dual_bind_multiplier, medal_multiplier = self._multipliers(
+                tg_id, self.emby_tg_ids
+            )
+            multiplier = dual_bind_multiplier * medal_multiplier
+            base_credits = min(play_duration, 8)
+            is_abusive = play_duration > threshold
+            credits_inc = 0 if is_abusive else round(base_credits * multiplier, 2)
+            watched_time = (watched_time_init or 0) + play_duration
+
+            if not tg_id:
+                credits = (credits_init or 0.0) + credits_inc
+                self._writes.plex_users.append((credits, watched_time, plex_id))
+            else:
+                self._writes.plex_watched.append((watched_time, plex_id))
+                if tg_id not in self.balances:
+                    logger.warning(f"TG 用户 {tg_id} 没有积分记录，跳过 Plex 积分结算")
+                    continue
+                credits = self.balances[tg_id] + credits_inc
+                if not is_abusive:
+                    self.balances[tg_id] = credits
+                    self._writes.stats_touched.add(tg_id)
+
+                if is_abusive:
+                    self._abuse_notifications(
+                        "Plex",
+                        plex_username,
+                        tg_id,
+                        play_duration,
+                        f"⚠️ 今日观看时长异常 ({play_duration:.1f}h)，已超过合理阈值，本日积分已清零。如有疑问请联系管理员。",
+                    )
+                else:
+                    self.notifications.append(
+                        (
+                            tg_id,
+                            _build_daily_report(
+                                "Plex",
+                                "🎬",
+                                play_duration,
+                                base_credits,
+                                credits_inc,
+                                dual_bind_multiplier,
+                                medal_multiplier,
+                                credits,
+                                watched_time,
+                            ),
+                        )
+                    )
+
+            self.deltas.append(
+                CreditDelta(
+                    "plex",
+                    str(plex_id),
+                    plex_username,
+                    tg_id,
+                    play_duration,
+                    base_credits,
+                    multiplier,
+                    credits_inc,
+                    credits,
+                    is_abusive,
+                )
+            )
+
+    def _settle_emby(self, duration: dict) -> None:
+        """根据 Emby 累计播放时长结算 Emby 积分（emby_watched_time 保存上次的累计值）"""
+        threshold = settings.ABUSE_WATCH_THRESHOLD
+        for emby_id, tg_id, watched_time, emby_credits_init, emby_username in self.emby_users:
+            watched_time = watched_time or 0.0
+            emby_credits_init = emby_credits_init or 0.0
+            playduration = round(float(duration.get(emby_id, 0)) / 3600, 2)
+            if playduration == 0:
+                continue
+
+            base_watch = max(0.0, round(playduration - watched_time, 2))
+            dual_bind_multiplier, medal_multiplier = self._multipliers(
+                tg_id, self.plex_tg_ids
+            )
+            multiplier = dual_bind_multiplier * medal_multiplier
+            base_credits = min(base_watch, 8)
+            is_abusive = base_watch > threshold
+            credits_inc = 0 if is_abusive else round(base_credits * multiplier, 2)
+
+            if not tg_id:
+                credits = emby_credits_init + credits_inc
+                self._writes.emby_users.append((playduration, credits, emby_id))
+            else:
+                if tg_id in self.balances:
+                    credits = self.balances[tg_id] + credits_inc
+                else:
+                    # 首次结算：把 Emby 账号上的积分转入新的 statistics 记录
+                    self._writes.emby_credits_reset.append((emby_id,))
+                    credits = emby_credits_init + credits_inc
+                    self._writes.stats_inserts[tg_id] = credits
+                self.balances[tg_id] = credits
+                self._writes.stats_touched.add(tg_id)
+                self._writes.emby_watched.append((playduration, emby_id))
+
+                if is_abusive:
+                    self._abuse_notifications(
+                        "Emby",
+                        emby_username,
+                        tg_id,
+                        base_watch,
+                        f"⚠️ 今日 Emby 观看时长异常 ({base_watch:.1f}h)，已超过合理阈值，本日积分已清零。如有疑问请联系管理员。",
+                    )
+                elif base_watch > 0:
+                    self.notifications.append(
+                        (
+                            tg_id,
+                            _build_daily_report(
+                                "Emby",
+                                "📺",
+                                base_watch,
+                                base_credits,
+                                credits_inc,
+                                dual_bind_multiplier,
+                                medal_multiplier,
+                                credits,
+                                playduration,
+                            ),
+                        )
+                    )
+
+            self.deltas.append(
+                CreditDelta(
+                    "emby",
+                    str(emby_id),
+                    emby_username,
+                    tg_id,
+                    base_watch,
+                    base_credits,
+                    multiplier,
+                    credits_inc,
+                    credits,
+                    is_abusive,
+                )
+            )
+
+    def apply(self) -> bool:
+        """在一个事务中写回全部结算结果，dry_run 时不写库"""
+        if self.dry_run:
+            logger.info(f"积分结算预览（未写入数据库）:\n{self.format_delta_table()}")
+            return True
+
+        writes = self._writes
+        touched = writes.stats_touched
+        stats_updates = [
+            (self.balances[tg_id], tg_id)
+            for tg_id in touched
+            if tg_id not in writes.stats_inserts
+        ]
+        cur = self.db.cur
+        try:
+            cur.executemany(
+                "UPDATE user SET credits=?, watched_time=? WHERE plex_id=?",
+                writes.plex_users,
+            )
+            cur.executemany(
+                "UPDATE user SET watched_time=? WHERE plex_id=?", writes.plex_watched
+            )
+            cur.executemany(
+                "UPDATE emby_user SET emby_watched_time=?, emby_credits=? WHERE emby_id=?",
+                writes.emby_users,
+            )
+            cur.executemany(
+                "UPDATE emby_user SET emby_credits=0 WHERE emby_id=?",
+                writes.emby_credits_reset,
+            )
+            cur.executemany(
+                "UPDATE emby_user SET emby_watched_time=? WHERE emby_id=?",
+                writes.emby_watched,
+            )
+            cur.executemany(
+                "INSERT INTO statistics (tg_id, donation, credits) VALUES (?, 0, ?)",
+                [(tg_id, self.balances[tg_id]) for tg_id in writes.stats_inserts],
+            )
+            cur.executemany(
+                "UPDATE statistics SET credits=? WHERE tg_id=?", stats_updates
+            )
+            # 积分转正的用户清除欠费起始时间
+            cur.executemany(
+                "UPDATE statistics SET debt_since = NULL WHERE tg_id = ?",
+                [(tg_id,) for tg_id in touched if self.balances[tg_id] >= 0],
+            )
+        except Exception as e:
+            self.db.con.rollback()
+            logger.error(f"写入积分结算结果失败: {e}")
+            raise
+        self.db.con.commit()
+        publish_user_credits(
+            self.db,
+            tg_ids=touched,
+            plex_ids=[plex_id for _, _, plex_id in writes.plex_users],
+            emby_ids=[emby_id for _, _, emby_id in writes.emby_users],
+        )
+        refresh_members(
+            self.db,
+            PLEX_WATCHED_TIME,
+            [row[-1] for row in (*writes.plex_users, *writes.plex_watched)],
+        )
+        refresh_members(
+            self.db,
+            EMBY_WATCHED_TIME,
+            [row[-1] for row in (*writes.emby_users, *writes.emby_watched)],
+        )
+        logger.info(
+            f"积分结算完成: {len(self.deltas)} 个账号，更新 {len(touched)} 个 TG 用户积分"
+        )
+        return True
+
+    def format_delta_table(self) -> str:
+        """输出积分变化表"""
+        header = (
+            f"{'服务':<6}{'账号':<24}{'TG':<14}{'时长':>8}{'基础':>8}"
+            f"{'倍率':>8}{'新增':>8}{'结算后':>12}  异常"
+        )
+        rows = [header]
+        for delta in self.deltas:
+            rows.append(
+                f"{delta.service:<6}{str(delta.username or delta.account_id)[:22]:<24}"
+                f"{str(delta.tg_id or '-'):<14}{delta.watch_hours:>8.2f}"
+                f"{delta.base_credits:>8.2f}{delta.multiplier:>8.2f}"
+                f"{delta.credits_inc:>8.2f}{delta.credits_after:>12.2f}  "
+                f"{'是' if delta.is_abusive else ''}"
+            )
+        return "\n".join(rows)
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""用户积分同步到 Redis
+
+OpenResty 通过 user_credits_cache（db 0，键为 plex:<用户名> / emby:<用户名>）读取积分。
+原来每 5 分钟把全部用户积分整体重写一遍，余额最多滞后 5 分钟。现在：
+
+- 积分变动的代码路径在提交后调用 publish_user_credits，只写入受影响账号的最新余额
+- rewrite_users_credits_to_redis 定时任务改为对账：与 Redis 中的现有值比较，只写入差异
+- Redis 不可用时暂停写入一段时间，不影响积分变动本身，由对账任务补齐
+- 同时更新积分排行榜（见 app.leaderboard）中受影响 TG 用户的分数
+"""
+
+from time import monotonic
+from typing import Iterable
+
+from app.cache import user_credits_cache
+from app.leaderboard import CREDITS, refresh_members
+from app.log import logger
+
+_SQL_CHUNK_SIZE = 500
+_SUSPEND_SECONDS = 60
+
+_suspended_until = 0.0
+
+
+def _chunked(values: list, size: int = _SQL_CHUNK_SIZE):
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _collect_credit_entries(db, plex_sql: str, emby_sql: str, params: tuple) -> dict:
+    entries = {}
+    for plex_id, plex_username, credits in db.cur.execute(plex_sql, params):
+        # 未接受邀请，此时数据库中的 plex_id 为空
+        if plex_id and plex_username:
+            entries[f"plex:{plex_username.lower()}"] = credits or 0
+    for emby_username, credits in db.cur.execute(emby_sql, params):
+        if emby_username:
+            entries[f"emby:{emby_username.lower()}"] = credits or 0
+    return entries
+
+
+# 绑定了 TG 的账号使用 statistics 中的积分，否则使用账号自身的积分
+_PLEX_SELECT = """
+    SELECT u.plex_id, u.plex_username,
+        CASE WHEN u.tg_id THEN COALESCE(s.credits, 0) ELSE u.credits END
+    FROM user u LEFT JOIN statistics s ON s.tg_id = u.tg_id
+"""
+_EMBY_SELECT = """
+    SELECT e.emby_username,
+        CASE WHEN e.tg_id THEN COALESCE(s.credits, 0) ELSE e.emby_credits END
+    FROM emby_user e LEFT JOIN statistics s ON s.tg_id = e.tg_id
+"""
+
+
+def build_user_credit_entries(
+    db,
+    *,
+    tg_ids: Iterable = (),
+    plex_ids: Iterable = (),
+    emby_ids: Iterable = (),
+    all_users: bool = False,
+) -> dict:
+    """从数据库计算积分缓存内容 {plex:<用户名> / emby:<用户名>: 积分}"""
+    if all_users:
+        return _collect_credit_entries(db, _PLEX_SELECT, _EMBY_SELECT, ())
+
+    entries = {}
+    # plex_id 只存在于 Plex 表，emby_id 只存在于 Emby 表
+    for plex_column, emby_column, ids in (
+        ("u.tg_id", "e.tg_id", tg_ids),
+        ("u.plex_id", "0", plex_ids),
+        ("0", "e.emby_id", emby_ids),
+    ):
+        for chunk in _chunked([i for i in dict.fromkeys(ids) if i]):
+            placeholders = ",".join("?" * len(chunk))
+            entries.update(
+                _collect_credit_entries(
+                    db,
+                    f"{_PLEX_SELECT} WHERE {plex_column} IN ({placeholders})",
+                    f"{_EMBY_SELECT} WHERE {emby_column} IN ({placeholders})",
+                    tuple(chunk),
+                )
+            )
+    return entries
+
+
+def publish_user_credits(
+    db,
+    *,
+    tg_ids: Iterable = (),
+    plex_ids: Iterable = (),
+    emby_ids: Iterable = (),
+) -> int:
+    """积分变动提交后，把受影响账号的最新余额写入 Redis，返回写入条数"""
+    global _suspended_until
+    tg_ids = list(tg_ids)
+    refresh_members(db, CREDITS, tg_ids)
+    if monotonic() < _suspended_until:
+        return 0
+    try:
+        entries = build_user_credit_entries(
+            db, tg_ids=tg_ids, plex_ids=plex_ids, emby_ids=emby_ids
+        )
+        if entries:
+            # 需要拿到写入异常才能暂停同步
+            user_credits_cache.put_many(entries, raise_errors=True)
+        return len(entries)
+    except Exception as e:
+        _suspended_until = monotonic() + _SUSPEND_SECONDS
+        logger.warning(f"同步积分到 Redis 失败，{_SUSPEND_SECONDS} 秒内暂停同步: {e}")
+        return 0
+
+
+def _same_credits(cached, credits) -> bool:
+    try:
+        return cached is not None and float(cached) == float(credits)
+    except (TypeError, ValueError):
+        return False
+
+
+def reconcile_user_credits(db) -> tuple[int, int]:
+    """对比数据库与 Redis 中的积分，只写入变化的键并删除已不存在的账号
+
+    Returns:
+        (写入数量, 删除数量)
+    """
+    global _suspended_until
+    expected = build_user_credit_entries(db, all_users=True)
+    cached = user_credits_cache.get_all_key_values()
+    changed = {
+        key: credits
+        for key, credits in expected.items()
+        if not _same_credits(cached.get(key), credits)
+    }
+    stale = [key for key in cached if key not in expected]
+    if changed:
+        user_credits_cache.put_many(changed)
+    if stale:
+        user_credits_cache.delete_many(stale)
+    # 对账成功说明 Redis 已恢复
+    _suspended_until = 0.0
+    return len(changed), len(stale)
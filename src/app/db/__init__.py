@@ -8,6 +8,7 @@
 - credits.py: 积分和统计相关操作
 - invitation.py: 邀请码相关操作
 - line.py: 线路和媒体库相关操作
+- pool.py: 进程内共享的连接池
 - _types.py: 类型定义
 
 使用方式保持不变：
@@ -34,6 +35,7 @@ from app.db.credits import CreditsMixin
 from app.db.invitation import InvitationMixin
 from app.db.line import LineMixin
 from app.db._types import HasDBConnection
+from app.db.pool import ConnectionPool, close_pools, get_pool
 
 __all__ = [
     "DB",
@@ -43,4 +45,7 @@ __all__ = [
     "InvitationMixin",
     "LineMixin",
     "HasDBConnection",
+    "ConnectionPool",
+    "get_pool",
+    "close_pools",
 ]
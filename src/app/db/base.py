@@ -206,15 +206,8 @@ class DBBase:
                 date TEXT NOT NULL
             );
 
-            CREATE TABLE IF NOT EXISTS line_traffic_stats(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                line TEXT NOT NULL,
-                send_bytes INTEGER NOT NULL,
-                service TEXT NOT NULL,
-                username TEXT NOT NULL,
-                user_id TEXT DEFAULT NULL,
-                timestamp TEXT NOT NULL
-            );
+            -- 原始流量记录按月分区（line_traffic_stats_YYYYMM），
+            -- 分区表和 line_traffic_stats 视图由 app.db_legacy.DB 创建
 
             CREATE TABLE IF NOT EXISTS line_traffic_monthly_stats(
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -239,6 +232,15 @@ class DBBase:
                 UNIQUE(tg_id)
             );
 
+            -- 群组成员状态：ChatMember 事件实时写入，定时对账只复核未知或过期的记录
+            CREATE TABLE IF NOT EXISTS group_member_status(
+                tg_id INTEGER PRIMARY KEY,
+                group_id INTEGER,
+                is_member INTEGER NOT NULL,
+                source TEXT NOT NULL DEFAULT 'sweep',
+                checked_at INTEGER NOT NULL
+            );
+
             CREATE TABLE IF NOT EXISTS shared_proxy_profile(
                 tg_id INTEGER PRIMARY KEY,
                 custom_domain TEXT NOT NULL,
@@ -251,12 +253,6 @@ class DBBase:
                 updated_at INTEGER DEFAULT (strftime('%s', 'now'))
             );
 
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_timestamp ON line_traffic_stats(timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_service_user_time ON line_traffic_stats(service, username, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_line_time ON line_traffic_stats(line, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_daily_query ON line_traffic_stats(service, username, date(timestamp));
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_line_stats ON line_traffic_stats(line, timestamp, send_bytes);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_month ON line_traffic_stats(date(timestamp, 'start of month'));
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_service_user_month ON line_traffic_monthly_stats(service, username, year_month);
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_line_month ON line_traffic_monthly_stats(line, year_month);
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_month ON line_traffic_monthly_stats(year_month);
@@ -300,6 +296,8 @@ class DBBase:
         """对现有表进行迁移，添加新字段（幂等操作）"""
         migrations = [
             "ALTER TABLE statistics ADD COLUMN debt_since INTEGER DEFAULT NULL",
+            "CREATE INDEX IF NOT EXISTS idx_user_plex_username_lower ON user(LOWER(plex_username))",
+            "CREATE INDEX IF NOT EXISTS idx_emby_user_username_lower ON emby_user(LOWER(emby_username))",
         ]
         for sql in migrations:
             try:
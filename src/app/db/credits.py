@@ -5,6 +5,8 @@ import sqlite3
 from datetime import date, timedelta
 from typing import List, Optional, Tuple
 
+from app.credits_cache import publish_user_credits
+from app.leaderboard import CHECKIN_TOTAL, DONATION, member_rank, refresh_members
 from app.log import logger
 
 
@@ -46,6 +48,12 @@ class CreditsMixin:
                 logger.error("update_user_credits: 缺少必要参数 (tg_id/plex_id/emby_id)")
                 return False
             self.con.commit()
+            publish_user_credits(
+                self,
+                tg_ids=[tg_id],
+                plex_ids=[] if tg_id else [plex_id],
+                emby_ids=[] if tg_id or plex_id else [emby_id],
+            )
             return True
         except sqlite3.IntegrityError as e:
             logger.error(f"更新积分时数据完整性错误: {e}")
@@ -81,6 +89,7 @@ class CreditsMixin:
                 "UPDATE statistics SET donation=? WHERE tg_id=?", (donation, tg_id)
             )
             self.con.commit()
+            refresh_members(self, DONATION, [tg_id])
             return True
         except sqlite3.IntegrityError as e:
             logger.error(f"更新捐赠金额时数据完整性错误: {e}")
@@ -180,6 +189,7 @@ class CreditsMixin:
                 (tg_id, checkin_date, streak, month, credits_earned),
             )
             self.con.commit()
+            refresh_members(self, CHECKIN_TOTAL, [tg_id])
             return True
         except Exception as e:
             logger.error(f"添加签到记录失败: {e}")
@@ -203,33 +213,8 @@ class CreditsMixin:
 
     def get_checkin_total_rank(self, tg_id: int):
         """获取用户按累计签到天数统计的总榜排名，同天数按先签到者优先"""
-        current = self.cur.execute(
-            """
-            SELECT COUNT(*) AS total_days, MAX(id) AS last_checkin_id
-            FROM checkin_stats
-            WHERE tg_id = ?
-            """,
-            (tg_id,),
-        ).fetchone()
-        total_count = current["total_days"] if current else 0
-        last_checkin_id = current["last_checkin_id"] if current else None
-        if total_count <= 0 or last_checkin_id is None:
-            return None
-
-        row = self.cur.execute(
-            """
-            SELECT COUNT(*) FROM (
-                SELECT tg_id, COUNT(*) AS total_days, MAX(id) AS last_checkin_id
-                FROM checkin_stats
-                GROUP BY tg_id
-                HAVING COUNT(*) > ?
-                    OR (COUNT(*) = ? AND MAX(id) < ?)
-            )
-            """,
-            (total_count, total_count, last_checkin_id),
-        ).fetchone()
-        higher_count = row[0] if row else 0
-        return higher_count + 1
+        rank = member_rank(self, CHECKIN_TOTAL, tg_id)
+        return rank[0] if rank else None
 
     def get_checkin_monthly_leaderboard(self, month: str) -> List[sqlite3.Row]:
         """获取某月签到天数排行，同天数按先签到者优先"""
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""数据库连接池 - 进程内共享的长连接
+
+建表/迁移只在首次创建连接池时执行一次，之后借出的连接都已应用 PRAGMA，
+请求级使用只需借出和归还连接。
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Union
+
+from app.config import settings
+from app.db_legacy import DB
+from app.log import logger
+
+
+class ConnectionPool:
+    """SQLite 连接池"""
+
+    def __init__(self, db_path: Union[Path, str], size: int = 8) -> None:
+        self.db_path = db_path
+        self.size = size
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+        # 首次创建时执行建表与迁移
+        con = self._new_connection()
+        DB(db=db_path, con=con)
+        self._idle.put(con)
+
+    def _new_connection(self) -> sqlite3.Connection:
+        con = DB.connect(self.db_path)
+        self._created += 1
+        return con
+
+    def acquire(self, timeout: float = 30.0) -> sqlite3.Connection:
+        """借出连接，池满时等待其他请求归还"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                return self._new_connection()
+        return self._idle.get(timeout=timeout)
+
+    def release(self, con: sqlite3.Connection) -> None:
+        """归还连接，未提交的事务会被回滚"""
+        if self._closed:
+            con.close()
+            return
+        try:
+            if con.in_transaction:
+                con.rollback()
+        except sqlite3.ProgrammingError:
+            # 连接已被关闭，补充一个新连接
+            with self._lock:
+                self._created -= 1
+            return
+        self._idle.put(con)
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        con = self.acquire()
+        try:
+            yield con
+        finally:
+            self.release(con)
+
+    @contextmanager
+    def db(self) -> Iterator[DB]:
+        """借出连接并包装为 DB 实例"""
+        with self.connection() as con:
+            yield DB(db=self.db_path, con=con)
+
+    def close(self) -> None:
+        self._closed = True
+        while True:
+            try:
+                con = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                con.close()
+            except Exception as e:
+                logger.error(f"关闭数据库连接时出错: {e}")
+
+
+_pools: dict = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Optional[Union[Path, str]] = None) -> ConnectionPool:
+    """获取当前进程的连接池（gunicorn fork 后每个 worker 各自创建）"""
+    db_path = db_path or settings.DATA_PATH / "data.db"
+    key = (os.getpid(), os.path.abspath(str(db_path)))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(key)
+            if pool is None:
+                pool = ConnectionPool(db_path, size=settings.DB_POOL_SIZE)
+                _pools[key] = pool
+    return pool
+
+
+def close_pools() -> None:
+    with _pools_lock:
+        for key in [key for key in _pools if key[0] == os.getpid()]:
+            _pools.pop(key).close()
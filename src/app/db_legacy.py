@@ -1,14 +1,23 @@
 #!/usr/bin/env python3
 
+import os
 import sqlite3
 import threading
 import time
 import traceback
-from datetime import date, datetime, timedelta
+from datetime import date, datetime, timedelta, timezone
 from typing import List, Optional
 
 from app.config import settings
+from app.credits_cache import publish_user_credits
 from app.invitation_utils import get_invitation_timestamps
+from app.leaderboard import (
+    CHECKIN_TOTAL,
+    DONATION,
+    checkin_total_leaderboard,
+    member_rank,
+    refresh_members,
+)
 from app.log import logger
 
 CHECKIN_TOTAL_RANK_MEDALS = (
@@ -63,51 +72,76 @@ class DB:
     """class DB with thread-safe connection management"""
 
     _local = threading.local()
-
-    def __init__(self, db=settings.DATA_PATH / "data.db"):
+    # 已完成建表/迁移的数据库文件，每个进程只需执行一次
+    _schema_ready: set = set()
+    _schema_lock = threading.Lock()
+    # 流量记录按月分区，表名为前缀加 YYYYMM，line_traffic_stats 为合并所有分区的视图
+    _TRAFFIC_PARTITION_PREFIX = "line_traffic_stats_"
+    # 分区前的单表改名后等待后台迁移，迁移完成后删除
+    _TRAFFIC_LEGACY_TABLE = "line_traffic_stats_legacy"
+
+    def __init__(
+        self,
+        db=settings.DATA_PATH / "data.db",
+        con: Optional[sqlite3.Connection] = None,
+    ):
+        """
+        Args:
+            db: 数据库文件路径
+            con: 外部借出的连接（如连接池），传入时由调用方负责归还
+        """
         self.db_path = db
+        self._con = con
+        schema_key = os.path.abspath(str(db))
+        needs_schema = (
+            schema_key not in DB._schema_ready or not os.path.exists(schema_key)
+        )
         self._ensure_connection()
-        self.create_table()
-        # executescript() 会关闭连接，需要重新确保连接可用
-        self._ensure_connection()
+        if needs_schema:
+            with DB._schema_lock:
+                self.create_table()
+                # executescript() 会关闭连接，需要重新确保连接可用
+                self._ensure_connection()
+                DB._schema_ready.add(schema_key)
+
+    @staticmethod
+    def connect(db_path) -> sqlite3.Connection:
+        """创建已应用 PRAGMA 的新连接"""
+        con = sqlite3.connect(
+            db_path,
+            check_same_thread=False,
+            timeout=30.0  # 30秒超时
+        )
+        con.row_factory = sqlite3.Row
+        # 启用 WAL 模式提高并发性能
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA busy_timeout=30000")  # 30秒忙等待
+        con.execute("PRAGMA temp_store=MEMORY")
+        return con
 
     def _ensure_connection(self):
         """Ensure thread-local connection exists and is open"""
-        # 检查连接是否存在且未关闭
-        needs_new_connection = (
-            not hasattr(self._local, 'con') or
-            self._local.con is None
-        )
-
-        # 如果连接存在，检查是否已关闭
-        if not needs_new_connection:
+        if self._con is not None:
+            return
+        con = getattr(self._local, "con", None)
+        if con is not None:
             try:
-                # 尝试执行简单查询来验证连接是否可用
-                self._local.con.execute("SELECT 1")
-            except (sqlite3.ProgrammingError, sqlite3.OperationalError):
-                # 连接已关闭，需要重新创建
-                needs_new_connection = True
+                # 已关闭的连接访问属性会抛出 ProgrammingError，无需执行查询探测
+                con.total_changes
+                return
+            except sqlite3.ProgrammingError:
                 self._local.con = None
-
-        if needs_new_connection:
-            self._local.con = sqlite3.connect(
-                self.db_path,
-                check_same_thread=False,
-                timeout=30.0  # 30秒超时
-            )
-            self._local.con.row_factory = sqlite3.Row
-            # 启用 WAL 模式提高并发性能
-            self._local.con.execute("PRAGMA journal_mode=WAL")
-            self._local.con.execute("PRAGMA busy_timeout=30000")  # 30秒忙等待
+        self._local.con = self.connect(self.db_path)
 
     def _get_cursor(self):
         """Get a fresh cursor for the current thread"""
-        self._ensure_connection()
-        return self._local.con.cursor()
+        return self.con.cursor()
 
     @property
     def con(self):
         """Get thread-local connection"""
+        if self._con is not None:
+            return self._con
         self._ensure_connection()
         return self._local.con
 
@@ -198,16 +232,6 @@ class DB:
                 date TEXT NOT NULL
             );
 
-            CREATE TABLE IF NOT EXISTS line_traffic_stats(
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                line TEXT NOT NULL,
-                send_bytes INTEGER NOT NULL,
-                service TEXT NOT NULL,
-                username TEXT NOT NULL,
-                user_id TEXT DEFAULT NULL,
-                timestamp TEXT NOT NULL
-            );
-
             -- 月度流量聚合表
             CREATE TABLE IF NOT EXISTS line_traffic_monthly_stats(
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -232,6 +256,15 @@ class DB:
                 UNIQUE(tg_id)
             );
 
+            -- 群组成员状态：ChatMember 事件实时写入，定时对账只复核未知或过期的记录
+            CREATE TABLE IF NOT EXISTS group_member_status(
+                tg_id INTEGER PRIMARY KEY,
+                group_id INTEGER,
+                is_member INTEGER NOT NULL,
+                source TEXT NOT NULL DEFAULT 'sweep',
+                checked_at INTEGER NOT NULL
+            );
+
             CREATE TABLE IF NOT EXISTS shared_proxy_profile(
                 tg_id INTEGER PRIMARY KEY,
                 custom_domain TEXT NOT NULL,
@@ -244,16 +277,6 @@ class DB:
                 updated_at INTEGER DEFAULT (strftime('%s', 'now'))
             );
 
-            -- 索引优化：为 line_traffic_stats 表添加关键索引（当月数据）
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_timestamp ON line_traffic_stats(timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_service_timestamp ON line_traffic_stats(service, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_service_user_time ON line_traffic_stats(service, username, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_line_time ON line_traffic_stats(line, timestamp);
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_daily_query ON line_traffic_stats(service, username, date(timestamp));
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_line_stats ON line_traffic_stats(line, timestamp, send_bytes);
-            -- 添加月份索引，用于快速识别和处理当月数据
-            CREATE INDEX IF NOT EXISTS idx_line_traffic_month ON line_traffic_stats(date(timestamp, 'start of month'));
-
             -- 索引优化：为 line_traffic_monthly_stats 表添加索引（历史月度数据）
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_service_user_month ON line_traffic_monthly_stats(service, username, year_month);
             CREATE INDEX IF NOT EXISTS idx_monthly_traffic_line_month ON line_traffic_monthly_stats(line, year_month);
@@ -301,10 +324,38 @@ class DB:
 
             CREATE INDEX IF NOT EXISTS idx_user_medals_tg_active
                 ON user_medals(tg_id, is_active);
+
+            -- 勋章数据版本号，任何勋章写入都会递增，用于失效进程内的勋章缓存
+            CREATE TABLE IF NOT EXISTS medal_version(
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            INSERT OR IGNORE INTO medal_version (id, version) VALUES (1, 0);
+
+            CREATE TRIGGER IF NOT EXISTS trg_user_medals_insert_version
+            AFTER INSERT ON user_medals
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS trg_user_medals_update_version
+            AFTER UPDATE ON user_medals
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS trg_user_medals_delete_version
+            AFTER DELETE ON user_medals
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS trg_medal_catalog_insert_version
+            AFTER INSERT ON medal_catalog
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS trg_medal_catalog_update_version
+            AFTER UPDATE ON medal_catalog
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
+            CREATE TRIGGER IF NOT EXISTS trg_medal_catalog_delete_version
+            AFTER DELETE ON medal_catalog
+            BEGIN UPDATE medal_version SET version = version + 1 WHERE id = 1; END;
             """
         )
         self.con.commit()
         self._migrate_legacy_tables()
+        self._migrate_traffic_partitions()
+        self._migrate_line_traffic_rollup()
         self._seed_default_medals()
 
     def _migrate_legacy_tables(self) -> None:
@@ -330,6 +381,240 @@ class DB:
                 pass
         self.con.commit()
 
+    def _migrate_line_traffic_rollup(self) -> None:
+        """创建流量小时汇总表，首次创建时从月度分区回填
+
+        旧表中尚未迁移的记录不在这里回填，由 migrate_legacy_traffic 迁移时逐批累加。
+        """
+        exists = self.cur.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'line_traffic_rollup'"
+        ).fetchone()
+        if exists:
+            return
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.execute(
+                """
+                CREATE TABLE IF NOT EXISTS line_traffic_rollup(
+                    line TEXT NOT NULL,
+                    service TEXT NOT NULL,
+                    username TEXT NOT NULL DEFAULT '',
+                    bucket INTEGER NOT NULL,
+                    send_bytes INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (line, service, username, bucket)
+                )
+                """
+            )
+            self.cur.execute(
+                "CREATE INDEX IF NOT EXISTS idx_line_traffic_rollup_bucket ON line_traffic_rollup(bucket, line)"
+            )
+            partitions = self._traffic_partitions()
+            if partitions:
+                source = " UNION ALL ".join(
+                    f"SELECT line, service, username, ts, send_bytes FROM {name}"
+                    for name in partitions
+                )
+                # bucket 为小时起始时间（Unix 秒）
+                self.cur.execute(
+                    f"""
+                    INSERT INTO line_traffic_rollup (line, service, username, bucket, send_bytes)
+                    SELECT line, service, COALESCE(username, ''), ts / 3600 * 3600 AS bucket,
+                           SUM(send_bytes)
+                    FROM ({source})
+                    WHERE line IS NOT NULL AND service IS NOT NULL
+                    GROUP BY line, service, COALESCE(username, ''), bucket
+                    """
+                )
+            self.con.commit()
+        except Exception as e:
+            self.con.rollback()
+            logger.error(f"创建流量汇总表失败: {e}")
+
+    def _create_traffic_partition(self, name: str) -> None:
+        """创建单月流量分区表（不提交事务）
+
+        ts 为 Unix 秒，username_norm 为小写用户名，写入时由 LOWER() 填充。
+        """
+        self.cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {name}(
+                id INTEGER PRIMARY KEY,
+                line TEXT NOT NULL,
+                send_bytes INTEGER NOT NULL,
+                service TEXT NOT NULL,
+                username TEXT NOT NULL,
+                user_id TEXT DEFAULT NULL,
+                ts INTEGER NOT NULL,
+                username_norm TEXT NOT NULL
+            )
+            """
+        )
+        # 单个用户按日查询流量的覆盖索引，包含 line 以支持只统计 premium 线路
+        self.cur.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{name}_service_norm_ts ON {name}(service, username_norm, ts, send_bytes, line)"
+        )
+        # 流量排行的覆盖索引，按时间范围扫描时无需回表
+        self.cur.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_{name}_service_ts_norm ON {name}(service, ts, username_norm, user_id, send_bytes)"
+        )
+
+    def _legacy_traffic_exists(self) -> bool:
+        return (
+            self.cur.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (self._TRAFFIC_LEGACY_TABLE,),
+            ).fetchone()
+            is not None
+        )
+
+    def _legacy_traffic_select(self) -> str:
+        """按分区的列格式读取未迁移旧表的查询，strftime('%s') 会按时间戳自带的时区换算为 UTC"""
+        return f"""
+            SELECT id, line, send_bytes, service, username, user_id,
+                   CAST(strftime('%s', timestamp) AS INTEGER) AS ts,
+                   COALESCE(username_norm, LOWER(username)) AS username_norm
+            FROM {self._TRAFFIC_LEGACY_TABLE}
+        """
+
+    def _adopt_legacy_traffic_table(self) -> bool:
+        """把旧的单表 line_traffic_stats 改名为待迁移表（不提交事务），返回是否改名
+
+        改名只修改表结构，不复制数据；数据由 migrate_legacy_traffic 在后台分批迁移。
+        """
+        row = self.cur.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'line_traffic_stats'"
+        ).fetchone()
+        if row is None or row[0] != "table":
+            return False
+        self.cur.execute(f"ALTER TABLE line_traffic_stats RENAME TO {self._TRAFFIC_LEGACY_TABLE}")
+        columns = {
+            column[1]
+            for column in self.cur.execute(f"PRAGMA table_info({self._TRAFFIC_LEGACY_TABLE})")
+        }
+        if "username_norm" not in columns:
+            self.cur.execute(f"ALTER TABLE {self._TRAFFIC_LEGACY_TABLE} ADD COLUMN username_norm TEXT")
+        return True
+
+    def _rebuild_traffic_view(self) -> None:
+        """按现有分区重建 line_traffic_stats 视图（不提交事务）
+
+        视图上的 ts / service 等条件会下推到每个分区，仍能使用分区上的索引。
+        旧表迁移完成前，视图同时包含旧表中尚未迁移的记录。
+        """
+        self._adopt_legacy_traffic_table()
+        partitions = self._traffic_partitions()
+        if not partitions:
+            partitions = [self._traffic_partition_name(int(time.time()))]
+            self._create_traffic_partition(partitions[0])
+        selects = [
+            f"SELECT id, line, send_bytes, service, username, user_id, ts, username_norm FROM {name}"
+            for name in partitions
+        ]
+        if self._legacy_traffic_exists():
+            selects.append(self._legacy_traffic_select())
+        self.cur.execute("DROP VIEW IF EXISTS line_traffic_stats")
+        self.cur.execute("CREATE VIEW line_traffic_stats AS " + " UNION ALL ".join(selects))
+
+    def _migrate_traffic_partitions(self) -> None:
+        """把流量记录迁移到按月分区的表中
+
+        原来的 line_traffic_stats 是单表，timestamp 为带时区的 ISO 字符串，按字符串比较
+        时不同时区偏移的记录顺序错误，月度清理也只能整月 DELETE。现在每月一张
+        line_traffic_stats_YYYYMM 表，ts 为 Unix 秒，line_traffic_stats 改为合并所有分区
+        的只读视图；清理某月只需 DROP 对应分区。
+
+        初始化时只把旧表改名并重建视图，不复制数据，不会长时间占用写锁；
+        旧表的数据由 migrate_legacy_traffic 分批迁移，迁移期间视图和查询同时读取旧表。
+        """
+        for sql in [
+            "CREATE INDEX IF NOT EXISTS idx_user_plex_username_lower ON user(LOWER(plex_username))",
+            "CREATE INDEX IF NOT EXISTS idx_emby_user_username_lower ON emby_user(LOWER(emby_username))",
+        ]:
+            try:
+                self.cur.execute(sql)
+            except Exception as e:
+                logger.error(f"创建用户名索引失败: {e}")
+        self.con.commit()
+
+        try:
+            self.cur.execute("BEGIN IMMEDIATE")
+            row = self.cur.execute(
+                "SELECT type FROM sqlite_master WHERE name = 'line_traffic_stats'"
+            ).fetchone()
+            if row is not None and row[0] == "view":
+                self.con.commit()
+                return
+            self._rebuild_traffic_view()
+            self.con.commit()
+        except Exception as e:
+            # 下次初始化或创建新分区重建视图时会再次尝试改名
+            self.con.rollback()
+            logger.error(f"迁移流量分区表失败: {e}")
+
+    def legacy_traffic_pending(self) -> bool:
+        """旧 line_traffic_stats 表是否仍有待迁移的记录"""
+        return self._legacy_traffic_exists()
+
+    def migrate_legacy_traffic(self, batch_size: int = 2000, pause: float = 0.05) -> int:
+        """把旧表的记录按 id 范围分批迁移到月度分区，返回迁移的记录数
+
+        每批在同一个事务中写入分区、累加到小时汇总表并从旧表删除，单独提交后短暂
+        让出写锁，原始记录的查询在迁移期间不会重复或遗漏。旧表清空后删除旧表并重建视图。
+        时间无法解析的记录直接丢弃。
+        """
+        total = dropped = 0
+        while True:
+            try:
+                self.cur.execute("BEGIN IMMEDIATE")
+                if not self._legacy_traffic_exists():
+                    self.con.commit()
+                    break
+                first_id = self.cur.execute(
+                    f"SELECT MIN(id) FROM {self._TRAFFIC_LEGACY_TABLE}"
+                ).fetchone()[0]
+                if first_id is None:
+                    self.cur.execute(f"DROP TABLE {self._TRAFFIC_LEGACY_TABLE}")
+                    self._rebuild_traffic_view()
+                    self.con.commit()
+                    logger.info(f"旧流量表迁移完成，共迁移 {total} 条记录")
+                    break
+                rows = self.cur.execute(
+                    f"""
+                    SELECT line, send_bytes, service, username, user_id, ts, username_norm
+                    FROM ({self._legacy_traffic_select()})
+                    WHERE id >= ? AND id < ?
+                    """,
+                    (first_id, first_id + batch_size),
+                ).fetchall()
+                partitions: dict = {}
+                for row in rows:
+                    if row[5] is None:
+                        dropped += 1
+                        continue
+                    partitions.setdefault(self._traffic_partition_name(row[5]), []).append(tuple(row))
+                self._ensure_traffic_partitions(partitions)
+                for name, partition_rows in partitions.items():
+                    self.cur.executemany(
+                        f"INSERT INTO {name} (line, send_bytes, service, username, user_id, ts, username_norm) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        partition_rows,
+                    )
+                    # 汇总表只回填了分区中的记录，旧表记录在迁移时累加
+                    self._upsert_line_traffic_rollup([row[:6] for row in partition_rows])
+                self.cur.execute(
+                    f"DELETE FROM {self._TRAFFIC_LEGACY_TABLE} WHERE id >= ? AND id < ?",
+                    (first_id, first_id + batch_size),
+                )
+                self.con.commit()
+            except Exception as e:
+                self.con.rollback()
+                logger.error(f"迁移旧流量记录失败: {e}")
+                break
+            total += sum(len(partition_rows) for partition_rows in partitions.values())
+            time.sleep(pause)
+        if dropped:
+            logger.warning(f"{dropped} 条流量记录的时间无法解析，迁移时已丢弃")
+        return total
+
     def _seed_default_medals(self) -> None:
         """写入默认勋章配置"""
         try:
@@ -571,6 +856,12 @@ class DB:
             return False
         else:
             self.con.commit()
+            publish_user_credits(
+                self,
+                tg_ids=[tg_id],
+                plex_ids=[] if tg_id else [plex_id],
+                emby_ids=[] if tg_id or plex_id else [emby_id],
+            )
         return True
 
     def get_user_credits(self, tg_id):
@@ -598,6 +889,7 @@ class DB:
             return False
         else:
             self.con.commit()
+            refresh_members(self, DONATION, [tg_id])
         return True
 
     def transfer_tg_binding_assets(
@@ -857,6 +1149,9 @@ class DB:
             )
 
             self.con.commit()
+            publish_user_credits(self, tg_ids=[old_tg_id, new_tg_id])
+            for board_name in (DONATION, CHECKIN_TOTAL):
+                refresh_members(self, board_name, [old_tg_id, new_tg_id])
             return {
                 "fee_amount": fee,
                 "remaining_credits": remaining_credits,
@@ -1047,23 +1342,33 @@ class DB:
         return [self._normalize_medal_row(row) for row in rows]
 
     def get_checkin_total_leaderboard(self, limit: int = 3):
-        return self.cur.execute(
-            """
-            SELECT tg_id, COUNT(*) AS total_days, MAX(id) AS last_checkin_id
-            FROM checkin_stats
-            GROUP BY tg_id
-            ORDER BY total_days DESC, last_checkin_id ASC, tg_id ASC
-            LIMIT ?
-            """,
-            (limit,),
-        ).fetchall()
+        return checkin_total_leaderboard(self, limit)
 
     def sync_checkin_total_rank_medals(self):
+        """按累计签到总榜前几名发放总榜勋章
+
+        由签到、换绑等会改变总榜的写入路径调用；持有者没有变化时只读不写，
+        不会占用数据库写锁。
+        """
         medal_codes = [medal["code"] for medal in CHECKIN_TOTAL_RANK_MEDALS]
         leaderboard = self.get_checkin_total_leaderboard(limit=len(CHECKIN_TOTAL_RANK_MEDALS))
         now_ts = int(time.time())
         placeholders = ",".join("?" for _ in medal_codes)
 
+        expected_holders = sorted(
+            (medal["code"], row["tg_id"])
+            for medal, row in zip(CHECKIN_TOTAL_RANK_MEDALS, leaderboard)
+        )
+        current_holders = self.cur.execute(
+            f"""
+            SELECT medal_code, tg_id FROM user_medals
+            WHERE medal_code IN ({placeholders}) AND is_active = 1
+            """,
+            tuple(medal_codes),
+        ).fetchall()
+        if sorted(tuple(row) for row in current_holders) == expected_holders:
+            return leaderboard
+
         try:
             cursor = self.cur
             cursor.execute("BEGIN IMMEDIATE")
@@ -1101,6 +1406,12 @@ class DB:
             logger.error(f"同步签到总榜勋章失败: {e}")
             return []
 
+    def get_medal_version(self) -> int:
+        row = self.cur.execute(
+            "SELECT version FROM medal_version WHERE id = 1"
+        ).fetchone()
+        return row[0] if row else 0
+
     def get_users_medals_map(self, tg_ids):
         if not tg_ids:
             return {}
@@ -1153,7 +1464,6 @@ class DB:
         return round(multiplier, 4)
 
     def get_medal_shop_payload(self, tg_id: int):
-        self.sync_checkin_total_rank_medals()
         owned_medals = self.get_user_medals(tg_id)
         owned_codes = {medal["code"] for medal in owned_medals}
         shop_rows = self.cur.execute(
@@ -1261,6 +1571,7 @@ class DB:
                 (tg_id, medal_code, int(time.time())),
             )
             self.con.commit()
+            publish_user_credits(self, tg_ids=[tg_id])
         except Exception as e:
             self.con.rollback()
             logger.error(f"购买勋章失败: {e}")
@@ -1822,6 +2133,10 @@ class DB:
                 )
 
             self.con.commit()
+            publish_user_credits(
+                self,
+                tg_ids=[a["winner_id"] for a in finished_auctions if a["credits_reduced"]],
+            )
             return finished_auctions
         except Exception as e:
             logger.error(f"Error finishing expired auctions: {e}")
@@ -2050,6 +2365,8 @@ class DB:
             )
 
             self.con.commit()
+            if credits_reduced:
+                publish_user_credits(self, tg_ids=[winner_id])
             return True, {
                 "id": auction_id,
                 "title": auction["title"],
@@ -2742,6 +3059,109 @@ class DB:
                 "premium_emby_users": 0,
             }
 
+    @staticmethod
+    def _traffic_epoch(timestamp) -> int:
+        """把流量记录的时间（Unix 秒或 ISO 字符串）转换为 Unix 秒，不带时区的按 UTC 处理"""
+        if isinstance(timestamp, (int, float)):
+            return int(timestamp)
+        dt = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return int(dt.timestamp())
+
+    @classmethod
+    def _traffic_bucket(cls, timestamp) -> int:
+        """计算流量记录所属的小时桶（Unix 秒）"""
+        return cls._traffic_epoch(timestamp) // 3600 * 3600
+
+    @classmethod
+    def _traffic_partition_name(cls, ts: int) -> str:
+        """流量记录所在的月度分区表名，按 settings.TZ 的自然月划分"""
+        return cls._TRAFFIC_PARTITION_PREFIX + datetime.fromtimestamp(ts, settings.TZ).strftime("%Y%m")
+
+    def _traffic_partitions(self) -> list:
+        """现有的月度分区表名，按月份升序"""
+        rows = self.cur.execute(
+            """
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name GLOB ?
+            ORDER BY name
+            """,
+            (self._TRAFFIC_PARTITION_PREFIX + "[0-9]" * 6,),
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _traffic_source(self, columns: str, start_ts: int, end_ts: int) -> Optional[str]:
+        """由覆盖 [start_ts, end_ts] 的月度分区组成的子查询，没有对应分区时返回 None
+
+        与直接查询视图相比，只读取需要的列（可以使用分区上的覆盖索引），
+        也不会访问范围之外的分区。旧表迁移完成前同时读取旧表。
+        """
+        first = self._traffic_partition_name(start_ts)
+        last = self._traffic_partition_name(end_ts)
+        selects = [
+            f"SELECT {columns} FROM {name}"
+            for name in self._traffic_partitions()
+            if first <= name <= last
+        ]
+        if self._legacy_traffic_exists():
+            selects.append(f"SELECT {columns} FROM ({self._legacy_traffic_select()})")
+        if not selects:
+            return None
+        return "(" + " UNION ALL ".join(selects) + ")"
+
+    def _ensure_traffic_partitions(self, names) -> None:
+        """创建缺失的月度分区并重建视图（不提交事务，随本批写入一起提交）"""
+        existing = set(self._traffic_partitions())
+        missing = [name for name in names if name not in existing]
+        if not missing:
+            return
+        if not self.con.in_transaction:
+            self.cur.execute("BEGIN IMMEDIATE")
+        for name in missing:
+            self._create_traffic_partition(name)
+        self._rebuild_traffic_view()
+
+    def _insert_line_traffic_rows(self, rows) -> None:
+        """按月份把流量记录写入分区表，并累加到小时汇总表（不提交事务）
+
+        Args:
+            rows: (line, send_bytes, service, username, user_id, timestamp) 元组列表
+        """
+        partitions: dict = {}
+        for line, send_bytes, service, username, user_id, timestamp in rows:
+            ts = self._traffic_epoch(timestamp)
+            partitions.setdefault(self._traffic_partition_name(ts), []).append(
+                (line, send_bytes, service, username, user_id, ts)
+            )
+        self._ensure_traffic_partitions(partitions)
+        for name, partition_rows in partitions.items():
+            self.cur.executemany(
+                f"INSERT INTO {name} (line, send_bytes, service, username, user_id, ts, username_norm) VALUES (?1, ?2, ?3, ?4, ?5, ?6, LOWER(?4))",
+                partition_rows,
+            )
+        self._upsert_line_traffic_rollup(rows)
+
+    def _upsert_line_traffic_rollup(self, rows) -> None:
+        """把原始流量记录累加到小时汇总表（不提交事务）
+
+        Args:
+            rows: (line, send_bytes, service, username, user_id, timestamp) 元组列表
+        """
+        totals: dict = {}
+        for line, send_bytes, service, username, _user_id, timestamp in rows:
+            key = (line, service, username or "", self._traffic_bucket(timestamp))
+            totals[key] = totals.get(key, 0) + int(send_bytes or 0)
+        self.cur.executemany(
+            """
+            INSERT INTO line_traffic_rollup (line, service, username, bucket, send_bytes)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(line, service, username, bucket)
+            DO UPDATE SET send_bytes = send_bytes + excluded.send_bytes
+            """,
+            [(*key, total) for key, total in totals.items()],
+        )
+
     def create_line_traffic_entry(
         self,
         line: str,
@@ -2751,98 +3171,148 @@ class DB:
         user_id: str,
         timestamp: str,
     ):
+        row = (line, send_bytes, service, username, user_id, timestamp)
         try:
-            self.cur.execute(
-                "INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
-                (line, send_bytes, service, username, user_id, timestamp),
-            )
+            self._insert_line_traffic_rows([row])
         except Exception as e:
+            self.con.rollback()
             logger.error(f"Error creating line traffic entry: {e}")
             return False
         else:
             self.con.commit()
             return True
 
-    def get_premium_line_traffic_statistics(self):
-        """获取Premium线路流量统计信息"""
+    def create_line_traffic_entries(self, rows) -> bool:
+        """批量写入流量记录，整批在同一个事务中提交
+
+        Args:
+            rows: (line, send_bytes, service, username, user_id, timestamp) 元组列表
+
+        Returns:
+            bool: 整批写入成功返回 True，失败时整批回滚并返回 False
+        """
+        rows = list(rows)
+        if not rows:
+            return True
         try:
-            now = datetime.now(settings.TZ)
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=now.weekday())
-            month_start = today_start.replace(day=1)
+            self._insert_line_traffic_rows(rows)
+        except Exception as e:
+            self.con.rollback()
+            logger.error(f"Error creating line traffic entries in batch: {e}")
+            return False
+        else:
+            self.con.commit()
+            return True
 
-            # 动态从数据库获取所有实际使用的线路（排除估算数据）
-            get_lines_query = """
+    def get_line_traffic_usernames(self, line: str, service: str, since: int) -> set:
+        """获取指定线路自 since（Unix 秒）以来有流量记录的用户名（小写）"""
+        rows = self.cur.execute(
+            """
+            SELECT DISTINCT username_norm FROM line_traffic_stats
+            WHERE service = ? AND ts >= ? AND line = ?
+            """,
+            (service, since, line),
+        ).fetchall()
+        return {row[0] for row in rows if row[0]}
+
+    @staticmethod
+    def _traffic_period_starts():
+        """返回今日、本周、本月的起始时间"""
+        now = datetime.now(settings.TZ)
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        week_start = today_start - timedelta(days=now.weekday())
+        month_start = today_start.replace(day=1)
+        return today_start, week_start, month_start
+
+    def _get_rollup_lines(self) -> list:
+        """从汇总表获取所有实际使用的线路（排除估算数据）"""
+        rows = self.cur.execute(
+            """
             SELECT DISTINCT line
-            FROM line_traffic_stats
+            FROM line_traffic_rollup
             WHERE line NOT LIKE '%estimate%'
             ORDER BY line
             """
-            lines_result = self.cur.execute(get_lines_query).fetchall()
-            premium_lines = [row[0] for row in lines_result]
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _get_rollup_line_summaries(self) -> dict:
+        """从小时汇总表一次性计算各线路今日/本周/本月流量、今日活跃用户和本月前五用户"""
+        today_start, week_start, month_start = self._traffic_period_starts()
+        params = {
+            "today": int(today_start.timestamp()),
+            "week": int(week_start.timestamp()),
+            "month": int(month_start.timestamp()),
+            "since": int(min(week_start, month_start).timestamp()),
+        }
+        summaries = {}
+        rows = self.cur.execute(
+            """
+            SELECT line,
+                   SUM(CASE WHEN bucket >= :today THEN send_bytes ELSE 0 END),
+                   SUM(CASE WHEN bucket >= :week THEN send_bytes ELSE 0 END),
+                   SUM(CASE WHEN bucket >= :month THEN send_bytes ELSE 0 END),
+                   COUNT(DISTINCT CASE WHEN bucket >= :today THEN NULLIF(username, '') END)
+            FROM line_traffic_rollup
+            WHERE bucket >= :since
+            GROUP BY line
+            """,
+            params,
+        ).fetchall()
+        for line, today, week, month, active_users in rows:
+            summaries[line] = {
+                "today_traffic": today,
+                "week_traffic": week,
+                "month_traffic": month,
+                "active_users": active_users,
+                "top_users": [],
+            }
+
+        top_rows = self.cur.execute(
+            """
+            SELECT line, username, total_traffic
+            FROM (
+                SELECT line, NULLIF(username, '') AS username,
+                       SUM(send_bytes) AS total_traffic,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY line ORDER BY SUM(send_bytes) DESC
+                       ) AS rn
+                FROM line_traffic_rollup
+                WHERE bucket >= :month
+                GROUP BY line, username
+            )
+            WHERE rn <= 5
+            ORDER BY line, total_traffic DESC
+            """,
+            params,
+        ).fetchall()
+        for line, username, traffic in top_rows:
+            if line in summaries:
+                summaries[line]["top_users"].append(
+                    {"username": username, "traffic": traffic}
+                )
+        return summaries
+
+    def get_premium_line_traffic_statistics(self):
+        """获取Premium线路流量统计信息"""
+        try:
+            premium_lines = self._get_rollup_lines()
 
             # 如果数据库中没有线路，回退到配置文件
             if not premium_lines:
                 premium_lines = settings.PREMIUM_STREAM_BACKEND
 
+            summaries = self._get_rollup_line_summaries()
             line_stats = []
-
             for line in premium_lines:
-                # 计算今日流量
-                today_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                today_traffic = self.cur.execute(
-                    today_traffic_query, (line, today_start.isoformat())
-                ).fetchone()[0]
-
-                # 计算本周流量
-                week_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                week_traffic = self.cur.execute(
-                    week_traffic_query, (line, week_start.isoformat())
-                ).fetchone()[0]
-
-                # 计算本月流量
-                month_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                """
-                month_traffic = self.cur.execute(
-                    month_traffic_query, (line, month_start.isoformat())
-                ).fetchone()[0]
-
-                # 获取当前线路流量排名前五的用户（基于本月数据）
-                top_users_query = """
-                SELECT username, SUM(send_bytes) as total_traffic
-                FROM line_traffic_stats 
-                WHERE line = ? AND timestamp >= ?
-                GROUP BY username 
-                ORDER BY total_traffic DESC 
-                LIMIT 5
-                """
-                top_users_result = self.cur.execute(
-                    top_users_query, (line, month_start.isoformat())
-                ).fetchall()
-
-                top_users = []
-                for user_data in top_users_result:
-                    username, traffic = user_data
-                    top_users.append({"username": username, "traffic": traffic})
-
+                summary = summaries.get(line, {})
                 line_stats.append(
                     {
                         "line": line,
-                        "today_traffic": today_traffic,
-                        "week_traffic": week_traffic,
-                        "month_traffic": month_traffic,
-                        "top_users": top_users,
+                        "today_traffic": summary.get("today_traffic", 0),
+                        "week_traffic": summary.get("week_traffic", 0),
+                        "month_traffic": summary.get("month_traffic", 0),
+                        "top_users": summary.get("top_users", []),
                     }
                 )
 
@@ -2855,98 +3325,26 @@ class DB:
     def get_all_lines_traffic_statistics(self):
         """获取所有线路（普通+高级）的流量统计信息"""
         try:
-            now = datetime.now(settings.TZ)
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=now.weekday())
-            month_start = today_start.replace(day=1)
-
-            # 动态从数据库获取所有实际使用的线路（排除估算数据）
-            get_lines_query = """
-            SELECT DISTINCT line
-            FROM line_traffic_stats
-            WHERE line NOT LIKE '%estimate%'
-            ORDER BY line
-            """
-            lines_result = self.cur.execute(get_lines_query).fetchall()
-            all_lines = [row[0] for row in lines_result]
+            all_lines = self._get_rollup_lines()
 
             # 如果数据库中没有线路，回退到配置文件
             if not all_lines:
                 all_lines = list(set(settings.STREAM_BACKEND + settings.PREMIUM_STREAM_BACKEND))
 
+            summaries = self._get_rollup_line_summaries()
             line_stats = []
-
             for line in all_lines:
-                # 判断线路类型
-                is_premium = line in settings.PREMIUM_STREAM_BACKEND
-
-                # 计算今日流量
-                today_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats
-                WHERE line = ? AND timestamp >= ?
-                """
-                today_traffic = self.cur.execute(
-                    today_traffic_query, (line, today_start.isoformat())
-                ).fetchone()[0]
-
-                # 计算本周流量
-                week_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats
-                WHERE line = ? AND timestamp >= ?
-                """
-                week_traffic = self.cur.execute(
-                    week_traffic_query, (line, week_start.isoformat())
-                ).fetchone()[0]
-
-                # 计算本月流量
-                month_traffic_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats
-                WHERE line = ? AND timestamp >= ?
-                """
-                month_traffic = self.cur.execute(
-                    month_traffic_query, (line, month_start.isoformat())
-                ).fetchone()[0]
-
-                # 获取当前线路使用人数（今日活跃用户）
-                active_users_query = """
-                SELECT COUNT(DISTINCT username)
-                FROM line_traffic_stats
-                WHERE line = ? AND timestamp >= ?
-                """
-                active_users = self.cur.execute(
-                    active_users_query, (line, today_start.isoformat())
-                ).fetchone()[0]
-
-                # 获取当前线路流量排名前五的用户（基于本月数据）
-                top_users_query = """
-                SELECT username, SUM(send_bytes) as total_traffic
-                FROM line_traffic_stats
-                WHERE line = ? AND timestamp >= ?
-                GROUP BY username
-                ORDER BY total_traffic DESC
-                LIMIT 5
-                """
-                top_users_result = self.cur.execute(
-                    top_users_query, (line, month_start.isoformat())
-                ).fetchall()
-
-                top_users = []
-                for user_data in top_users_result:
-                    username, traffic = user_data
-                    top_users.append({"username": username, "traffic": traffic})
-
+                summary = summaries.get(line, {})
                 line_stats.append(
                     {
                         "line": line,
-                        "is_premium": is_premium,
-                        "today_traffic": today_traffic,
-                        "week_traffic": week_traffic,
-                        "month_traffic": month_traffic,
-                        "active_users": active_users,
-                        "top_users": top_users,
+                        # 判断线路类型
+                        "is_premium": line in settings.PREMIUM_STREAM_BACKEND,
+                        "today_traffic": summary.get("today_traffic", 0),
+                        "week_traffic": summary.get("week_traffic", 0),
+                        "month_traffic": summary.get("month_traffic", 0),
+                        "active_users": summary.get("active_users", 0),
+                        "top_users": summary.get("top_users", []),
                     }
                 )
 
@@ -3068,25 +3466,24 @@ class DB:
             else:
                 date = date.astimezone(settings.TZ)
 
-            # 计算指定日期的开始和结束时间
+            # 计算指定日期的开始和结束时间（Unix 秒）
             day_start = date.replace(hour=0, minute=0, second=0, microsecond=0)
-            day_end = date.replace(hour=23, minute=59, second=59, microsecond=999999)
+            day_start_ts = int(day_start.timestamp())
+            day_end_ts = int((day_start + timedelta(days=1)).timestamp())
 
-            # 判断查询日期是否为当月
-            now = datetime.now(settings.TZ)
-            current_month_start = now.replace(
-                day=1, hour=0, minute=0, second=0, microsecond=0
+            # 查询日期所在月份的原始数据已清理时只有月度总计
+            source = self._traffic_source(
+                "send_bytes, service, username_norm, ts, line", day_start_ts, day_end_ts - 1
             )
-
-            if date >= current_month_start:
-                # 当月数据，从 line_traffic_stats 表查询
+            if source is not None:
+                # 从对应的月度分区查询
                 # 构建查询条件
-                base_conditions = "LOWER(username) = ? AND service = ? AND timestamp >= ? AND timestamp <= ?"
+                base_conditions = "username_norm = LOWER(?) AND service = ? AND ts >= ? AND ts < ?"
                 params = [
-                    username.lower(),
+                    username,
                     service,
-                    day_start.isoformat(),
-                    day_end.isoformat(),
+                    day_start_ts,
+                    day_end_ts,
                 ]
 
                 # 如果只统计 premium 线路
@@ -3106,13 +3503,13 @@ class DB:
                 # 查询特定服务的指定日期流量
                 query = f"""
                 SELECT COALESCE(SUM(send_bytes), 0) as traffic
-                FROM line_traffic_stats 
+                FROM {source}
                 WHERE {base_conditions}
                 """
                 result = self.cur.execute(query, params).fetchone()
                 return result[0] if result else 0
             else:
-                # 历史月份数据，从 line_traffic_monthly_stats 表查询
+                # 已清理月份的数据，只在 line_traffic_monthly_stats 表中保留
                 # 注意：月度表只有月度总计，无法精确到天，返回 0
                 logger.warning(
                     f"无法获取历史日期 {date.strftime('%Y-%m-%d')} 的精确日流量数据"
@@ -3126,76 +3523,50 @@ class DB:
     def get_traffic_statistics(self):
         """获取全面的流量统计信息，包括今日/本周/本月，按服务类型和线路分类"""
         try:
-            now = datetime.now(settings.TZ)
-            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            week_start = today_start - timedelta(days=now.weekday())
-            month_start = today_start.replace(day=1)
-
-            # 获取所有服务类型的流量统计
+            today_start, week_start, month_start = self._traffic_period_starts()
             periods = [
-                ("today", today_start.isoformat()),
-                ("week", week_start.isoformat()),
-                ("month", month_start.isoformat()),
+                ("today", int(today_start.timestamp())),
+                ("week", int(week_start.timestamp())),
+                ("month", int(month_start.timestamp())),
             ]
 
-            result = {}
-
-            for period_name, start_time in periods:
-                # 查询按服务类型分组的流量统计
-                service_query = """
-                SELECT 
-                    service,
-                    COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
-                GROUP BY service
-                """
-                service_results = self.cur.execute(
-                    service_query, (start_time,)
-                ).fetchall()
-
-                # 查询按线路分组的流量统计
-                line_query = """
-                SELECT 
-                    line,
-                    COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
-                GROUP BY line
-                ORDER BY total_traffic DESC
+            # 从小时汇总表一次性按服务类型和线路分组统计三个时间段
+            rows = self.cur.execute(
                 """
-                line_results = self.cur.execute(line_query, (start_time,)).fetchall()
-
-                # 计算总流量
-                total_query = """
-                SELECT COALESCE(SUM(send_bytes), 0) as total_traffic
-                FROM line_traffic_stats 
-                WHERE timestamp >= ?
-                """
-                total_traffic = self.cur.execute(total_query, (start_time,)).fetchone()[
-                    0
-                ]
+                SELECT service, line,
+                       SUM(CASE WHEN bucket >= ? THEN send_bytes ELSE 0 END),
+                       SUM(CASE WHEN bucket >= ? THEN send_bytes ELSE 0 END),
+                       SUM(CASE WHEN bucket >= ? THEN send_bytes ELSE 0 END)
+                FROM line_traffic_rollup
+                WHERE bucket >= ?
+                GROUP BY service, line
+                """,
+                (*[start for _, start in periods], min(start for _, start in periods)),
+            ).fetchall()
 
-                # 构建期间数据
+            result = {}
+            known_lines = settings.STREAM_BACKEND + settings.PREMIUM_STREAM_BACKEND
+            for index, (period_name, _) in enumerate(periods):
                 period_data = {
-                    "total": total_traffic,
+                    "total": 0,
                     "emby": 0,
                     "plex": 0,
                     "lines": [],
                 }
-
-                for service, traffic in service_results:
-                    if service.lower() == "emby":
-                        period_data["emby"] = traffic
-                    elif service.lower() == "plex":
-                        period_data["plex"] = traffic
+                line_traffic: dict = {}
+                for row in rows:
+                    service, line, traffic = row[0], row[1], row[2 + index]
+                    period_data["total"] += traffic
+                    if service.lower() in ("emby", "plex"):
+                        period_data[service.lower()] += traffic
+                    line_traffic[line] = line_traffic.get(line, 0) + traffic
 
                 # 添加线路数据
-                for line, traffic in line_results:
+                for line, traffic in sorted(
+                    line_traffic.items(), key=lambda item: item[1], reverse=True
+                ):
                     # 排除自定义线路
-                    for _line in (
-                        settings.STREAM_BACKEND + settings.PREMIUM_STREAM_BACKEND
-                    ):
+                    for _line in known_lines:
                         if line.lower() in _line.lower():
                             # 只统计已知的线路
                             period_data["lines"].append(
@@ -3252,26 +3623,35 @@ class DB:
                 if end_date > today_end:
                     end_date = today_end
 
-            # 仅当月数据，从 line_traffic_stats 表查询
-            query = """
-            SELECT u.plex_username, lts.user_id, SUM(lts.send_bytes) as total_traffic,
+            # 仅当月数据，只查询范围内的月度分区
+            # 先按用户名聚合再关联用户表，两边都能使用索引；
+            # 子查询列带 TEXT 亲和性会导致表达式索引失效，关联条件中用 + 去掉亲和性
+            start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+            source = self._traffic_source(
+                "service, ts, username_norm, user_id, send_bytes", start_ts, end_ts
+            )
+            if source is None:
+                return []
+            query = f"""
+            SELECT u.plex_username, t.user_id, t.total_traffic,
                    COALESCE(u.is_premium, 0) as is_premium,
                    u.tg_id
-            FROM line_traffic_stats lts
-            LEFT JOIN user u ON LOWER(lts.username) = LOWER(u.plex_username)
-            WHERE lts.service = 'plex' 
-                AND lts.timestamp >= ?
-                AND lts.timestamp <= ?
-                AND lts.username IS NOT NULL
-                AND lts.username != ''
-            GROUP BY LOWER(lts.username), lts.user_id, u.is_premium, u.tg_id
-            ORDER BY total_traffic DESC
+            FROM (
+                SELECT username_norm AS username_key, user_id,
+                       SUM(send_bytes) AS total_traffic
+                FROM {source}
+                WHERE service = 'plex'
+                    AND ts >= ?
+                    AND ts <= ?
+                    AND username_norm != ''
+                GROUP BY username_key, user_id
+            ) t
+            LEFT JOIN user u ON LOWER(u.plex_username) = +t.username_key
+            ORDER BY t.total_traffic DESC
             LIMIT 50
             """
 
-            result = self.cur.execute(
-                query, (start_date.isoformat(), end_date.isoformat())
-            ).fetchall()
+            result = self.cur.execute(query, (start_ts, end_ts)).fetchall()
             return result
 
         except Exception as e:
@@ -3315,25 +3695,32 @@ class DB:
                 if end_date > today_end:
                     end_date = today_end
 
-            query = """
-            SELECT eu.emby_username, lts.user_id, SUM(lts.send_bytes) as total_traffic,
+            start_ts, end_ts = int(start_date.timestamp()), int(end_date.timestamp())
+            source = self._traffic_source(
+                "service, ts, username_norm, user_id, send_bytes", start_ts, end_ts
+            )
+            if source is None:
+                return []
+            query = f"""
+            SELECT eu.emby_username, t.user_id, t.total_traffic,
                    COALESCE(eu.is_premium, 0) as is_premium,
                    eu.tg_id
-            FROM line_traffic_stats lts
-            LEFT JOIN emby_user eu ON LOWER(lts.username) = LOWER(eu.emby_username)
-            WHERE lts.service = 'emby' 
-                AND lts.timestamp >= ?
-                AND lts.timestamp <= ?
-                AND lts.username IS NOT NULL
-                AND lts.username != ''
-            GROUP BY LOWER(lts.username), lts.user_id, eu.is_premium, eu.tg_id
-            ORDER BY total_traffic DESC
+            FROM (
+                SELECT username_norm AS username_key, user_id,
+                       SUM(send_bytes) AS total_traffic
+                FROM {source}
+                WHERE service = 'emby'
+                    AND ts >= ?
+                    AND ts <= ?
+                    AND username_norm != ''
+                GROUP BY username_key, user_id
+            ) t
+            LEFT JOIN emby_user eu ON LOWER(eu.emby_username) = +t.username_key
+            ORDER BY t.total_traffic DESC
             LIMIT 50
             """
 
-            result = self.cur.execute(
-                query, (start_date.isoformat(), end_date.isoformat())
-            ).fetchall()
+            result = self.cur.execute(query, (start_ts, end_ts)).fetchall()
             return result
 
         except Exception as e:
@@ -3382,22 +3769,17 @@ class DB:
             if existing_check > 0:
                 return False, f"月份 {target_month} 的数据已经聚合过，跳过处理"
 
-            # 计算目标月份的开始和结束时间
-            month_start = datetime.strptime(f"{target_month}-01", "%Y-%m-%d").replace(
-                tzinfo=settings.TZ
-            )
-            if month_start.month == 12:
-                next_month_start = month_start.replace(
-                    year=month_start.year + 1, month=1
-                )
-            else:
-                next_month_start = month_start.replace(month=month_start.month + 1)
+            # 旧表迁移完成前，目标月份的记录可能仍在旧表中
+            if self._legacy_traffic_exists():
+                return False, "旧流量表仍在迁移中，请等迁移完成后再聚合"
 
-            month_start_str = month_start.isoformat()
-            next_month_start_str = next_month_start.isoformat()
+            # 目标月份的原始数据都在对应的月度分区中
+            partition = self._TRAFFIC_PARTITION_PREFIX + target_month.replace("-", "")
+            if partition not in self._traffic_partitions():
+                return False, f"月份 {target_month} 没有找到需要聚合的数据"
 
             # 聚合查询：按 line, service, username 分组求和
-            aggregation_query = """
+            aggregation_query = f"""
             SELECT 
                 line,
                 service,
@@ -3405,16 +3787,13 @@ class DB:
                 user_id,
                 SUM(send_bytes) as total_bytes,
                 COUNT(*) as record_count
-            FROM line_traffic_stats 
-            WHERE timestamp >= ? AND timestamp < ?
+            FROM {partition}
             GROUP BY line, service, username
             HAVING SUM(send_bytes) > 0
             ORDER BY total_bytes DESC
             """
 
-            aggregated_data = self.cur.execute(
-                aggregation_query, (month_start_str, next_month_start_str)
-            ).fetchall()
+            aggregated_data = self.cur.execute(aggregation_query).fetchall()
 
             if not aggregated_data:
                 return False, f"月份 {target_month} 没有找到需要聚合的数据"
@@ -3498,34 +3877,34 @@ class DB:
             else:
                 next_month_start = month_start.replace(month=month_start.month + 1)
 
-            month_start_str = month_start.isoformat()
-            next_month_start_str = next_month_start.isoformat()
+            if self._legacy_traffic_exists():
+                return False, "旧流量表仍在迁移中，请等迁移完成后再清理"
+
+            partition = self._TRAFFIC_PARTITION_PREFIX + target_month.replace("-", "")
+            if partition not in self._traffic_partitions():
+                return True, f"月份 {target_month} 没有需要清理的原始数据"
 
             # 统计要删除的记录数
-            delete_count_query = """
-            SELECT COUNT(*) FROM line_traffic_stats
-            WHERE timestamp >= ? AND timestamp < ?
-            """
             delete_count = self.cur.execute(
-                delete_count_query, (month_start_str, next_month_start_str)
+                f"SELECT COUNT(*) FROM {partition}"
             ).fetchone()[0]
 
-            if delete_count == 0:
-                return True, f"月份 {target_month} 没有需要清理的原始数据"
-
-            # 删除原始数据
-            delete_query = """
-            DELETE FROM line_traffic_stats
-            WHERE timestamp >= ? AND timestamp < ?
-            """
-
-            self.cur.execute(delete_query, (month_start_str, next_month_start_str))
+            # 整个分区直接 DROP，无需逐行删除
+            if not self.con.in_transaction:
+                self.cur.execute("BEGIN IMMEDIATE")
+            self.cur.execute(f"DROP TABLE IF EXISTS {partition}")
+            self._rebuild_traffic_view()
+            self.cur.execute(
+                "DELETE FROM line_traffic_rollup WHERE bucket >= ? AND bucket < ?",
+                (int(month_start.timestamp()), int(next_month_start.timestamp())),
+            )
             self.con.commit()
 
             logger.info(f"已清理 {target_month} 月份的 {delete_count} 条原始流量数据")
             return True, f"成功清理 {target_month} 月份的 {delete_count} 条原始流量数据"
 
         except Exception as e:
+            self.con.rollback()
             logger.error(f"清理月度流量数据失败: {e}")
             return False, f"清理月度流量数据失败: {str(e)}"
 
@@ -3614,6 +3993,44 @@ class DB:
             logger.error(f"Error removing group member left record: {e}")
             return False
 
+    def update_group_member_statuses(
+        self, statuses: list[tuple[int, bool]], group_id=None, source: str = "sweep"
+    ) -> bool:
+        """批量写入群组成员状态，statuses 为 (tg_id, 是否在群组中) 列表"""
+        checked_at = int(time.time())
+        try:
+            self.cur.executemany(
+                """
+                INSERT INTO group_member_status (tg_id, group_id, is_member, source, checked_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(tg_id) DO UPDATE SET
+                    group_id = excluded.group_id,
+                    is_member = excluded.is_member,
+                    source = excluded.source,
+                    checked_at = excluded.checked_at
+                """,
+                [
+                    (tg_id, group_id, int(bool(is_member)), source, checked_at)
+                    for tg_id, is_member in statuses
+                ],
+            )
+            self.con.commit()
+            return True
+        except Exception as e:
+            logger.error(f"Error updating group member status: {e}")
+            return False
+
+    def get_group_member_statuses(self) -> dict:
+        """获取全部群组成员状态 {tg_id: (是否在群组中, 确认时间)}"""
+        try:
+            rows = self.cur.execute(
+                "SELECT tg_id, is_member, checked_at FROM group_member_status"
+            ).fetchall()
+            return {row[0]: (bool(row[1]), row[2]) for row in rows}
+        except Exception as e:
+            logger.error(f"Error getting group member status: {e}")
+            return {}
+
     def delete_plex_user(self, tg_id: int) -> bool:
         """删除Plex用户记录"""
         try:
@@ -3637,8 +4054,7 @@ class DB:
     def health_check(self) -> bool:
         """检查数据库连接是否健康"""
         try:
-            self._ensure_connection()
-            self._local.con.execute("SELECT 1")
+            self.con.execute("SELECT 1")
             return True
         except Exception as e:
             logger.error(f"数据库健康检查失败: {e}")
@@ -3723,6 +4139,11 @@ class DB:
                 (tg_id, checkin_date, streak, month, credits_earned),
             )
             self.con.commit()
+            refresh_members(self, CHECKIN_TOTAL, [tg_id])
+            # 签到只会让本人名次上升，本人不在勋章名次内时总榜勋章不会变化
+            rank = self.get_checkin_total_rank(tg_id)
+            if rank is not None and rank <= len(CHECKIN_TOTAL_RANK_MEDALS):
+                self.sync_checkin_total_rank_medals()
             return True
         except Exception as e:
             logger.error(f"添加签到记录失败: {e}")
@@ -3743,33 +4164,8 @@ class DB:
         return row[0] if row else 0
 
     def get_checkin_total_rank(self, tg_id: int):
-        current = self.cur.execute(
-            """
-            SELECT COUNT(*) AS total_days, MAX(id) AS last_checkin_id
-            FROM checkin_stats
-            WHERE tg_id = ?
-            """,
-            (tg_id,),
-        ).fetchone()
-        total_count = current["total_days"] if current else 0
-        last_checkin_id = current["last_checkin_id"] if current else None
-        if total_count <= 0 or last_checkin_id is None:
-            return None
-
-        row = self.cur.execute(
-            """
-            SELECT COUNT(*) FROM (
-                SELECT tg_id, COUNT(*) AS total_days, MAX(id) AS last_checkin_id
-                FROM checkin_stats
-                GROUP BY tg_id
-                HAVING COUNT(*) > ?
-                    OR (COUNT(*) = ? AND MAX(id) < ?)
-            )
-            """,
-            (total_count, total_count, last_checkin_id),
-        ).fetchone()
-        higher_count = row[0] if row else 0
-        return higher_count + 1
+        rank = member_rank(self, CHECKIN_TOTAL, tg_id)
+        return rank[0] if rank else None
 
     def get_checkin_monthly_leaderboard(self, month: str):
         return self.cur.execute(
@@ -3807,7 +4203,12 @@ class DB:
         }
 
     def close(self) -> None:
-        """关闭数据库连接"""
+        """关闭数据库连接
+
+        连接池借出的连接由连接池负责归还，这里不做处理
+        """
+        if self._con is not None:
+            return
         if hasattr(self._local, 'con') and self._local.con:
             try:
                 self._local.con.close()
@@ -1,21 +1,20 @@
 #! /usr/bin/env python3
 
 import json
-import pickle
 from time import time
 from typing import Any, Optional, Union
 
 import aiohttp
-import filelock
 import requests
 from app.cache import emby_api_key_cache
 from app.config import settings
+from app.emby_user_index import emby_user_index
 from app.log import logger
 
 
 class Emby:
-    cache = settings.DATA_PATH / "emby_user_info.cache"
-    cache_lock = filelock.FileLock(str(cache) + ".lock")
+    # 用户列表分页大小
+    USER_PAGE_SIZE = 500
 
     def __init__(
         self,
@@ -148,90 +147,128 @@ class Emby:
     def get_uid_from_username(self, username: str) -> Optional[str]:
         return self.get_user_info_from_username(username).get("id")
 
+    def _build_user_info(self, item: dict, added_time: float) -> dict:
+        """将 /Users/Query 返回的条目转换为缓存格式"""
+        user_id = item["Id"]
+        primary_image_tag = item.get("PrimaryImageTag", "")
+        user_avatar = (
+            self.base_url
+            + "/Users/"
+            + user_id
+            + f"/Images/Primary?tag={primary_image_tag}&maxWidth=160&quality=90"
+            if primary_image_tag
+            else ""
+        )
+        return {
+            "id": user_id,
+            "name": item["Name"],
+            "avatar": user_avatar,
+            "date_created": item.get("DateCreated"),
+            "added_time": added_time,
+        }
+
     def get_user_info_from_username(
         self, username: str, from_emby=True, is_hidden=settings.EMBY_USER_IS_HIDDEN
     ):
-        cache = {}
-        user_info = {}
-        with self.cache_lock:
-            if self.cache.exists():
-                with open(self.cache, "rb") as f:
-                    cache = pickle.load(f)
-            if username in cache:
-                user_info = cache[username]
-                # 如果缓存中的用户信息未过期，则直接返回
-                if time() - user_info.get("added_time", 0) < 7 * 24 * 3600:
-                    logger.debug(f"Cache hit for {username}: {user_info}")
-                    return user_info
-
-            if not from_emby:
-                # 如果不从 Emby 获取，则直接返回过期信息或者空字典
-                return user_info
-
-            headers = {"accept": "application/json"}
+        user_info = emby_user_index.get(username)
+        # 如果索引中的用户信息未过期，则直接返回
+        if user_info and time() - user_info.get("added_time", 0) < 7 * 24 * 3600:
+            return dict(user_info)
+
+        if not from_emby:
+            # 如果不从 Emby 获取，则直接返回过期信息或者空字典
+            return dict(user_info)
+
+        headers = {"accept": "application/json"}
+
+        params = {
+            "IsHidden": str(is_hidden).lower(),
+            "IsDisabled": "false",
+            "Limit": "1",
+            "NameStartsWithOrGreater": username,
+            "api_key": self.api_token,
+        }
+
+        retry = 3
+        name = None
+        while retry > 0:
+            try:
+                response = requests.get(
+                    url=self.base_url + "/Users/Query",
+                    params=params,
+                    headers=headers,
+                )
+
+                response_json = response.json()
+                logger.debug(f"{response_json=}")
+
+                if response.status_code == 200:
+                    if (
+                        response_json.get("Items") is None
+                        or len(response_json["Items"]) == 0
+                    ):
+                        # 用户不存在
+                        return {}
+                    name = response_json["Items"][0]["Name"]
+                    break
+                response.raise_for_status()
+            except Exception as e:
+                logger.error(f"Error fetching user ID for {username}: {e}")
+                retry -= 1
+
+        # 判断用户名是否一致
+        if name != username:
+            return {}
+
+        user_info = self._build_user_info(response_json["Items"][0], time())
+        emby_user_index.upsert(user_info)
+        logger.info(f"Updated user info for {username}: {user_info}")
 
+        return user_info
+
+    def fetch_all_user_info(self) -> Optional[list[dict]]:
+        """分页拉取全部启用用户的信息，失败时返回 None"""
+        headers = {"accept": "application/json", "X-Emby-Token": self.api_token}
+        users = []
+        added_time = time()
+        start_index = 0
+        while True:
             params = {
-                "IsHidden": str(is_hidden).lower(),
                 "IsDisabled": "false",
-                "Limit": "1",
-                "NameStartsWithOrGreater": username,
-                "api_key": self.api_token,
+                "StartIndex": start_index,
+                "Limit": self.USER_PAGE_SIZE,
             }
-
             retry = 3
-            name = None
-            while retry > 0:
+            while True:
                 try:
                     response = requests.get(
                         url=self.base_url + "/Users/Query",
                         params=params,
                         headers=headers,
                     )
-
-                    response_json = response.json()
-                    logger.debug(f"{response_json=}")
-
-                    if response.status_code == 200:
-                        if (
-                            response_json.get("Items") is None
-                            or len(response_json["Items"]) == 0
-                        ):
-                            # 用户不存在
-                            return {}
-                        name = response_json["Items"][0]["Name"]
-                        break
                     response.raise_for_status()
+                    response_json = response.json()
+                    break
                 except Exception as e:
-                    logger.error(f"Error fetching user ID for {username}: {e}")
                     retry -= 1
-
-            # 判断用户名是否一致
-            if name != username:
-                return {}
-
-            user_id = response_json["Items"][0]["Id"]
-            primary_image_tag = response_json["Items"][0].get("PrimaryImageTag", "")
-            user_avatar = (
-                self.base_url
-                + "/Users/"
-                + user_id
-                + f"/Images/Primary?tag={primary_image_tag}&maxWidth=160&quality=90"
-                if primary_image_tag
-                else ""
-            )
-            user_info = {
-                "id": user_id,
-                "name": name,
-                "avatar": user_avatar,
-                "date_created": response_json["Items"][0]["DateCreated"],
-                "added_time": time(),
-            }
-            cache[username] = user_info
-            with open(self.cache, "wb") as f:
-                pickle.dump(cache, f)
-            logger.info(f"Updated user info for {username}: {user_info}")
-
-            return user_info
+                    logger.error(f"Error fetching emby users from {start_index}: {e}")
+                    if retry <= 0:
+                        return None
+
+            items = response_json.get("Items") or []
+            users.extend(self._build_user_info(item, added_time) for item in items)
+            start_index += len(items)
+            total = response_json.get("TotalRecordCount", start_index)
+            if not items or start_index >= total:
+                return users
+
+    def refresh_user_index(self) -> int:
+        """全量刷新 Emby 用户信息索引，返回用户数量"""
+        users = self.fetch_all_user_info()
+        if users is None:
+            return 0
+        emby_user_index.replace_all(users)
+        return len(users)
 
     def get_user_avatar_by_username(self, username: str, from_emby=True) -> str:
         """获取用户头像 URL"""
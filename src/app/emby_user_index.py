@@ -0,0 +1,127 @@
+"""Emby 用户信息内存索引
+
+索引格式:
+    {name: {"id": id, "name": name, "avatar": url, "date_created": date, "added_time": timestamp}}
+
+索引在进程内常驻，查询只读字典，不加锁也不读文件。
+持久化使用 SQLite，单个用户按主键 upsert，全量刷新在一个事务内替换；
+其他进程写入后数据库文件 mtime 变化，本进程下次查询时重新加载。
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+from app.config import settings
+from app.log import logger
+
+_COLUMNS = ("name", "id", "avatar", "date_created", "added_time")
+
+
+class EmbyUserIndex:
+    """进程内共享的 Emby 用户信息索引"""
+
+    def __init__(self, store_path: Callable[[], Path] = lambda: settings.EMBY_USER_INFO_CACHE_PATH):
+        self._store_path = store_path
+        self._lock = threading.Lock()
+        self._data: dict = {}
+        self._mtime_ns: Optional[int] = None
+
+    def _stat_mtime(self, path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _connect(self) -> sqlite3.Connection:
+        path = self._store_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        con = sqlite3.connect(path, timeout=30)
+        con.execute(
+            """
+            CREATE TABLE IF NOT EXISTS emby_user_info (
+                name TEXT PRIMARY KEY,
+                id TEXT NOT NULL,
+                avatar TEXT NOT NULL DEFAULT '',
+                date_created TEXT,
+                added_time REAL NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+        return con
+
+    def _ensure_fresh(self) -> dict:
+        """持久化文件变化时重新加载，返回当前快照"""
+        path = self._store_path()
+        mtime_ns = self._stat_mtime(path)
+        if mtime_ns is None or mtime_ns == self._mtime_ns:
+            return self._data
+
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return self._data
+            try:
+                con = self._connect()
+                try:
+                    rows = con.execute(f"SELECT {', '.join(_COLUMNS)} FROM emby_user_info").fetchall()
+                finally:
+                    con.close()
+            except Exception as e:
+                logger.error(f"加载 Emby 用户信息失败: {e}")
+                return self._data
+            # 整体替换引用，读取方无需加锁
+            self._data = {row[0]: dict(zip(_COLUMNS, row)) for row in rows}
+            self._mtime_ns = mtime_ns
+            return self._data
+
+    def get(self, name: str) -> dict:
+        return self._ensure_fresh().get(name, {})
+
+    def snapshot(self) -> dict:
+        """返回当前全部用户信息的副本"""
+        return dict(self._ensure_fresh())
+
+    def _write(self, sql_batches: Iterable[tuple[str, list]]):
+        con = self._connect()
+        try:
+            with con:
+                for sql, rows in sql_batches:
+                    con.executemany(sql, rows)
+        finally:
+            con.close()
+
+    def upsert(self, user_info: dict):
+        """写入单个用户信息"""
+        self._ensure_fresh()
+        row = tuple(user_info.get(column) for column in _COLUMNS)
+        with self._lock:
+            self._write(
+                [(f"INSERT OR REPLACE INTO emby_user_info VALUES ({', '.join('?' * len(_COLUMNS))})", [row])]
+            )
+            data = dict(self._data)
+            data[user_info["name"]] = dict(zip(_COLUMNS, row))
+            self._data = data
+            self._mtime_ns = self._stat_mtime(self._store_path())
+
+    def replace_all(self, users: Iterable[dict]):
+        """用全量拉取结果替换索引，已不存在的用户一并删除"""
+        data = {user["name"]: {column: user.get(column) for column in _COLUMNS} for user in users}
+        rows = [tuple(info[column] for column in _COLUMNS) for info in data.values()]
+        with self._lock:
+            self._write(
+                [
+                    ("DELETE FROM emby_user_info", [()]),
+                    (f"INSERT INTO emby_user_info VALUES ({', '.join('?' * len(_COLUMNS))})", rows),
+                ]
+            )
+            self._data = data
+            self._mtime_ns = self._stat_mtime(self._store_path())
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            self._mtime_ns = None
+
+
+emby_user_index = EmbyUserIndex()
@@ -0,0 +1,109 @@
+"""阻塞调用执行层
+
+FastAPI 路由运行在事件循环上，SQLite 查询、基于 requests 的 Emby 调用和 plexapi 调用
+都是同步阻塞的，需要放到专用线程池中执行，避免一个慢查询拖慢所有请求。
+
+- run_db: 在数据库线程池中执行（线程数与连接池大小一致）
+- run_blocking: 在媒体服务 HTTP 线程池中执行
+- AsyncEmby / AsyncPlex: 把同步客户端的方法包装为协程
+"""
+
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from app.config import settings
+
+_executors: dict[str, ThreadPoolExecutor] = {}
+_executors_lock = threading.Lock()
+
+
+def _get_executor(name: str, max_workers: int) -> ThreadPoolExecutor:
+    executor = _executors.get(name)
+    if executor is None:
+        with _executors_lock:
+            executor = _executors.get(name)
+            if executor is None:
+                executor = ThreadPoolExecutor(
+                    max_workers=max_workers, thread_name_prefix=name
+                )
+                _executors[name] = executor
+    return executor
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    return _get_executor("db", settings.DB_POOL_SIZE)
+
+
+def get_http_executor() -> ThreadPoolExecutor:
+    return _get_executor("media-http", settings.MEDIA_HTTP_WORKERS)
+
+
+async def run_db(func: Callable, *args, **kwargs) -> Any:
+    """在数据库线程池中执行同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_db_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def run_blocking(func: Callable, *args, **kwargs) -> Any:
+    """在媒体服务 HTTP 线程池中执行同步函数"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_http_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def shutdown_executors(wait: bool = True):
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=wait)
+        _executors.clear()
+
+
+class AsyncClient:
+    """把同步客户端的方法调用转为在线程池中执行的协程"""
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    def __getattr__(self, name: str):
+        attr = getattr(self._client, name)
+        if not callable(attr) or asyncio.iscoroutinefunction(attr):
+            return attr
+
+        @functools.wraps(attr)
+        async def wrapper(*args, **kwargs):
+            return await run_blocking(attr, *args, **kwargs)
+
+        return wrapper
+
+
+class AsyncEmby(AsyncClient):
+    """Emby 异步客户端"""
+
+    def __init__(self, emby: Optional[Any] = None):
+        if emby is None:
+            from app.emby import Emby
+
+            emby = Emby()
+        super().__init__(emby)
+
+
+class AsyncPlex(AsyncClient):
+    """Plex 异步客户端，Plex() 初始化需要访问网络，需通过 create() 创建"""
+
+    @classmethod
+    async def create(cls, *args, **kwargs) -> "AsyncPlex":
+        from app.plex import Plex
+
+        return cls(await run_blocking(Plex, *args, **kwargs))
+
+    @staticmethod
+    async def get_user_avatar_by_username(username: str) -> str:
+        from app.plex import Plex
+
+        return await run_blocking(Plex.get_user_avatar_by_username, username)
@@ -1,4 +1,9 @@
-"""群组成员变化监听Handler"""
+"""群组成员变化监听Handler
+
+成员加入/离开事件实时写入 group_member_status 和 group_member_left_status，
+定时任务 process_left_group_members 只复核状态未知或过期的用户。
+Bot 需要是群组管理员并在轮询时订阅 chat_member 更新才能收到这些事件。
+"""
 
 import time
 
@@ -63,6 +68,9 @@ async def track_group_member_changes(
 
     db = DB()
     try:
+        db.update_group_member_statuses(
+            [(tg_id, has_joined)], group_id=group_id, source="event"
+        )
         if has_left:
             # 用户离开群组，记录离开时间
             left_time = int(time.time())
@@ -1,6 +1,13 @@
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.leaderboard import (
+    CREDITS,
+    DONATION,
+    emby_watched_time_rank,
+    plex_watched_time_rank,
+    top_entries,
+)
 from app.log import logger
 from app.utils.utils import get_user_name_from_tg_id, send_message
 from telegram import Update
@@ -11,11 +18,10 @@ from telegram.ext import CommandHandler, ContextTypes
 async def credits_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
     _db = DB()
-    res = _db.get_credits_rank()
+    res = top_entries(_db, CREDITS, 30)
     rank = [
         f"{i}. {get_user_name_from_tg_id(info[0])}: {info[1]:.2f}"
         for i, info in enumerate(res, 1)
-        if i <= 30
     ]
 
     body_text = """
@@ -36,7 +42,7 @@ async def credits_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
 async def donation_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
     _db = DB()
-    res = _db.get_donation_rank()
+    res = top_entries(_db, DONATION, settings.LEADERBOARD_SIZE)
     rank = [
         f"{i}. {get_user_name_from_tg_id(info[0])}: {info[1]:.2f}"
         for i, info in enumerate(res, 1)
@@ -61,16 +67,10 @@ async def donation_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
 async def watched_time_rank(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update._effective_chat.id
     _db = DB()
-    res = _db.get_plex_watched_time_rank()
-    rank = [
-        f"{i}. {info[2]}: {info[3]:.2f}" for i, info in enumerate(res, 1) if i <= 15
-    ]
-    emby_res = _db.get_emby_watched_time_rank()
-    emby_rank = [
-        f"{i}. {info[1]}: {info[2]:.2f}"
-        for i, info in enumerate(emby_res, 1)
-        if i <= 15
-    ]
+    res = plex_watched_time_rank(_db, 15)
+    rank = [f"{i}. {info[2]}: {info[3]:.2f}" for i, info in enumerate(res, 1)]
+    emby_res = emby_watched_time_rank(_db, 15)
+    emby_rank = [f"{i}. {info[1]}: {info[2]:.2f}" for i, info in enumerate(emby_res, 1)]
     body_text = """
 <strong>观看时长榜 (Hour)</strong>
 ==================
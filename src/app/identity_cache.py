@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""流量归属身份缓存
+
+同一个播放器的一次播放会产生成百上千个分片请求，它们携带相同的 Token / API Key /
+PlaySessionId，逐条解析会反复查询 SQLite、Plex.tv 和 Tautulli。
+
+IdentityCache 是进程内共享、有容量上限的 LRU + TTL 缓存：
+- 解析失败的结果（负缓存）同样会被记住，但过期时间更短
+- 统计命中/未命中次数，便于观察缓存效果
+"""
+
+import threading
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Hashable
+
+from app.config import settings
+
+
+def _is_negative(value: Any) -> bool:
+    if value is None:
+        return True
+    if isinstance(value, tuple):
+        return not any(value)
+    return False
+
+
+class IdentityCache:
+    """LRU + TTL 身份缓存"""
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        negative_ttl: float,
+        clock: Callable[[], float] = monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> tuple[bool, Any]:
+        """查询缓存
+
+        Returns:
+            (是否命中, 缓存值)，负缓存命中时返回 (True, None) 或 (True, (None, None))
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._data[key]
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            if _is_negative(value):
+                self.negative_hits += 1
+            return True, value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        ttl = self.negative_ttl if _is_negative(value) else self.ttl
+        with self._lock:
+            self._data[key] = (self._clock() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.negative_hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+traffic_identity_cache = IdentityCache(
+    maxsize=settings.TRAFFIC_IDENTITY_CACHE_SIZE,
+    ttl=settings.TRAFFIC_IDENTITY_CACHE_TTL,
+    negative_ttl=settings.TRAFFIC_IDENTITY_CACHE_NEGATIVE_TTL,
+)
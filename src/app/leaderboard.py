@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""排行榜物化到 Redis
+
+积分、捐赠、观看时长和累计签到排行保存在 Redis ZSET（键 leaderboard:<榜单名>）中，
+读取前 N 名和查询个人排名都是 O(log n)，不再每次对整张表排序：
+
+- 积分、捐赠、观看时长、签到的写入路径在提交后调用 refresh_members，
+  只重新读取受影响成员的分数并 ZADD / ZREM
+- 榜单从未构建过（首次启动、Redis 被清空）时由读取方从数据库整体重建，
+  rebuild_leaderboards 定时任务定期重建，修正绑定变化等未单独处理的写入
+- Redis 不可用时暂停一段时间并直接查询数据库，恢复后重建出错期间漏写的榜单
+"""
+
+from dataclasses import dataclass
+from time import monotonic, time
+from typing import Callable, Iterable, Optional
+
+from app.log import logger
+from app.redis_client import Redis
+
+CREDITS = "credits"
+DONATION = "donation"
+PLEX_WATCHED_TIME = "plex_watched_time"
+EMBY_WATCHED_TIME = "emby_watched_time"
+CHECKIN_TOTAL = "checkin_total"
+
+_KEY_PREFIX = "leaderboard:"
+# hash，field 为榜单名，值为最近一次整体重建的时间；缺失说明榜单需要重建
+_BUILT_KEY = "leaderboard:built"
+_SQL_CHUNK_SIZE = 500
+_ZADD_CHUNK_SIZE = 1000
+_SUSPEND_SECONDS = 60
+# 累计签到按天数降序、最后一次签到 id 升序排列，合成一个分数：天数 * 2^32 - 最后签到 id
+_CHECKIN_ID_SPAN = 1 << 32
+
+
+@dataclass(frozen=True)
+class Board:
+    name: str
+    # 查询 (member, score)，{where} 处拼接按成员过滤的条件
+    sql: str
+    member_column: str
+    parse_member: Callable
+
+    @property
+    def key(self) -> str:
+        return _KEY_PREFIX + self.name
+
+
+BOARDS = {
+    board.name: board
+    for board in (
+        # 只统计绑定了 Plex 或 Emby 账号的 TG 用户
+        Board(
+            CREDITS,
+            """
+            SELECT s.tg_id AS member, COALESCE(s.credits, 0) AS score
+            FROM statistics s
+            WHERE s.tg_id IS NOT NULL {where} AND (
+                EXISTS (
+                    SELECT 1 FROM user u WHERE u.tg_id = s.tg_id AND u.plex_id IS NOT NULL
+                ) OR EXISTS (
+                    SELECT 1 FROM emby_user eu WHERE eu.tg_id = s.tg_id AND eu.emby_id IS NOT NULL
+                )
+            )
+            """,
+            "s.tg_id",
+            int,
+        ),
+        Board(
+            DONATION,
+            """
+            SELECT tg_id AS member, donation AS score FROM statistics
+            WHERE tg_id IS NOT NULL AND donation > 0 {where}
+            """,
+            "tg_id",
+            int,
+        ),
+        Board(
+            PLEX_WATCHED_TIME,
+            """
+            SELECT plex_id AS member, watched_time AS score FROM user
+            WHERE plex_id IS NOT NULL AND watched_time > 0 {where}
+            """,
+            "plex_id",
+            int,
+        ),
+        Board(
+            EMBY_WATCHED_TIME,
+            """
+            SELECT emby_id AS member, emby_watched_time AS score FROM emby_user
+            WHERE emby_id IS NOT NULL AND emby_watched_time > 0 {where}
+            """,
+            "emby_id",
+            str,
+        ),
+        Board(
+            CHECKIN_TOTAL,
+            f"""
+            SELECT tg_id AS member, COUNT(*) * {_CHECKIN_ID_SPAN} - MAX(id) AS score
+            FROM checkin_stats
+            WHERE 1 {{where}}
+            GROUP BY tg_id
+            """,
+            "tg_id",
+            int,
+        ),
+    )
+}
+
+_redis_client = None
+_suspended_until = 0.0
+# 本进程写入失败过的榜单，Redis 恢复后先整体重建
+_stale_boards: set[str] = set()
+
+
+def _get_client():
+    global _redis_client
+    if _redis_client is None:
+        _redis_client = Redis().get_connection()
+    return _redis_client
+
+
+def _available() -> bool:
+    return monotonic() >= _suspended_until
+
+
+def _suspend(action: str, board_names: Iterable[str], error: Exception) -> None:
+    global _suspended_until
+    _suspended_until = monotonic() + _SUSPEND_SECONDS
+    _stale_boards.update(board_names)
+    logger.warning(f"{action}失败，{_SUSPEND_SECONDS} 秒内改为查询数据库: {error}")
+
+
+def _chunked(values: list, size: int):
+    for start in range(0, len(values), size):
+        yield values[start : start + size]
+
+
+def _load_scores(db, board: Board, members: Optional[list] = None) -> dict:
+    """从数据库读取 {成员: 分数}，members 为空时读取整个榜单"""
+    if members is None:
+        batches = [("", ())]
+    else:
+        batches = [
+            (
+                f"AND {board.member_column} IN ({','.join('?' * len(chunk))})",
+                tuple(chunk),
+            )
+            for chunk in _chunked(members, _SQL_CHUNK_SIZE)
+        ]
+    scores = {}
+    for where, params in batches:
+        for member, score in db.cur.execute(board.sql.format(where=where), params):
+            if member is not None and score is not None:
+                scores[str(member)] = float(score)
+    return scores
+
+
+def rebuild(db, board_name: str) -> int:
+    """从数据库整体重建榜单，返回成员数量
+
+    写入临时键后在同一个事务中 RENAME 替换，读取方不会看到构建到一半的榜单。
+    """
+    board = BOARDS[board_name]
+    scores = _load_scores(db, board)
+    temp_key = f"{board.key}:rebuild"
+    pipeline = _get_client().pipeline(transaction=True)
+    pipeline.delete(temp_key)
+    for chunk in _chunked(list(scores.items()), _ZADD_CHUNK_SIZE):
+        pipeline.zadd(temp_key, dict(chunk))
+    if scores:
+        pipeline.rename(temp_key, board.key)
+    else:
+        pipeline.delete(board.key)
+    pipeline.hset(_BUILT_KEY, board.name, int(time()))
+    pipeline.execute()
+    _stale_boards.discard(board.name)
+    return len(scores)
+
+
+def rebuild_boards(db, board_names: Optional[Iterable[str]] = None) -> dict:
+    """重建多个榜单（默认全部），返回 {榜单名: 成员数量}，失败的榜单不在结果中"""
+    result = {}
+    for board_name in board_names or BOARDS:
+        try:
+            result[board_name] = rebuild(db, board_name)
+        except Exception as e:
+            _stale_boards.add(board_name)
+            logger.error(f"重建排行榜 {board_name} 失败: {e}")
+    return result
+
+
+def refresh_members(db, board_name: str, members: Iterable) -> None:
+    """数据提交后调用，把受影响成员的最新分数写入榜单，不再上榜的成员移除"""
+    members = [member for member in dict.fromkeys(members) if member]
+    if not members:
+        return
+    if not _available():
+        _stale_boards.add(board_name)
+        return
+    board = BOARDS[board_name]
+    try:
+        if board_name in _stale_boards:
+            rebuild(db, board_name)
+            return
+        scores = _load_scores(db, board, members)
+        removed = [str(member) for member in members if str(member) not in scores]
+        # 榜单尚未构建时这里只写入部分成员，读取方看到构建标记缺失仍会整体重建
+        pipeline = _get_client().pipeline(transaction=False)
+        if scores:
+            pipeline.zadd(board.key, scores)
+        if removed:
+            pipeline.zrem(board.key, *removed)
+        pipeline.execute()
+    except Exception as e:
+        _suspend(f"更新排行榜 {board_name} ", [board_name], e)
+
+
+def _read(db, board: Board, queue_reads: Callable) -> list:
+    """执行读取命令，榜单未构建或本进程写入失败过时先重建再读"""
+    client = _get_client()
+    pipeline = client.pipeline(transaction=False)
+    pipeline.hexists(_BUILT_KEY, board.name)
+    queue_reads(pipeline)
+    built, *results = pipeline.execute()
+    if built and board.name not in _stale_boards:
+        return results
+    rebuild(db, board.name)
+    pipeline = client.pipeline(transaction=False)
+    queue_reads(pipeline)
+    return pipeline.execute()
+
+
+def top_entries(db, board_name: str, limit: int) -> list[tuple]:
+    """获取榜单前 limit 名 [(成员, 分数)]，按分数降序"""
+    board = BOARDS[board_name]
+    if limit <= 0:
+        return []
+    if _available():
+        try:
+            (entries,) = _read(
+                db,
+                board,
+                lambda pipeline: pipeline.zrevrange(
+                    board.key, 0, limit - 1, withscores=True
+                ),
+            )
+            return [(board.parse_member(member), score) for member, score in entries]
+        except Exception as e:
+            _suspend(f"读取排行榜 {board_name} ", [], e)
+    rows = db.cur.execute(
+        f"SELECT member, score FROM ({board.sql.format(where='')}) ORDER BY score DESC LIMIT ?",
+        (limit,),
+    ).fetchall()
+    return [(board.parse_member(member), float(score)) for member, score in rows]
+
+
+def member_rank(db, board_name: str, member) -> Optional[tuple[int, float]]:
+    """获取成员的 (名次, 分数)，名次从 1 开始；未上榜返回 None"""
+    board = BOARDS[board_name]
+    if not member:
+        return None
+    if _available():
+        try:
+            rank, score = _read(
+                db,
+                board,
+                lambda pipeline: (
+                    pipeline.zrevrank(board.key, str(member)),
+                    pipeline.zscore(board.key, str(member)),
+                ),
+            )
+            if rank is None or score is None:
+                return None
+            return rank + 1, float(score)
+        except Exception as e:
+            _suspend(f"读取排行榜 {board_name} ", [], e)
+    score = _load_scores(db, board, [member]).get(str(member))
+    if score is None:
+        return None
+    row = db.cur.execute(
+        f"SELECT COUNT(*) FROM ({board.sql.format(where='')}) WHERE score > ?",
+        (score,),
+    ).fetchone()
+    return row[0] + 1, score
+
+
+def _rows_by_member(db, sql: str, members: list) -> dict:
+    rows = {}
+    for chunk in _chunked(members, _SQL_CHUNK_SIZE):
+        for row in db.cur.execute(sql.format(",".join("?" * len(chunk))), tuple(chunk)):
+            rows[str(row[0])] = row
+    return rows
+
+
+def plex_watched_time_rank(db, limit: int) -> list:
+    """Plex 观看时长前 limit 名，字段与 DB.get_plex_watched_time_rank 相同"""
+    members = [member for member, _ in top_entries(db, PLEX_WATCHED_TIME, limit)]
+    rows = _rows_by_member(
+        db,
+        "SELECT plex_id, tg_id, plex_username, watched_time, is_premium FROM user WHERE plex_id IN ({})",
+        members,
+    )
+    return [rows[str(member)] for member in members if str(member) in rows]
+
+
+def emby_watched_time_rank(db, limit: int) -> list:
+    """Emby 观看时长前 limit 名，字段与 DB.get_emby_watched_time_rank 相同"""
+    members = [member for member, _ in top_entries(db, EMBY_WATCHED_TIME, limit)]
+    rows = _rows_by_member(
+        db,
+        "SELECT emby_id, emby_username, emby_watched_time, is_premium, tg_id FROM emby_user WHERE emby_id IN ({})",
+        members,
+    )
+    return [rows[str(member)] for member in members if str(member) in rows]
+
+
+def _decode_checkin_score(score: float) -> tuple[int, int]:
+    """把累计签到榜的分数还原为 (累计天数, 最后签到 id)"""
+    score = int(score)
+    total_days = score // _CHECKIN_ID_SPAN + 1
+    return total_days, total_days * _CHECKIN_ID_SPAN - score
+
+
+def checkin_total_leaderboard(db, limit: int) -> list[dict]:
+    """累计签到榜前 limit 名，同天数按先签到者优先"""
+    result = []
+    for tg_id, score in top_entries(db, CHECKIN_TOTAL, limit):
+        total_days, last_checkin_id = _decode_checkin_score(score)
+        result.append(
+            {"tg_id": tg_id, "total_days": total_days, "last_checkin_id": last_checkin_id}
+        )
+    return result
@@ -10,11 +10,15 @@ from app.handlers.start import *
 from app.handlers.status import *
 from app.handlers.user import *
 from app.log import logger
+from app.notifier import NotificationDispatcher
 from app.scheduler import Scheduler
+from app.traffic_consumer import TrafficStreamConsumer
 from app.update_db import (
     check_debt_and_ban,
     finish_expired_auctions_job,
+    migrate_legacy_traffic,
     process_left_group_members,
+    rebuild_leaderboards,
     rewrite_users_credits_to_redis,
     settle_checkin_monthly,
     update_credits,
@@ -50,7 +54,8 @@ def start_api_server():
 
 def start_bot(application):
     """启动 Telegram Bot"""
-    application.run_polling()
+    # chat_member 更新默认不会推送，需要显式订阅才能实时跟踪群组成员变化
+    application.run_polling(allowed_updates=Update.ALL_TYPES)
 
 
 def add_init_scheduler_job():
@@ -111,7 +116,7 @@ def add_init_scheduler_job():
     logger.info("添加定时任务：每天早上 07:00 更新 Emby 用户信息")
 
     # 每小时检查并结束过期的竞拍活动 (同步任务)
-    scheduler.add_async_job(
+    scheduler.add_sync_job(
         func=finish_expired_auctions_job,
         trigger="cron",
         id="finish_expired_auctions",
@@ -122,6 +127,7 @@ def add_init_scheduler_job():
     logger.info("添加定时任务：每小时自动结束过期竞拍活动")
 
     # 每 1 分钟消费一次 HTTP 流量日志，更新流量榜单原始数据
+    # 启用常驻消费者时，定时任务只负责 Nginx 日志补采
     scheduler.add_async_job(
         func=update_line_traffic_stats,
         trigger="cron",
@@ -129,19 +135,42 @@ def add_init_scheduler_job():
         replace_existing=True,
         max_instances=1,
         minute="*/1",
+        kwargs={"fallback_only": settings.TRAFFIC_CONSUMER_ENABLED},
     )
     logger.info("添加定时任务：每 1 分钟更新线路流量统计信息")
 
-    # 每 5min 更新一次积分信息
+    # 积分变动时已实时写入 Redis，每 30min 对账一次积分缓存
     scheduler.add_sync_job(
         func=rewrite_users_credits_to_redis,
         trigger="cron",
         id="update_users_credits",
         replace_existing=True,
         max_instances=1,
-        minute="*/5",  # 每 5 分钟执行一次
+        minute="*/30",  # 每 30 分钟执行一次
+    )
+    logger.info("添加定时任务：每 30 分钟对账用户积分缓存")
+
+    # 排行榜写入时增量更新，每小时从数据库重建一次兜底
+    scheduler.add_sync_job(
+        func=rebuild_leaderboards,
+        trigger="cron",
+        id="rebuild_leaderboards",
+        replace_existing=True,
+        max_instances=1,
+        minute=20,  # 每小时第 20 分钟执行
     )
-    logger.info("添加定时任务：每 5 分钟更新用户积分信息")
+    logger.info("添加定时任务：每小时重建排行榜")
+
+    # 启动后在后台分批迁移旧流量表的记录到月度分区，已完成时直接返回
+    scheduler.add_sync_job(
+        func=migrate_legacy_traffic,
+        trigger="date",
+        id="migrate_legacy_traffic",
+        replace_existing=True,
+        max_instances=1,
+        run_date=datetime.datetime.now(settings.TZ) + datetime.timedelta(seconds=20),
+    )
+    logger.info("添加一次性任务：迁移旧流量记录到月度分区")
 
     # 每 1h 更新一次用户信息
     scheduler.add_sync_job(
@@ -156,16 +185,16 @@ def add_init_scheduler_job():
     )
     logger.info("添加定时任务：每 1 小时更新用户信息")
 
-    # 每 5 分钟检查一次离开群组超过72小时的用户并注销账号 (异步任务)
+    # 群组成员状态由 ChatMember 事件实时更新，每小时对账一次并注销离开群组超过72小时的用户 (异步任务)
     scheduler.add_async_job(
         func=process_left_group_members,
         trigger="cron",
         id="process_left_group_members",
         replace_existing=True,
         max_instances=1,
-        minute="*/5",  # 每 5 分钟执行一次
+        minute=10,  # 每小时第 10 分钟执行
     )
-    logger.info("添加定时任务：每 5 分钟检查离开群组超过72小时的用户并注销账号")
+    logger.info("添加定时任务：每小时对账群组成员状态并注销离开群组超过72小时的用户")
 
     # 每天凌晨 01:30 检查欠积分超期用户并封禁
     scheduler.add_async_job(
@@ -226,6 +255,27 @@ if __name__ == "__main__":
     else:
         logger.info("WebApp 服务已禁用（在配置中设置 ENABLE_WEBAPP=True 可启用）")
 
+    # 启动流量日志常驻消费者（在单独的线程中）
+    traffic_consumer = None
+    if settings.TRAFFIC_CONSUMER_ENABLED:
+        traffic_consumer = TrafficStreamConsumer()
+        traffic_consumer_thread = traffic_consumer.start_in_thread()
+
+    # 启动通知发送队列（在单独的线程中）
+    notification_dispatcher = NotificationDispatcher()
+    notification_dispatcher_thread = notification_dispatcher.start_in_thread()
+
     # 启动 Telegram Bot（在主线程中）
     logger.info("启动 Telegram Bot...")
-    start_bot(application)
+    try:
+        start_bot(application)
+    finally:
+        # 未发送的通知保留在队列中，下次启动后继续发送
+        notification_dispatcher.stop()
+        notification_dispatcher_thread.join(timeout=30)
+        if traffic_consumer is not None:
+            # 等待当前批次写库完成后退出
+            traffic_consumer.stop()
+            traffic_consumer_thread.join(
+                timeout=settings.TRAFFIC_CONSUMER_BLOCK_TIMEOUT + 30
+            )
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""排行榜展示用的用户勋章缓存
+
+排行榜每次渲染都要查询上百个用户的勋章。勋章很少变化，这里在进程内缓存
+{tg_id: 勋章列表}，以 medal_version 表中的版本号作为失效依据：
+user_medals / medal_catalog 上的触发器在任何写入后递增版本号，
+读取时版本号变化就清空缓存，多个 worker 进程之间也能保持一致。
+"""
+
+import threading
+from typing import Iterable
+
+_lock = threading.Lock()
+_version = None
+_medals: dict = {}
+
+
+def get_users_medals_map(db, tg_ids: Iterable) -> dict:
+    """与 DB.get_users_medals_map 相同，命中缓存的用户不再查询数据库"""
+    global _version
+    tg_ids = [tg_id for tg_id in dict.fromkeys(tg_ids) if tg_id is not None]
+    if not tg_ids:
+        return {}
+
+    version = db.get_medal_version()
+    with _lock:
+        if version != _version:
+            _medals.clear()
+            _version = version
+        result = {tg_id: _medals[tg_id] for tg_id in tg_ids if tg_id in _medals}
+
+    missing = [tg_id for tg_id in tg_ids if tg_id not in result]
+    if missing:
+        # 先读版本号再查询，缓存内容不会比它标记的版本更旧
+        fetched = db.get_users_medals_map(missing)
+        with _lock:
+            if version == _version:
+                _medals.update(fetched)
+        result.update(fetched)
+    return result
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""Nginx 日志补采状态存储
+
+旧实现每分钟把文件偏移和最多 2048 个 Emby 播放会话整体序列化为 JSON 再写回，
+并且每次都对全部会话重新排序。这里改为 SQLite 文件增量保存：
+
+- tail_files: 每个日志文件的读取偏移
+- emby_play_sessions: PlaySessionId 到用户的映射
+
+内存中的会话按最后更新时间顺序保存在 OrderedDict 中，过期清理只需从头部弹出，
+保存时只写入本次变化的会话，开销与变化量成正比。每次写入的会话分配递增的 seq，
+重新加载时按 (updated_at, seq) 排序即可还原写入顺序。
+
+进程内应复用同一个实例，reload_if_changed 通过 PRAGMA data_version 判断
+是否有其他连接写入，只有这种情况才需要重新加载。
+"""
+
+import json
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from time import time
+from typing import Optional, Union
+
+from app.log import logger
+
+EMBY_SESSION_TTL_SECONDS = 6 * 60 * 60
+EMBY_SESSION_STATE_LIMIT = 2048
+
+
+class PlaySessionStore(OrderedDict):
+    """按更新时间排序的 Emby 播放会话表，记录变化以便增量保存"""
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        # 按更新顺序记录变化的会话，保存时保持同样的顺序
+        self.dirty: dict = {}
+        self.removed: set = set()
+
+    def __setitem__(self, session_id, session_data) -> None:
+        super().__setitem__(session_id, session_data)
+        # 会话每次更新都会刷新 updated_at，移动到末尾即可保持按时间有序
+        self.move_to_end(session_id)
+        self.dirty.pop(session_id, None)
+        self.dirty[session_id] = None
+        self.removed.discard(session_id)
+
+    def _drop_oldest(self) -> None:
+        session_id, _ = self.popitem(last=False)
+        self.dirty.pop(session_id, None)
+        self.removed.add(session_id)
+
+    def expire(
+        self,
+        ttl: int = EMBY_SESSION_TTL_SECONDS,
+        limit: int = EMBY_SESSION_STATE_LIMIT,
+    ) -> None:
+        """移除过期会话和超出上限的最旧会话"""
+        cutoff = int(time()) - ttl
+        while self:
+            session_data = next(iter(self.values()))
+            if int(session_data.get("updated_at") or 0) >= cutoff:
+                break
+            self._drop_oldest()
+        while len(self) > limit:
+            self._drop_oldest()
+
+    def mark_clean(self) -> None:
+        self.dirty.clear()
+        self.removed.clear()
+
+
+class NginxTrafficState:
+    """Nginx 日志补采状态（SQLite 持久化）"""
+
+    def __init__(self, path: Union[Path, str]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        self._create_tables()
+        self._load()
+
+    def _create_tables(self) -> None:
+        self.con.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS tail_files (
+                key TEXT PRIMARY KEY,
+                path TEXT,
+                inode INTEGER NOT NULL DEFAULT 0,
+                offset INTEGER NOT NULL DEFAULT 0,
+                updated_at INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS emby_play_sessions (
+                session_id TEXT PRIMARY KEY,
+                username TEXT NOT NULL,
+                user_id TEXT,
+                updated_at INTEGER NOT NULL,
+                seq INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_emby_play_sessions_updated_at
+            ON emby_play_sessions (updated_at);
+            """
+        )
+        columns = {
+            row[1] for row in self.con.execute("PRAGMA table_info(emby_play_sessions)")
+        }
+        if "seq" not in columns:
+            # 旧版本没有写入序号，按 rowid 初始化
+            self.con.execute(
+                "ALTER TABLE emby_play_sessions ADD COLUMN seq INTEGER NOT NULL DEFAULT 0"
+            )
+            self.con.execute("UPDATE emby_play_sessions SET seq = rowid")
+        self.con.commit()
+
+    def _data_version(self) -> int:
+        return self.con.execute("PRAGMA data_version").fetchone()[0]
+
+    def _load(self) -> None:
+        self._files: dict = {}
+        self._dirty_files: set = set()
+        self.play_sessions = PlaySessionStore()
+        self._seq = self.con.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM emby_play_sessions"
+        ).fetchone()[0]
+        for key, path, inode, offset, updated_at in self.con.execute(
+            "SELECT key, path, inode, offset, updated_at FROM tail_files"
+        ):
+            self._files[key] = {
+                "path": path,
+                "inode": inode,
+                "offset": offset,
+                "updated_at": updated_at,
+            }
+        for session_id, username, user_id, updated_at in self.con.execute(
+            "SELECT session_id, username, user_id, updated_at FROM emby_play_sessions ORDER BY updated_at, seq"
+        ):
+            self.play_sessions[session_id] = {
+                "username": username,
+                "user_id": user_id,
+                "updated_at": updated_at,
+            }
+        self.play_sessions.mark_clean()
+        self._loaded_version = self._data_version()
+
+    def reload_if_changed(self) -> bool:
+        """其他连接写入过数据库时丢弃内存状态并重新加载"""
+        if self._data_version() == self._loaded_version:
+            return False
+        self._load()
+        return True
+
+    def file_state(self, key: str) -> dict:
+        return dict(self._files.get(key) or {})
+
+    def set_file_state(self, key: str, file_state: dict) -> None:
+        if self._files.get(key) == file_state:
+            return
+        self._files[key] = dict(file_state)
+        self._dirty_files.add(key)
+
+    def save(self) -> None:
+        """只写入本次变化的文件偏移和会话"""
+        sessions = self.play_sessions
+        if not (self._dirty_files or sessions.dirty or sessions.removed):
+            return
+        seq = self._seq
+        try:
+            with self.con:
+                self.con.executemany(
+                    """
+                    INSERT INTO tail_files (key, path, inode, offset, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        path = excluded.path,
+                        inode = excluded.inode,
+                        offset = excluded.offset,
+                        updated_at = excluded.updated_at
+                    """,
+                    [
+                        (
+                            key,
+                            self._files[key].get("path"),
+                            int(self._files[key].get("inode") or 0),
+                            int(self._files[key].get("offset") or 0),
+                            int(self._files[key].get("updated_at") or 0),
+                        )
+                        for key in self._dirty_files
+                    ],
+                )
+                self.con.executemany(
+                    "DELETE FROM emby_play_sessions WHERE session_id = ?",
+                    [(session_id,) for session_id in sessions.removed],
+                )
+                self.con.executemany(
+                    """
+                    INSERT INTO emby_play_sessions (session_id, username, user_id, updated_at, seq)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        username = excluded.username,
+                        user_id = excluded.user_id,
+                        updated_at = excluded.updated_at,
+                        seq = excluded.seq
+                    """,
+                    [
+                        (
+                            session_id,
+                            sessions[session_id].get("username"),
+                            sessions[session_id].get("user_id"),
+                            int(sessions[session_id].get("updated_at") or 0),
+                            next_seq,
+                        )
+                        for next_seq, session_id in enumerate(sessions.dirty, start=seq + 1)
+                    ],
+                )
+        except Exception as e:
+            logger.error(f"保存 Nginx 流量状态失败: {e}")
+            return
+        self._seq = seq + len(sessions.dirty)
+        self._dirty_files.clear()
+        sessions.mark_clean()
+
+    def migrate_from_json(self, json_path: Union[Path, str]) -> bool:
+        """导入旧版 JSON 状态文件，导入后重命名为 .migrated"""
+        json_path = Path(json_path)
+        if not json_path.exists():
+            return False
+        try:
+            with open(json_path, "r", encoding="utf-8") as handle:
+                legacy = json.load(handle)
+        except Exception as e:
+            logger.warning(f"读取旧版 Nginx 流量状态文件失败，将重新初始化: {e}")
+            legacy = {}
+
+        if isinstance(legacy, dict):
+            for key, file_state in (legacy.get("files") or {}).items():
+                if isinstance(file_state, dict):
+                    self.set_file_state(key, file_state)
+            play_sessions = legacy.get("emby_play_sessions") or {}
+            for session_id, session_data in sorted(
+                play_sessions.items(),
+                key=lambda item: int((item[1] or {}).get("updated_at") or 0)
+                if isinstance(item[1], dict)
+                else 0,
+            ):
+                if isinstance(session_data, dict) and session_data.get("username"):
+                    self.play_sessions[session_id] = session_data
+            self.play_sessions.expire()
+        self.save()
+        json_path.replace(json_path.with_suffix(".json.migrated"))
+        logger.info("已将 Nginx 流量状态从 JSON 迁移到 SQLite")
+        return True
+
+    def close(self) -> None:
+        try:
+            self.con.close()
+        except Exception as e:
+            logger.error(f"关闭 Nginx 流量状态数据库时出错: {e}")
+
+
+def open_nginx_traffic_state(
+    path: Union[Path, str],
+    legacy_json_path: Optional[Union[Path, str]] = None,
+) -> NginxTrafficState:
+    state = NginxTrafficState(path)
+    if legacy_json_path is not None:
+        state.migrate_from_json(legacy_json_path)
+    return state
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""Telegram 通知发送队列
+
+定时任务（积分结算、群组检查、欠费检查等）原本在任务末尾直接逐条或并发调用
+send_message_by_url，零点结算时会瞬间发出数千条消息，触发 Telegram 每秒 30 条
+的全局限制和每个会话每秒 1 条的限制。这里改为：
+
+- 任务只把通知写入 SQLite 持久化队列，进程重启后未发送的通知不会丢失
+- 常驻的 NotificationDispatcher 用令牌桶控制全局发送速率，并保证同一会话的发送间隔
+- 同一会话排队中的多条通知合并为一条消息发送
+- 收到 429 时按 retry_after 暂停发送并延后该消息；网络或服务端错误按指数退避重试，
+  被拉黑、会话不存在等永久性错误直接丢弃
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from time import monotonic, time
+from typing import Awaitable, Callable, Iterable, Optional, Union
+
+from app.config import settings
+from app.log import logger
+from app.rate_limit import AsyncRateLimiter
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+_COALESCE_SEPARATOR = "\n\n"
+_METRICS_LOG_INTERVAL_SECONDS = 60
+_IDLE_POLL_SECONDS = 1.0
+_MAX_RETRY_BACKOFF_SECONDS = 300
+
+
+class NotificationQueue:
+    """通知队列（SQLite 持久化）"""
+
+    def __init__(self, path: Union[Path, str]) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.con = sqlite3.connect(self.path, check_same_thread=False)
+        self.con.execute("PRAGMA journal_mode=WAL")
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        # 定时任务线程写入，发送线程读取
+        self._lock = threading.Lock()
+        self.con.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS notifications (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id TEXT NOT NULL,
+                text TEXT NOT NULL,
+                options TEXT NOT NULL DEFAULT '{}',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_notifications_not_before
+            ON notifications (not_before, id);
+            """
+        )
+        self.con.commit()
+
+    def enqueue_many(self, tasks: Iterable[tuple], **options) -> int:
+        """批量加入通知，tasks 为 (chat_id, text) 列表，options 为 sendMessage 的附加参数"""
+        now = time()
+        options_json = json.dumps(options, sort_keys=True)
+        rows = [
+            (str(chat_id), text, options_json, now)
+            for chat_id, text in tasks
+            if chat_id and text and text.strip()
+        ]
+        if not rows:
+            return 0
+        with self._lock, self.con:
+            self.con.executemany(
+                "INSERT INTO notifications (chat_id, text, options, created_at) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def due(
+        self, limit: int, now: Optional[float] = None, exclude_chats: Iterable = ()
+    ) -> list[dict]:
+        """按入队顺序取出已到发送时间的通知，跳过 exclude_chats 中的会话"""
+        now = time() if now is None else now
+        exclude_chats = [str(chat_id) for chat_id in exclude_chats]
+        exclude_sql = (
+            f"AND chat_id NOT IN ({', '.join('?' * len(exclude_chats))})"
+            if exclude_chats
+            else ""
+        )
+        with self._lock:
+            rows = self.con.execute(
+                f"""
+                SELECT id, chat_id, text, options, attempts FROM notifications
+                WHERE not_before <= ? {exclude_sql}
+                ORDER BY id
+                LIMIT ?
+                """,
+                (now, *exclude_chats, limit),
+            ).fetchall()
+        return [
+            {
+                "id": row[0],
+                "chat_id": row[1],
+                "text": row[2],
+                "options": row[3],
+                "attempts": row[4],
+            }
+            for row in rows
+        ]
+
+    def ack(self, ids: list[int]) -> None:
+        with self._lock, self.con:
+            self.con.executemany(
+                "DELETE FROM notifications WHERE id = ?", [(i,) for i in ids]
+            )
+
+    def retry(self, ids: list[int], not_before: float, count_attempt: bool = True) -> None:
+        with self._lock, self.con:
+            self.con.executemany(
+                "UPDATE notifications SET not_before = ?, attempts = attempts + ? WHERE id = ?",
+                [(not_before, int(count_attempt), i) for i in ids],
+            )
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self.con.execute("SELECT COUNT(*) FROM notifications").fetchone()[0]
+
+    def close(self) -> None:
+        try:
+            self.con.close()
+        except Exception as e:
+            logger.error(f"关闭通知队列数据库时出错: {e}")
+
+
+_queue: Optional[NotificationQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_notification_queue() -> NotificationQueue:
+    """获取进程内共享的通知队列"""
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = NotificationQueue(settings.NOTIFICATION_QUEUE_PATH)
+    return _queue
+
+
+def enqueue_notifications(tasks: Iterable[tuple], **options) -> int:
+    """把 (chat_id, text) 通知加入发送队列，返回入队条数"""
+    try:
+        return get_notification_queue().enqueue_many(tasks, **options)
+    except Exception as e:
+        logger.error(f"写入通知队列失败: {e}")
+        return 0
+
+
+def enqueue_notification(chat_id, text: str, **options) -> bool:
+    return enqueue_notifications([(chat_id, text)], **options) == 1
+
+
+async def _post_send_message(chat_id: str, text: str, options: dict) -> dict:
+    """调用 Bot API sendMessage，返回 Telegram 的响应内容"""
+    from app.utils.utils import get_thread_safe_session
+
+    session = await get_thread_safe_session()
+    data = {"chat_id": chat_id, "text": text}
+    data.update(options)
+    async with session.post(
+        f"https://api.telegram.org/bot{settings.TG_API_TOKEN}/sendMessage", data=data
+    ) as response:
+        try:
+            return await response.json(content_type=None)
+        except Exception:
+            return {"ok": False, "error_code": response.status}
+
+
+class NotificationDispatcher:
+    """通知队列发送器"""
+
+    def __init__(
+        self,
+        queue: Optional[NotificationQueue] = None,
+        *,
+        sender: Optional[Callable[[str, str, dict], Awaitable[dict]]] = None,
+        rate: Optional[float] = None,
+        chat_interval: Optional[float] = None,
+        max_attempts: Optional[int] = None,
+    ) -> None:
+        self._queue = queue
+        self.sender = sender or _post_send_message
+        rate = rate or settings.TG_NOTIFY_RATE_LIMIT
+        self.limiter = AsyncRateLimiter(rate)
+        self.chat_interval = (
+            settings.TG_NOTIFY_CHAT_INTERVAL if chat_interval is None else chat_interval
+        )
+        self.max_attempts = max_attempts or settings.TG_NOTIFY_MAX_ATTEMPTS
+        self.batch_size = max(1, int(rate))
+        self._chat_ready_at: dict = {}
+        self._stopping = threading.Event()
+        self._last_metrics_log = monotonic()
+        self.metrics = {
+            "sent": 0,
+            "coalesced": 0,
+            "retried": 0,
+            "rate_limited": 0,
+            "failed": 0,
+            "backlog": 0,
+        }
+
+    @property
+    def queue(self) -> NotificationQueue:
+        if self._queue is None:
+            self._queue = get_notification_queue()
+        return self._queue
+
+    def _coalesce(self, rows: list[dict], now: float) -> list[dict]:
+        """把同一会话、相同发送参数的通知合并为不超过消息长度上限的若干条"""
+        groups: dict = {}
+        for row in rows:
+            if self._chat_ready_at.get(row["chat_id"], 0.0) > now:
+                continue
+            key = (row["chat_id"], row["options"])
+            text = row["text"].strip()
+            chunks = groups.setdefault(key, [])
+            last = chunks[-1] if chunks else None
+            if (
+                last is not None
+                and len(last["text"]) + len(_COALESCE_SEPARATOR) + len(text)
+                <= TELEGRAM_MESSAGE_LIMIT
+            ):
+                last["text"] += _COALESCE_SEPARATOR + text
+                last["ids"].append(row["id"])
+                last["attempts"] = max(last["attempts"], row["attempts"])
+            else:
+                chunks.append(
+                    {
+                        "chat_id": row["chat_id"],
+                        "text": text,
+                        "options": row["options"],
+                        "ids": [row["id"]],
+                        "attempts": row["attempts"],
+                    }
+                )
+        # 每个会话本轮只发第一条，其余等待会话间隔后再发
+        selected = {}
+        for (chat_id, _), chunks in groups.items():
+            selected.setdefault(chat_id, chunks[0])
+        return list(selected.values())
+
+    async def _deliver(self, group: dict) -> None:
+        chat_id = group["chat_id"]
+        await self.limiter.acquire()
+        self._chat_ready_at[chat_id] = monotonic() + self.chat_interval
+        try:
+            result = await self.sender(chat_id, group["text"], json.loads(group["options"]))
+        except Exception as e:
+            result = {"ok": False, "description": f"{type(e).__name__}: {e}"}
+
+        if result.get("ok"):
+            self.queue.ack(group["ids"])
+            self.metrics["sent"] += 1
+            self.metrics["coalesced"] += len(group["ids"]) - 1
+            return
+
+        error_code = int(result.get("error_code") or 0)
+        description = result.get("description", "")
+        if error_code == 429:
+            retry_after = float((result.get("parameters") or {}).get("retry_after") or 1)
+            # 429 是全局限制，暂停所有发送
+            self.limiter.pause(retry_after)
+            self.queue.retry(group["ids"], time() + retry_after, count_attempt=False)
+            self.metrics["rate_limited"] += 1
+            logger.warning(f"发送通知触发 Telegram 限流，暂停 {retry_after:.0f} 秒")
+        elif 400 <= error_code < 500 or group["attempts"] + 1 >= self.max_attempts:
+            # 被拉黑、会话不存在、消息格式错误等重试也不会成功
+            self.queue.ack(group["ids"])
+            self.metrics["failed"] += 1
+            logger.error(f"发送通知给 {chat_id} 失败，已丢弃: {error_code} {description}")
+        else:
+            backoff = min(2 ** group["attempts"], _MAX_RETRY_BACKOFF_SECONDS)
+            self.queue.retry(group["ids"], time() + backoff)
+            self.metrics["retried"] += 1
+            logger.warning(f"发送通知给 {chat_id} 失败，{backoff} 秒后重试: {description}")
+
+    async def dispatch_once(self) -> int:
+        """发送一轮到期的通知，返回本轮发送的消息数"""
+        now = monotonic()
+        self._chat_ready_at = {
+            chat_id: ready_at
+            for chat_id, ready_at in self._chat_ready_at.items()
+            if ready_at > now
+        }
+        # 仍在会话间隔内的会话在查询时排除，避免单个会话的积压占满每一轮的读取窗口
+        rows = self.queue.due(self.batch_size * 4, exclude_chats=self._chat_ready_at)
+        groups = self._coalesce(rows, now)[: self.batch_size]
+        if groups:
+            await asyncio.gather(*(self._deliver(group) for group in groups))
+        return len(groups)
+
+    def _log_metrics(self, force: bool = False) -> None:
+        if not force and monotonic() - self._last_metrics_log < _METRICS_LOG_INTERVAL_SECONDS:
+            return
+        self._last_metrics_log = monotonic()
+        metrics = self.metrics
+        metrics["backlog"] = self.queue.backlog()
+        if not force and not metrics["backlog"] and not metrics["sent"]:
+            return
+        logger.info(
+            f"通知队列: 已发送 {metrics['sent']}, 合并 {metrics['coalesced']}, "
+            f"重试 {metrics['retried']}, 限流 {metrics['rate_limited']}, "
+            f"失败 {metrics['failed']}, 积压 {metrics['backlog']}"
+        )
+
+    async def run(self) -> None:
+        """发送循环，stop() 后发完当前一轮退出，未发送的通知保留在队列中"""
+        logger.info("通知发送队列已启动")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    if not await self.dispatch_once():
+                        await asyncio.sleep(_IDLE_POLL_SECONDS)
+                except Exception as e:
+                    logger.error(f"发送通知队列出错: {e}")
+                    await asyncio.sleep(_IDLE_POLL_SECONDS)
+                self._log_metrics()
+        finally:
+            self._log_metrics(force=True)
+            logger.info("通知发送队列已停止")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def start_in_thread(self) -> threading.Thread:
+        """在独立线程和事件循环中运行，不占用 Bot 的事件循环"""
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.run(),),
+            name="notification-dispatcher",
+            daemon=True,
+        )
+        thread.start()
+        return thread
@@ -2,18 +2,44 @@
 
 import logging
 import pickle
+import threading
+from dataclasses import dataclass, field
+from time import monotonic
 from typing import Optional, Union
 
 import filelock
 import requests
 from app.config import settings
 from app.log import logger
+from app.utils.utils import SingletonMeta
 from plexapi.myplex import Section
 from plexapi.server import PlexServer
 
 
-class Plex:
-    """class Plex"""
+@dataclass
+class _UserDirectory:
+    """某一时刻的 Plex 用户列表及按 id / 邮箱 / 用户名建立的索引"""
+
+    users: list
+    loaded_at: float
+    by_id: dict = field(default_factory=dict)
+    by_email: dict = field(default_factory=dict)
+    by_username: dict = field(default_factory=dict)
+
+    def __post_init__(self):
+        for user in self.users:
+            self.by_id[user.id] = (user.username, user)
+            self.by_email[user.email] = (user.id, user)
+            self.by_username[user.username] = user
+
+
+class Plex(metaclass=SingletonMeta):
+    """class Plex
+
+    每个进程共享一个实例：连接服务器和获取 plex.tv 账号只在首次创建时进行。
+    用户列表缓存 PLEX_USER_DIRECTORY_TTL 秒，邀请、移除用户或修改共享资料库后
+    立即失效。users_by_* 返回的字典为缓存本身，调用方不要修改。
+    """
 
     cache = settings.DATA_PATH / "plex_user_info.cache"
     cache_lock = filelock.FileLock(str(cache) + ".lock")
@@ -26,38 +52,49 @@ class Plex:
         self.plex_server = PlexServer(baseurl=base_url, token=token)
         self.my_plex_account = self.plex_server.myPlexAccount()
         self.plex_server_name = self.plex_server.friendlyName
-        self.users = []
+        self._directory: Optional[_UserDirectory] = None
+        self._directory_lock = threading.Lock()
 
     def get_libraries(self) -> list:
         return [section.title for section in self.plex_server.library.sections()]
 
+    def _get_directory(self) -> _UserDirectory:
+        """获取用户列表缓存，过期或失效时从 plex.tv 重新拉取"""
+        directory = self._directory
+        if directory is None or monotonic() - directory.loaded_at >= settings.PLEX_USER_DIRECTORY_TTL:
+            with self._directory_lock:
+                directory = self._directory
+                if directory is None or monotonic() - directory.loaded_at >= settings.PLEX_USER_DIRECTORY_TTL:
+                    users = list(self.my_plex_account.users())
+                    users.append(self.my_plex_account)
+                    directory = self._directory = _UserDirectory(users, monotonic())
+        return directory
+
+    def invalidate_users(self) -> None:
+        """用户或共享资料库变化后调用，下次访问时重新拉取用户列表"""
+        self._directory = None
+
     def get_users(self):
-        if self.users:
-            return self.users
-        self.users = [user for user in self.my_plex_account.users()]
-        self.users.append(self.my_plex_account)
-        return self.users
+        return self._get_directory().users
+
+    def _get_user(self, user_id):
+        """按 id 获取 Plex 用户，缓存中没有时再查询 plex.tv"""
+        user = self._get_directory().by_id.get(user_id)
+        if user is not None:
+            return user[1]
+        return self.my_plex_account.user(user_id)
 
     @property
     def users_by_email(self):
-        users_by_email = {}
-        for user in self.get_users():
-            users_by_email[user.email] = (user.id, user)
-        return users_by_email
+        return self._get_directory().by_email
 
     @property
     def users_by_id(self):
-        users_by_id = {}
-        for user in self.get_users():
-            users_by_id[user.id] = (user.username, user)
-        return users_by_id
+        return self._get_directory().by_id
 
     @property
     def users_info(self):
-        users_info = {}
-        for user in self.get_users():
-            users_info[user.username] = user
-        return users_info
+        return self._get_directory().by_username
 
     def get_user_id_by_email(self, email: str) -> int:
         """get user's id by email"""
@@ -97,16 +134,11 @@ class Plex:
         """get shared libraries with specified user by id"""
         if self.get_username_by_user_id(user_id) == settings.PLEX_ADMIN_USER:
             return self.get_libraries()
-        data = (
-            self.my_plex_account.user(user_id)
-            .server(self.plex_server_name)
-            ._server.query(
-                self.my_plex_account.FRIENDSERVERS.format(
-                    machineId=self.plex_server.machineIdentifier,
-                    serverId=self.my_plex_account.user(user_id)
-                    .server(self.plex_server_name)
-                    .id,
-                )
+        server = self._get_user(user_id).server(self.plex_server_name)
+        data = server._server.query(
+            self.my_plex_account.FRIENDSERVERS.format(
+                machineId=self.plex_server.machineIdentifier,
+                serverId=server.id,
             )
         )
         return [
@@ -122,18 +154,18 @@ class Plex:
             return True
         return (
             True
-            if self.my_plex_account.user(user_id)
-            .server(self.plex_server_name)
-            .numLibraries
+            if self._get_user(user_id).server(self.plex_server_name).numLibraries
             == 6
             else False
         )
 
-    def update_user_shared_libs(self, user_id, libs: list):
+    def update_user_shared_libs(self, user_id, libs: list, invalidate: bool = True):
         """update shared libraries with specified user by id"""
         self.my_plex_account.updateFriend(
-            self.my_plex_account.user(user_id), self.plex_server, sections=libs
+            self._get_user(user_id), self.plex_server, sections=libs
         )
+        if invalidate:
+            self.invalidate_users()
 
     def invite_friend(self, user, libs=None):
         try:
@@ -146,6 +178,7 @@ class Plex:
             logging.error(e)
             return False
         else:
+            self.invalidate_users()
             return True
 
     def add_shared_libs_for_all_users(self, add_sections: Union[str, list]):
@@ -154,9 +187,7 @@ class Plex:
         if isinstance(add_sections, str):
             add_sections = [add_sections]
 
-        if not self.users_by_email:
-            self.get_users()
-
+        # 全部更新完成后再统一失效用户列表缓存，避免每个用户都重新拉取一次
         for email, user_info in self.users_by_email.items():
             if (not email) or email == settings.PLEX_ADMIN_EMAIL:
                 continue
@@ -165,12 +196,15 @@ class Plex:
                     cur_libs = self.get_user_shared_libs_by_id(user_info[0])
                     cur_libs.extend(add_sections)
                     new_libs = list(set(cur_libs))
-                    self.update_user_shared_libs(user_info[0], libs=new_libs)
+                    self.update_user_shared_libs(
+                        user_info[0], libs=new_libs, invalidate=False
+                    )
                 except Exception:
                     logging.error(
                         f"Failed to update libraries({', '.join(new_libs)}) for {user_info[1].username}"
                     )
                     continue
+        self.invalidate_users()
 
     def _authenticate_user_by_username(
         self, username: str, password: str
@@ -260,8 +294,9 @@ class Plex:
             tuple: (是否成功, 消息)
         """
         try:
-            user = self.my_plex_account.user(user_id)
+            user = self._get_user(user_id)
             self.my_plex_account.removeFriend(user)
+            self.invalidate_users()
             logger.info(f"Successfully removed Plex friend: {user_id}")
             return True, "ok"
         except Exception as e:
@@ -0,0 +1,69 @@
+"""异步限流工具"""
+
+import asyncio
+from time import monotonic
+from typing import Optional
+from urllib.parse import urlsplit
+
+
+class AsyncRateLimiter:
+    """异步令牌桶限流器
+
+    Args:
+        rate: 每秒补充的令牌数
+        capacity: 桶容量（允许的突发请求数），默认与 rate 相同
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1.0):
+        """获取令牌，不足时等待"""
+        async with self._lock:
+            while True:
+                now = monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """暂停发放令牌（例如收到 429 retry_after 时）"""
+        self._paused_until = max(self._paused_until, monotonic() + seconds)
+
+
+class HostRateLimiter:
+    """按主机分别限流"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity
+        self._limiters: dict[str, AsyncRateLimiter] = {}
+
+    def for_url(self, url: str) -> AsyncRateLimiter:
+        host = urlsplit(url).hostname or ""
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = AsyncRateLimiter(self.rate, self.capacity)
+            self._limiters[host] = limiter
+        return limiter
+
+    async def acquire(self, url: str):
+        await self.for_url(url).acquire()
@@ -1,4 +1,9 @@
-"""Redis 线路同步工具。"""
+"""Redis 线路同步工具。
+
+路由键变更后会在 ROUTE_CHANNEL 上发布变更事件，事件携带单调递增的路由版本号
+（保存在 ROUTE_VERSION_KEY）。OpenResty 把路由缓存在 ngx.shared 字典中，
+收到事件后失效对应的键；发现版本号不连续时说明漏收了事件，清空整个本地缓存。
+"""
 
 from __future__ import annotations
 
@@ -7,6 +12,23 @@ from typing import Optional
 from app.log import logger
 from app.redis_client import Redis
 
+_RECONCILE_CHUNK_SIZE = 1000
+
+ROUTE_VERSION_KEY = "media_route:version"
+ROUTE_CHANNEL = "media_route:changes"
+
+# KEYS[1]: 版本号键；ARGV[1]: 频道，ARGV[2..]: 变更的路由键
+# 在 Redis 中原子地递增版本号并发布，保证事件的版本号与发布顺序一致
+_PUBLISH_SCRIPT = """
+local version = redis.call('INCR', KEYS[1])
+local keys = {}
+for i = 2, #ARGV do
+    keys[#keys + 1] = ARGV[i]
+end
+redis.call('PUBLISH', ARGV[1], cjson.encode({version = version, keys = keys}))
+return version
+"""
+
 
 class RedisLineSync:
     """同步 Plex / Emby 线路到 Redis，供 Nginx/Lua 动态路由读取。"""
@@ -14,25 +36,75 @@ class RedisLineSync:
     def __init__(self, db: int = 0):
         self.db = db
         self._redis_wrapper = None
+        self._publish_script = None
+        self._scripts_client = None
 
     def _get_client(self):
         if self._redis_wrapper is None:
             self._redis_wrapper = Redis(db=self.db)
         return self._redis_wrapper.get_connection()
 
+    def _publish_changes(self, client, pipeline, keys: list[str]) -> None:
+        """在写入路由的 pipeline 末尾排入版本号递增和变更事件发布"""
+        if self._scripts_client is not client:
+            self._publish_script = client.register_script(_PUBLISH_SCRIPT)
+            self._scripts_client = client
+        self._publish_script(
+            keys=[ROUTE_VERSION_KEY], args=[ROUTE_CHANNEL, *keys], client=pipeline
+        )
+
     def _sync_key(self, key: str, target: Optional[str]) -> bool:
         try:
             client = self._get_client()
+            pipeline = client.pipeline(transaction=False)
             if target:
-                client.set(key, str(target).strip())
+                pipeline.set(key, str(target).strip())
             else:
-                client.delete(key)
+                pipeline.delete(key)
+            self._publish_changes(client, pipeline, [key])
+            pipeline.execute()
             return True
         except Exception as exc:
             self._redis_wrapper = None
             logger.error("Redis 线路同步失败 key=%s target=%s error=%s", key, target, exc)
             return False
 
+    def reconcile(self, routes: dict[str, Optional[str]]) -> dict[str, int]:
+        """批量对账路由键，routes 中 target 为空表示该键应删除。
+
+        分批 MGET 读取当前值，只把有差异的键通过 pipeline 中的 MSET / DEL 写入。
+        """
+        summary = {"total": len(routes), "set": 0, "deleted": 0, "unchanged": 0}
+        client = self._get_client()
+        keys = list(routes)
+        try:
+            for start in range(0, len(keys), _RECONCILE_CHUNK_SIZE):
+                chunk = keys[start : start + _RECONCILE_CHUNK_SIZE]
+                to_set = {}
+                to_delete = []
+                for key, current in zip(chunk, client.mget(chunk)):
+                    target = routes[key]
+                    if target:
+                        if current != target:
+                            to_set[key] = target
+                    elif current is not None:
+                        to_delete.append(key)
+                if to_set or to_delete:
+                    pipeline = client.pipeline(transaction=False)
+                    if to_set:
+                        pipeline.mset(to_set)
+                    if to_delete:
+                        pipeline.delete(*to_delete)
+                    self._publish_changes(client, pipeline, [*to_set, *to_delete])
+                    pipeline.execute()
+                summary["set"] += len(to_set)
+                summary["deleted"] += len(to_delete)
+                summary["unchanged"] += len(chunk) - len(to_set) - len(to_delete)
+        except Exception:
+            self._redis_wrapper = None
+            raise
+        return summary
+
     @staticmethod
     def _normalize_identity(identity: Optional[str]) -> Optional[str]:
         if identity is None:
@@ -41,12 +113,31 @@ class RedisLineSync:
         normalized_identity = str(identity).strip().lower()
         return normalized_identity or None
 
+    @classmethod
+    def plex_identity_key(cls, plex_identity: Optional[str]) -> Optional[str]:
+        normalized_identity = cls._normalize_identity(plex_identity)
+        return f"plex_email:{normalized_identity}" if normalized_identity else None
+
+    @classmethod
+    def plex_id_key(cls, plex_id: Optional[str]) -> Optional[str]:
+        normalized_plex_id = cls._normalize_identity(plex_id)
+        return f"plex_id:{normalized_plex_id}" if normalized_plex_id else None
+
+    @staticmethod
+    def emby_id_key(emby_id: Optional[str]) -> Optional[str]:
+        return f"emby_line:{emby_id}" if emby_id else None
+
+    @classmethod
+    def emby_username_key(cls, emby_username: Optional[str]) -> Optional[str]:
+        normalized_username = cls._normalize_identity(emby_username)
+        return f"emby_username:{normalized_username}" if normalized_username else None
+
     def sync_plex_line(self, plex_identity: Optional[str], target: Optional[str]) -> bool:
-        normalized_identity = self._normalize_identity(plex_identity)
-        if not normalized_identity:
+        key = self.plex_identity_key(plex_identity)
+        if not key:
             logger.warning("同步 Plex 线路时缺少有效标识")
             return False
-        return self._sync_key(f"plex_email:{normalized_identity}", target)
+        return self._sync_key(key, target)
 
     def sync_plex_username_line(
         self, plex_username: Optional[str], target: Optional[str]
@@ -54,11 +145,11 @@ class RedisLineSync:
         return self.sync_plex_line(plex_username, target)
 
     def sync_plex_id_line(self, plex_id: Optional[str], target: Optional[str]) -> bool:
-        normalized_plex_id = self._normalize_identity(plex_id)
-        if not normalized_plex_id:
+        key = self.plex_id_key(plex_id)
+        if not key:
             logger.warning("同步 Plex 线路时缺少 plex_id")
             return False
-        return self._sync_key(f"plex_id:{normalized_plex_id}", target)
+        return self._sync_key(key, target)
 
     def sync_plex_email_line(self, plex_email: Optional[str], target: Optional[str]) -> bool:
         return self.sync_plex_line(plex_email, target)
@@ -67,7 +158,7 @@ class RedisLineSync:
         if not emby_id:
             logger.warning("同步 Emby 线路时缺少 emby_id")
             return False
-        return self._sync_key(f"emby_line:{emby_id}", target)
+        return self._sync_key(self.emby_id_key(emby_id), target)
 
     def sync_emby_username_line(
         self, emby_username: Optional[str], target: Optional[str]
@@ -76,12 +167,12 @@ class RedisLineSync:
             logger.warning("同步 Emby 线路时缺少 emby_username")
             return False
 
-        normalized_username = str(emby_username).strip().lower()
-        if not normalized_username:
+        key = self.emby_username_key(emby_username)
+        if not key:
             logger.warning("同步 Emby 线路时 emby_username 无效")
             return False
 
-        return self._sync_key(f"emby_username:{normalized_username}", target)
+        return self._sync_key(key, target)
 
 
 redis_line_sync = RedisLineSync()
@@ -325,31 +325,67 @@ def sync_user_media_routes(db: Any, tg_id: int) -> tuple[bool, list[str]]:
     return not errors, errors
 
 
-def sync_all_media_routes(db: Any) -> tuple[int, list[int]]:
-    """启动时全量回填 Redis 路由，补齐历史用户映射。"""
-    synced_count = 0
-    failed_tg_ids: list[int] = []
+def build_media_route_plan(db: Any) -> dict[str, Optional[str]]:
+    """用一次联表查询计算全部已绑定用户的期望路由，target 为空表示应删除该键。
 
+    与 sync_user_media_routes 的规则一致：开启共享反代时优先使用共享反代，
+    否则使用用户绑定的线路。
+    """
     rows = db.cur.execute(
         """
-        SELECT DISTINCT tg_id
-        FROM (
-            SELECT tg_id FROM user WHERE tg_id IS NOT NULL
-            UNION
-            SELECT tg_id FROM emby_user WHERE tg_id IS NOT NULL
-            UNION
-            SELECT tg_id FROM shared_proxy_profile WHERE tg_id IS NOT NULL
-        )
-        ORDER BY tg_id
+        SELECT 'plex', u.plex_id, u.plex_username, u.plex_email, u.plex_line,
+            sp.custom_domain, sp.custom_port, sp.is_enabled
+        FROM user u
+        LEFT JOIN shared_proxy_profile sp ON sp.tg_id = u.tg_id
+        WHERE u.tg_id IS NOT NULL
+        UNION ALL
+        SELECT 'emby', e.emby_id, e.emby_username, NULL, e.emby_line,
+            sp.custom_domain, sp.custom_port, sp.is_enabled
+        FROM emby_user e
+        LEFT JOIN shared_proxy_profile sp ON sp.tg_id = e.tg_id
+        WHERE e.tg_id IS NOT NULL
         """
     ).fetchall()
 
-    for row in rows:
-        tg_id = row[0]
-        ok, _ = sync_user_media_routes(db, tg_id)
-        if ok:
-            synced_count += 1
+    resolved_lines: dict[Any, Optional[str]] = {}
+    routes: dict[str, Optional[str]] = {}
+    for service, media_id, username, email, line, domain, port, enabled in rows:
+        if enabled and domain:
+            target = f"{domain}:{port}"
         else:
-            failed_tg_ids.append(int(tg_id))
+            if line not in resolved_lines:
+                resolved_lines[line] = _resolve_bound_line_target(line)
+            target = resolved_lines[line]
+        target = str(target).strip() if target else None
+
+        if service == "plex":
+            keys = (
+                redis_line_sync.plex_id_key(media_id),
+                redis_line_sync.plex_identity_key(username),
+                redis_line_sync.plex_identity_key(email),
+            )
+        else:
+            keys = (
+                redis_line_sync.emby_id_key(media_id),
+                redis_line_sync.emby_username_key(username),
+            )
+        for key in keys:
+            if key:
+                routes[key] = target
+    return routes
+
 
-    return synced_count, failed_tg_ids
+def sync_all_media_routes(db: Any) -> dict[str, int]:
+    """全量对账 Redis 路由，补齐历史用户映射，返回变更统计。
+
+    批量读取 Redis 当前值后只写入有差异的键，用于启动回填和管理员全量重新同步。
+    """
+    summary = redis_line_sync.reconcile(build_media_route_plan(db))
+    logger.info(
+        "媒体路由对账完成: 共 %s 个键，写入 %s，删除 %s，未变化 %s",
+        summary["total"],
+        summary["set"],
+        summary["deleted"],
+        summary["unchanged"],
+    )
+    return summary
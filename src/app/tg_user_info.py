@@ -0,0 +1,95 @@
+"""Telegram 用户信息内存索引
+
+TG 用户信息缓存文件格式:
+    {tg_id: {"first_name": first_name, "username": username, "added": timestamp, "photo_url": url}}
+
+索引在进程内常驻，只有在缓存文件 mtime 变化时才重新反序列化，
+`refresh_tg_user_info` 通过 `save` 写回缓存并直接把结果灌入索引。
+"""
+
+import os
+import pickle
+import threading
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import filelock
+from app.config import settings
+from app.log import logger
+
+
+class TGUserInfoIndex:
+    """进程内共享的 TG 用户信息索引"""
+
+    def __init__(self, cache_path: Callable[[], Path] = lambda: settings.TG_USER_INFO_CACHE_PATH):
+        self._cache_path = cache_path
+        self._lock = threading.Lock()
+        self._data: dict = {}
+        self._mtime_ns: Optional[int] = None
+
+    def _stat_mtime(self, path: Path) -> Optional[int]:
+        try:
+            return path.stat().st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _ensure_fresh(self) -> dict:
+        """缓存文件变化时重新加载，返回当前快照"""
+        path = self._cache_path()
+        mtime_ns = self._stat_mtime(path)
+        if mtime_ns is None:
+            if self._mtime_ns is not None or not self._data:
+                logger.warning(f"Not found {path}")
+            return self._data
+        if mtime_ns == self._mtime_ns:
+            return self._data
+
+        with self._lock:
+            if mtime_ns == self._mtime_ns:
+                return self._data
+            try:
+                with open(path, "rb") as f:
+                    data = pickle.load(f)
+            except Exception as e:
+                logger.error(f"加载 TG 用户信息缓存失败: {e}")
+                return self._data
+            # 整体替换引用，读取方无需加锁
+            self._data = data if isinstance(data, dict) else {}
+            self._mtime_ns = mtime_ns
+            return self._data
+
+    def get(self, tg_id: int) -> dict:
+        return self._ensure_fresh().get(tg_id, {})
+
+    def get_many(self, tg_ids: Iterable[int]) -> dict[int, dict]:
+        """批量获取用户信息，缺失的用户返回空字典"""
+        data = self._ensure_fresh()
+        return {tg_id: data.get(tg_id, {}) for tg_id in tg_ids}
+
+    def snapshot(self) -> dict:
+        """返回当前全部用户信息的副本"""
+        return dict(self._ensure_fresh())
+
+    def feed(self, data: dict):
+        """由刷新任务写入最新数据，并记录对应的文件 mtime 避免重复加载"""
+        with self._lock:
+            self._data = dict(data)
+            self._mtime_ns = self._stat_mtime(self._cache_path())
+
+    def save(self, data: dict):
+        """原子写回缓存文件并更新索引"""
+        path = self._cache_path()
+        tmp_path = path.with_name(path.name + ".tmp")
+        with filelock.FileLock(str(path) + ".lock"):
+            with open(tmp_path, "wb") as f:
+                pickle.dump(data, f)
+            os.replace(tmp_path, path)
+            self.feed(data)
+
+    def clear(self):
+        with self._lock:
+            self._data = {}
+            self._mtime_ns = None
+
+
+tg_user_info_index = TGUserInfoIndex()
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""流量日志常驻消费者
+
+替代每分钟 LPOP 固定条数的定时任务，持续从 filebeat_nginx_stream_logs 队列阻塞读取：
+
+- BLMOVE 把日志原子地移动到本消费者的 processing 列表，写库提交后再 LTRIM 掉该批次（ACK），
+  进程在批次中途崩溃时，重启后会先重放 processing 列表中未确认的日志
+- 消费者定期刷新心跳键，启动时接管没有存活心跳的其他 processing 列表，
+  容器重建导致消费者 ID 变化时遗留的日志也不会丢失
+- 每批最多 TRAFFIC_CONSUMER_BATCH_SIZE 条，写库完成后才读取下一批，形成背压
+- stop() 后处理完当前批次再退出
+- 记录处理量、积压长度和日志延迟，定期输出到日志
+"""
+
+import asyncio
+import json
+import socket
+import threading
+from datetime import datetime
+from time import monotonic, time
+from typing import Any, Optional
+
+import redis.asyncio as aioredis
+
+from app.config import settings
+from app.db import DB
+from app.identity_cache import traffic_identity_cache
+from app.log import logger
+from app.nginx_traffic_state import PlaySessionStore
+from app.update_db import (
+    _TRAFFIC_ACTIVE_KEY,
+    _TRAFFIC_QUEUE_KEY,
+    ingest_traffic_logs,
+)
+
+_METRICS_LOG_INTERVAL_SECONDS = 60
+_RETRY_BACKOFF_SECONDS = 5
+_ACTIVE_MARK_TTL_SECONDS = 120
+_HEARTBEAT_TTL_SECONDS = 120
+
+
+class TrafficStreamConsumer:
+    """流量日志队列消费者"""
+
+    def __init__(
+        self,
+        redis_client: Optional[Any] = None,
+        *,
+        queue_key: str = _TRAFFIC_QUEUE_KEY,
+        consumer_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        block_timeout: Optional[int] = None,
+    ) -> None:
+        self.batch_size = batch_size or settings.TRAFFIC_CONSUMER_BATCH_SIZE
+        self.block_timeout = block_timeout or settings.TRAFFIC_CONSUMER_BLOCK_TIMEOUT
+        self.queue_key = queue_key
+        # consumer_id 在重启后保持不变时直接重放自己的 processing 列表，
+        # 变化时由启动时的接管逻辑找回旧列表中的日志
+        self.consumer_id = (
+            consumer_id or settings.TRAFFIC_CONSUMER_ID or socket.gethostname()
+        )
+        self.processing_key = f"{queue_key}:processing:{self.consumer_id}"
+        self.heartbeat_key = f"{queue_key}:consumer:{self.consumer_id}"
+        self._recovered = False
+        self._redis = redis_client
+        self._stopping = threading.Event()
+        self._has_pending = True
+        self._emby_play_sessions = PlaySessionStore()
+        self._last_metrics_log = monotonic()
+        self.metrics = {
+            "batches": 0,
+            "received": 0,
+            "processed": 0,
+            "errors": 0,
+            "backlog": 0,
+            "lag_seconds": 0.0,
+            "last_batch_seconds": 0.0,
+            "last_record_at": None,
+        }
+
+    @property
+    def redis(self):
+        if self._redis is None:
+            self._redis = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD or None,
+                db=15,
+                decode_responses=True,
+                socket_connect_timeout=5,
+                # 阻塞读取期间不能触发 socket 超时
+                socket_timeout=self.block_timeout + 5,
+            )
+        return self._redis
+
+    async def _recover_orphans(self) -> int:
+        """把没有存活消费者的 processing 列表移入本消费者的 processing 列表"""
+        prefix = f"{self.queue_key}:processing:"
+        recovered = 0
+        async for key in self.redis.scan_iter(match=f"{prefix}*"):
+            owner = key[len(prefix):]
+            if owner == self.consumer_id:
+                continue
+            if await self.redis.exists(f"{self.queue_key}:consumer:{owner}"):
+                continue
+            moved = 0
+            while await self.redis.lmove(key, self.processing_key, "LEFT", "RIGHT") is not None:
+                moved += 1
+            if moved:
+                logger.warning(f"接管消费者 {owner} 遗留的 {moved} 条未确认流量日志")
+                recovered += moved
+        if recovered:
+            self._has_pending = True
+        return recovered
+
+    async def _next_batch(self) -> list:
+        """读取下一批日志：优先重放未确认的 processing 列表，否则阻塞等待新日志"""
+        await self.redis.set(self.heartbeat_key, int(time()), ex=_HEARTBEAT_TTL_SECONDS)
+        if not self._recovered:
+            await self._recover_orphans()
+            self._recovered = True
+
+        if self._has_pending:
+            # 接管的列表可能很长，重放同样按 batch_size 分批
+            pending = await self.redis.lrange(self.processing_key, 0, self.batch_size - 1)
+            if pending:
+                logger.info(f"重放 {len(pending)} 条未确认的流量日志")
+                return pending
+            self._has_pending = False
+
+        first = await self.redis.blmove(
+            self.queue_key, self.processing_key, self.block_timeout, "LEFT", "RIGHT"
+        )
+        if first is None:
+            return []
+
+        batch = [first]
+        if self.batch_size > 1:
+            pipeline = self.redis.pipeline(transaction=False)
+            for _ in range(self.batch_size - 1):
+                pipeline.lmove(self.queue_key, self.processing_key, "LEFT", "RIGHT")
+            batch.extend(item for item in await pipeline.execute() if item is not None)
+        return batch
+
+    async def _handle_batch(self, batch: list) -> None:
+        started = monotonic()
+        # 批次写入失败时保留 processing 列表，下一轮重放
+        self._has_pending = True
+        _db = DB()
+        try:
+            processed = await ingest_traffic_logs(
+                _db,
+                batch,
+                emby_play_sessions=self._emby_play_sessions,
+            )
+        finally:
+            _db.close()
+
+        # 只确认本批次，processing 列表中剩余的日志下一轮继续重放
+        pipeline = self.redis.pipeline(transaction=False)
+        pipeline.ltrim(self.processing_key, len(batch), -1)
+        pipeline.llen(self.processing_key)
+        pipeline.set(_TRAFFIC_ACTIVE_KEY, int(time()), ex=_ACTIVE_MARK_TTL_SECONDS)
+        pipeline.llen(self.queue_key)
+        _, remaining, _, backlog = await pipeline.execute()
+        self._has_pending = remaining > 0
+
+        self.metrics["batches"] += 1
+        self.metrics["received"] += len(batch)
+        self.metrics["processed"] += processed
+        self.metrics["backlog"] = backlog
+        self.metrics["last_batch_seconds"] = monotonic() - started
+        self.metrics["last_record_at"] = time()
+        self.metrics["lag_seconds"] = self._record_lag(batch[-1])
+
+        self._emby_play_sessions.expire()
+
+    @staticmethod
+    def _record_lag(raw_log: str) -> float:
+        """计算日志产生时间到入库的延迟（秒）"""
+        try:
+            timestamp = json.loads(raw_log).get("@timestamp", "")
+            produced_at = datetime.fromisoformat(str(timestamp).replace("Z", "+00:00"))
+            return max(0.0, time() - produced_at.timestamp())
+        except Exception:
+            return 0.0
+
+    def _log_metrics(self, force: bool = False) -> None:
+        if not force and monotonic() - self._last_metrics_log < _METRICS_LOG_INTERVAL_SECONDS:
+            return
+        self._last_metrics_log = monotonic()
+        metrics = self.metrics
+        cache_stats = traffic_identity_cache.stats()
+        logger.info(
+            f"流量消费者: 批次 {metrics['batches']}, 接收 {metrics['received']}, "
+            f"入库 {metrics['processed']}, 错误 {metrics['errors']}, "
+            f"积压 {metrics['backlog']}, 延迟 {metrics['lag_seconds']:.1f}s, "
+            f"身份缓存命中率 {cache_stats['hit_rate']:.1%}"
+        )
+
+    async def run(self) -> None:
+        """消费循环，stop() 后处理完当前批次退出"""
+        logger.info(f"流量消费者已启动: {self.processing_key}")
+        try:
+            while not self._stopping.is_set():
+                try:
+                    batch = await self._next_batch()
+                    if batch:
+                        await self._handle_batch(batch)
+                except Exception as e:
+                    self.metrics["errors"] += 1
+                    logger.error(f"流量消费者处理批次失败，{_RETRY_BACKOFF_SECONDS} 秒后重试: {e}")
+                    await asyncio.sleep(_RETRY_BACKOFF_SECONDS)
+                self._log_metrics()
+        finally:
+            self._log_metrics(force=True)
+            try:
+                await self.redis.close()
+            except Exception as e:
+                logger.error(f"关闭流量消费者 Redis 连接时出错: {e}")
+            logger.info("流量消费者已停止")
+
+    def stop(self) -> None:
+        self._stopping.set()
+
+    def start_in_thread(self) -> threading.Thread:
+        """在独立线程和事件循环中运行，不占用 Bot 的事件循环"""
+        thread = threading.Thread(
+            target=asyncio.run,
+            args=(self.run(),),
+            name="traffic-consumer",
+            daemon=True,
+        )
+        thread.start()
+        return thread
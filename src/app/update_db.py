@@ -4,6 +4,7 @@ import re
 from datetime import datetime
 from pathlib import Path
 from time import time
+from typing import Callable, Iterable, Optional
 from urllib.parse import parse_qs, urlparse
 from uuid import NAMESPACE_URL, uuid3
 
@@ -14,20 +15,30 @@ from app.cache import (
     emby_api_key_cache,
     plex_token_cache,
     stream_traffic_cache,
-    user_credits_cache,
     user_info_cache,
 )
 from app.config import settings
+from app.credit_settlement import CreditSettlement
+from app.credits_cache import publish_user_credits, reconcile_user_credits
 from app.db import DB
+from app.identity_cache import traffic_identity_cache
 from app.invitation_utils import INVITATION_EXPIRE_DAYS, generate_unique_invitation_code
+from app.leaderboard import PLEX_WATCHED_TIME, rebuild_boards, refresh_members
 from app.emby import Emby
 from app.log import logger
+from app.nginx_traffic_state import (
+    NginxTrafficState,
+    open_nginx_traffic_state,
+)
+from app.notifier import enqueue_notifications
 from app.plex import Plex
+from app.rate_limit import HostRateLimiter
 from app.tautulli import Tautulli
 from app.utils.utils import (
+    _tg_api_get,
+    get_thread_safe_session,
     get_user_name_from_tg_id,
     get_user_total_duration,
-    send_message_by_url,
 )
 
 
@@ -37,69 +48,71 @@ _NGINX_ACCESS_LOG_RE = re.compile(
     r'"(?P<method>\S+) (?P<request_uri>\S+) (?P<protocol>[^"]+)" '
     r'(?P<status>\d{3}) (?P<bytes_sent>\d+)'
 )
+_ACCESS_LOG_PREFILTER_RE = re.compile(rb'" 2\d\d \d{4,}')
+_PLEX_STREAM_PATH_PREFILTER_RE = re.compile(
+    rb"/library/parts/|/video/:/transcode/|/library/files/", re.IGNORECASE
+)
+_JSON_STATUS_PREFILTER_RE = re.compile(rb'"status"\s*:\s*"?(\d{3})')
+_JSON_BYTES_SENT_PREFILTER_RE = re.compile(rb'"bytes_sent"\s*:\s*"?(\d+)')
+_NGINX_TAIL_CHUNK_BYTES = 1 << 20
+_NGINX_TAIL_MAX_BYTES = 64 << 20
 _EMBY_USER_ID_PATH_RE = re.compile(r"/Users/([^/]+)/", re.IGNORECASE)
 _PLEX_DIRECT_PLAY_PATH_RE = re.compile(r"^/library/parts/\d+/.+", re.IGNORECASE)
 _PLEX_TRANSCODE_PATH_RE = re.compile(r"^/video/:/transcode/", re.IGNORECASE)
 _PLEX_FILE_PATH_RE = re.compile(r"^/library/files/", re.IGNORECASE)
 _PLEX_METADATA_ID_RE = re.compile(r"/library/metadata/(\d+)", re.IGNORECASE)
-_EMBY_SESSION_TTL_SECONDS = 6 * 60 * 60
-_EMBY_SESSION_STATE_LIMIT = 2048
 _PLEX_TAUTULLI_HISTORY_CACHE_TTL_SECONDS = 5 * 60
 _plex_tautulli_history_cache: dict[str, tuple[float, list[dict]]] = {}
+_TRAFFIC_QUEUE_KEY = "filebeat_nginx_stream_logs"
+_TRAFFIC_DEAD_LETTER_KEY = f"{_TRAFFIC_QUEUE_KEY}:dead"
+# 常驻消费者最近处理过数据的标记，存在时定时任务不再从 Nginx 日志补采
+_TRAFFIC_ACTIVE_KEY = f"{_TRAFFIC_QUEUE_KEY}:active"
 
 
-def _load_nginx_traffic_state() -> dict:
-    path = settings.NGINX_TRAFFIC_STATE_PATH
-    default_state = {
-        "files": {},
-        "emby_play_sessions": {},
-    }
+def _open_nginx_traffic_state() -> NginxTrafficState:
+    return open_nginx_traffic_state(
+        settings.NGINX_TRAFFIC_STATE_PATH,
+        legacy_json_path=settings.DATA_PATH / "nginx_traffic_state.json",
+    )
 
-    if not path.exists():
-        return default_state
 
-    try:
-        with open(path, "r", encoding="utf-8") as handle:
-            state = json.load(handle)
-        if not isinstance(state, dict):
-            return default_state
-    except Exception as exc:
-        logger.warning(f"读取 Nginx 流量状态文件失败，将重新初始化: {exc}")
-        return default_state
-
-    state.setdefault("files", {})
-    state.setdefault("emby_play_sessions", {})
-    return state
-
-
-def _save_nginx_traffic_state(state: dict) -> None:
-    path = settings.NGINX_TRAFFIC_STATE_PATH
-    path.parent.mkdir(parents=True, exist_ok=True)
-    temp_path = path.with_suffix(".tmp")
-    with open(temp_path, "w", encoding="utf-8") as handle:
-        json.dump(state, handle, ensure_ascii=False, indent=2, sort_keys=True)
-    temp_path.replace(path)
-
-
-def _cleanup_emby_play_sessions(play_sessions: dict) -> dict:
-    now_ts = int(time())
-    kept_items = []
-    for session_id, session_data in play_sessions.items():
-        if not isinstance(session_data, dict):
-            continue
-        updated_at = int(session_data.get("updated_at") or 0)
-        if now_ts - updated_at > _EMBY_SESSION_TTL_SECONDS:
-            continue
-        if not session_data.get("username"):
-            continue
-        kept_items.append((session_id, session_data))
-
-    kept_items.sort(
-        key=lambda item: int(item[1].get("updated_at") or 0),
-        reverse=True,
-    )
-    kept_items = kept_items[:_EMBY_SESSION_STATE_LIMIT]
-    return {session_id: session_data for session_id, session_data in kept_items}
+# 补采状态在进程内常驻，每次任务只写入变化的偏移和会话
+_nginx_traffic_state: Optional[NginxTrafficState] = None
+
+
+def _get_nginx_traffic_state() -> NginxTrafficState:
+    global _nginx_traffic_state
+    if _nginx_traffic_state is None:
+        _nginx_traffic_state = _open_nginx_traffic_state()
+    else:
+        _nginx_traffic_state.reload_if_changed()
+    return _nginx_traffic_state
+
+
+def _discard_nginx_traffic_state() -> None:
+    """任务出错时丢弃内存状态，下次从已保存的偏移重新读取"""
+    global _nginx_traffic_state
+    if _nginx_traffic_state is not None:
+        _nginx_traffic_state.close()
+        _nginx_traffic_state = None
+
+
+def _prefilter_plex_json_line(line: bytes) -> bool:
+    """在完整解析 JSON 前用字节匹配排除非播放请求、非 2xx 和小于 1KB 的记录"""
+    if not _PLEX_STREAM_PATH_PREFILTER_RE.search(line):
+        return False
+    status = _JSON_STATUS_PREFILTER_RE.search(line)
+    if status and not status.group(1).startswith(b"2"):
+        return False
+    bytes_sent = _JSON_BYTES_SENT_PREFILTER_RE.search(line)
+    if bytes_sent and int(bytes_sent.group(1)) < 1024:
+        return False
+    return True
+
+
+def _prefilter_access_log_line(line: bytes) -> bool:
+    """access log 中状态码为 2xx 且发送字节数至少 4 位时才需要正则解析"""
+    return _ACCESS_LOG_PREFILTER_RE.search(line) is not None
 
 
 def _read_new_log_lines(
@@ -107,7 +120,14 @@ def _read_new_log_lines(
     file_state: dict,
     *,
     limit: int,
+    prefilter: Callable[[bytes], bool] | None = None,
+    max_bytes: int = _NGINX_TAIL_MAX_BYTES,
 ) -> tuple[list[str], dict]:
+    """按块读取日志文件新增内容
+
+    只解码通过 prefilter 的行；limit 只计算通过过滤的行，单次最多扫描 max_bytes 字节。
+    末尾不完整的行不会被消费，留到下次读取。
+    """
     if not path.exists():
         return [], file_state
 
@@ -120,16 +140,29 @@ def _read_new_log_lines(
         offset = 0
 
     lines: list[str] = []
-    with open(path, "r", encoding="utf-8", errors="ignore") as handle:
+    scan_end = min(stat_info.st_size, offset + max_bytes)
+    with open(path, "rb") as handle:
         handle.seek(offset)
-        while len(lines) < limit:
-            line = handle.readline()
-            if not line:
+        pending = b""
+        while len(lines) < limit and offset + len(pending) < scan_end:
+            chunk = handle.read(
+                min(_NGINX_TAIL_CHUNK_BYTES, scan_end - offset - len(pending))
+            )
+            if not chunk:
                 break
-            text = line.strip()
-            if text:
-                lines.append(text)
-        offset = handle.tell()
+            raw_lines = (pending + chunk).split(b"\n")
+            pending = raw_lines.pop()
+            for raw_line in raw_lines:
+                offset += len(raw_line) + 1
+                raw_line = raw_line.strip()
+                if not raw_line:
+                    continue
+                if prefilter is not None and not prefilter(raw_line):
+                    continue
+                lines.append(raw_line.decode("utf-8", errors="ignore"))
+                if len(lines) >= limit:
+                    pending = b""
+                    break
 
     next_state.update(
         {
@@ -179,39 +212,48 @@ def _parse_nginx_access_log_line(line: str, *, service: str) -> dict | None:
     }
 
 
-def _collect_fallback_traffic_logs(max_records: int) -> tuple[list[dict], dict]:
-    state = _load_nginx_traffic_state()
-    next_state = {
-        "files": dict(state.get("files") or {}),
-        "emby_play_sessions": dict(state.get("emby_play_sessions") or {}),
-    }
+def _collect_fallback_traffic_logs(
+    max_records: int,
+    state: NginxTrafficState,
+) -> list[dict]:
+    """从 Nginx 日志读取新增记录，文件偏移更新到 state 中（由调用方在处理完成后保存）"""
     records: list[dict] = []
     log_dir = Path(settings.NGINX_TRAFFIC_LOG_DIR)
 
     candidates = [
-        ("plex_json", log_dir / "plex_traffic.log", "plex", _parse_nginx_json_log_line),
-        ("emby_access", log_dir / "emby_access.log", "emby", _parse_nginx_access_log_line),
+        (
+            "plex_json",
+            log_dir / "plex_traffic.log",
+            "plex",
+            _parse_nginx_json_log_line,
+            _prefilter_plex_json_line,
+        ),
+        (
+            "emby_access",
+            log_dir / "emby_access.log",
+            "emby",
+            _parse_nginx_access_log_line,
+            _prefilter_access_log_line,
+        ),
     ]
 
-    for state_key, path, service, parser in candidates:
+    for state_key, path, service, parser, prefilter in candidates:
         remaining = max_records - len(records)
         if remaining <= 0:
             break
         lines, file_state = _read_new_log_lines(
             path,
-            next_state["files"].get(state_key, {}),
+            state.file_state(state_key),
             limit=remaining,
+            prefilter=prefilter,
         )
-        next_state["files"][state_key] = file_state
+        state.set_file_state(state_key, file_state)
         for line in lines:
             parsed = parser(line, service=service)
             if parsed:
                 records.append(parsed)
 
-    next_state["emby_play_sessions"] = _cleanup_emby_play_sessions(
-        next_state["emby_play_sessions"]
-    )
-    return records, next_state
+    return records
 
 
 def _lookup_plex_user_id(_db: DB, username: str | None) -> str | None:
@@ -362,32 +404,39 @@ async def _resolve_plex_identity_from_tautulli(
         return None, None
 
     username = best_row.get("user")
-    user_id = _lookup_plex_user_id(_db, username)
+    user_id = _cached_plex_user_id(_db, username)
     return username, user_id
 
 
-async def _resolve_plex_identity(
-    _db: DB,
-    request_uri: str,
-    *,
-    timestamp: str | None = None,
-    remote_addr: str | None = None,
-    user_agent: str | None = None,
-) -> tuple[str | None, str | None]:
-    parsed_url = urlparse(request_uri)
-    query_params = parse_qs(parsed_url.query)
+def _cached_lookup(key: tuple, loader):
+    """先查身份缓存，未命中时调用 loader 并缓存结果（包括失败结果）"""
+    found, value = traffic_identity_cache.get(key)
+    if found:
+        return value
+    value = loader()
+    traffic_identity_cache.put(key, value)
+    return value
 
-    token_list = query_params.get("X-Plex-Token") or query_params.get("x-plex-token")
-    if not token_list:
-        return None, None
 
-    token = token_list[0]
+def _cached_plex_user_id(_db: DB, username: str | None) -> str | None:
+    if not username:
+        return None
+    return _cached_lookup(
+        ("plex_user", username.lower()),
+        lambda: _lookup_plex_user_id(_db, username),
+    )
+
+
+async def _resolve_plex_token_identity(
+    _db: DB,
+    token: str,
+) -> tuple[str | None, str | None]:
     cached_username = plex_token_cache.get(token)
     if isinstance(cached_username, bytes):
         cached_username = cached_username.decode("utf-8")
 
     username = cached_username
-    user_id = _lookup_plex_user_id(_db, username)
+    user_id = _cached_plex_user_id(_db, username)
     if username and user_id:
         return username, user_id
 
@@ -399,7 +448,7 @@ async def _resolve_plex_identity(
             follow_redirects=True,
         )
         if response.status_code != 200:
-            return None, None
+            raise ValueError(f"Plex account API returned {response.status_code}")
 
         import xml.etree.ElementTree as ET
 
@@ -409,20 +458,76 @@ async def _resolve_plex_identity(
             raise ValueError("Plex account API returned empty username")
 
         plex_token_cache.put(token, username)
-        user_id = _lookup_plex_user_id(_db, username)
+        user_id = _cached_plex_user_id(_db, username)
         return username, user_id
     except Exception as exc:
         logger.debug(f"通过 Plex Token 解析用户名失败: {exc}")
-        username, user_id = await _resolve_plex_identity_from_tautulli(
-            _db,
-            timestamp=timestamp,
-            remote_addr=remote_addr,
-            request_uri=request_uri,
-            user_agent=user_agent,
-        )
-        if username:
-            plex_token_cache.put(token, username)
-        return username, user_id
+        return None, None
+
+
+async def _resolve_plex_identity(
+    _db: DB,
+    request_uri: str,
+    *,
+    timestamp: str | None = None,
+    remote_addr: str | None = None,
+    user_agent: str | None = None,
+) -> tuple[str | None, str | None]:
+    parsed_url = urlparse(request_uri)
+    query_params = parse_qs(parsed_url.query)
+
+    token_list = query_params.get("X-Plex-Token") or query_params.get("x-plex-token")
+    if not token_list:
+        return None, None
+
+    token = token_list[0]
+    token_key = ("plex_token", token)
+    found, identity = traffic_identity_cache.get(token_key)
+    if not found:
+        identity = await _resolve_plex_token_identity(_db, token)
+        traffic_identity_cache.put(token_key, identity)
+    if identity[0]:
+        return identity
+
+    # Token 无法解析时，按客户端地址和 UA 匹配 Tautulli 播放历史
+    client_key = ("plex_client", remote_addr, user_agent)
+    found, identity = traffic_identity_cache.get(client_key)
+    if found:
+        return identity
+
+    username, user_id = await _resolve_plex_identity_from_tautulli(
+        _db,
+        timestamp=timestamp,
+        remote_addr=remote_addr,
+        request_uri=request_uri,
+        user_agent=user_agent,
+    )
+    if username:
+        plex_token_cache.put(token, username)
+        traffic_identity_cache.put(token_key, (username, user_id))
+    traffic_identity_cache.put(client_key, (username, user_id))
+    return username, user_id
+
+
+async def _resolve_emby_api_key(api_key: str) -> str | None:
+    key = ("emby_api_key", api_key)
+    found, username = traffic_identity_cache.get(key)
+    if found:
+        return username
+
+    username = emby_api_key_cache.get(api_key)
+    if isinstance(username, bytes):
+        username = username.decode("utf-8")
+
+    if not username:
+        try:
+            username = await Emby().get_emby_username_from_api_key(api_key)
+        except Exception as exc:
+            logger.debug(f"通过 Emby API Key 解析用户名失败: {exc}")
+            username = None
+
+    traffic_identity_cache.put(key, username)
+    return username
 
 
 async def _resolve_emby_identity(
@@ -454,29 +559,31 @@ async def _resolve_emby_identity(
         user_id = user_id_list[0]
 
     if api_key_list:
-        api_key = api_key_list[0]
-        cached_username = emby_api_key_cache.get(api_key)
-        if isinstance(cached_username, bytes):
-            cached_username = cached_username.decode("utf-8")
-        username = cached_username
-
-        if not username:
-            try:
-                username = await Emby().get_emby_username_from_api_key(api_key)
-            except Exception as exc:
-                logger.debug(f"通过 Emby API Key 解析用户名失败: {exc}")
-                username = None
+        username = await _resolve_emby_api_key(api_key_list[0])
 
     if username and not user_id:
-        username, user_id = _lookup_emby_user_by_username(_db, username)
+        lookup_username = username
+        username, user_id = _cached_lookup(
+            ("emby_username", lookup_username.lower()),
+            lambda: _lookup_emby_user_by_username(_db, lookup_username),
+        )
     elif user_id and not username:
-        username, user_id = _lookup_emby_user_by_id(_db, user_id)
+        lookup_user_id = user_id
+        username, user_id = _cached_lookup(
+            ("emby_user_id", lookup_user_id),
+            lambda: _lookup_emby_user_by_id(_db, lookup_user_id),
+        )
 
     if not username and play_session_id:
         session_data = play_sessions.get(play_session_id)
         if isinstance(session_data, dict):
             username = session_data.get("username")
             user_id = session_data.get("user_id")
+        else:
+            # 跨批次共享的会话缓存
+            found, identity = traffic_identity_cache.get(("emby_session", play_session_id))
+            if found and identity:
+                username, user_id = identity
 
     if username and play_session_id:
         play_sessions[play_session_id] = {
@@ -484,16 +591,18 @@ async def _resolve_emby_identity(
             "user_id": user_id,
             "updated_at": int(time()),
         }
+        traffic_identity_cache.put(("emby_session", play_session_id), (username, user_id))
 
     return username, user_id
 
 
-async def _process_traffic_log_entry(
+async def _build_traffic_row(
     _db: DB,
     log_data: dict,
     *,
     emby_play_sessions: dict,
-) -> bool:
+) -> tuple | None:
+    """解析一条流量日志，返回待写入 line_traffic_stats 的记录，无需统计时返回 None"""
     timestamp = log_data.get("@timestamp", "")
     service = (log_data.get("service") or "").strip().lower()
     request_uri = log_data.get("request_uri") or ""
@@ -501,17 +610,17 @@ async def _process_traffic_log_entry(
     bytes_sent = int(log_data.get("bytes_sent") or 0)
 
     if not service or not request_uri:
-        return False
+        return None
     if status_code < 200 or status_code >= 300:
-        return False
+        return None
     if bytes_sent < 1024:
-        return False
+        return None
 
     username = None
     user_id = None
     if service == "plex":
         if not _is_plex_stream_request(request_uri):
-            return False
+            return None
         username, user_id = await _resolve_plex_identity(
             _db,
             request_uri,
@@ -526,10 +635,10 @@ async def _process_traffic_log_entry(
             emby_play_sessions,
         )
     else:
-        return False
+        return None
 
     if not username:
-        return False
+        return None
 
     try:
         formatted_timestamp = (
@@ -540,302 +649,166 @@ async def _process_traffic_log_entry(
     except (ValueError, AttributeError):
         formatted_timestamp = datetime.now(settings.TZ).isoformat()
 
-    return _db.create_line_traffic_entry(
-        line=f"http-{service}",
-        send_bytes=bytes_sent,
-        service=service,
-        username=username,
-        user_id=user_id,
-        timestamp=formatted_timestamp,
+    return (
+        f"http-{service}",
+        bytes_sent,
+        service,
+        username,
+        user_id,
+        formatted_timestamp,
     )
 
 
-def _build_credit_bonus_lines(dual_bind_multiplier: float, medal_multiplier: float):
-    bonus_lines = []
-    if dual_bind_multiplier > 1.0:
-        bonus_lines.append(f"   🎁  双账号加成：×{dual_bind_multiplier:.2f}")
-    if medal_multiplier > 1.0:
-        bonus_lines.append(f"   🏅  勋章加成：×{medal_multiplier:.2f}")
-    return "\n".join(bonus_lines) + ("\n" if bonus_lines else "")
+async def _process_traffic_log_entry(
+    _db: DB,
+    log_data: dict,
+    *,
+    emby_play_sessions: dict,
+) -> bool:
+    row = await _build_traffic_row(
+        _db,
+        log_data,
+        emby_play_sessions=emby_play_sessions,
+    )
+    if row is None:
+        return False
+    return _db.create_line_traffic_entry(*row)
 
 
-def update_plex_credits():
-    """更新积分及观看时长"""
-    logger.info("开始更新 Plex 用户积分及观看时长")
-    _db = DB()
-    notification_tasks = []
+def _write_traffic_rows(_db: DB, rows: list[tuple]) -> tuple[int, list[tuple]]:
+    """批量写入流量记录，整批失败时逐条重试以隔离坏数据
+
+    Returns:
+        (成功写入条数, 写入失败的记录列表)
+    """
+    if not rows:
+        return 0, []
+    if _db.create_line_traffic_entries(rows):
+        return len(rows), []
+
+    logger.warning(f"批量写入 {len(rows)} 条流量记录失败，改为逐条写入")
+    written = 0
+    failed_rows = []
+    for row in rows:
+        if _db.create_line_traffic_entry(*row):
+            written += 1
+        else:
+            failed_rows.append(row)
+    return written, failed_rows
+
+
+def _push_traffic_dead_letters(entries: list[dict]) -> None:
+    """把处理失败的流量日志写入死信队列，便于排查和重放"""
+    if not entries:
+        return
     try:
-        _db.sync_checkin_total_rank_medals()
-        duration = get_user_total_duration(
-            Tautulli().get_home_stats(
-                1, "duration", len(Plex().users_by_id), "top_users"
-            )
+        pipeline = stream_traffic_cache.redis_client.pipeline()
+        pipeline.rpush(
+            _TRAFFIC_DEAD_LETTER_KEY,
+            *[json.dumps(entry, ensure_ascii=False, default=str) for entry in entries],
         )
-        res = _db.cur.execute("select plex_id from user")
-        users = res.fetchall()
-        for user in users:
-            plex_id = user[0]
-            play_duration = round(min(float(duration.get(plex_id, 0)), 24), 2)
-            if play_duration == 0:
-                continue
-            res = _db.cur.execute(
-                "SELECT credits,watched_time,tg_id,plex_username FROM user WHERE plex_id=?",
-                (plex_id,),
-            ).fetchone()
-            if not res:
-                continue
-            watched_time_init = res[1]
-            tg_id = res[2]
-            plex_username = res[3]
-
-            # 双账号绑定加成
-            if tg_id:
-                has_emby = bool(_db.get_emby_info_by_tg_id(tg_id))
-                dual_bind_multiplier = settings.DUAL_BIND_MULTIPLIER if has_emby else 1.0
-                medal_multiplier = _db.get_user_medal_multiplier(tg_id)
-            else:
-                dual_bind_multiplier = 1.0
-                medal_multiplier = 1.0
-            multiplier = dual_bind_multiplier * medal_multiplier
-            base_credits = min(play_duration, 8)
-            credits_inc = round(base_credits * multiplier, 2)
-
-            # 异常观看检测
-            ABUSE_THRESHOLD = settings.ABUSE_WATCH_THRESHOLD
-            is_abusive = play_duration > ABUSE_THRESHOLD
-            if is_abusive:
-                credits_inc = 0
-
-            watched_time = watched_time_init + play_duration
-            if not tg_id:
-                credits_init = res[0]
-                credits = credits_init if is_abusive else credits_init + credits_inc
-                _db.cur.execute(
-                    "UPDATE user SET credits=?,watched_time=? WHERE plex_id=?",
-                    (credits, watched_time, plex_id),
-                )
-            else:
-                credits_init = _db.cur.execute(
-                    "SELECT credits FROM statistics WHERE tg_id=?", (tg_id,)
-                ).fetchone()[0]
-                credits = credits_init if is_abusive else credits_init + credits_inc
-                _db.cur.execute(
-                    "UPDATE user SET watched_time=? WHERE plex_id=?",
-                    (watched_time, plex_id),
-                )
-                if not is_abusive:
-                    _db.cur.execute(
-                        "UPDATE statistics SET credits=? WHERE tg_id=?", (credits, tg_id)
-                    )
-                    _handle_debt_after_credit_update(_db, tg_id, credits)
+        pipeline.ltrim(
+            _TRAFFIC_DEAD_LETTER_KEY,
+            -settings.REDIS_LINE_TRAFFIC_DEAD_LETTER_LIMIT,
+            -1,
+        )
+        pipeline.execute()
+        logger.warning(f"{len(entries)} 条流量日志处理失败，已写入死信队列")
+    except Exception as e:
+        logger.error(f"写入流量日志死信队列失败，丢弃 {len(entries)} 条记录: {e}")
 
-                if is_abusive:
-                    notification_tasks.append((
-                        tg_id,
-                        f"⚠️ 今日观看时长异常 ({play_duration:.1f}h)，已超过合理阈值，本日积分已清零。如有疑问请联系管理员。",
-                    ))
-                    for chat_id in settings.TG_ADMIN_CHAT_ID:
-                        notification_tasks.append((
-                            chat_id,
-                            f"🚨 异常观看告警：Plex 用户 {plex_username} (TG: {tg_id}) 今日观看 {play_duration:.1f}h，超过阈值 {ABUSE_THRESHOLD}h",
-                        ))
-                elif play_duration > 0:
-                    bonus_line = _build_credit_bonus_lines(
-                        dual_bind_multiplier, medal_multiplier
-                    )
-                    notification_tasks.append((
-                        tg_id,
-                        f"""
-╭━━━━━━━━━━━━━━━━━━━━━━━━━╮
-┃  🎬 Plex 每日观影报告  ┃
-╰━━━━━━━━━━━━━━━━━━━━━━━━━╯
 
-🌟 今日观看收益
-━━━━━━━━━━━━━━━━━
-   ⏱️  观看时长：{play_duration:.2f} 小时
-   💎  基础积分：+{base_credits:.2f}
-{bonus_line}   ✨  实际获得：+{credits_inc:.2f}
+def _fetch_plex_durations() -> dict:
+    """Tautulli 当日各 Plex 用户观看时长（小时）"""
+    return get_user_total_duration(
+        Tautulli().get_home_stats(1, "duration", len(Plex().users_by_id), "top_users")
+    )
 
-━━━━━━━━━━━━━━━━━━━━━━━━━
 
-💰 当前总积分：{credits:.2f}
-🎞️  总观看时长：{watched_time:.2f} 小时
+def _fetch_emby_durations() -> dict:
+    """Emby 各用户累计播放时长（秒）"""
+    return Emby().get_user_total_play_time()
 
-━━━━━━━━━━━━━━━━━━━━━━━━━
-💜 MisayaMedia · 享受观影时光""",
-                    ))
 
-            logger.info(
-                f"更新 Plex 用户 {plex_username} ({plex_id}) 的积分和观看时长: "
-                f"新增观看时长 {round(play_duration, 2)} 小时，基础积分 {round(base_credits, 2)}，实际积分 {round(credits_inc, 2)}"
-            )
+_CREDIT_DURATION_FETCHERS = {
+    "plex": ("Plex", _fetch_plex_durations),
+    "emby": ("Emby", _fetch_emby_durations),
+}
 
-    except Exception as e:
-        logger.error(f"更新 Plex 用户积分及观看时长失败: {e}")
-        for chat_id in settings.TG_ADMIN_CHAT_ID:
-            notification_tasks.append(
-                (
-                    chat_id,
-                    f"更新 Plex 用户积分及观看时长失败: {e}",
-                )
-            )
-        return notification_tasks
-    else:
-        _db.con.commit()
-        logger.info("Plex 用户积分及观看时长更新完成")
-        return notification_tasks
-    finally:
-        _db.close()
 
+def settle_daily_credits(
+    services: tuple = ("plex", "emby"),
+    *,
+    dry_run: bool = False,
+) -> tuple[list, CreditSettlement | None]:
+    """批量结算 Plex / Emby 每日积分及观看时长
 
-def update_emby_credits():
-    """更新 emby 积分及观看时长"""
-    logger.info("开始更新 Emby 用户积分及观看时长")
-    emby = Emby()
+    Returns:
+        (通知列表, 结算引擎)，dry_run 时只计算并输出变化表，不写库
+    """
+    logger.info(f"开始结算每日积分: {', '.join(services)}{' (预览)' if dry_run else ''}")
     _db = DB()
-    notification_tasks = []
+    error_notifications = []
+    settlement = None
     try:
-        _db.sync_checkin_total_rank_medals()
-        duration = emby.get_user_total_play_time()
-        users = _db.cur.execute(
-            "select emby_id, tg_id, emby_watched_time, emby_credits, emby_username from emby_user"
-        ).fetchall()
-        ABUSE_THRESHOLD = settings.ABUSE_WATCH_THRESHOLD
-        for user in users:
-            emby_id, tg_id, watched_time, emby_credits_init, emby_username = user
-            watched_time = watched_time or 0.0
-            emby_credits_init = emby_credits_init or 0.0
-            playduration = round(float(duration.get(emby_id, 0)) / 3600, 2)
-            if playduration == 0:
-                continue
-
-            base_watch = max(0.0, round(playduration - watched_time, 2))
-
-            # 双账号绑定加成
-            if tg_id:
-                has_plex = bool(_db.get_plex_info_by_tg_id(tg_id))
-                dual_bind_multiplier = settings.DUAL_BIND_MULTIPLIER if has_plex else 1.0
-                medal_multiplier = _db.get_user_medal_multiplier(tg_id)
-            else:
-                dual_bind_multiplier = 1.0
-                medal_multiplier = 1.0
-            multiplier = dual_bind_multiplier * medal_multiplier
-            base_credits = min(base_watch, 8)
-            credits_inc = round(base_credits * multiplier, 2)
-
-            # 异常观看检测
-            is_abusive = base_watch > ABUSE_THRESHOLD
-            if is_abusive:
-                credits_inc = 0
-
-            if not tg_id:
-                _credits = emby_credits_init + credits_inc
-                _db.cur.execute(
-                    "UPDATE emby_user SET emby_watched_time=?,emby_credits=? WHERE emby_id=?",
-                    (playduration, _credits, emby_id),
-                )
-            else:
-                stats_info = _db.get_stats_by_tg_id(tg_id)
-                if stats_info:
-                    credits_init = stats_info[2]
-                    _credits = credits_init + credits_inc
-                    _db.update_user_credits(_credits, tg_id=tg_id)
-                    _handle_debt_after_credit_update(_db, tg_id, _credits)
-                else:
-                    _db.update_user_credits(0, emby_id=emby_id)
-                    _credits = emby_credits_init + credits_inc
-                    _db.add_user_data(tg_id, credits=_credits)
-                _db.cur.execute(
-                    "UPDATE emby_user SET emby_watched_time=? WHERE emby_id=?",
-                    (playduration, emby_id),
-                )
-
-                if is_abusive:
-                    notification_tasks.append((
-                        tg_id,
-                        f"⚠️ 今日 Emby 观看时长异常 ({base_watch:.1f}h)，已超过合理阈值，本日积分已清零。如有疑问请联系管理员。",
-                    ))
-                    for chat_id in settings.TG_ADMIN_CHAT_ID:
-                        notification_tasks.append((
-                            chat_id,
-                            f"🚨 异常观看告警：Emby 用户 {emby_username} (TG: {tg_id}) 今日观看 {base_watch:.1f}h，超过阈值 {ABUSE_THRESHOLD}h",
-                        ))
-                elif base_watch > 0:
-                    bonus_line = _build_credit_bonus_lines(
-                        dual_bind_multiplier, medal_multiplier
+        if not dry_run:
+            _db.sync_checkin_total_rank_medals()
+        settlement = CreditSettlement(_db, dry_run=dry_run)
+        for service in services:
+            label, fetch_durations = _CREDIT_DURATION_FETCHERS[service]
+            try:
+                settlement.settle(service, fetch_durations())
+            except Exception as e:
+                logger.error(f"更新 {label} 用户积分及观看时长失败: {e}")
+                for chat_id in settings.TG_ADMIN_CHAT_ID:
+                    error_notifications.append(
+                        (chat_id, f"更新 {label} 用户积分及观看时长失败: {e}")
                     )
-                    notification_tasks.append((
-                        tg_id,
-                        f"""
-╭━━━━━━━━━━━━━━━━━━━━━━━━━╮
-┃  📺 Emby 每日观影报告  ┃
-╰━━━━━━━━━━━━━━━━━━━━━━━━━╯
-
-🌟 今日观看收益
-━━━━━━━━━━━━━━━━━
-   ⏱️  观看时长：{base_watch:.2f} 小时
-   💎  基础积分：+{base_credits:.2f}
-{bonus_line}   ✨  实际获得：+{credits_inc:.2f}
-
-━━━━━━━━━━━━━━━━━━━━━━━━━
-
-💰 当前总积分：{_credits:.2f}
-🎞️  总观看时长：{playduration:.2f} 小时
-
-━━━━━━━━━━━━━━━━━━━━━━━━━
-💜 MisayaMedia · 享受观影时光""",
-                    ))
-
-            logger.info(
-                f"更新 Emby 用户 {emby_username} ({emby_id}) 的积分和观看时长: "
-                f"新增观看时长 {base_watch:.2f} 小时，基础积分 {base_credits:.2f}，实际积分 {credits_inc:.2f}"
-            )
+        settlement.apply()
     except Exception as e:
-        logger.error(f"更新 Emby 用户积分及观看时长失败: {e}")
+        logger.error(f"写入每日积分结算结果失败: {e}")
         for chat_id in settings.TG_ADMIN_CHAT_ID:
-            notification_tasks.append(
-                (
-                    chat_id,
-                    f"更新 Emby 用户积分及观看时长失败: {e}",
-                )
-            )
-        return notification_tasks
-    else:
-        _db.con.commit()
-        logger.info("Emby 用户积分及观看时长更新完成")
-        return notification_tasks
+            error_notifications.append((chat_id, f"写入每日积分结算结果失败: {e}"))
+        return error_notifications, settlement
     finally:
         _db.close()
 
+    return settlement.notifications + error_notifications, settlement
 
-async def update_credits():
-    """更新 Plex 和 Emby 用户积分及观看时长"""
-    logger.info("开始执行每日积分结算任务")
-    notification_tasks = update_plex_credits()
-    notification_tasks.extend(update_emby_credits())
-    logger.info(f"准备发送 {len(notification_tasks)} 条通知")
 
-    success_count = 0
-    fail_count = 0
+def update_plex_credits():
+    """更新 Plex 积分及观看时长"""
+    notification_tasks, _ = settle_daily_credits(("plex",))
+    return notification_tasks
 
-    for tg_id, text in notification_tasks:
-        try:
-            # 发送通知消息，使用静默模式避免打扰用户
-            await send_message_by_url(chat_id=tg_id, text=text, disable_notification=True)
-            success_count += 1
-            logger.info(f"成功发送积分结算通知给用户 {tg_id}")
-        except Exception as e:
-            fail_count += 1
-            logger.error(f"发送积分结算通知给用户 {tg_id} 失败: {str(e)}")
-        await asyncio.sleep(1)
 
-    logger.info(f"积分结算通知发送完成: 成功 {success_count} 条，失败 {fail_count} 条")
+def update_emby_credits():
+    """更新 Emby 积分及观看时长"""
+    notification_tasks, _ = settle_daily_credits(("emby",))
+    return notification_tasks
+
+
+async def update_credits(dry_run: bool = False):
+    """更新 Plex 和 Emby 用户积分及观看时长
+
+    Args:
+        dry_run: 只输出积分变化表，不写库也不发送通知
+    """
+    logger.info("开始执行每日积分结算任务")
+    notification_tasks, settlement = settle_daily_credits(dry_run=dry_run)
+    if dry_run:
+        return settlement.format_delta_table() if settlement else ""
+    # 使用静默模式避免打扰用户，由通知队列限速发送
+    queued = enqueue_notifications(notification_tasks, disable_notification=True)
+    logger.info(f"积分结算通知已加入发送队列: {queued} 条")
 
 
 def update_plex_info():
     """更新 plex 用户信息"""
     _db = DB()
     _plex = Plex()
+    # 每日同步以 plex.tv 上的最新用户列表为准
+    _plex.invalidate_users()
     try:
         users = _plex.users_by_id
         for uid, user in users.items():
@@ -921,6 +894,7 @@ def update_watched_time():
         print(e)
     else:
         _db.con.commit()
+        rebuild_boards(_db, [PLEX_WATCHED_TIME])
     finally:
         _db.close()
 
@@ -934,10 +908,10 @@ def add_all_plex_user():
         )
     )
     _plex = Plex()
-    users = [user for user in _plex.my_plex_account.users()]
-    users.append(_plex.my_plex_account)
+    users = _plex.get_users()
     _db = DB()
-    all_libs = Plex().get_libraries()
+    all_libs = _plex.get_libraries()
+    added_plex_ids = []
     try:
         _existing_users = _db.cur.execute("select plex_id from user").fetchall()
         existing_users = [user[0] for user in _existing_users]
@@ -962,11 +936,14 @@ def add_all_plex_user():
                 all_lib=all_lib_flag,
                 watched_time=watched_time,
             )
+            added_plex_ids.append(user.id)
 
     except Exception as e:
         print(e)
     else:
         _db.con.commit()
+        publish_user_credits(_db, plex_ids=added_plex_ids)
+        refresh_members(_db, PLEX_WATCHED_TIME, added_plex_ids)
     finally:
         _db.close()
 
@@ -1001,6 +978,7 @@ def update_donation_credits(old_multiplier, new_multiplier):
             )
 
         db.con.commit()
+        publish_user_credits(db, tg_ids=[tg_id for tg_id, _, _ in donations])
     except Exception as e:
         logger.error(str(e))
     finally:
@@ -1053,24 +1031,26 @@ def add_redeem_code(tg_id=None, num=1, is_privileged=False):
     finally:
         db.close()
 
-async def finish_expired_auctions_job():
-    """定时任务：结束过期的竞拍活动"""
+def finish_expired_auctions_job():
+    """定时任务：结束过期的竞拍活动（同步任务，通知写入发送队列）"""
     try:
         db = DB()
         finished_auctions = db.finish_expired_auctions()
         # 通知用户
+        notification_tasks = []
         for autction in finished_auctions:
-            await send_message_by_url(
+            notification_tasks.append((
                 autction.get("winner_id"),
                 f"恭喜你，竞拍 {autction['title']} 获胜！最终出价为 {autction['final_price']} 积分",
-            )
+            ))
             if not autction.get("credits_reduced", False):
                 # 如果未扣除积分，通知管理员
                 for chat_id in settings.TG_ADMIN_CHAT_ID:
-                    await send_message_by_url(
-                        chat_id=chat_id,
-                        text=f"用户 {autction.get('winner_id')} 在竞拍 {autction['title']} 中获胜，但未扣除积分。",
-                    )
+                    notification_tasks.append((
+                        chat_id,
+                        f"用户 {autction.get('winner_id')} 在竞拍 {autction['title']} 中获胜，但未扣除积分。",
+                    ))
+        enqueue_notifications(notification_tasks)
         return finished_auctions
     except Exception as e:
         logger.error(f"自动结束过期竞拍失败: {e}")
@@ -1078,10 +1058,72 @@ async def finish_expired_auctions_job():
         db.close()
 
 
+async def ingest_traffic_logs(
+    _db: DB,
+    values: list,
+    *,
+    emby_play_sessions: dict,
+    decode_json: bool = True,
+) -> int:
+    """解析一批流量日志并在一个事务中写入，失败的记录进入死信队列
+
+    Args:
+        values: Redis 队列中的原始 JSON 字符串，decode_json=False 时为已解析的字典
+
+    Returns:
+        int: 成功写入的记录数
+    """
+    rows: list[tuple] = []
+    row_sources: list = []
+    dead_letters: list[dict] = []
+
+    for raw_log in values:
+        try:
+            if decode_json:
+                if isinstance(raw_log, bytes):
+                    raw_log = raw_log.decode("utf-8")
+                log_data = json.loads(raw_log)
+            else:
+                log_data = raw_log
+
+            row = await _build_traffic_row(
+                _db,
+                log_data,
+                emby_play_sessions=emby_play_sessions,
+            )
+            if row is not None:
+                rows.append(row)
+                row_sources.append(raw_log)
+
+        except json.JSONDecodeError as e:
+            logger.error(f"流量日志 JSON 解析失败: {e}")
+            dead_letters.append({"raw": raw_log, "error": f"json: {e}"})
+        except Exception as e:
+            logger.error(f"处理流量日志时出错: {e}")
+            dead_letters.append({"raw": raw_log, "error": str(e)})
+
+    # 整批在一个事务中写入，避免每条记录单独提交
+    processed_count, failed_rows = _write_traffic_rows(_db, rows)
+    if failed_rows:
+        failed_set = set(failed_rows)
+        dead_letters.extend(
+            {"raw": raw_log, "error": "db write failed"}
+            for row, raw_log in zip(rows, row_sources)
+            if row in failed_set
+        )
+    _push_traffic_dead_letters(dead_letters)
+    return processed_count
+
+
 async def update_line_traffic_stats(
     count: int = settings.REDIS_LINE_TRAFFIC_STATS_HANDLE_SIZE,
+    fallback_only: bool = False,
 ):
-    """消费 HTTP 流量日志并写入排行榜统计表。"""
+    """消费 HTTP 流量日志并写入排行榜统计表。
+
+    Args:
+        fallback_only: 常驻消费者已负责 Redis 队列时为 True，仅在队列近期无数据时从 Nginx 日志补采
+    """
     lock = FileLock(str(settings.DATA_PATH / "update_line_traffic_stats.lock"))
     try:
         lock.acquire(timeout=0)
@@ -1090,21 +1132,34 @@ async def update_line_traffic_stats(
         return 0
 
     try:
-        values = stream_traffic_cache.redis_client.lpop(
-            "filebeat_nginx_stream_logs", count=count
-        )
+        if fallback_only:
+            values = None
+            if stream_traffic_cache.redis_client.exists(_TRAFFIC_ACTIVE_KEY):
+                logger.debug("流量消费者近期有数据，跳过 Nginx 日志补采")
+                return 0
+        else:
+            values = stream_traffic_cache.redis_client.lpop(
+                _TRAFFIC_QUEUE_KEY, count=count
+            )
 
         source_label = "Redis 队列"
-        state: dict | None = None
+        state: NginxTrafficState | None = None
 
         if values:
             if not isinstance(values, list):
                 values = [values]
             logger.info(f"从 Redis 队列读取到 {len(values)} 条流量日志")
         elif settings.NGINX_TRAFFIC_FALLBACK_ENABLED:
-            values, state = _collect_fallback_traffic_logs(count)
+            state = _get_nginx_traffic_state()
+            try:
+                values = _collect_fallback_traffic_logs(count, state)
+            except Exception:
+                _discard_nginx_traffic_state()
+                raise
             source_label = "Nginx 日志 fallback"
             if not values:
+                # 文件轮转等情况下偏移也可能变化
+                state.save()
                 logger.info("Redis 队列为空，Nginx fallback 也没有新的流量日志")
                 return 0
             logger.info(f"Redis 队列为空，改为从 Nginx 日志补采 {len(values)} 条流量日志")
@@ -1114,43 +1169,33 @@ async def update_line_traffic_stats(
 
         emby_play_sessions = {}
         if state is not None:
-            emby_play_sessions = dict(state.get("emby_play_sessions") or {})
+            emby_play_sessions = state.play_sessions
 
         _db = DB()
         processed_count = 0
 
         try:
-            for raw_log in values:
-                try:
-                    if state is None:
-                        if isinstance(raw_log, bytes):
-                            raw_log = raw_log.decode("utf-8")
-                        log_data = json.loads(raw_log)
-                    else:
-                        log_data = raw_log
-
-                    if await _process_traffic_log_entry(
-                        _db,
-                        log_data,
-                        emby_play_sessions=emby_play_sessions,
-                    ):
-                        processed_count += 1
-
-                except json.JSONDecodeError as e:
-                    logger.error(f"流量日志 JSON 解析失败: {e}")
-                except Exception as e:
-                    logger.error(f"处理流量日志时出错: {e}")
+            processed_count = await ingest_traffic_logs(
+                _db,
+                values,
+                emby_play_sessions=emby_play_sessions,
+                decode_json=state is None,
+            )
 
             if state is not None:
-                state["emby_play_sessions"] = _cleanup_emby_play_sessions(
-                    emby_play_sessions
-                )
-                _save_nginx_traffic_state(state)
+                state.play_sessions.expire()
+                state.save()
 
-            logger.info(f"通过 {source_label} 成功处理了 {processed_count} 条流量日志")
+            cache_stats = traffic_identity_cache.stats()
+            logger.info(
+                f"通过 {source_label} 成功处理了 {processed_count} 条流量日志，"
+                f"身份缓存命中率 {cache_stats['hit_rate']:.1%}"
+            )
             return processed_count
         except Exception as e:
             logger.error(f"更新线路流量统计时发生错误: {e}")
+            if state is not None:
+                _discard_nginx_traffic_state()
             return processed_count
         finally:
             _db.close()
@@ -1192,14 +1237,9 @@ async def update_traffic_stats_from_tautulli():
         now = datetime.now(settings.TZ)
         today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
 
-        existing_today = _db.cur.execute(
-            """SELECT DISTINCT username FROM line_traffic_stats
-               WHERE line = 'tautulli-estimate'
-                 AND timestamp >= ?
-                 AND service = 'plex'""",
-            (today_start.isoformat(),),
-        ).fetchall()
-        existing_usernames = {row[0].lower() for row in existing_today if row[0]}
+        existing_usernames = _db.get_line_traffic_usernames(
+            "tautulli-estimate", "plex", int(today_start.timestamp())
+        )
 
         for user_id, watch_hours in today_duration.items():
             if watch_hours <= 0:
@@ -1233,16 +1273,9 @@ async def update_traffic_stats_from_tautulli():
                    WHERE emby_id IS NOT NULL"""
             ).fetchall()
 
-            existing_emby_today = _db.cur.execute(
-                """SELECT DISTINCT username FROM line_traffic_stats
-                   WHERE line = 'tautulli-estimate'
-                     AND timestamp >= ?
-                     AND service = 'emby'""",
-                (today_start.isoformat(),),
-            ).fetchall()
-            existing_emby_usernames = {
-                row[0].lower() for row in existing_emby_today if row[0]
-            }
+            existing_emby_usernames = _db.get_line_traffic_usernames(
+                "tautulli-estimate", "emby", int(today_start.timestamp())
+            )
 
             for emby_id, username, _tg_id, prev_watched_time in emby_users:
                 if not username or username.lower() in existing_emby_usernames:
@@ -1284,50 +1317,65 @@ async def update_traffic_stats_from_tautulli():
 
 def rewrite_users_credits_to_redis():
     """
-    将用户积分信息写入 redis 缓存
+    对账 Redis 中的用户积分缓存
+
+    积分变动时已实时写入 Redis，这里只补齐 Redis 故障或遗漏的写入：
+    只写入与数据库不一致的键，并删除已不存在的账号
     """
     _db = DB()
     try:
-        # 从 statistics 表中获取所有用户的积分信息
-        stats = _db.cur.execute("SELECT tg_id, credits FROM statistics").fetchall()
-        user_stats = {tg_id: credits for tg_id, credits in stats}
-        # 获取 Plex 用户信息
-        plex_users = _db.cur.execute(
-            "SELECT plex_id, tg_id, credits, plex_username FROM user"
-        ).fetchall()
-        for user in plex_users:
-            # 未接受邀请，此时数据库中的 plex_id 为空
-            if not user[0]:
-                continue
-            tg_id = user[1]
-            credits = user[2]
-            plex_username = user[3]
-            if tg_id:
-                credits = user_stats.get(tg_id, 0)
-            user_credits_cache.put(f"plex:{plex_username.lower()}", credits)
-        # 获取 Emby 用户信息
-        emby_users = _db.cur.execute(
-            "SELECT emby_id, tg_id, emby_credits, emby_username FROM emby_user"
-        ).fetchall()
-        for user in emby_users:
-            tg_id = user[1]
-            credits = user[2]
-            emby_username = user[3]
-            if tg_id:
-                credits = user_stats.get(tg_id, 0)
-            user_credits_cache.put(f"emby:{emby_username.lower()}", credits)
+        changed, removed = reconcile_user_credits(_db)
+        if changed or removed:
+            logger.info(f"积分缓存对账完成: 更新 {changed} 个，删除 {removed} 个")
     except Exception as e:
         logger.error(f"检查用户积分时发生错误: {e}")
     finally:
         _db.close()
 
 
+def rebuild_leaderboards():
+    """
+    从数据库整体重建 Redis 排行榜
+
+    写入时已增量更新榜单，这里修正绑定、注销等未单独处理的变化，
+    并按重建后的累计签到总榜校正总榜勋章
+    """
+    _db = DB()
+    try:
+        result = rebuild_boards(_db)
+        logger.info(f"排行榜重建完成: {result}")
+        _db.sync_checkin_total_rank_medals()
+    except Exception as e:
+        logger.error(f"重建排行榜时发生错误: {e}")
+    finally:
+        _db.close()
+
+
+def migrate_legacy_traffic():
+    """
+    分批把旧 line_traffic_stats 表的记录迁移到月度分区
+
+    迁移完成前流量查询同时读取旧表和分区，已完成时直接返回
+    """
+    _db = DB()
+    try:
+        if not _db.legacy_traffic_pending():
+            return
+        count = _db.migrate_legacy_traffic()
+        logger.info(f"本次迁移旧流量记录 {count} 条")
+    except Exception as e:
+        logger.error(f"迁移旧流量记录时发生错误: {e}")
+    finally:
+        _db.close()
+
+
 def write_user_info_cache():
     """
     将 user info 写入 redis 缓存
     """
     _db = DB()
     try:
+        user_infos = {}
         # 获取 Plex 用户信息
         plex_users = _db.cur.execute(
             "SELECT plex_id, tg_id, plex_username, plex_email FROM user"
@@ -1341,16 +1389,13 @@ def write_user_info_cache():
             plex_username = user[2]
             plex_email = user[3]
             if plex_username:
-                user_info_cache.put(
-                    f"plex:{plex_username.lower()}",
-                    json.dumps(
-                        {
-                            "plex_id": plex_id,
-                            "tg_id": tg_id,
-                            "plex_username": plex_username,
-                            "plex_email": plex_email,
-                        }
-                    ),
+                user_infos[f"plex:{plex_username.lower()}"] = json.dumps(
+                    {
+                        "plex_id": plex_id,
+                        "tg_id": tg_id,
+                        "plex_username": plex_username,
+                        "plex_email": plex_email,
+                    }
                 )
         # 获取 Emby 用户信息
         emby_users = _db.cur.execute(
@@ -1361,139 +1406,167 @@ def write_user_info_cache():
             tg_id = user[1]
             emby_username = user[2]
             if emby_username:
-                user_info_cache.put(
-                    f"emby:{emby_username.lower()}",
-                    json.dumps(
-                        {
-                            "emby_id": emby_id,
-                            "tg_id": tg_id,
-                            "emby_username": emby_username,
-                        }
-                    ),
+                user_infos[f"emby:{emby_username.lower()}"] = json.dumps(
+                    {
+                        "emby_id": emby_id,
+                        "tg_id": tg_id,
+                        "emby_username": emby_username,
+                    }
                 )
+        user_info_cache.put_many(user_infos)
     except Exception as e:
         logger.error(f"写入用户信息缓存时发生错误: {e}")
     finally:
         _db.close()
 
 
-async def check_user_in_group(tg_id: int, group_id: str) -> bool:
-    """检查用户是否在群组中
+_GROUP_MEMBER_STATUSES = ("member", "administrator", "creator")
 
-    Args:
-        tg_id: 用户的Telegram ID
-        group_id: 群组ID
+
+async def _fetch_group_membership(
+    session, limiter: HostRateLimiter, tg_id: int, group_id: str
+) -> Optional[bool]:
+    """调用 getChatMember 检查用户是否在群组中，请求失败时返回 None"""
+    data = await _tg_api_get(
+        session,
+        limiter,
+        f"https://api.telegram.org/bot{settings.TG_API_TOKEN}/getChatMember"
+        f"?chat_id={group_id}&user_id={tg_id}",
+    )
+    if not data or not data.get("ok"):
+        logger.warning(f"检查用户 {tg_id} 群组状态失败: {(data or {}).get('description')}")
+        return None
+    # 在群组中的状态：member, administrator, creator
+    return data.get("result", {}).get("status") in _GROUP_MEMBER_STATUSES
+
+
+async def check_group_memberships(tg_ids: Iterable[int], group_id: str) -> dict:
+    """有界并发地检查一批用户是否在群组中
 
     Returns:
-        bool: True表示在群组中，False表示不在
+        dict: {tg_id: 是否在群组中}，请求失败的用户不在结果中
     """
-    try:
-        url = f"https://api.telegram.org/bot{settings.TG_API_TOKEN}/getChatMember"
-        params = {"chat_id": group_id, "user_id": tg_id}
-
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params, timeout=10)
-            data = response.json()
+    queue: asyncio.Queue = asyncio.Queue()
+    for tg_id in tg_ids:
+        queue.put_nowait(tg_id)
+    if queue.empty():
+        return {}
+
+    session = await get_thread_safe_session()
+    limiter = HostRateLimiter(settings.TG_API_RATE_LIMIT)
+    results = {}
+
+    async def worker():
+        while True:
+            try:
+                tg_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                is_member = await _fetch_group_membership(session, limiter, tg_id, group_id)
+            except Exception as e:
+                logger.error(f"检查用户 {tg_id} 是否在群组时出错: {e}")
+                continue
+            if is_member is not None:
+                results[tg_id] = is_member
 
-            if data.get("ok"):
-                status = data.get("result", {}).get("status")
-                # 在群组中的状态：member, administrator, creator
-                return status in ["member", "administrator", "creator"]
-            else:
-                # API调用失败，保守起见返回True（避免误删）
-                logger.warning(f"检查用户 {tg_id} 群组状态失败: {data.get('description')}")
-                return True
-    except Exception as e:
-        logger.error(f"检查用户 {tg_id} 是否在群组时出错: {e}")
-        return True  # 出错时保守返回True
+    workers = max(1, settings.GROUP_MEMBER_CHECK_CONCURRENCY)
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    return results
 
 
 async def process_left_group_members():
-    """检查所有用户的群组状态，处理不在群组超过72小时的用户
+    """对账群组成员状态，处理不在群组超过72小时的用户
 
-    工作流程：
-    1. 检查所有已绑定Plex/Emby的用户是否在群组中
-    2. 对于不在群组的用户，记录首次检测时间
-    3. 每24小时发送一次警告通知（24小时、48小时）
-    4. 在72小时时注销账号并发送通知
-    """
-    logger.info("开始检查用户群组状态")
-    _db = DB()
-    notification_tasks = []
+    成员状态由 handlers/group_member.py 的 ChatMember 事件实时写入 group_member_status，
+    本任务只复核以下用户，其余用户直接使用已记录的状态：
+    - 没有状态记录的用户
+    - 状态超过 GROUP_MEMBER_RECHECK_HOURS 未确认的用户
+    - 有未处理离开记录的用户（警告或注销前再次确认，避免漏收加入事件导致误删）
 
+    对不在群组的用户：首次记录离开时间，每24小时发送一次警告（24小时、48小时），
+    72小时时注销账号并发送通知
+    """
     # 检查是否配置了群组ID
     if not settings.TG_GROUP:
         logger.warning("未配置TG_GROUP，跳过群组检查")
         return
 
+    logger.info("开始对账用户群组状态")
+    _db = DB()
+    notification_tasks = []
+
     try:
         # 获取所有绑定了Plex或Emby的用户
-        # 从 user 表获取 Plex 用户
-        plex_users = _db.cur.execute(
+        rows = _db.cur.execute(
             """
-            SELECT DISTINCT tg_id FROM user
+            SELECT tg_id FROM user
             WHERE tg_id IS NOT NULL AND plex_id IS NOT NULL
-            """
-        ).fetchall()
-
-        # 从 emby_user 表获取 Emby 用户
-        emby_users = _db.cur.execute(
-            """
-            SELECT DISTINCT tg_id FROM emby_user
+            UNION
+            SELECT tg_id FROM emby_user
             WHERE tg_id IS NOT NULL AND emby_id IS NOT NULL
             """
         ).fetchall()
 
-        # 合并去重
-        all_tg_ids = set()
-        for user in plex_users:
-            all_tg_ids.add(user["tg_id"])
-        for user in emby_users:
-            all_tg_ids.add(user["tg_id"])
-
+        # 跳过管理员和特权用户
+        exempt_ids = {int(admin_id) for admin_id in settings.TG_ADMIN_CHAT_ID}
+        exempt_ids.update(settings.TG_PRIVILEGED_USERS)
+        all_tg_ids = {row[0] for row in rows} - exempt_ids
         if not all_tg_ids:
             logger.info("没有需要检查的用户")
             return
 
-        logger.info(f"开始检查 {len(all_tg_ids)} 个用户的群组状态 (Plex用户: {len(plex_users)}, Emby用户: {len(emby_users)})")
+        statuses = _db.get_group_member_statuses()
+        left_records = {
+            row[0]: row[1]
+            for row in _db.cur.execute(
+                "SELECT tg_id, is_processed FROM group_member_left_status"
+            )
+        }
+        stale_before = int(time()) - settings.GROUP_MEMBER_RECHECK_HOURS * 3600
+        to_check = [
+            tg_id
+            for tg_id in all_tg_ids
+            if tg_id not in statuses
+            or statuses[tg_id][1] < stale_before
+            or left_records.get(tg_id) == 0
+        ]
 
-        # 获取管理员和特权用户ID列表
-        admin_ids = [int(admin_id) for admin_id in settings.TG_ADMIN_CHAT_ID]
-        privileged_user_ids = settings.TG_PRIVILEGED_USERS
+        logger.info(f"共 {len(all_tg_ids)} 个用户，需要复核群组状态 {len(to_check)} 个")
+        checked = await check_group_memberships(to_check, settings.TG_GROUP)
+        if checked:
+            _db.update_group_member_statuses(
+                list(checked.items()), group_id=int(settings.TG_GROUP), source="sweep"
+            )
 
         for tg_id in all_tg_ids:
-            # 跳过管理员和特权用户
-            if tg_id in admin_ids or tg_id in privileged_user_ids:
+            if tg_id in checked:
+                is_in_group = checked[tg_id]
+            elif left_records.get(tg_id) == 0:
+                # 警告或注销前必须复核成功，复核失败时不沿用旧状态
+                continue
+            elif tg_id in statuses:
+                is_in_group = statuses[tg_id][0]
+            else:
+                # 状态未知且本次复核失败，保守起见跳过
                 continue
-
-            # 检查用户是否在群组中
-            is_in_group = await check_user_in_group(tg_id, settings.TG_GROUP)
 
             if is_in_group:
                 # 用户在群组中，清除离开记录（如果有）
-                existing_record = _db.cur.execute(
-                    "SELECT * FROM group_member_left_status WHERE tg_id = ?",
-                    (tg_id,)
-                ).fetchone()
-
-                if existing_record:
+                if tg_id in left_records:
                     _db.remove_group_member_left_record(tg_id)
                     logger.info(f"用户 {tg_id} 已在群组中，清除离开记录")
             else:
                 # 用户不在群组中，处理离开记录
                 await handle_user_not_in_group(tg_id, _db, notification_tasks)
 
-            # 避免API请求过快
-            await asyncio.sleep(0.5)
-
     except Exception as e:
         logger.error(f"检查用户群组状态时发生错误: {e}")
     finally:
         _db.close()
 
-    # 发送所有通知
-    if notification_tasks:
-        await asyncio.gather(*notification_tasks, return_exceptions=True)
+    # 通知由发送队列限速发送
+    enqueue_notifications(notification_tasks)
 
     logger.info("用户群组状态检查完成")
 
@@ -1510,7 +1583,7 @@ async def handle_user_not_in_group(tg_id: int, _db: DB, notification_tasks: list
     Args:
         tg_id: 用户ID
         _db: 数据库连接
-        notification_tasks: 通知任务列表
+        notification_tasks: 待入队的 (chat_id, text) 通知列表
     """
     current_time = int(time())
 
@@ -1565,9 +1638,7 @@ async def handle_user_not_in_group(tg_id: int, _db: DB, notification_tasks: list
             f"群组链接：{settings.TG_GROUP_LINK if hasattr(settings, 'TG_GROUP_LINK') and settings.TG_GROUP_LINK else '请联系管理员获取'}\n\n"
             f"如已加入群组，请忽略此消息。"
         )
-        notification_tasks.append(
-            send_message_by_url(chat_id=tg_id, text=warning_msg)
-        )
+        notification_tasks.append((tg_id, warning_msg))
         # 更新最后警告时间
         _db.mark_left_member_warning_sent(tg_id)
         logger.info(f"已向用户 {tg_id} ({username}) 发送警告通知（离开 {hours_elapsed} 小时）")
@@ -1579,7 +1650,7 @@ async def deactivate_user_accounts(tg_id: int, _db: DB, notification_tasks: list
     Args:
         tg_id: 用户ID
         _db: 数据库连接
-        notification_tasks: 通知任务列表
+        notification_tasks: 待入队的 (chat_id, text) 通知列表
     """
     try:
         # 获取用户信息
@@ -1641,9 +1712,7 @@ async def deactivate_user_accounts(tg_id: int, _db: DB, notification_tasks: list
                 f"如需恢复账号，请加入群组并联系管理员。\n"
                 f"群组链接：{settings.TG_GROUP_LINK if hasattr(settings, 'TG_GROUP_LINK') and settings.TG_GROUP_LINK else '请联系管理员获取'}"
             )
-            notification_tasks.append(
-                send_message_by_url(chat_id=tg_id, text=notification_msg)
-            )
+            notification_tasks.append((tg_id, notification_msg))
 
         # 标记为已处理
         _db.mark_left_member_as_processed(tg_id)
@@ -1653,12 +1722,6 @@ async def deactivate_user_accounts(tg_id: int, _db: DB, notification_tasks: list
 
 
 
-def _handle_debt_after_credit_update(db, tg_id: int, new_credits: float) -> None:
-    """积分更新后处理债务状态：转正则清零 debt_since"""
-    if new_credits >= 0:
-        db.clear_debt_since(tg_id)
-
-
 async def check_debt_and_ban():
     """检查欠积分超过 DEBT_MAX_MONTHS 个月的用户并封禁"""
     import time as _time
@@ -1744,11 +1807,7 @@ async def check_debt_and_ban():
     finally:
         _db.close()
 
-    for tg_id, text in notification_tasks:
-        try:
-            await send_message_by_url(chat_id=tg_id, text=text)
-        except Exception as e:
-            logger.error(f"发送债务通知失败 tg_id={tg_id}: {e}")
+    enqueue_notifications(notification_tasks)
 
 
 async def settle_checkin_monthly():
@@ -1788,11 +1847,7 @@ async def settle_checkin_monthly():
     finally:
         _db.close()
 
-    for tg_id, text in notification_tasks:
-        try:
-            await send_message_by_url(chat_id=tg_id, text=text)
-        except Exception as e:
-            logger.error(f"发送月度奖励通知失败: {e}")
+    enqueue_notifications(notification_tasks)
 
 
 if __name__ == "__main__":
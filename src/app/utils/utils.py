@@ -1,17 +1,17 @@
 #!/usr/bin/env python3
 
 import asyncio
-import pickle
 import threading
 from time import time
 from typing import Optional
 
 import aiohttp
-import filelock
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
 from app.log import logger
+from app.rate_limit import HostRateLimiter
+from app.tg_user_info import tg_user_info_index
 from telegram.ext import ContextTypes
 
 
@@ -215,53 +215,21 @@ def get_user_info_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
     """Get telegram user's info
     cache format: {tg_id: {"first_name": first_name, "username": username, "added": timestamp}}
     """
-    cache_file = settings.TG_USER_INFO_CACHE_PATH
-    cache = {}
-    if not cache_file.exists():
-        logger.warning(f"Not found {settings.TG_USER_INFO_CACHE_PATH}")
-        return {}
-    with open(cache_file, "rb") as f:
-        cache = pickle.load(f)
-    return cache.get(chat_id, {})
-
-
-async def get_tg_user_photo_url(tg_id: int, token: str = settings.TG_API_TOKEN):
-    """获取 Telegram 头像"""
-    session = await get_thread_safe_session()
-    retry = 5
-    while retry > 0:
-        try:
-            # 获取用户头像
-            async with session.get(
-                f"https://api.telegram.org/bot{token}/getUserProfilePhotos?user_id={tg_id}&limit=1",
-            ) as photos_response:
-                photo_url = None
-                if photos_response.status == 200:
-                    photos_data = await photos_response.json()
-                    if photos_data.get("result", {}).get("total_count", 0) > 0:
-                        photo_file_id = photos_data["result"]["photos"][0][0]["file_id"]
-
-                        # 获取文件路径
-                        async with session.get(
-                            f"https://api.telegram.org/bot{token}/getFile?file_id={photo_file_id}",
-                        ) as file_response:
-                            if file_response.status == 200:
-                                file_data = await file_response.json()
-                                if file_data.get("ok"):
-                                    file_path = file_data["result"]["file_path"]
-                                    photo_url = f"https://api.telegram.org/file/bot{token}/{file_path}"
-
-            return photo_url
-        except Exception:
-            logger.error(f"Error: failed to get photo for {tg_id}, retrying...")
-            await asyncio.sleep(1)
-            retry -= 1
-    return None
+    return tg_user_info_index.get(chat_id)
+
+
+def get_users_info_from_tg_ids(chat_ids) -> dict:
+    """批量获取 Telegram 用户信息，返回 {tg_id: user_info}"""
+    return tg_user_info_index.get_many(chat_ids)
+
+
+def format_tg_user_name(chat_id: int, user_info: dict):
+    return user_info.get("first_name") or user_info.get("username") or chat_id
 
 
 def get_user_name_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
     user_info = get_user_info_from_tg_id(chat_id, token=token)
-    return user_info.get("first_name") or user_info.get("username") or chat_id
+    return format_tg_user_name(chat_id, user_info)
 
 
 def get_user_avatar_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
@@ -270,113 +238,190 @@ def get_user_avatar_from_tg_id(chat_id: int, token=settings.TG_API_TOKEN):
     return user_info.get("photo_url")
 
 
-async def refresh_tg_user_info(token: str = settings.TG_API_TOKEN):
-    """刷新用户信息"""
-    try:
-        cache_file_lock = filelock.FileLock(
-            str(settings.TG_USER_INFO_CACHE_PATH) + ".lock"
+async def _tg_api_get(
+    session: aiohttp.ClientSession,
+    limiter: HostRateLimiter,
+    url: str,
+    *,
+    raw: bool = False,
+    retry: int = 3,
+):
+    """限流调用 Bot API，遇到 429 时遵循 retry_after"""
+    while retry > 0:
+        await limiter.acquire(url)
+        try:
+            async with session.get(url) as response:
+                if response.status == 429:
+                    data = await response.json()
+                    retry_after = data.get("parameters", {}).get("retry_after", 1)
+                    limiter.for_url(url).pause(retry_after)
+                    retry -= 1
+                    continue
+                if response.status != 200:
+                    return None
+                return await response.read() if raw else await response.json()
+        except Exception as e:
+            logger.error(f"Error: {e}, retrying in 1 seconds...")
+            await asyncio.sleep(1)
+            retry -= 1
+    return None
+
+
+async def _fetch_tg_user_info(
+    session: aiohttp.ClientSession,
+    limiter: HostRateLimiter,
+    tg_id: int,
+    token: str,
+    cached_info: dict,
+) -> Optional[dict]:
+    """获取单个用户信息，头像 file_unique_id 未变化时不重新下载"""
+    api_url = f"https://api.telegram.org/bot{token}"
+    chat = await _tg_api_get(session, limiter, f"{api_url}/getChat?chat_id={tg_id}")
+    if chat is None:
+        logger.error(f"Error: failed to get info. for {tg_id}")
+        return None
+    result = chat.get("result", {})
+    user_info = {
+        "first_name": result.get("first_name"),
+        "username": result.get("username"),
+        "added": time(),
+    }
+
+    photos = await _tg_api_get(
+        session,
+        limiter,
+        f"{api_url}/getUserProfilePhotos?user_id={tg_id}&limit=1",
+    )
+    if not photos or photos.get("result", {}).get("total_count", 0) <= 0:
+        return user_info
+
+    photo = photos["result"]["photos"][0][0]
+    photo_path = settings.TG_USER_PROFILE_CACHE_PATH / f"{tg_id}.jpg"
+    photo_url = f"{settings.WEBAPP_URL.strip('/')}/pics/{tg_id}.jpg"
+    file_unique_id = photo.get("file_unique_id")
+    if (
+        file_unique_id
+        and cached_info.get("photo_file_unique_id") == file_unique_id
+        and photo_path.exists()
+    ):
+        user_info["photo_url"] = photo_url
+        user_info["photo_file_unique_id"] = file_unique_id
+        return user_info
+
+    file_data = await _tg_api_get(
+        session, limiter, f"{api_url}/getFile?file_id={photo['file_id']}"
+    )
+    if file_data and file_data.get("ok"):
+        file_path = file_data["result"]["file_path"]
+        content = await _tg_api_get(
+            session,
+            limiter,
+            f"https://api.telegram.org/file/bot{token}/{file_path}",
+            raw=True,
         )
-        cache = {}
-        db = DB()
-        session = await get_thread_safe_session()
+        if content:
+            try:
+                with open(photo_path, "wb") as f:
+                    f.write(content)
+                user_info["photo_file_unique_id"] = file_unique_id
+            except Exception as e:
+                logger.error(f"Error: {e}")
+    user_info["photo_url"] = photo_url
+    return user_info
+
+
+async def refresh_tg_user_info(token: str = settings.TG_API_TOKEN):
+    """刷新用户信息
 
+    使用有界 worker 池并发刷新，请求按主机限流，缓存按批写回
+    """
+    db = DB()
+    try:
         # 从 statistics 表获取所有用户
         stats_users = db.cur.execute("SELECT tg_id FROM statistics").fetchall()
         stats_users = [user[0] for user in stats_users]
-
-        for tg_id in stats_users:
-            if settings.TG_USER_INFO_CACHE_PATH.exists():
-                with open(settings.TG_USER_INFO_CACHE_PATH, "rb") as f:
-                    cache = pickle.load(f)
-            # 缓存保留 6 小时（更频繁地更新用户姓名和头像）
-            if tg_id in cache:
-                if time() - cache.get(tg_id).get("added") <= 6 * 3600:
-                    logger.info(
-                        f"{cache.get(tg_id).get('username')}({tg_id}) info is not expired, skip"
-                    )
-                    continue
-            retry = 10
-            while retry > 0:
-                try:
-                    async with session.get(
-                        url=f"https://api.telegram.org/bot{token}/getChat?chat_id={tg_id}",
-                    ) as response:
-                        if response.status != 200:
-                            logger.error(f"Error: failed to get info. for {tg_id}")
-                            break
-                        result = (await response.json()).get("result", {})
-                except Exception as e:
-                    logger.error(f"Error: {e}, retrying in 1 seconds...")
-                    await asyncio.sleep(1)
-                    retry -= 1
-                    continue
-                else:
-                    break
-
-            if retry == 0:
-                continue
-
-            user_info = {
-                "first_name": result.get("first_name"),
-                "username": result.get("username"),
-                "added": time(),
-            }
-            # 获取用户 photo url
-            photo_url = await get_tg_user_photo_url(tg_id, token=token)
-            if photo_url:
-                # 下载头像到本地
-                photo_path = settings.TG_USER_PROFILE_CACHE_PATH / f"{tg_id}.jpg"
-                try:
-                    async with session.get(
-                        photo_url,
-                    ) as response:
-                        if response.status == 200:
-                            content = await response.read()
-                            with open(photo_path, "wb") as f:
-                                f.write(content)
-                except Exception as e:
-                    logger.error(f"Error: {e}")
-                user_info["photo_url"] = (
-                    f"{settings.WEBAPP_URL.strip('/')}/pics/{tg_id}.jpg"
-                )
-            # add cache
-            cache.update({tg_id: user_info})
-            logger.info(f"Updated tg user info: {user_info.get('username')}({tg_id})")
-            with cache_file_lock:
-                with open(settings.TG_USER_INFO_CACHE_PATH, "wb") as f:
-                    pickle.dump(cache, f)
     except Exception as e:
         logger.error(f"Refresh user tg info failed: {e}")
+        return
     finally:
         db.close()
 
+    cache = tg_user_info_index.snapshot()
+    now = time()
+    queue: asyncio.Queue = asyncio.Queue()
+    for tg_id in stats_users:
+        # 缓存保留 6 小时（更频繁地更新用户姓名和头像）
+        if tg_id in cache and now - cache[tg_id].get("added", 0) <= 6 * 3600:
+            continue
+        queue.put_nowait(tg_id)
+    if queue.empty():
+        logger.info("All tg user info is not expired, skip")
+        return
+
+    logger.info(f"Refreshing {queue.qsize()} tg user info")
+    session = await get_thread_safe_session()
+    limiter = HostRateLimiter(settings.TG_API_RATE_LIMIT)
+    batch_size = max(1, settings.TG_USER_INFO_REFRESH_BATCH_SIZE)
+    pending: dict = {}
+    flush_lock = asyncio.Lock()
+
+    async def flush():
+        async with flush_lock:
+            if not pending:
+                return
+            cache.update(pending)
+            pending.clear()
+            try:
+                tg_user_info_index.save(cache)
+            except Exception as e:
+                logger.error(f"Save tg user info cache failed: {e}")
+
+    async def worker():
+        while True:
+            try:
+                tg_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                user_info = await _fetch_tg_user_info(
+                    session, limiter, tg_id, token, cache.get(tg_id, {})
+                )
+            except Exception as e:
+                logger.error(f"Refresh tg user info for {tg_id} failed: {e}")
+                continue
+            if user_info is None:
+                continue
+            pending[tg_id] = user_info
+            logger.info(f"Updated tg user info: {user_info.get('username')}({tg_id})")
+            if len(pending) >= batch_size:
+                await flush()
+
+    workers = max(1, settings.TG_USER_INFO_REFRESH_CONCURRENCY)
+    await asyncio.gather(*(worker() for _ in range(workers)))
+    await flush()
+
 
 def refresh_emby_user_info():
-    """刷新 emby user info"""
-    emby = Emby()
-    # 获取所有的 emby 用户名
+    """刷新 emby user info，一次分页拉取全部用户并替换索引"""
     try:
-        db = DB()
-
-        emby_users = db.cur.execute("SELECT emby_username from emby_user").fetchall()
-        emby_users = [user[0] for user in emby_users]
-        for user in emby_users:
-            emby.get_user_info_from_username(user)
+        count = Emby().refresh_user_index()
+        logger.info(f"Refreshed emby user info: {count} users")
     except Exception as e:
         logger.error(f"Refresh emby user info failed: {e}")
-    finally:
-        db.close()
 
 
 class SingletonMeta(type):
     """Singleton metaclass"""
 
     _instances = {}
+    _lock = threading.Lock()
 
     def __call__(cls, *args, **kwargs):
         if cls not in cls._instances:
-            instance = super().__call__(*args, **kwargs)
-            cls._instances[cls] = instance
+            # 多个线程同时首次创建时只构造一次；构造失败不缓存，下次调用重试
+            with SingletonMeta._lock:
+                if cls not in cls._instances:
+                    cls._instances[cls] = super().__call__(*args, **kwargs)
         return cls._instances[cls]
 
 
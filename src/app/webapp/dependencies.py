@@ -0,0 +1,11 @@
+"""WebApp 依赖项"""
+
+from typing import Iterator
+
+from app.db import DB, get_pool
+
+
+def get_db() -> Iterator[DB]:
+    """请求级数据库依赖：从连接池借出连接，请求结束后归还"""
+    with get_pool().db() as db:
+        yield db
@@ -2,6 +2,7 @@ from datetime import datetime, timedelta
 
 from app.config import settings
 from app.db import DB
+from app.executors import run_db
 from app.log import uvicorn_logger as logger
 from app.update_db import finish_expired_auctions_job
 from app.utils.utils import get_user_name_from_tg_id, send_message_by_url
@@ -23,12 +24,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request, status
 router = APIRouter(prefix="/auction", tags=["auction"])
 
 
-@router.get("/list", response_model=AuctionListResponse)
-@require_telegram_auth
-async def get_auction_list(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取竞拍列表"""
+def _get_auction_list():
+    """获取竞拍列表（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         auctions_data = db.get_active_auctions()
@@ -62,12 +59,18 @@ async def get_auction_list(
             db.close()
 
 
-@router.get("/stats", response_model=AuctionStatsResponse)
+@router.get("/list", response_model=AuctionListResponse)
 @require_telegram_auth
-async def get_auction_stats(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def get_auction_list(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取竞拍统计数据（仅管理员）"""
+    """获取竞拍列表"""
+    return await run_db(_get_auction_list)
+
+
+def _get_auction_stats(current_user: TelegramUser):
+    """获取竞拍统计数据（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -94,14 +97,18 @@ async def get_auction_stats(
             db.close()
 
 
-@router.get("/{auction_id}", response_model=AuctionDetailResponse)
+@router.get("/stats", response_model=AuctionStatsResponse)
 @require_telegram_auth
-async def get_auction_detail(
-    auction_id: int,
+async def get_auction_stats(
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取竞拍详情"""
+    """获取竞拍统计数据（仅管理员）"""
+    return await run_db(_get_auction_stats, current_user)
+
+
+def _get_auction_detail(auction_id: int, current_user: TelegramUser):
+    """获取竞拍详情（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         auction_data = db.get_auction_by_id(auction_id)
@@ -169,14 +176,19 @@ async def get_auction_detail(
             db.close()
 
 
-@router.post("/create")
+@router.get("/{auction_id}", response_model=AuctionDetailResponse)
 @require_telegram_auth
-async def create_auction(
-    request_data: CreateAuctionRequest,
+async def get_auction_detail(
+    auction_id: int,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """创建竞拍（仅管理员）"""
+    """获取竞拍详情"""
+    return await run_db(_get_auction_detail, auction_id, current_user)
+
+
+def _create_auction(request_data: CreateAuctionRequest, current_user: TelegramUser):
+    """创建竞拍（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -222,14 +234,19 @@ async def create_auction(
             db.close()
 
 
-@router.post("/bid", response_model=PlaceBidResponse)
+@router.post("/create")
 @require_telegram_auth
-async def place_bid(
-    bid_request: PlaceBidRequest,
+async def create_auction(
+    request_data: CreateAuctionRequest,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """出价"""
+    """创建竞拍（仅管理员）"""
+    return await run_db(_create_auction, request_data, current_user)
+
+
+def _place_bid(bid_request: PlaceBidRequest, current_user: TelegramUser):
+    """出价，返回 (响应, 群通知文本)（同步，在数据库线程池中运行）"""
     try:
         db = DB()
 
@@ -292,26 +309,20 @@ async def place_bid(
                 f"用户 {display_name} 对竞拍 {bid_request.auction_id} 出价 {bid_request.bid_amount}"
             )
 
-            # 发群通知
-            group_id = settings.TG_GROUP
-            if group_id:
-                notify_text = (
-                    f"🔔 <b>{display_name}</b> 参与了竞拍！\n"
-                    f"🏷️ {auction_data['title']}\n"
-                    f"💰 出价：<b>{bid_request.bid_amount}</b> 积分\n"
-                    f"📈 当前最高价：<b>{bid_request.bid_amount}</b> 积分"
-                )
-                try:
-                    await send_message_by_url(chat_id=group_id, text=notify_text, parse_mode='HTML')
-                except Exception:
-                    pass
+            # 群通知在事件循环中发送
+            notify_text = (
+                f"🔔 <b>{display_name}</b> 参与了竞拍！\n"
+                f"🏷️ {auction_data['title']}\n"
+                f"💰 出价：<b>{bid_request.bid_amount}</b> 积分\n"
+                f"📈 当前最高价：<b>{bid_request.bid_amount}</b> 积分"
+            )
 
             return PlaceBidResponse(
                 success=True,
                 message="出价成功",
                 current_price=bid_request.bid_amount,
                 user_credits=user_credits,
-            )
+            ), notify_text
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="出价失败"
@@ -329,17 +340,34 @@ async def place_bid(
             db.close()
 
 
-@router.post("/finish-expired")
+@router.post("/bid", response_model=PlaceBidResponse)
 @require_telegram_auth
-async def finish_expired_auctions(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def place_bid(
+    bid_request: PlaceBidRequest,
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """结束过期竞拍（仅管理员）"""
+    """出价"""
+    response, notify_text = await run_db(_place_bid, bid_request, current_user)
+
+    # 发群通知
+    group_id = settings.TG_GROUP
+    if group_id:
+        try:
+            await send_message_by_url(chat_id=group_id, text=notify_text, parse_mode='HTML')
+        except Exception:
+            pass
+
+    return response
+
+
+def _finish_expired_auctions(current_user: TelegramUser):
+    """结束过期竞拍（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
 
-        finished_auctions = await finish_expired_auctions_job()
+        finished_auctions = finish_expired_auctions_job()
 
         logger.info(
             f"管理员 {get_user_name_from_tg_id(current_user.id)} 结束了 {len(finished_auctions)} 个过期竞拍"
@@ -360,17 +388,18 @@ async def finish_expired_auctions(
         )
 
 
-# 管理员专用路由
-@router.get("/admin/list")
+@router.post("/finish-expired")
 @require_telegram_auth
-async def get_all_auctions_admin(
+async def finish_expired_auctions(
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
-    status_filter: str = None,
-    page: int = 1,
-    limit: int = 20,
 ):
-    """获取所有竞拍活动列表（仅管理员）"""
+    """结束过期竞拍（仅管理员）"""
+    return await run_db(_finish_expired_auctions, current_user)
+
+
+def _get_all_auctions_admin(current_user: TelegramUser, status_filter: str, page: int, limit: int):
+    """获取所有竞拍活动列表（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -415,15 +444,22 @@ async def get_all_auctions_admin(
             db.close()
 
 
-@router.put("/admin/{auction_id}")
+# 管理员专用路由
+@router.get("/admin/list")
 @require_telegram_auth
-async def update_auction_admin(
-    auction_id: int,
-    update_data: CreateAuctionRequest,
+async def get_all_auctions_admin(
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
+    status_filter: str = None,
+    page: int = 1,
+    limit: int = 20,
 ):
-    """更新竞拍活动（仅管理员）"""
+    """获取所有竞拍活动列表（仅管理员）"""
+    return await run_db(_get_all_auctions_admin, current_user, status_filter, page, limit)
+
+
+def _update_auction_admin(auction_id: int, update_data: CreateAuctionRequest, current_user: TelegramUser):
+    """更新竞拍活动（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -473,14 +509,20 @@ async def update_auction_admin(
             db.close()
 
 
-@router.delete("/admin/{auction_id}")
+@router.put("/admin/{auction_id}")
 @require_telegram_auth
-async def delete_auction_admin(
+async def update_auction_admin(
     auction_id: int,
+    update_data: CreateAuctionRequest,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """删除竞拍活动（仅管理员）"""
+    """更新竞拍活动（仅管理员）"""
+    return await run_db(_update_auction_admin, auction_id, update_data, current_user)
+
+
+def _delete_auction_admin(auction_id: int, current_user: TelegramUser):
+    """删除竞拍活动（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -518,14 +560,19 @@ async def delete_auction_admin(
             db.close()
 
 
-@router.post("/admin/{auction_id}/finish")
+@router.delete("/admin/{auction_id}")
 @require_telegram_auth
-async def finish_auction_admin(
+async def delete_auction_admin(
     auction_id: int,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """手动结束竞拍活动（仅管理员）"""
+    """删除竞拍活动（仅管理员）"""
+    return await run_db(_delete_auction_admin, auction_id, current_user)
+
+
+def _finish_auction_admin(auction_id: int, current_user: TelegramUser):
+    """手动结束竞拍活动，返回 (响应, 待发送通知)（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -550,24 +597,25 @@ async def finish_auction_admin(
             logger.info(
                 f"管理员 {get_user_name_from_tg_id(current_user.id)} 手动结束了竞拍 {auction_id}"
             )
-            # 通知用户
+            # 通知用户，由事件循环发送
+            notices = []
             if winner:
-                await send_message_by_url(
+                notices.append((
                     winner.get("winner_id"),
                     f"恭喜你，竞拍 {existing_auction['title']} 获胜！最终出价为 {winner.get('final_price')} 积分",
-                )
+                ))
                 if not winner.get("credits_reduced", False):
                     # 如果未扣除积分，通知管理员
                     for chat_id in settings.TG_ADMIN_CHAT_ID:
-                        await send_message_by_url(
-                            chat_id=chat_id,
-                            text=f"用户 {winner.get('winner_id')} 在竞拍 {existing_auction['title']} 中获胜，但未扣除积分。",
-                        )
+                        notices.append((
+                            chat_id,
+                            f"用户 {winner.get('winner_id')} 在竞拍 {existing_auction['title']} 中获胜，但未扣除积分。",
+                        ))
             return {
                 "success": True,
                 "message": "竞拍已结束",
                 "finished_auctions": [winner],
-            }
+            }, notices
         else:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="结束竞拍失败"
@@ -585,15 +633,22 @@ async def finish_auction_admin(
             db.close()
 
 
-@router.get("/admin/{auction_id}/bids")
+@router.post("/admin/{auction_id}/finish")
 @require_telegram_auth
-async def get_auction_bids_admin(
+async def finish_auction_admin(
     auction_id: int,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 50,
 ):
-    """获取竞拍出价历史（仅管理员）"""
+    """手动结束竞拍活动（仅管理员）"""
+    response, notices = await run_db(_finish_auction_admin, auction_id, current_user)
+    for chat_id, text in notices:
+        await send_message_by_url(chat_id=chat_id, text=text)
+    return response
+
+
+def _get_auction_bids_admin(auction_id: int, current_user: TelegramUser, limit: int):
+    """获取竞拍出价历史（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -637,15 +692,20 @@ async def get_auction_bids_admin(
             db.close()
 
 
-@router.get("/admin/user/{user_id}/history")
+@router.get("/admin/{auction_id}/bids")
 @require_telegram_auth
-async def get_user_auction_history_admin(
-    user_id: int,
+async def get_auction_bids_admin(
+    auction_id: int,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 20,
+    limit: int = 50,
 ):
-    """获取用户竞拍历史（仅管理员）"""
+    """获取竞拍出价历史（仅管理员）"""
+    return await run_db(_get_auction_bids_admin, auction_id, current_user, limit)
+
+
+def _get_user_auction_history_admin(user_id: int, current_user: TelegramUser, limit: int):
+    """获取用户竞拍历史（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -684,15 +744,20 @@ async def get_user_auction_history_admin(
             db.close()
 
 
-@router.get("/admin/detailed-stats")
+@router.get("/admin/user/{user_id}/history")
 @require_telegram_auth
-async def get_detailed_auction_stats_admin(
+async def get_user_auction_history_admin(
+    user_id: int,
     request: Request,
     current_user: TelegramUser = Depends(get_telegram_user),
-    start_date: int = None,
-    end_date: int = None,
+    limit: int = 20,
 ):
-    """获取详细竞拍统计（仅管理员）"""
+    """获取用户竞拍历史（仅管理员）"""
+    return await run_db(_get_user_auction_history_admin, user_id, current_user, limit)
+
+
+def _get_detailed_auction_stats_admin(current_user: TelegramUser, start_date: int, end_date: int):
+    """获取详细竞拍统计（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -712,3 +777,16 @@ async def get_detailed_auction_stats_admin(
     finally:
         if "db" in locals():
             db.close()
+
+
+
+@router.get("/admin/detailed-stats")
+@require_telegram_auth
+async def get_detailed_auction_stats_admin(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
+    start_date: int = None,
+    end_date: int = None,
+):
+    """获取详细竞拍统计（仅管理员）"""
+    return await run_db(_get_detailed_auction_stats_admin, current_user, start_date, end_date)
\ No newline at end of file
@@ -6,6 +6,7 @@ from typing import List
 
 from app.cache import redis_cache, blackjack_game_state_cache
 from app.db import DB
+from app.executors import run_db
 from app.log import logger
 from app.utils.utils import get_user_name_from_tg_id
 from app.webapp.auth import get_telegram_user
@@ -224,14 +225,8 @@ async def update_config(
         )
 
 
-@router.post("/start", response_model=BlackjackGameState)
-@require_telegram_auth
-async def start_game(
-    request: Request,
-    start_request: StartGameRequest,
-    current_user: TelegramUser = Depends(get_telegram_user),
-):
-    """开始新游戏"""
+def _start_game(start_request: StartGameRequest, current_user: TelegramUser):
+    """开始新游戏（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -356,14 +351,19 @@ async def start_game(
         db.close()
 
 
-@router.post("/hit", response_model=BlackjackGameState)
+@router.post("/start", response_model=BlackjackGameState)
 @require_telegram_auth
-async def hit_card(
+async def start_game(
     request: Request,
-    action_request: GameActionRequest,
+    start_request: StartGameRequest,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """要牌"""
+    """开始新游戏"""
+    return await run_db(_start_game, start_request, current_user)
+
+
+def _hit_card(action_request: GameActionRequest, current_user: TelegramUser):
+    """要牌（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -430,14 +430,19 @@ async def hit_card(
         db.close()
 
 
-@router.post("/stand", response_model=BlackjackGameState)
+@router.post("/hit", response_model=BlackjackGameState)
 @require_telegram_auth
-async def stand(
+async def hit_card(
     request: Request,
     action_request: GameActionRequest,
     current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """停牌（庄家回合）"""
+    """要牌"""
+    return await run_db(_hit_card, action_request, current_user)
+
+
+def _stand(action_request: GameActionRequest, current_user: TelegramUser):
+    """停牌（庄家回合，同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -529,12 +534,19 @@ async def stand(
         db.close()
 
 
-@router.get("/user-status")
+@router.post("/stand", response_model=BlackjackGameState)
 @require_telegram_auth
-async def get_user_status(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def stand(
+    request: Request,
+    action_request: GameActionRequest,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取用户游戏参与状态"""
+    """停牌（庄家回合）"""
+    return await run_db(_stand, action_request, current_user)
+
+
+def _get_user_status(current_user: TelegramUser):
+    """获取用户游戏参与状态（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -571,12 +583,18 @@ async def get_user_status(
         db.close()
 
 
-@router.get("/stats")
+@router.get("/user-status")
 @require_telegram_auth
-async def get_blackjack_statistics(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def get_user_status(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取21点统计数据（仅管理员）"""
+    """获取用户游戏参与状态"""
+    return await run_db(_get_user_status, current_user)
+
+
+def _get_blackjack_statistics(current_user: TelegramUser):
+    """获取21点统计数据（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -598,12 +616,18 @@ async def get_blackjack_statistics(
             db.close()
 
 
-@router.get("/user-activity-stats")
+@router.get("/stats")
 @require_telegram_auth
-async def get_user_activity_stats(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def get_blackjack_statistics(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取用户个人21点活动统计数据"""
+    """获取21点统计数据（仅管理员）"""
+    return await run_db(_get_blackjack_statistics, current_user)
+
+
+def _get_user_activity_stats(current_user: TelegramUser):
+    """获取用户个人21点活动统计数据（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -621,3 +645,14 @@ async def get_user_activity_stats(
         )
     finally:
         db.close()
+
+
+
+@router.get("/user-activity-stats")
+@require_telegram_auth
+async def get_user_activity_stats(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
+):
+    """获取用户个人21点活动统计数据"""
+    return await run_db(_get_user_activity_stats, current_user)
\ No newline at end of file
@@ -5,6 +5,7 @@ import time
 
 from app.cache import lucky_wheel_config_cache
 from app.db import DB
+from app.executors import run_db
 from app.log import logger
 from app.premium import update_premium_status
 from app.update_db import add_redeem_code
@@ -273,12 +274,8 @@ async def update_config(
         )
 
 
-@router.post("/spin", response_model=LuckyWheelSpinResult)
-@require_telegram_auth
-async def spin_wheel(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
-):
-    """转动转盘"""
+def _spin_wheel(current_user: TelegramUser):
+    """转动转盘（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -352,12 +349,18 @@ async def spin_wheel(
         db.close()
 
 
-@router.get("/user-status")
+@router.post("/spin", response_model=LuckyWheelSpinResult)
 @require_telegram_auth
-async def get_user_status(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def spin_wheel(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取用户转盘参与状态"""
+    """转动转盘"""
+    return await run_db(_spin_wheel, current_user)
+
+
+def _get_user_status(current_user: TelegramUser):
+    """获取用户转盘参与状态（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -390,6 +393,16 @@ async def get_user_status(
         db.close()
 
 
+@router.get("/user-status")
+@require_telegram_auth
+async def get_user_status(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
+):
+    """获取用户转盘参与状态"""
+    return await run_db(_get_user_status, current_user)
+
+
 def get_randomness_config_from_redis() -> dict:
     """从Redis获取随机性配置"""
     try:
@@ -669,12 +682,8 @@ async def get_randomness_config(
         )
 
 
-@router.get("/stats")
-@require_telegram_auth
-async def get_wheel_statistics(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取转盘统计数据（仅管理员）"""
+def _get_wheel_statistics(current_user: TelegramUser):
+    """获取转盘统计数据（仅管理员，同步，在数据库线程池中运行）"""
     try:
         # 检查管理员权限
         check_admin_permission(current_user)
@@ -696,12 +705,18 @@ async def get_wheel_statistics(
             db.close()
 
 
-@router.get("/user-activity-stats")
+@router.get("/stats")
 @require_telegram_auth
-async def get_user_activity_stats(
-    request: Request, current_user: TelegramUser = Depends(get_telegram_user)
+async def get_wheel_statistics(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取用户个人活动统计数据"""
+    """获取转盘统计数据（仅管理员）"""
+    return await run_db(_get_wheel_statistics, current_user)
+
+
+def _get_user_activity_stats(current_user: TelegramUser):
+    """获取用户个人活动统计数据（同步，在数据库线程池中运行）"""
     try:
         db = DB()
         user_id = current_user.id
@@ -719,3 +734,14 @@ async def get_user_activity_stats(
         )
     finally:
         db.close()
+
+
+
+@router.get("/user-activity-stats")
+@require_telegram_auth
+async def get_user_activity_stats(
+    request: Request,
+    current_user: TelegramUser = Depends(get_telegram_user),
+):
+    """获取用户个人活动统计数据"""
+    return await run_db(_get_user_activity_stats, current_user)
\ No newline at end of file
@@ -1,17 +1,21 @@
+from typing import Optional
+
 from app.cache import (
     emby_last_user_defined_line_cache,
     emby_user_defined_line_cache,
     free_premium_lines_cache,
     get_line_tags,
+    get_lines_tags,
     line_tags_cache,
     plex_last_user_defined_line_cache,
     plex_user_defined_line_cache,
 )
 from app.config import settings
 from app.db import DB
+from app.executors import run_db
 from app.invitation_utils import INVITATION_EXPIRE_DAYS
 from app.log import uvicorn_logger as logger
-from app.shared_proxy import sync_user_media_routes
+from app.shared_proxy import sync_all_media_routes, sync_user_media_routes
 from app.utils.utils import (
     get_user_name_from_tg_id,
     is_binded_premium_line,
@@ -359,13 +363,16 @@ async def set_emby_free_premium_lines(
     return await set_free_premium_lines(request, data, user)
 
 
-async def unbind_emby_premium_free():
-    """解绑所有 Emby Premium Free（恢复普通用户）"""
+async def _send_line_notices(notices: list):
+    """发送线路变更通知"""
+    for tg_id, text in notices:
+        await send_message_by_url(chat_id=tg_id, text=text, parse_mode="markdownv2")
 
-    if settings.PREMIUM_FREE:
-        logger.info("Emby Premium Free 功能未启用，跳过解绑操作")
-        return True, None
+
+def _unbind_emby_premium_free():
+    """把普通用户绑定的 Emby 高级线路恢复为普通线路，返回 (待发送通知, 错误信息)，同步，在数据库线程池中运行"""
     db = DB()
+    notices = []
     try:
         # 获取所有绑定了 Emby 线路的用户
         users = db.get_emby_user_with_binded_line()
@@ -391,30 +398,39 @@ async def unbind_emby_premium_free():
                 emby_last_user_defined_line_cache.delete(str(emby_username).lower())
             else:
                 emby_user_defined_line_cache.delete(str(emby_username).lower())
-            # 发送通知给用户
+            # 通知用户
             if tg_id:
-                await send_message_by_url(
-                    chat_id=tg_id,
-                    text=f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
-                    parse_mode="markdownv2",
+                notices.append(
+                    (
+                        tg_id,
+                        f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
+                    )
                 )
 
-        return True, None
+        return notices, None
     except Exception as e:
         logger.error(f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}")
-        return False, f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}"
+        return notices, f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}"
     finally:
         db.close()
         logger.debug("数据库连接已关闭")
 
 
-async def unbind_plex_premium_free():
-    """解绑所有 Plex Premium Free（恢复普通用户）"""
+async def unbind_emby_premium_free():
+    """解绑所有 Emby Premium Free（恢复普通用户）"""
 
     if settings.PREMIUM_FREE:
-        logger.info("Plex Premium Free 功能未启用，跳过解绑操作")
+        logger.info("Emby Premium Free 功能未启用，跳过解绑操作")
         return True, None
+    notices, error = await run_db(_unbind_emby_premium_free)
+    await _send_line_notices(notices)
+    return error is None, error
+
+
+def _unbind_plex_premium_free():
+    """把普通用户绑定的 Plex 高级线路恢复为普通线路，返回 (待发送通知, 错误信息)，同步，在数据库线程池中运行"""
     db = DB()
+    notices = []
     try:
         # 获取所有绑定了 Plex 线路的用户
         users = db.get_plex_user_with_binded_line()
@@ -440,30 +456,40 @@ async def unbind_plex_premium_free():
                 plex_last_user_defined_line_cache.delete(str(plex_username).lower())
             else:
                 plex_user_defined_line_cache.delete(str(plex_username).lower())
-            # 发送通知给用户
+            # 通知用户
             if tg_id:
-                await send_message_by_url(
-                    chat_id=tg_id,
-                    text=f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
-                    parse_mode="markdownv2",
+                notices.append(
+                    (
+                        tg_id,
+                        f"通知：高级线路开放通道已关闭，您绑定的线路已切换为 `{last_line or 'AUTO'}`",
+                    )
                 )
 
-        return True, None
+        return notices, None
     except Exception as e:
         logger.error(f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}")
-        return False, f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}"
+        return notices, f"解绑所有普通用户的 premium 线路时发生错误: {str(e)}"
     finally:
         db.close()
         logger.debug("数据库连接已关闭")
 
 
-async def handle_free_premium_lines_change(removed_lines: list | set):
-    """处理免费高级线路变更，检查并处理不再免费的线路"""
+async def unbind_plex_premium_free():
+    """解绑所有 Plex Premium Free（恢复普通用户）"""
+
+    if settings.PREMIUM_FREE:
+        logger.info("Plex Premium Free 功能未启用，跳过解绑操作")
+        return True, None
+    notices, error = await run_db(_unbind_plex_premium_free)
+    await _send_line_notices(notices)
+    return error is None, error
+
+
+def _handle_free_premium_lines_change(removed_lines: list | set):
+    """切换绑定了不再免费线路的普通用户，返回 (待发送通知, 错误信息)，同步，在数据库线程池中运行"""
     db = DB()
+    notices = []
     try:
-        if not removed_lines:
-            return True, None
-
         # 获取所有绑定了被移除线路的普通用户
         users = db.get_emby_user_with_binded_line()
         for user in users:
@@ -494,12 +520,13 @@ async def handle_free_premium_lines_change(removed_lines: list | set):
                 emby_last_user_defined_line_cache.delete(str(emby_username).lower())
             else:
                 emby_user_defined_line_cache.delete(str(emby_username).lower())
-            # 发送通知给用户
+            # 通知用户
             if tg_id:
-                await send_message_by_url(
-                    chat_id=tg_id,
-                    text=f"通知：线路 `{emby_line}` 已不再免费开放，您的 Emby 绑定线路已切换为 `{last_line or 'AUTO'}`",
-                    parse_mode="markdownv2",
+                notices.append(
+                    (
+                        tg_id,
+                        f"通知：线路 `{emby_line}` 已不再免费开放，您的 Emby 绑定线路已切换为 `{last_line or 'AUTO'}`",
+                    )
                 )
 
         # 获取所有绑定了被移除线路的 Plex 用户
@@ -529,26 +556,37 @@ async def handle_free_premium_lines_change(removed_lines: list | set):
                 plex_last_user_defined_line_cache.delete(str(plex_username).lower())
             else:
                 plex_user_defined_line_cache.delete(str(plex_username).lower())
-            # 发送通知给用户
+            # 通知用户
             if tg_id:
-                await send_message_by_url(
-                    chat_id=tg_id,
-                    text=f"通知：线路 `{plex_line}` 已不再开放，您绑定的 Plex 线路已切换为 `{last_line or 'AUTO'}`",
-                    parse_mode="markdownv2",
+                notices.append(
+                    (
+                        tg_id,
+                        f"通知：线路 `{plex_line}` 已不再开放，您绑定的 Plex 线路已切换为 `{last_line or 'AUTO'}`",
+                    )
                 )
 
-        return True, None
+        return notices, None
     except Exception as e:
         logger.error(f"处理免费高级线路变更时发生错误: {str(e)}")
-        return False, f"处理免费高级线路变更时发生错误: {str(e)}"
+        return notices, f"处理免费高级线路变更时发生错误: {str(e)}"
     finally:
         db.close()
         logger.debug("数据库连接已关闭")
 
 
-async def unbind_specified_line_for_all_users(line: str):
-    """解绑所有用户的指定线路（通用，同时支持Plex和Emby）"""
+async def handle_free_premium_lines_change(removed_lines: list | set):
+    """处理免费高级线路变更，检查并处理不再免费的线路"""
+    if not removed_lines:
+        return True, None
+    notices, error = await run_db(_handle_free_premium_lines_change, removed_lines)
+    await _send_line_notices(notices)
+    return error is None, error
+
+
+def _unbind_specified_line_for_all_users(line: str):
+    """解绑所有用户的指定线路，返回 (待发送通知, 错误信息)，同步，在数据库线程池中运行"""
     db = DB()
+    notices = []
     try:
         # 获取所有绑定了 Emby 线路的用户
         emby_users = db.get_emby_user_with_binded_line()
@@ -560,12 +598,13 @@ async def unbind_specified_line_for_all_users(line: str):
                 sync_user_media_routes(db, tg_id)
                 emby_user_defined_line_cache.delete(str(emby_username).lower())
                 emby_last_user_defined_line_cache.delete(str(emby_username).lower())
-                # 发送通知给用户
+                # 通知用户
                 if tg_id:
-                    await send_message_by_url(
-                        chat_id=tg_id,
-                        text=f"通知：您绑定的 Emby 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
-                        parse_mode="markdownv2",
+                    notices.append(
+                        (
+                            tg_id,
+                            f"通知：您绑定的 Emby 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
+                        )
                     )
 
         # 处理Plex用户解绑逻辑
@@ -578,48 +617,40 @@ async def unbind_specified_line_for_all_users(line: str):
                 sync_user_media_routes(db, tg_id)
                 plex_user_defined_line_cache.delete(str(plex_username).lower())
                 plex_last_user_defined_line_cache.delete(str(plex_username).lower())
-                # 发送通知给用户
+                # 通知用户
                 if tg_id:
-                    await send_message_by_url(
-                        chat_id=tg_id,
-                        text=f"通知：您绑定的 Plex 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
-                        parse_mode="markdownv2",
+                    notices.append(
+                        (
+                            tg_id,
+                            f"通知：您绑定的 Plex 线路 `{line}` 已被管理员下线，已切换为 `AUTO`",
+                        )
                     )
 
-        return True, None
+        return notices, None
 
     except Exception as e:
         logger.error(f"解绑所有用户的 {line} 线路时发生错误: {str(e)}")
-        return False, f"解绑所有用户的 {line} 线路时发生错误: {str(e)}"
+        return notices, f"解绑所有用户的 {line} 线路时发生错误: {str(e)}"
     finally:
         db.close()
         logger.debug("数据库连接已关闭")
 
 
-@router.post("/donation")
-@require_telegram_auth
-async def submit_donation_record(
-    request: Request,
-    data: dict = Body(...),
-    user: TelegramUser = Depends(get_telegram_user),
-):
-    """提交捐赠记录"""
-    check_admin_permission(user)
-
-    try:
-        tg_id = data.get("tg_id")
-        amount = data.get("amount", 0)
-        note = data.get("note", "")
-
-        if not tg_id or amount <= 0:
-            return BaseResponse(success=False, message="参数错误")
+async def unbind_specified_line_for_all_users(line: str):
+    """解绑所有用户的指定线路（通用，同时支持Plex和Emby）"""
+    notices, error = await run_db(_unbind_specified_line_for_all_users, line)
+    await _send_line_notices(notices)
+    return error is None, error
 
-        db = DB()
 
+def _submit_donation_record(tg_id: int, amount: float, note: str, user: TelegramUser):
+    """写入捐赠记录并增加积分，返回 (响应, 累计捐赠金额)，同步，在数据库线程池中运行"""
+    db = DB()
+    try:
         # 获取当前捐赠金额
         stats_info = db.get_stats_by_tg_id(tg_id)
         if not stats_info:
-            return BaseResponse(success=False, message="用户不存在")
+            return BaseResponse(success=False, message="用户不存在"), None
 
         current_donation = stats_info[1] if stats_info[1] else 0
         new_donation = round(current_donation + float(amount), 2)
@@ -630,19 +661,52 @@ async def submit_donation_record(
 
         # 更新捐赠金额
         success = db.update_user_donation(new_donation, tg_id)
+        if not success:
+            return BaseResponse(success=False, message="更新捐赠记录失败"), None
 
-        if success:
-            # 更新积分
-            db.update_user_credits(new_credits, tg_id=tg_id)
+        # 更新积分
+        db.update_user_credits(new_credits, tg_id=tg_id)
 
-            # 获取用户显示名称
-            user_name = get_user_name_from_tg_id(tg_id)
+        # 获取用户显示名称
+        user_name = get_user_name_from_tg_id(tg_id)
+
+        logger.info(
+            f"管理员 {user.username or user.id} 为用户 {user_name}({tg_id}) 添加捐赠记录: {amount}元"
+            + (f", 备注: {note}" if note else "")
+        )
+        return (
+            BaseResponse(
+                success=True, message=f"成功为 {user_name} 添加 {amount}元 捐赠记录"
+            ),
+            new_donation,
+        )
+    finally:
+        db.close()
 
-            logger.info(
-                f"管理员 {user.username or user.id} 为用户 {user_name}({tg_id}) 添加捐赠记录: {amount}元"
-                + (f", 备注: {note}" if note else "")
-            )
 
+@router.post("/donation")
+@require_telegram_auth
+async def submit_donation_record(
+    request: Request,
+    data: dict = Body(...),
+    user: TelegramUser = Depends(get_telegram_user),
+):
+    """提交捐赠记录"""
+    check_admin_permission(user)
+
+    try:
+        tg_id = data.get("tg_id")
+        amount = data.get("amount", 0)
+        note = data.get("note", "")
+
+        if not tg_id or amount <= 0:
+            return BaseResponse(success=False, message="参数错误")
+
+        response, new_donation = await run_db(
+            _submit_donation_record, tg_id, amount, note, user
+        )
+
+        if response.success:
             # 发送通知给用户
             try:
                 await send_message_by_url(
@@ -659,17 +723,11 @@ async def submit_donation_record(
             except Exception as e:
                 logger.warning(f"发送捐赠通知失败: {str(e)}")
 
-            return BaseResponse(
-                success=True, message=f"成功为 {user_name} 添加 {amount}元 捐赠记录"
-            )
-        else:
-            return BaseResponse(success=False, message="更新捐赠记录失败")
+        return response
 
     except Exception as e:
         logger.error(f"提交捐赠记录失败: {str(e)}")
         return BaseResponse(success=False, message="提交失败")
-    finally:
-        db.close()
 
 
 # ==================== 线路标签管理 API ==================== #
@@ -742,11 +800,8 @@ async def get_all_line_tags(
         all_lines.update(settings.STREAM_BACKEND)
         all_lines.update(settings.PREMIUM_STREAM_BACKEND)
 
-        # 获取每个线路的标签
-        lines_tags = {}
-        for line in all_lines:
-            tags = get_line_tags(line)
-            lines_tags[line] = tags
+        # 一次批量获取所有线路的标签
+        lines_tags = get_lines_tags(all_lines)
 
         return AllLineTagsResponse(lines=lines_tags)
     except Exception as e:
@@ -929,6 +984,38 @@ async def set_credits_transfer_enabled(
         return BaseResponse(success=False, message="设置失败")
 
 
+def _resync_all_media_routes() -> dict:
+    db = DB()
+    try:
+        return sync_all_media_routes(db)
+    finally:
+        db.close()
+
+
+@router.post("/media-routes/resync")
+@require_telegram_auth
+async def resync_media_routes(
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+):
+    """全量重新同步所有用户的 Plex / Emby 路由到 Redis"""
+    check_admin_permission(user)
+
+    try:
+        summary = await run_db(_resync_all_media_routes)
+        logger.info(f"管理员 {user.username or user.id} 全量重新同步媒体路由: {summary}")
+        return BaseResponse(
+            success=True,
+            message=(
+                f"已同步 {summary['total']} 个路由：写入 {summary['set']}，"
+                f"删除 {summary['deleted']}，未变化 {summary['unchanged']}"
+            ),
+        )
+    except Exception as e:
+        logger.error(f"全量重新同步媒体路由失败: {str(e)}")
+        return BaseResponse(success=False, message="同步失败")
+
+
 @router.get("/lines")
 @require_telegram_auth
 async def get_lines_config(
@@ -1155,6 +1242,28 @@ async def delete_premium_line(
     return await delete_premium_line_generic(line_name, request, user)
 
 
+def _add_admin_invite_codes(tg_id: int, count: int, is_premium: bool) -> Optional[str]:
+    """为目标用户生成邀请码，失败时返回错误信息，同步，在数据库线程池中运行"""
+    # 导入生成邀请码的函数
+    from app.update_db import add_redeem_code
+
+    db = DB()
+    try:
+        # 检查目标用户是否存在
+        if not db.get_stats_by_tg_id(tg_id):
+            return "目标用户不存在"
+    finally:
+        db.close()
+
+    # 使用 add_redeem_code 生成邀请码
+    try:
+        add_redeem_code(tg_id=tg_id, num=count, is_privileged=is_premium)
+    except Exception as e:
+        logger.error(f"生成邀请码失败: {str(e)}")
+        return f"生成邀请码失败: {str(e)}"
+    return None
+
+
 @router.post("/invite-codes/generate")
 @require_telegram_auth
 async def generate_admin_invite_codes(
@@ -1165,10 +1274,7 @@ async def generate_admin_invite_codes(
     """管理员生成邀请码"""
     check_admin_permission(user)
 
-    db = None
     try:
-        db = DB()
-
         tg_id = data.get("tg_id")
         count = data.get("count", 1)
         is_premium = data.get("is_premium", False)
@@ -1177,21 +1283,10 @@ async def generate_admin_invite_codes(
         if not tg_id or count <= 0 or count > 100:
             return BaseResponse(success=False, message="参数错误")
 
-        # 导入生成邀请码的函数
-        from app.update_db import add_redeem_code
-
-        # 检查目标用户是否存在
-        stats_info = db.get_stats_by_tg_id(tg_id)
-        if not stats_info:
-            return BaseResponse(success=False, message="目标用户不存在")
-
-        # 使用 add_redeem_code 生成邀请码
-        try:
-            add_redeem_code(tg_id=tg_id, num=count, is_privileged=is_premium)
-            success_count = count
-        except Exception as e:
-            logger.error(f"生成邀请码失败: {str(e)}")
-            return BaseResponse(success=False, message=f"生成邀请码失败: {str(e)}")
+        error = await run_db(_add_admin_invite_codes, tg_id, count, is_premium)
+        if error:
+            return BaseResponse(success=False, message=error)
+        success_count = count
 
         # 获取用户显示名称
         user_name = get_user_name_from_tg_id(tg_id)
@@ -1229,29 +1324,14 @@ async def generate_admin_invite_codes(
     except Exception as e:
         logger.error(f"管理员生成邀请码失败: {str(e)}")
         return BaseResponse(success=False, message=f"生成邀请码失败: {str(e)}")
-    finally:
-        db.close()
-
-
-@router.post("/change-tg-binding")
-@require_telegram_auth
-async def change_tg_binding(
-    request: Request,
-    data: ChangeTgBindingRequest = Body(...),
-    user: TelegramUser = Depends(get_telegram_user),
-):
-    """管理员更换用户的TG绑定"""
-    logger.info(f"收到TG换绑请求，操作者: {user.username or user.id}")
-    logger.info(f"换绑数据: {data}")
 
-    check_admin_permission(user)
 
+def _change_tg_binding(data: ChangeTgBindingRequest):
+    """迁移 TG 绑定和积分，返回 (原TG ID, 新TG ID, 更新的服务, 转移积分, 新账号积分)，同步，在数据库线程池中运行"""
+    db = DB()
     try:
-        db = DB()
-
         old_tg_id, plex_info, emby_info = _resolve_change_tg_binding_source(db, data)
         new_tg_id = data.new_tg_id
-        note = _clean_lookup_value(data.note) or ""
 
         _ensure_change_tg_binding_target_available(
             db, old_tg_id, new_tg_id, plex_info, emby_info
@@ -1293,6 +1373,33 @@ async def change_tg_binding(
             f"TG换绑迁移完成: {old_tg_id} -> {new_tg_id}, "
             f"扣费后转移积分 {remaining_credits:.2f}, 新账号积分 {final_credits:.2f}"
         )
+        return old_tg_id, new_tg_id, updated_services, remaining_credits, final_credits
+    finally:
+        db.close()
+
+
+@router.post("/change-tg-binding")
+@require_telegram_auth
+async def change_tg_binding(
+    request: Request,
+    data: ChangeTgBindingRequest = Body(...),
+    user: TelegramUser = Depends(get_telegram_user),
+):
+    """管理员更换用户的TG绑定"""
+    logger.info(f"收到TG换绑请求，操作者: {user.username or user.id}")
+    logger.info(f"换绑数据: {data}")
+
+    check_admin_permission(user)
+
+    try:
+        (
+            old_tg_id,
+            new_tg_id,
+            updated_services,
+            remaining_credits,
+            final_credits,
+        ) = await run_db(_change_tg_binding, data)
+        note = _clean_lookup_value(data.note) or ""
 
         # 获取用户显示名称
         old_user_name = get_user_name_from_tg_id(old_tg_id)
@@ -1377,6 +1484,3 @@ async def change_tg_binding(
     except Exception as e:
         logger.error(f"更换TG绑定失败: {str(e)}")
         return BaseResponse(success=False, message=f"更换TG绑定失败: {str(e)}")
-    finally:
-        if db:
-            db.close()
@@ -4,8 +4,11 @@ from datetime import datetime, timedelta
 
 from app.config import settings
 from app.db import DB
+from app.executors import run_db
+from app.medal_cache import get_users_medals_map
 from app.utils.utils import get_user_name_from_tg_id
 from app.webapp.auth import get_telegram_user
+from app.webapp.dependencies import get_db
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser
 from fastapi import APIRouter, Depends, HTTPException
@@ -44,129 +47,133 @@ def _get_checkin_availability(db: DB, tg_id: int) -> tuple[bool, str]:
     return True, ""
 
 
-@require_telegram_auth
-@router.post("")
-async def do_checkin(user: TelegramUser = Depends(get_telegram_user)):
-    """执行每日签到"""
-    db = DB()
+def _perform_checkin(db: DB, tg_id: int) -> dict:
+    """执行签到（同步，在数据库线程池中运行）"""
     today_date = _today_in_tz()
     today = today_date.strftime("%Y-%m-%d")
     month = today[:7]
 
+    can_checkin, disabled_reason = _get_checkin_availability(db, tg_id)
+    if not can_checkin:
+        raise HTTPException(status_code=403, detail=disabled_reason)
+
+    # 检查今日是否已签到
+    if db.get_checkin_today(tg_id, today):
+        return {"success": False, "message": "今日已签到，明天再来吧 ✨"}
+
+    # 计算连续签到天数
+    last = db.get_checkin_last(tg_id)
+    if last:
+        last_date = datetime.fromisoformat(last["checkin_date"]).date()
+        yesterday = today_date - timedelta(days=1)
+        streak = last["streak"] + 1 if last_date == yesterday else 1
+    else:
+        streak = 1
+
+    reward = _calc_reward(streak)
+
+    # 记录签到 + 发放积分
+    if not db.add_checkin(tg_id, today, streak, month, reward):
+        raise HTTPException(status_code=500, detail="签到记录写入失败，请稍后重试")
+    stats = db.get_stats_by_tg_id(tg_id)
+    if stats:
+        new_credits = round((stats["credits"] or 0) + reward, 2)
+        db.update_user_credits(new_credits, tg_id=tg_id)
+    else:
+        new_credits = reward
+        db.cur.execute(
+            "INSERT INTO statistics (tg_id, credits, donation) VALUES (?, ?, 0)",
+            (tg_id, new_credits),
+        )
+        db.con.commit()
+
+    month_count = db.get_checkin_month_count(tg_id, month)
+
+    # 构建奖励消息
+    milestone_msg = ""
+    if streak % 30 == 0:
+        milestone_msg = f"🏆 连续签到 {streak} 天！超级里程碑！"
+    elif streak % 14 == 0:
+        milestone_msg = f"🎉 连续签到 {streak} 天！双周里程碑！"
+    elif streak % 7 == 0:
+        milestone_msg = f"🌟 连续签到 {streak} 天！周签里程碑！"
+
+    return {
+        "success": True,
+        "message": "签到成功！",
+        "data": {
+            "streak": streak,
+            "reward": reward,
+            "new_credits": new_credits,
+            "month_count": month_count,
+            "milestone_msg": milestone_msg,
+        },
+    }
+
+
+@require_telegram_auth
+@router.post("")
+async def do_checkin(
+    user: TelegramUser = Depends(get_telegram_user), db: DB = Depends(get_db)
+):
+    """执行每日签到"""
     try:
-        db.sync_checkin_total_rank_medals()
-        can_checkin, disabled_reason = _get_checkin_availability(db, user.id)
-        if not can_checkin:
-            raise HTTPException(status_code=403, detail=disabled_reason)
-
-        # 检查今日是否已签到
-        if db.get_checkin_today(user.id, today):
-            return {"success": False, "message": "今日已签到，明天再来吧 ✨"}
-
-        # 计算连续签到天数
-        last = db.get_checkin_last(user.id)
-        if last:
-            last_date = datetime.fromisoformat(last["checkin_date"]).date()
-            yesterday = today_date - timedelta(days=1)
-            streak = last["streak"] + 1 if last_date == yesterday else 1
-        else:
-            streak = 1
-
-        reward = _calc_reward(streak)
-
-        # 记录签到 + 发放积分
-        if not db.add_checkin(user.id, today, streak, month, reward):
-            raise HTTPException(status_code=500, detail="签到记录写入失败，请稍后重试")
-        stats = db.get_stats_by_tg_id(user.id)
-        if stats:
-            new_credits = round((stats["credits"] or 0) + reward, 2)
-            db.update_user_credits(new_credits, tg_id=user.id)
-        else:
-            new_credits = reward
-            db.cur.execute(
-                "INSERT INTO statistics (tg_id, credits, donation) VALUES (?, ?, 0)",
-                (user.id, new_credits),
-            )
-            db.con.commit()
-
-        db.sync_checkin_total_rank_medals()
-        month_count = db.get_checkin_month_count(user.id, month)
-
-        # 构建奖励消息
-        milestone_msg = ""
-        if streak % 30 == 0:
-            milestone_msg = f"🏆 连续签到 {streak} 天！超级里程碑！"
-        elif streak % 14 == 0:
-            milestone_msg = f"🎉 连续签到 {streak} 天！双周里程碑！"
-        elif streak % 7 == 0:
-            milestone_msg = f"🌟 连续签到 {streak} 天！周签里程碑！"
-
-        return {
-            "success": True,
-            "message": "签到成功！",
-            "data": {
-                "streak": streak,
-                "reward": reward,
-                "new_credits": new_credits,
-                "month_count": month_count,
-                "milestone_msg": milestone_msg,
-            },
-        }
+        return await run_db(_perform_checkin, db, user.id)
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"签到失败 user={user.id}: {e}")
         raise HTTPException(status_code=500, detail="签到失败，请稍后重试")
-    finally:
-        db.close()
+
+
+def _get_checkin_status_payload(db: DB, tg_id: int) -> dict:
+    """构建签到状态（同步，在数据库线程池中运行）"""
+    today = _today_in_tz().strftime("%Y-%m-%d")
+    status = db.get_checkin_status(tg_id, today)
+    can_checkin, disabled_reason = _get_checkin_availability(db, tg_id)
+    next_reward = _calc_reward(status["streak"] + 1)
+    return {
+        "success": True,
+        "data": {
+            **status,
+            "next_reward": next_reward,
+            "today": today,
+            "can_checkin": can_checkin,
+            "disabled_reason": disabled_reason,
+        },
+    }
 
 
 @require_telegram_auth
 @router.get("/status")
-async def get_checkin_status(user: TelegramUser = Depends(get_telegram_user)):
+async def get_checkin_status(
+    user: TelegramUser = Depends(get_telegram_user), db: DB = Depends(get_db)
+):
     """获取当前用户签到状态"""
-    db = DB()
-    today = _today_in_tz().strftime("%Y-%m-%d")
-    try:
-        db.sync_checkin_total_rank_medals()
-        status = db.get_checkin_status(user.id, today)
-        can_checkin, disabled_reason = _get_checkin_availability(db, user.id)
-        next_reward = _calc_reward(status["streak"] + 1)
-        return {
-            "success": True,
-            "data": {
-                **status,
-                "next_reward": next_reward,
-                "today": today,
-                "can_checkin": can_checkin,
-                "disabled_reason": disabled_reason,
-            },
-        }
-    finally:
-        db.close()
+    return await run_db(_get_checkin_status_payload, db, user.id)
+
+
+def _get_checkin_leaderboard_payload(db: DB) -> dict:
+    """构建本月签到排行榜（同步，在数据库线程池中运行）"""
+    month = _today_in_tz().strftime("%Y-%m")
+    rows = db.get_checkin_monthly_leaderboard(month)[:3]
+    medal_map = get_users_medals_map(db, [row["tg_id"] for row in rows])
+    result = []
+    for rank, row in enumerate(rows, start=1):
+        tg_id = row["tg_id"]
+        name = get_user_name_from_tg_id(tg_id) or f"用户{tg_id}"
+        result.append({
+            "rank": rank,
+            "tg_id": tg_id,
+            "name": name,
+            "days": row["days"],
+            "total_credits": round(row["total_credits"] or 0, 2),
+            "medals": medal_map.get(tg_id, []),
+        })
+    return {"success": True, "data": result, "month": month}
 
 
 @router.get("/leaderboard")
-async def get_checkin_leaderboard():
+async def get_checkin_leaderboard(db: DB = Depends(get_db)):
     """本月签到排行榜（公开，无需登录，仅展示前三）"""
-    month = _today_in_tz().strftime("%Y-%m")
-    db = DB()
-    try:
-        db.sync_checkin_total_rank_medals()
-        rows = db.get_checkin_monthly_leaderboard(month)[:3]
-        medal_map = db.get_users_medals_map([row["tg_id"] for row in rows]) if rows else {}
-        result = []
-        for rank, row in enumerate(rows, start=1):
-            tg_id = row["tg_id"]
-            name = get_user_name_from_tg_id(tg_id) or f"用户{tg_id}"
-            result.append({
-                "rank": rank,
-                "tg_id": tg_id,
-                "name": name,
-                "days": row["days"],
-                "total_credits": round(row["total_credits"] or 0, 2),
-                "medals": medal_map.get(tg_id, []),
-            })
-        return {"success": True, "data": result, "month": month}
-    finally:
-        db.close()
+    return await run_db(_get_checkin_leaderboard_payload, db)
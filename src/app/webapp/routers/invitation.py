@@ -1,13 +1,14 @@
+from typing import Optional
+
 from app.config import settings
 from app.db import DB
-from app.emby import Emby
+from app.executors import AsyncEmby, AsyncPlex, run_db
 from app.invitation_utils import (
     INVITATION_EXPIRE_DAYS,
     generate_unique_invitation_code,
     is_invitation_expired,
 )
 from app.log import uvicorn_logger as logger
-from app.plex import Plex
 from app.utils.utils import get_user_name_from_tg_id, send_message_by_url
 from app.webapp.auth import get_telegram_user
 from app.webapp.middlewares import require_telegram_auth
@@ -33,14 +34,8 @@ router = APIRouter(
 )
 
 
-@router.get("/points-info", response_model=InvitePointsResponse)
-@require_telegram_auth
-async def get_invite_points_info(
-    request: Request, telegram_user: TelegramUser = Depends(get_telegram_user)
-):
-    """
-    获取用户当前积分和生成邀请码所需的积分信息
-    """
+def _get_invite_points_info(telegram_user: TelegramUser):
+    """获取用户当前积分和生成邀请码所需的积分信息（同步，在数据库线程池中运行）"""
     try:
         user_id = telegram_user.id
         _db = DB()
@@ -85,15 +80,19 @@ async def get_invite_points_info(
         _db.close()
 
 
-@router.post("/generate", response_model=GenerateInviteCodeResponse)
+@router.get("/points-info", response_model=InvitePointsResponse)
 @require_telegram_auth
-async def generate_invite_code(
-    request: Request,
-    telegram_user: TelegramUser = Depends(get_telegram_user),
+async def get_invite_points_info(
+    request: Request, telegram_user: TelegramUser = Depends(get_telegram_user)
 ):
     """
-    生成新的邀请码，消耗用户积分
+    获取用户当前积分和生成邀请码所需的积分信息
     """
+    return await run_db(_get_invite_points_info, telegram_user)
+
+
+def _generate_invite_code(telegram_user: TelegramUser):
+    """生成新的邀请码，消耗用户积分（同步，在数据库线程池中运行）"""
     try:
         user_id = telegram_user.id
         _db = DB()
@@ -162,6 +161,18 @@ async def generate_invite_code(
         _db.close()
 
 
+@router.post("/generate", response_model=GenerateInviteCodeResponse)
+@require_telegram_auth
+async def generate_invite_code(
+    request: Request,
+    telegram_user: TelegramUser = Depends(get_telegram_user),
+):
+    """
+    生成新的邀请码，消耗用户积分
+    """
+    return await run_db(_generate_invite_code, telegram_user)
+
+
 @router.get("/register-status")
 async def get_register_status():
     """获取媒体服务的注册状态"""
@@ -175,6 +186,94 @@ async def get_register_status():
         )
 
 
+def _check_invitation_code(_db: DB, code: str) -> tuple[Optional[str], Optional[int]]:
+    """检查邀请码是否可用，返回 (错误信息, 邀请码所有者)"""
+    res = _db.verify_invitation_code_is_used(code)
+    if not res:
+        return "邀请码不存在", None
+    if res[0]:
+        return "邀请码已被使用", None
+    if is_invitation_expired(res[2]):
+        return "邀请码已过期", None
+    return None, res[1]
+
+
+def _bind_plex_to_telegram(_db: DB, telegram_user_id: int, email: str) -> bool:
+    """把新邀请的 Plex 账户绑定到 Telegram 用户，返回是否绑定成功"""
+    try:
+        # 检查是否已经存在该 Telegram 用户的 Plex 绑定
+        existing_plex_info = _db.get_plex_info_by_tg_id(telegram_user_id)
+        if existing_plex_info:
+            logger.warning(
+                f"Telegram 用户 {telegram_user_id} 已绑定其他 Plex 账户"
+            )
+            return False
+        # 添加 Plex 用户到数据库，暂时不设置 plex_id（需要用户接受邀请后获取）
+        success = _db.add_plex_user(
+            tg_id=telegram_user_id, plex_email=email, credits=0
+        )
+        if not success:
+            logger.error(
+                f"绑定 Plex 账户到 Telegram 失败: {telegram_user_id} -> {email}"
+            )
+            return False
+        # 确保用户在统计表中存在
+        stats_info = _db.get_stats_by_tg_id(telegram_user_id)
+        if not stats_info:
+            _db.add_user_data(telegram_user_id, credits=0)
+        logger.info(
+            f"成功将 Plex 账户 {email} 绑定到 Telegram 用户 {telegram_user_id}"
+        )
+        return True
+    except Exception as e:
+        logger.error(f"绑定 Telegram 账户过程出错: {str(e)}")
+        return False
+
+
+def _save_emby_user(
+    _db: DB, username: str, emby_id: str, telegram_user_id: int, bind_to_telegram: bool
+) -> bool:
+    """保存新建的 Emby 用户，按需绑定到 Telegram 用户，返回是否绑定成功"""
+    if not bind_to_telegram:
+        # 不绑定到 Telegram 时，添加 emby 用户信息
+        _db.add_emby_user(username, emby_id=emby_id)
+        return False
+    try:
+        # 检查是否已经存在该 Telegram 用户的 Emby 绑定
+        existing_emby_info = _db.get_emby_info_by_tg_id(telegram_user_id)
+        if existing_emby_info:
+            logger.warning(
+                f"Telegram 用户 {telegram_user_id} 已绑定其他 Emby 账户"
+            )
+            # 即使已绑定其他账户，也添加新的 Emby 用户记录，但设置 tg_id 为 None
+            _db.add_emby_user(username, emby_id=emby_id)
+            return False
+        # 添加 emby 用户信息并绑定到 Telegram
+        success = _db.add_emby_user(
+            username, emby_id=emby_id, tg_id=telegram_user_id
+        )
+        if not success:
+            # 如果绑定失败，仍然添加 Emby 用户记录，但不绑定 TG
+            _db.add_emby_user(username, emby_id=emby_id)
+            logger.error(
+                f"绑定 Emby 账户到 Telegram 失败: {telegram_user_id} -> {username}"
+            )
+            return False
+        # 确保用户在统计表中存在
+        stats_info = _db.get_stats_by_tg_id(telegram_user_id)
+        if not stats_info:
+            _db.add_user_data(telegram_user_id, credits=0)
+        logger.info(
+            f"成功将 Emby 账户 {username} 绑定到 Telegram 用户 {telegram_user_id}"
+        )
+        return True
+    except Exception as e:
+        # 如果绑定过程出错，仍然添加 Emby 用户记录，但不绑定 TG
+        _db.add_emby_user(username, emby_id=emby_id)
+        logger.error(f"绑定 Telegram 账户过程出错: {str(e)}")
+        return False
+
+
 @router.post("/redeem/plex", response_model=RedeemResponse)
 @require_telegram_auth
 async def redeem_plex_code(
@@ -198,37 +297,31 @@ async def redeem_plex_code(
         if not email or "@" not in email:
             return RedeemResponse(success=False, message="请输入有效的邮箱地址")
 
-        _db = DB()
+        _db = await run_db(DB)
 
         try:
             # 检查邀请码是否存在且未被使用
-            res = _db.verify_invitation_code_is_used(code)
-            if not res:
-                return RedeemResponse(success=False, message="邀请码不存在")
-
-            if res[0]:
-                return RedeemResponse(success=False, message="邀请码已被使用")
-            if is_invitation_expired(res[2]):
-                return RedeemResponse(success=False, message="邀请码已过期")
-            code_owner = res[1]
+            error_message, code_owner = await run_db(_check_invitation_code, _db, code)
+            if error_message:
+                return RedeemResponse(success=False, message=error_message)
 
             # 实例化 Plex 对象
-            _plex = Plex()
+            _plex = await AsyncPlex.create()
 
             # 检查该用户是否已经被邀请
-            if email in _plex.users_by_email:
+            if await _plex.get_user_id_by_email(email):
                 return RedeemResponse(
                     success=False, message="该邮箱账户已被邀请，请使用其他邮箱"
                 )
 
             # 发送邀请
-            if not _plex.invite_friend(email):
+            if not await _plex.invite_friend(email):
                 return RedeemResponse(
                     success=False, message="邀请失败，请稍后再试或联系管理员"
                 )
 
             # 更新邀请码状态
-            res = _db.update_invitation_status(code=code, used_by=email)
+            res = await run_db(_db.update_invitation_status, code=code, used_by=email)
             if not res:
                 return RedeemResponse(
                     success=False, message="更新邀请码状态失败，请联系管理员"
@@ -238,33 +331,9 @@ async def redeem_plex_code(
 
             # 如果用户选择绑定到 Telegram
             if bind_to_telegram:
-                try:
-                    # 检查是否已经存在该 Telegram 用户的 Plex 绑定
-                    existing_plex_info = _db.get_plex_info_by_tg_id(telegram_user_id)
-                    if existing_plex_info:
-                        logger.warning(
-                            f"Telegram 用户 {telegram_user_id} 已绑定其他 Plex 账户"
-                        )
-                    else:
-                        # 添加 Plex 用户到数据库，暂时不设置 plex_id（需要用户接受邀请后获取）
-                        success = _db.add_plex_user(
-                            tg_id=telegram_user_id, plex_email=email, credits=0
-                        )
-                        if success:
-                            # 确保用户在统计表中存在
-                            stats_info = _db.get_stats_by_tg_id(telegram_user_id)
-                            if not stats_info:
-                                _db.add_user_data(telegram_user_id, credits=0)
-                            telegram_bound = True
-                            logger.info(
-                                f"成功将 Plex 账户 {email} 绑定到 Telegram 用户 {telegram_user_id}"
-                            )
-                        else:
-                            logger.error(
-                                f"绑定 Plex 账户到 Telegram 失败: {telegram_user_id} -> {email}"
-                            )
-                except Exception as e:
-                    logger.error(f"绑定 Telegram 账户过程出错: {str(e)}")
+                telegram_bound = await run_db(
+                    _bind_plex_to_telegram, _db, telegram_user_id, email
+                )
 
             for admin in settings.TG_ADMIN_CHAT_ID:
                 bind_status = (
@@ -293,7 +362,7 @@ async def redeem_plex_code(
             )
 
         finally:
-            _db.close()
+            await run_db(_db.close)
 
     except Exception as e:
         logger.error(f"兑换 Plex 邀请码失败: {str(e)}")
@@ -328,83 +397,39 @@ async def redeem_emby_code(
         if not password or len(password) < 4:
             return RedeemResponse(success=False, message="请输入有效的密码")
 
-        _db = DB()
+        _db = await run_db(DB)
 
         try:
             # 检查邀请码是否存在且未被使用
-            res = _db.verify_invitation_code_is_used(code)
-            if not res:
-                return RedeemResponse(success=False, message="邀请码不存在")
-
-            if res[0]:
-                return RedeemResponse(success=False, message="邀请码已被使用")
-            if is_invitation_expired(res[2]):
-                return RedeemResponse(success=False, message="邀请码已过期")
-
-            code_owner = res[1]
+            error_message, code_owner = await run_db(_check_invitation_code, _db, code)
+            if error_message:
+                return RedeemResponse(success=False, message=error_message)
 
             # 检查该用户是否存在
-            _emby = Emby()
-            if _db.get_emby_info_by_emby_username(
-                username
-            ) or _emby.get_uid_from_username(username):
+            _emby = AsyncEmby()
+            if await run_db(
+                _db.get_emby_info_by_emby_username, username
+            ) or await _emby.get_uid_from_username(username):
                 return RedeemResponse(
                     success=False, message="该用户名已存在，请使用其他用户名"
                 )
 
             # 创建用户
-            flag, msg = _emby.add_user(username=username, password=password)
+            flag, msg = await _emby.add_user(username=username, password=password)
             if not flag:
                 return RedeemResponse(success=False, message=f"创建用户失败: {msg}")
 
             # 更新邀请码状态
-            res = _db.update_invitation_status(code=code, used_by=username)
+            res = await run_db(_db.update_invitation_status, code=code, used_by=username)
             if not res:
                 return RedeemResponse(
                     success=False, message="更新邀请码状态失败，请联系管理员"
                 )
 
-            telegram_bound = False
             emby_id = msg  # msg 是创建成功时返回的 emby_id
-
-            # 如果用户选择绑定到 Telegram
-            if bind_to_telegram:
-                try:
-                    # 检查是否已经存在该 Telegram 用户的 Emby 绑定
-                    existing_emby_info = _db.get_emby_info_by_tg_id(telegram_user_id)
-                    if existing_emby_info:
-                        logger.warning(
-                            f"Telegram 用户 {telegram_user_id} 已绑定其他 Emby 账户"
-                        )
-                        # 即使已绑定其他账户，也添加新的 Emby 用户记录，但设置 tg_id 为 None
-                        _db.add_emby_user(username, emby_id=emby_id)
-                    else:
-                        # 添加 emby 用户信息并绑定到 Telegram
-                        success = _db.add_emby_user(
-                            username, emby_id=emby_id, tg_id=telegram_user_id
-                        )
-                        if success:
-                            # 确保用户在统计表中存在
-                            stats_info = _db.get_stats_by_tg_id(telegram_user_id)
-                            if not stats_info:
-                                _db.add_user_data(telegram_user_id, credits=0)
-                            telegram_bound = True
-                            logger.info(
-                                f"成功将 Emby 账户 {username} 绑定到 Telegram 用户 {telegram_user_id}"
-                            )
-                        else:
-                            # 如果绑定失败，仍然添加 Emby 用户记录，但不绑定 TG
-                            _db.add_emby_user(username, emby_id=emby_id)
-                            logger.error(
-                                f"绑定 Emby 账户到 Telegram 失败: {telegram_user_id} -> {username}"
-                            )
-                except Exception as e:
-                    # 如果绑定过程出错，仍然添加 Emby 用户记录，但不绑定 TG
-                    _db.add_emby_user(username, emby_id=emby_id)
-                    logger.error(f"绑定 Telegram 账户过程出错: {str(e)}")
-            else:
-                # 不绑定到 Telegram 时，添加 emby 用户信息
-                _db.add_emby_user(username, emby_id=emby_id)
+            telegram_bound = await run_db(
+                _save_emby_user, _db, username, emby_id, telegram_user_id, bind_to_telegram
+            )
 
             for admin in settings.TG_ADMIN_CHAT_ID:
                 bind_status = (
@@ -432,21 +457,15 @@ async def redeem_emby_code(
                 telegram_bound=telegram_bound,
             )
         finally:
-            _db.close()
+            await run_db(_db.close)
 
     except Exception as e:
         logger.error(f"兑换 Emby 邀请码失败: {str(e)}")
         return RedeemResponse(success=False, message="兑换过程出错，请稍后再试")
 
 
-@router.post("/check-privileged", response_model=CheckPrivilegedCodeResponse)
-async def check_privileged_invite_code(
-    request: Request,
-    data: CheckPrivilegedCodeRequest = Body(...),
-):
-    """
-    检查邀请码是否为特权邀请码
-    """
+def _check_privileged_invite_code(data: CheckPrivilegedCodeRequest):
+    """检查邀请码是否为特权邀请码（同步，在数据库线程池中运行）"""
     try:
         code = data.code
 
@@ -469,16 +488,19 @@ async def check_privileged_invite_code(
         return CheckPrivilegedCodeResponse(privileged=False)
 
 
-@router.post("/redeem-for-credits", response_model=RedeemForCreditsResponse)
-@require_telegram_auth
-async def redeem_invite_code_for_credits(
+@router.post("/check-privileged", response_model=CheckPrivilegedCodeResponse)
+async def check_privileged_invite_code(
     request: Request,
-    data: RedeemForCreditsRequest = Body(...),
-    telegram_user: TelegramUser = Depends(get_telegram_user),
+    data: CheckPrivilegedCodeRequest = Body(...),
 ):
     """
-    将邀请码兑换为积分
+    检查邀请码是否为特权邀请码
     """
+    return await run_db(_check_privileged_invite_code, data)
+
+
+def _redeem_invite_code_for_credits(data: RedeemForCreditsRequest, telegram_user: TelegramUser):
+    """将邀请码兑换为积分（同步，在数据库线程池中运行）"""
     try:
         user_id = telegram_user.id
         code = data.code
@@ -546,3 +568,16 @@ async def redeem_invite_code_for_credits(
         return RedeemForCreditsResponse(
             success=False, message="兑换过程出错，请稍后再试"
         )
+
+
+@router.post("/redeem-for-credits", response_model=RedeemForCreditsResponse)
+@require_telegram_auth
+async def redeem_invite_code_for_credits(
+    request: Request,
+    data: RedeemForCreditsRequest = Body(...),
+    telegram_user: TelegramUser = Depends(get_telegram_user),
+):
+    """
+    将邀请码兑换为积分
+    """
+    return await run_db(_redeem_invite_code_for_credits, data, telegram_user)
@@ -3,7 +3,9 @@
 from fastapi import APIRouter, Depends, HTTPException, Request
 
 from app.db import DB
+from app.executors import run_db
 from app.webapp.auth import get_telegram_user
+from app.webapp.dependencies import get_db
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser
 
@@ -15,15 +17,13 @@ router = APIRouter(prefix="/medals", tags=["medals"])
 async def get_medal_shop(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取勋章商店和当前用户勋章信息"""
-    db = DB()
     try:
-        return {"success": True, "data": db.get_medal_shop_payload(user.id)}
+        return {"success": True, "data": await run_db(db.get_medal_shop_payload, user.id)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"获取勋章商店失败: {str(e)}")
-    finally:
-        db.close()
 
 
 @router.post("/shop/{medal_code}/purchase")
@@ -32,13 +32,10 @@ async def purchase_medal(
     medal_code: str,
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """购买勋章"""
-    db = DB()
-    try:
-        success, message, payload = db.purchase_medal(user.id, medal_code)
-        if not success:
-            raise HTTPException(status_code=400, detail=message)
-        return {"success": True, "message": message, "data": payload}
-    finally:
-        db.close()
+    success, message, payload = await run_db(db.purchase_medal, user.id, medal_code)
+    if not success:
+        raise HTTPException(status_code=400, detail=message)
+    return {"success": True, "message": message, "data": payload}
@@ -3,10 +3,20 @@ from datetime import datetime
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.executors import run_db
+from app.leaderboard import (
+    CREDITS,
+    DONATION,
+    emby_watched_time_rank,
+    plex_watched_time_rank,
+    top_entries,
+)
 from app.log import uvicorn_logger as logger
+from app.medal_cache import get_users_medals_map
 from app.plex import Plex
-from app.utils.utils import get_user_avatar_from_tg_id, get_user_name_from_tg_id
+from app.utils.utils import format_tg_user_name, get_users_info_from_tg_ids
 from app.webapp.auth import get_telegram_user
+from app.webapp.dependencies import get_db
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
@@ -15,40 +25,177 @@ router = APIRouter(prefix="/api", tags=["rankings"])
 
 
 def _get_medal_map(db: DB, tg_ids: list[int]):
-    db.sync_checkin_total_rank_medals()
-    return db.get_users_medals_map(tg_ids)
+    return get_users_medals_map(db, tg_ids)
+
+
+def _parse_date_range(start_date: str, end_date: str):
+    """解析日期参数"""
+    parsed_start_date = None
+    parsed_end_date = None
+
+    if start_date:
+        try:
+            parsed_start_date = datetime.strptime(start_date, "%Y-%m-%d")
+            parsed_start_date = parsed_start_date.replace(tzinfo=settings.TZ)
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="开始日期格式错误，应为 YYYY-MM-DD"
+            )
+
+    if end_date:
+        try:
+            parsed_end_date = datetime.strptime(end_date, "%Y-%m-%d")
+            parsed_end_date = parsed_end_date.replace(
+                hour=23, minute=59, second=59, tzinfo=settings.TZ
+            )
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="结束日期格式错误，应为 YYYY-MM-DD"
+            )
+
+    return parsed_start_date, parsed_end_date
+
+
+# 以下构建函数均为同步阻塞调用（SQLite、头像缓存文件），通过 run_db 在数据库线程池中执行
+
+
+def _build_credits_rankings(db: DB, user_id: int) -> list:
+    # 管理员不展示，多取几名补足
+    credits_data = [
+        info
+        for info in top_entries(
+            db, CREDITS, settings.LEADERBOARD_SIZE + len(settings.TG_ADMIN_CHAT_ID)
+        )
+        if info[0] not in settings.TG_ADMIN_CHAT_ID
+    ][: settings.LEADERBOARD_SIZE]
+    if not credits_data:
+        return []
+    tg_ids = [info[0] for info in credits_data]
+    medal_map = _get_medal_map(db, tg_ids)
+    users_info = get_users_info_from_tg_ids(tg_ids)
+    return [
+        {
+            "name": format_tg_user_name(info[0], users_info[info[0]]),
+            "credits": info[1],
+            "avatar": users_info[info[0]].get("photo_url"),
+            "medals": medal_map.get(info[0], []),
+            "is_self": info[0] == user_id,  # tg_id 比较
+        }
+        for info in credits_data
+    ]
+
+
+def _build_donation_rankings(db: DB, user_id: int) -> list:
+    donation_data = top_entries(db, DONATION, settings.LEADERBOARD_SIZE)
+    if not donation_data:
+        return []
+    tg_ids = [info[0] for info in donation_data if info[1] > 0]
+    medal_map = _get_medal_map(db, tg_ids)
+    users_info = get_users_info_from_tg_ids(tg_ids)
+    return [
+        {
+            "name": format_tg_user_name(info[0], users_info[info[0]]),
+            "donation": info[1],
+            "avatar": users_info[info[0]].get("photo_url"),
+            "medals": medal_map.get(info[0], []),
+            "is_self": info[0] == user_id,  # tg_id 比较
+        }
+        for info in donation_data
+        if info[1] > 0
+    ]
+
+
+def _build_plex_watched_time_rankings(db: DB, user_id: int) -> list:
+    plex_watch_time_data = plex_watched_time_rank(db, settings.LEADERBOARD_SIZE)
+    if not plex_watch_time_data:
+        return []
+    medal_map = _get_medal_map(db, [info[1] for info in plex_watch_time_data])
+    return [
+        {
+            "name": info[2],
+            "watched_time": info[3],
+            "avatar": Plex.get_user_avatar_by_username(info[2]),
+            "medals": medal_map.get(info[1], []),
+            "is_premium": bool(info[4])
+            if len(info) > 4 and info[4] is not None
+            else False,
+            "is_self": info[1] == user_id,  # tg_id 比较
+        }
+        for info in plex_watch_time_data
+        if info[3] > 0
+    ]
+
+
+def _build_emby_watched_time_rankings(db: DB, user_id: int) -> list:
+    emby_watch_time_data = emby_watched_time_rank(db, settings.LEADERBOARD_SIZE)
+    if not emby_watch_time_data:
+        return []
+    emby = Emby()
+    medal_map = _get_medal_map(
+        db,
+        [info[4] for info in emby_watch_time_data if len(info) > 4],
+    )
+    return [
+        {
+            "name": info[1],
+            "watched_time": info[2],
+            "avatar": emby.get_user_avatar_by_username(info[1], from_emby=False),
+            "medals": medal_map.get(info[4], []),
+            "is_premium": bool(info[3])
+            if len(info) > 3 and info[3] is not None
+            else False,
+            "is_self": info[4] == user_id if len(info) > 4 else False,  # tg_id 比较
+        }
+        for info in emby_watch_time_data
+        if info[2] > 0
+    ]
+
+
+def _build_traffic_rankings(
+    db: DB, user_id: int, service: str, start_date, end_date
+) -> list:
+    if service == "plex":
+        traffic_data = db.get_plex_traffic_rank(start_date, end_date)
+        get_avatar = Plex.get_user_avatar_by_username
+    else:
+        traffic_data = db.get_emby_traffic_rank(start_date, end_date)
+        emby = Emby()
+
+        def get_avatar(username):
+            return emby.get_user_avatar_by_username(username, from_emby=False)
+
+    if not traffic_data:
+        return []
+    medal_map = _get_medal_map(db, [info[4] for info in traffic_data if info[4]])
+    return [
+        {
+            "name": info[0],  # username
+            "traffic": info[2],  # total_traffic
+            "avatar": get_avatar(info[0]),
+            "medals": medal_map.get(info[4], []),
+            "is_premium": bool(info[3]) if info[3] is not None else False,  # is_premium
+            "is_self": info[4] == user_id if info[4] else False,  # tg_id 比较
+        }
+        for info in traffic_data
+        if info[2] > 0  # 流量大于0
+    ]
 
 
 @router.get("/rankings/credits")
 @require_telegram_auth
 async def get_credits_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取积分排行榜数据"""
     logger.info(f"{user.username or user.first_name or user.id} 开始获取积分排行榜数据")
 
-    db = DB()
     try:
         credits_rankings = []
         try:
             logger.debug("正在查询积分排行")
-            credits_data = db.get_credits_rank()
-            if credits_data:
-                medal_map = _get_medal_map(
-                    db,
-                    [info[0] for info in credits_data if info[0] not in settings.TG_ADMIN_CHAT_ID],
-                )
-                credits_rankings = [
-                    {
-                        "name": get_user_name_from_tg_id(info[0]),
-                        "credits": info[1],
-                        "avatar": get_user_avatar_from_tg_id(info[0]),
-                        "medals": medal_map.get(info[0], []),
-                        "is_self": info[0] == user.id,  # tg_id 比较
-                    }
-                    for info in credits_data
-                    if info[0] not in settings.TG_ADMIN_CHAT_ID
-                ]
+            credits_rankings = await run_db(_build_credits_rankings, db, user.id)
         except Exception as e:
             logger.error(f"获取积分排行失败: {str(e)}")
 
@@ -59,41 +206,23 @@ async def get_credits_rankings(
     except Exception as e:
         logger.error(f"获取积分排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取积分排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/donation")
 @require_telegram_auth
 async def get_donation_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取捐赠排行榜数据"""
     logger.info(f"{user.username or user.first_name or user.id} 开始获取捐赠排行榜数据")
 
-    db = DB()
     try:
         donation_rankings = []
         try:
             logger.debug("正在查询捐赠排行")
-            donation_data = db.get_donation_rank()
-            if donation_data:
-                medal_map = _get_medal_map(
-                    db,
-                    [info[0] for info in donation_data if info[1] > 0],
-                )
-                donation_rankings = [
-                    {
-                        "name": get_user_name_from_tg_id(info[0]),
-                        "donation": info[1],
-                        "avatar": get_user_avatar_from_tg_id(info[0]),
-                        "medals": medal_map.get(info[0], []),
-                        "is_self": info[0] == user.id,  # tg_id 比较
-                    }
-                    for info in donation_data
-                    if info[1] > 0
-                ]
+            donation_rankings = await run_db(_build_donation_rankings, db, user.id)
         except Exception as e:
             logger.error(f"获取捐赠排行失败: {str(e)}")
 
@@ -104,43 +233,27 @@ async def get_donation_rankings(
     except Exception as e:
         logger.error(f"获取捐赠排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取捐赠排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/watched-time/plex")
 @require_telegram_auth
 async def get_plex_watched_time_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取Plex观看时长排行榜数据"""
     logger.info(
         f"{user.username or user.first_name or user.id} 开始获取Plex观看时长排行榜数据"
     )
 
-    db = DB()
     try:
         watched_time_rank_plex = []
         try:
             logger.debug("正在查询Plex播放时长排行")
-            plex_watch_time_data = db.get_plex_watched_time_rank()
-            if plex_watch_time_data:
-                medal_map = _get_medal_map(db, [info[1] for info in plex_watch_time_data])
-                watched_time_rank_plex = [
-                    {
-                        "name": info[2],
-                        "watched_time": info[3],
-                        "avatar": Plex.get_user_avatar_by_username(info[2]),
-                        "medals": medal_map.get(info[1], []),
-                        "is_premium": bool(info[4])
-                        if len(info) > 4 and info[4] is not None
-                        else False,
-                        "is_self": info[1] == user.id,  # tg_id 比较
-                    }
-                    for info in plex_watch_time_data
-                    if info[3] > 0
-                ]
+            watched_time_rank_plex = await run_db(
+                _build_plex_watched_time_rankings, db, user.id
+            )
         except Exception as e:
             logger.error(f"获取Plex播放时长排行失败: {str(e)}")
 
@@ -151,51 +264,27 @@ async def get_plex_watched_time_rankings(
     except Exception as e:
         logger.error(f"获取Plex观看时长排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取Plex观看时长排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/watched-time/emby")
 @require_telegram_auth
 async def get_emby_watched_time_rankings(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取Emby观看时长排行榜数据"""
     logger.info(
         f"{user.username or user.first_name or user.id} 开始获取Emby观看时长排行榜数据"
     )
 
-    db = DB()
     try:
         watched_time_rank_emby = []
-        emby = Emby()
         try:
             logger.debug("正在查询Emby播放时长排行")
-            emby_watch_time_data = db.get_emby_watched_time_rank()
-            if emby_watch_time_data:
-                medal_map = _get_medal_map(
-                    db,
-                    [info[4] for info in emby_watch_time_data if len(info) > 4],
-                )
-                watched_time_rank_emby = [
-                    {
-                        "name": info[1],
-                        "watched_time": info[2],
-                        "avatar": emby.get_user_avatar_by_username(
-                            info[1], from_emby=False
-                        ),
-                        "medals": medal_map.get(info[4], []),
-                        "is_premium": bool(info[3])
-                        if len(info) > 3 and info[3] is not None
-                        else False,
-                        "is_self": info[4] == user.id
-                        if len(info) > 4
-                        else False,  # tg_id 比较
-                    }
-                    for info in emby_watch_time_data
-                    if info[2] > 0
-                ]
+            watched_time_rank_emby = await run_db(
+                _build_emby_watched_time_rankings, db, user.id
+            )
         except Exception as e:
             logger.error(f"获取Emby播放时长排行失败: {str(e)}")
 
@@ -206,9 +295,6 @@ async def get_emby_watched_time_rankings(
     except Exception as e:
         logger.error(f"获取Emby观看时长排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取Emby观看时长排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/traffic/plex")
@@ -218,6 +304,7 @@ async def get_plex_traffic_rankings(
     user: TelegramUser = Depends(get_telegram_user),
     start_date: str = Query(None, description="开始日期，格式: YYYY-MM-DD"),
     end_date: str = Query(None, description="结束日期，格式: YYYY-MM-DD"),
+    db: DB = Depends(get_db),
 ):
     """获取 Plex 流量排行榜数据
 
@@ -229,61 +316,21 @@ async def get_plex_traffic_rankings(
         f"{user.username or user.first_name or user.id} 开始获取 Plex 流量排行榜数据 (日期范围: {start_date} - {end_date})"
     )
 
-    db = DB()
+    parsed_start_date, parsed_end_date = _parse_date_range(start_date, end_date)
     try:
-        # 解析日期参数
-        parsed_start_date = None
-        parsed_end_date = None
-
-        if start_date:
-            try:
-                parsed_start_date = datetime.strptime(start_date, "%Y-%m-%d")
-                parsed_start_date = parsed_start_date.replace(tzinfo=settings.TZ)
-            except ValueError:
-                raise HTTPException(
-                    status_code=400, detail="开始日期格式错误，应为 YYYY-MM-DD"
-                )
-
-        if end_date:
-            try:
-                parsed_end_date = datetime.strptime(end_date, "%Y-%m-%d")
-                parsed_end_date = parsed_end_date.replace(
-                    hour=23, minute=59, second=59, tzinfo=settings.TZ
-                )
-            except ValueError:
-                raise HTTPException(
-                    status_code=400, detail="结束日期格式错误，应为 YYYY-MM-DD"
-                )
-
         traffic_rank_plex = []
         try:
             logger.debug(
                 f"正在查询 Plex 流量排行 (日期范围: {parsed_start_date} - {parsed_end_date})"
             )
-            plex_traffic_data = db.get_plex_traffic_rank(
-                parsed_start_date, parsed_end_date
+            traffic_rank_plex = await run_db(
+                _build_traffic_rankings,
+                db,
+                user.id,
+                "plex",
+                parsed_start_date,
+                parsed_end_date,
             )
-            if plex_traffic_data:
-                medal_map = _get_medal_map(
-                    db,
-                    [info[4] for info in plex_traffic_data if info[4]],
-                )
-                traffic_rank_plex = [
-                    {
-                        "name": info[0],  # username
-                        "traffic": info[2],  # total_traffic
-                        "avatar": Plex.get_user_avatar_by_username(info[0]),
-                        "medals": medal_map.get(info[4], []),
-                        "is_premium": bool(info[3])
-                        if info[3] is not None
-                        else False,  # is_premium
-                        "is_self": info[4] == user.id
-                        if info[4]
-                        else False,  # tg_id 比较
-                    }
-                    for info in plex_traffic_data
-                    if info[2] > 0  # 流量大于0
-                ]
         except Exception as e:
             logger.error(f"获取 Plex 流量排行失败: {str(e)}")
 
@@ -294,9 +341,6 @@ async def get_plex_traffic_rankings(
     except Exception as e:
         logger.error(f"获取 Plex 流量排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取 Plex 流量排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
 
 
 @router.get("/rankings/traffic/emby")
@@ -306,6 +350,7 @@ async def get_emby_traffic_rankings(
     user: TelegramUser = Depends(get_telegram_user),
     start_date: str = Query(None, description="开始日期，格式: YYYY-MM-DD"),
     end_date: str = Query(None, description="结束日期，格式: YYYY-MM-DD"),
+    db: DB = Depends(get_db),
 ):
     """获取 Emby 流量排行榜数据
 
@@ -317,64 +362,21 @@ async def get_emby_traffic_rankings(
         f"{user.username or user.first_name or user.id} 开始获取 Emby 流量排行榜数据 (日期范围: {start_date} - {end_date})"
     )
 
-    db = DB()
+    parsed_start_date, parsed_end_date = _parse_date_range(start_date, end_date)
     try:
-        # 解析日期参数
-        parsed_start_date = None
-        parsed_end_date = None
-
-        if start_date:
-            try:
-                parsed_start_date = datetime.strptime(start_date, "%Y-%m-%d")
-                parsed_start_date = parsed_start_date.replace(tzinfo=settings.TZ)
-            except ValueError:
-                raise HTTPException(
-                    status_code=400, detail="开始日期格式错误，应为 YYYY-MM-DD"
-                )
-
-        if end_date:
-            try:
-                parsed_end_date = datetime.strptime(end_date, "%Y-%m-%d")
-                parsed_end_date = parsed_end_date.replace(
-                    hour=23, minute=59, second=59, tzinfo=settings.TZ
-                )
-            except ValueError:
-                raise HTTPException(
-                    status_code=400, detail="结束日期格式错误，应为 YYYY-MM-DD"
-                )
-
         traffic_rank_emby = []
-        emby = Emby()
         try:
             logger.debug(
                 f"正在查询 Emby 流量排行 (日期范围: {parsed_start_date} - {parsed_end_date})"
             )
-            emby_traffic_data = db.get_emby_traffic_rank(
-                parsed_start_date, parsed_end_date
+            traffic_rank_emby = await run_db(
+                _build_traffic_rankings,
+                db,
+                user.id,
+                "emby",
+                parsed_start_date,
+                parsed_end_date,
             )
-            if emby_traffic_data:
-                medal_map = _get_medal_map(
-                    db,
-                    [info[4] for info in emby_traffic_data if info[4]],
-                )
-                traffic_rank_emby = [
-                    {
-                        "name": info[0],  # username
-                        "traffic": info[2],  # total_traffic
-                        "avatar": emby.get_user_avatar_by_username(
-                            info[0], from_emby=False
-                        ),
-                        "medals": medal_map.get(info[4], []),
-                        "is_premium": bool(info[3])
-                        if info[3] is not None
-                        else False,  # is_premium
-                        "is_self": info[4] == user.id
-                        if info[4]
-                        else False,  # tg_id 比较
-                    }
-                    for info in emby_traffic_data
-                    if info[2] > 0  # 流量大于0
-                ]
         except Exception as e:
             logger.error(f"获取 Emby 流量排行失败: {str(e)}")
 
@@ -385,6 +387,3 @@ async def get_emby_traffic_rankings(
     except Exception as e:
         logger.error(f"获取 Emby 流量排行榜数据时发生未预期的错误: {str(e)}")
         raise HTTPException(status_code=500, detail="获取 Emby 流量排行榜数据失败")
-    finally:
-        db.close()
-        logger.debug("数据库连接已关闭")
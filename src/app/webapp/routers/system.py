@@ -3,6 +3,7 @@ from datetime import datetime
 
 from app.config import settings
 from app.db import DB
+from app.executors import run_db
 from app.log import uvicorn_logger as logger
 from app.redis_client import Redis
 from app.utils.utils import get_user_name_from_tg_id
@@ -15,22 +16,35 @@ from pydantic import BaseModel
 router = APIRouter(prefix="/api/system", tags=["system"])
 
 
-@router.get("/health")
-async def health_check():
-    """健康检查端点 - 用于负载均衡和监控"""
-    start_time = time.time()
-    
-    # 检查数据库连接
-    db_healthy = False
-    db_info = None
+def _check_database():
+    """检查数据库连接，返回 (是否健康, 数据库信息)，同步，在数据库线程池中运行"""
     try:
         db = DB()
         db_healthy = db.health_check()
         db_info = db.get_db_info()
         db.close()
+        return db_healthy, db_info
     except Exception as e:
         logger.error(f"健康检查 - 数据库检查失败: {e}")
-        db_info = {"error": str(e)}
+        return False, {"error": str(e)}
+
+
+def _database_ready() -> bool:
+    """快速检查数据库是否可用，同步，在数据库线程池中运行"""
+    db = DB()
+    try:
+        return db.health_check()
+    finally:
+        db.close()
+
+
+@router.get("/health")
+async def health_check():
+    """健康检查端点 - 用于负载均衡和监控"""
+    start_time = time.time()
+    
+    # 检查数据库连接
+    db_healthy, db_info = await run_db(_check_database)
     
     # 检查Redis连接
     redis_healthy = False
@@ -90,9 +104,7 @@ async def readiness_check():
     """就绪检查端点 - Kubernetes readiness probe"""
     try:
         # 快速检查关键服务
-        db = DB()
-        db_ok = db.health_check()
-        db.close()
+        db_ok = await run_db(_database_ready)
         
         redis_client = Redis()
         redis_ok = redis_client.health_check()
@@ -108,14 +120,8 @@ async def readiness_check():
         raise HTTPException(status_code=503, detail=str(e))
 
 
-@router.get("/stats")
-@require_telegram_auth
-async def get_system_stats(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取系统统计信息（不需要管理员权限）"""
-    logger.info(f"{user.username or user.first_name or user.id} 获取系统统计信息")
-
+def _get_system_stats():
+    """获取系统统计信息，同步，在数据库线程池中运行"""
     db = DB()
     try:
         # 获取所有Plex用户数量
@@ -157,6 +163,16 @@ async def get_system_stats(
         logger.debug("数据库连接已关闭")
 
 
+@router.get("/stats")
+@require_telegram_auth
+async def get_system_stats(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
+):
+    """获取系统统计信息（不需要管理员权限）"""
+    logger.info(f"{user.username or user.first_name or user.id} 获取系统统计信息")
+    return await run_db(_get_system_stats)
+
+
 @router.get("/status")
 async def get_system_status():
     """获取系统状态信息（公开接口，不需要登录）"""
@@ -184,14 +200,8 @@ async def get_system_status():
         raise HTTPException(status_code=500, detail="获取系统状态信息失败")
 
 
-@router.get("/traffic-overview")
-@require_telegram_auth
-async def get_traffic_overview(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取流量统计概览数据（不需要管理员权限）"""
-    logger.info(f"{user.username or user.first_name or user.id} 获取流量统计概览")
-
+def _get_traffic_overview():
+    """获取流量统计概览数据，同步，在数据库线程池中运行"""
     db = DB()
     try:
         traffic_stats = db.get_traffic_statistics()
@@ -210,20 +220,18 @@ async def get_traffic_overview(
         logger.debug("数据库连接已关闭")
 
 
-@router.get("/all-lines-traffic-stats")
+@router.get("/traffic-overview")
 @require_telegram_auth
-async def get_all_lines_traffic_stats(
+async def get_traffic_overview(
     request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取所有线路（普通+高级）的流量统计信息（需要管理员权限）"""
-    # 检查管理员权限
-    if user.id not in settings.TG_ADMIN_CHAT_ID:
-        raise HTTPException(status_code=403, detail="权限不足，需要管理员权限")
+    """获取流量统计概览数据（不需要管理员权限）"""
+    logger.info(f"{user.username or user.first_name or user.id} 获取流量统计概览")
+    return await run_db(_get_traffic_overview)
 
-    logger.info(
-        f"{user.username or user.first_name or user.id} 获取所有线路流量统计信息"
-    )
 
+def _get_all_lines_traffic_stats():
+    """获取所有线路的流量统计信息，同步，在数据库线程池中运行"""
     db = DB()
     try:
         stats = db.get_all_lines_traffic_statistics()
@@ -236,18 +244,24 @@ async def get_all_lines_traffic_stats(
         db.close()
 
 
-@router.get("/line-switch-history")
+@router.get("/all-lines-traffic-stats")
 @require_telegram_auth
-async def get_line_switch_history(
-    request: Request,
-    user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 10,
+async def get_all_lines_traffic_stats(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取线路切换历史记录"""
+    """获取所有线路（普通+高级）的流量统计信息（需要管理员权限）"""
+    # 检查管理员权限
+    if user.id not in settings.TG_ADMIN_CHAT_ID:
+        raise HTTPException(status_code=403, detail="权限不足，需要管理员权限")
+
     logger.info(
-        f"{user.username or user.first_name or user.id} 获取线路切换历史记录"
+        f"{user.username or user.first_name or user.id} 获取所有线路流量统计信息"
     )
+    return await run_db(_get_all_lines_traffic_stats)
+
 
+def _get_line_switch_history(user: TelegramUser, limit: int):
+    """获取线路切换历史记录，同步，在数据库线程池中运行"""
     db = DB()
     try:
         # 普通用户只能查看自己的历史
@@ -265,6 +279,20 @@ async def get_line_switch_history(
         db.close()
 
 
+@router.get("/line-switch-history")
+@require_telegram_auth
+async def get_line_switch_history(
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = 10,
+):
+    """获取线路切换历史记录"""
+    logger.info(
+        f"{user.username or user.first_name or user.id} 获取线路切换历史记录"
+    )
+    return await run_db(_get_line_switch_history, user, limit)
+
+
 # 请求模型
 class PrivilegedUserRequest(BaseModel):
     tg_id: int
@@ -286,7 +314,7 @@ async def get_privileged_users(
         # 获取特权用户列表，并获取用户名
         privileged_users = []
         for tg_id in settings.TG_PRIVILEGED_USERS:
-            username = await get_user_name_from_tg_id(tg_id)
+            username = get_user_name_from_tg_id(tg_id)
             privileged_users.append({"tg_id": tg_id, "username": username})
 
         return {
@@ -331,7 +359,7 @@ async def add_privileged_user(
         }
         settings.save_config_to_env_file(config_data)
 
-        username = await get_user_name_from_tg_id(data.tg_id)
+        username = get_user_name_from_tg_id(data.tg_id)
         logger.info(f"成功添加特权用户: {username} (ID: {data.tg_id})")
 
         return {
@@ -377,7 +405,7 @@ async def remove_privileged_user(
         }
         settings.save_config_to_env_file(config_data)
 
-        username = await get_user_name_from_tg_id(tg_id)
+        username = get_user_name_from_tg_id(tg_id)
         logger.info(f"成功删除特权用户: {username} (ID: {tg_id})")
 
         return {
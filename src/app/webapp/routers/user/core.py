@@ -10,6 +10,8 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.executors import run_blocking, run_db
+from app.leaderboard import CREDITS, member_rank
 from app.log import uvicorn_logger as logger
 from app.plex import Plex
 from app.tautulli import Tautulli
@@ -18,58 +20,63 @@ from app.utils.utils import (
     get_user_total_duration,
 )
 from app.webapp.auth import get_telegram_user
+from app.webapp.dependencies import get_db
 from app.webapp.middlewares import require_telegram_auth
 from app.webapp.schemas import TelegramUser, UserInfo
 
 router = APIRouter()
 
 
+def _build_dashboard(db: DB, user_id: int) -> dict:
+    """构建仪表盘数据（同步，在数据库线程池中运行）"""
+    # 获取用户积分
+    credits = 0
+    success, user_credits = db.get_user_credits(user_id)
+    if success:
+        credits = user_credits
+
+    # 用户积分排名
+    rank = member_rank(db, CREDITS, user_id)
+    ranking = rank[0] if rank else 0
+
+    # 获取观看时长（Plex + Emby 总和，单位：分钟）
+    watch_time = 0
+
+    # Plex 观看时长
+    plex_info = db.get_plex_info_by_tg_id(user_id)
+    if plex_info and plex_info[7]:  # watched_time 字段
+        watch_time += int(plex_info[7] * 60)  # 小时转分钟
+
+    # Emby 观看时长
+    emby_info = db.get_emby_info_by_tg_id(user_id)
+    if emby_info and emby_info[5]:  # emby_watched_time 字段
+        watch_time += int(emby_info[5] * 60)  # 小时转分钟
+
+    return {
+        "credits": round(credits, 2),
+        "watchTime": watch_time,
+        "ranking": ranking if ranking > 0 else None,
+    }
+
+
 @router.get("/dashboard")
 @require_telegram_auth
 async def get_dashboard(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    db: DB = Depends(get_db),
 ):
     """获取用户仪表盘数据（积分、观看时长、排名）"""
     user_id = user.id
-    db = DB()
 
     try:
-        # 获取用户积分
-        credits = 0
-        success, user_credits = db.get_user_credits(user_id)
-        if success:
-            credits = user_credits
-
-        # 计算用户积分排名
-        ranking = 0
-        credits_rank = db.get_credits_rank()
-        for idx, (tg_id, _) in enumerate(credits_rank, 1):
-            if tg_id == user_id:
-                ranking = idx
-                break
-
-        # 获取观看时长（Plex + Emby 总和，单位：分钟）
-        watch_time = 0
-
-        # Plex 观看时长
-        plex_info = db.get_plex_info_by_tg_id(user_id)
-        if plex_info and plex_info[7]:  # watched_time 字段
-            watch_time += int(plex_info[7] * 60)  # 小时转分钟
-
-        # Emby 观看时长
-        emby_info = db.get_emby_info_by_tg_id(user_id)
-        if emby_info and emby_info[5]:  # emby_watched_time 字段
-            watch_time += int(emby_info[5] * 60)  # 小时转分钟
+        data = await run_db(_build_dashboard, db, user_id)
 
         logger.info(f"用户 {user.username or user.first_name or user_id} 获取仪表盘数据成功")
 
         return {
             "success": True,
-            "data": {
-                "credits": round(credits, 2),
-                "watchTime": watch_time,
-                "ranking": ranking if ranking > 0 else None,
-            }
+            "data": data,
         }
     except Exception as e:
         logger.error(f"获取用户仪表盘数据失败: {e}")
@@ -82,16 +89,10 @@ async def get_dashboard(
                 "ranking": None,
             }
         }
-    finally:
-        db.close()
 
 
-@router.get("/info")
-@require_telegram_auth
-async def get_user_info(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取用户信息"""
+def _get_user_info(user: TelegramUser):
+    """获取用户信息（同步，在媒体服务线程池中运行）"""
     user_id = user.id
     user_name = user.username or user.first_name
     logger.info(f"开始获取用户 {user_name or user_id} 的详细信息")
@@ -233,14 +234,17 @@ async def get_user_info(
         logger.debug("数据库连接已关闭")
 
 
-@router.get("/recent-activities")
+@router.get("/info")
 @require_telegram_auth
-async def get_recent_activities(
-    request: Request,
-    user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 10,
+async def get_user_info(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取用户当天的活动记录（包含转盘、21点、竞拍等）"""
+    """获取用户信息"""
+    return await run_blocking(_get_user_info, user)
+
+
+def _get_recent_activities(user: TelegramUser, limit: int):
+    """获取用户当天的活动记录（包含转盘、21点、竞拍等），同步，在媒体服务线程池中运行"""
     user_id = user.id
     db = DB()
 
@@ -408,14 +412,19 @@ async def get_recent_activities(
         db.close()
 
 
-@router.get("/recent-games")
+@router.get("/recent-activities")
 @require_telegram_auth
-async def get_recent_games(
+async def get_recent_activities(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 2,
+    limit: int = 10,
 ):
-    """获取用户最近玩过的游戏类型（最多2个）"""
+    """获取用户当天的活动记录（包含转盘、21点、竞拍等）"""
+    return await run_blocking(_get_recent_activities, user, limit)
+
+
+def _get_recent_games(user: TelegramUser, limit: int):
+    """获取用户最近玩过的游戏类型（最多2个），同步，在数据库线程池中运行"""
     user_id = user.id
     db = DB()
 
@@ -498,12 +507,19 @@ async def get_recent_games(
         db.close()
 
 
-@router.get("/users")
+@router.get("/recent-games")
 @require_telegram_auth
-async def get_all_users(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
+async def get_recent_games(
+    request: Request,
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = 2,
 ):
-    """获取所有用户信息（用于用户选择）- 只返回有账号的用户"""
+    """获取用户最近玩过的游戏类型（最多2个）"""
+    return await run_db(_get_recent_games, user, limit)
+
+
+def _get_all_users():
+    """获取所有用户信息（用于用户选择）- 只返回有账号的用户（同步，在数据库线程池中运行）"""
     db = DB()
     try:
         users = []
@@ -538,3 +554,12 @@ async def get_all_users(
         return {"success": False, "users": [], "error": str(e)}
     finally:
         db.close()
+
+
+@router.get("/users")
+@require_telegram_auth
+async def get_all_users(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
+):
+    """获取所有用户信息（用于用户选择）- 只返回有账号的用户"""
+    return await run_db(_get_all_users)
@@ -5,13 +5,15 @@ from typing import Optional
 from app.cache import (
     emby_last_user_defined_line_cache,
     emby_user_defined_line_cache,
-    get_line_tags,
+    get_lines_tags,
     plex_last_user_defined_line_cache,
     plex_user_defined_line_cache,
 )
 from app.config import settings
 from app.db import DB
 from app.emby import Emby
+from app.executors import run_blocking, run_db
+from app.leaderboard import CREDITS, member_rank
 from app.log import uvicorn_logger as logger
 from app.plex import Plex
 from app.shared_proxy import (
@@ -112,12 +114,8 @@ def _append_route_sync_notice(message: str, sync_errors: list[str]) -> str:
     return f"{message}（{', '.join(sync_errors)} 路由缓存同步失败，请稍后重试）"
 
 
-@router.get("/dashboard")
-@require_telegram_auth
-async def get_dashboard(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取用户仪表盘数据（积分、观看时长、排名）"""
+def _get_dashboard(user: TelegramUser):
+    """获取用户仪表盘数据（积分、观看时长、排名），同步，在数据库线程池中运行"""
     user_id = user.id
     db = DB()
 
@@ -128,13 +126,9 @@ async def get_dashboard(
         if success:
             credits = user_credits
 
-        # 计算用户积分排名
-        ranking = 0
-        credits_rank = db.get_credits_rank()
-        for idx, (tg_id, _) in enumerate(credits_rank, 1):
-            if tg_id == user_id:
-                ranking = idx
-                break
+        # 用户积分排名
+        rank = member_rank(db, CREDITS, user_id)
+        ranking = rank[0] if rank else 0
 
         # 获取观看时长（Plex + Emby 总和，单位：分钟）
         watch_time = 0
@@ -174,12 +168,17 @@ async def get_dashboard(
         db.close()
 
 
-@router.get("/info")
+@router.get("/dashboard")
 @require_telegram_auth
-async def get_user_info(
+async def get_dashboard(
     request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取用户信息"""
+    """获取用户仪表盘数据（积分、观看时长、排名）"""
+    return await run_db(_get_dashboard, user)
+
+
+def _get_user_info(user: TelegramUser):
+    """获取用户信息（同步，在媒体服务线程池中运行）"""
     user_id = user.id
     user_name = user.username or user.first_name
     # 从数据库获取更多用户信息
@@ -383,13 +382,17 @@ async def get_user_info(
         logger.debug("数据库连接已关闭")
 
 
-@router.get("/shared-proxy", response_model=SharedProxyResponse)
+@router.get("/info")
 @require_telegram_auth
-async def get_shared_proxy(
-    request: Request,
-    telegram_user: TelegramUser = Depends(get_telegram_user),
+async def get_user_info(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取当前用户的共享反代配置。"""
+    """获取用户信息"""
+    return await run_blocking(_get_user_info, user)
+
+
+def _get_shared_proxy(telegram_user: TelegramUser):
+    """获取当前用户的共享反代配置（同步，在数据库线程池中运行）"""
     tg_id = telegram_user.id
     db = DB()
     try:
@@ -406,20 +409,23 @@ async def get_shared_proxy(
         db.close()
 
 
-@router.post("/shared-proxy", response_model=SharedProxyResponse)
+@router.get("/shared-proxy", response_model=SharedProxyResponse)
 @require_telegram_auth
-async def save_shared_proxy(
+async def get_shared_proxy(
     request: Request,
-    data: SharedProxyRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """保存共享反代域名并执行连通性校验。"""
-    tg_id = telegram_user.id
+    """获取当前用户的共享反代配置。"""
+    return await run_db(_get_shared_proxy, telegram_user)
+
+
+def _save_shared_proxy(
+    tg_id: int, host: str, port: int, verified: bool, error_message: Optional[str]
+):
+    """根据校验结果保存共享反代配置（同步，在数据库线程池中运行）"""
     db = DB()
     try:
         current_profile = build_shared_proxy_profile(db.get_shared_proxy_profile(tg_id))
-        host, port = normalize_shared_proxy_domain(data.domain)
-        verified, error_message = await verify_shared_proxy_target(host, port)
         if not verified:
             return SharedProxyResponse(
                 success=False,
@@ -450,33 +456,43 @@ async def save_shared_proxy(
             message=_append_route_sync_notice("共享反代配置已保存", sync_errors),
             shared_proxy=profile,
         )
-    except SharedProxyValidationError as e:
-        return SharedProxyResponse(success=False, message=str(e))
-    except Exception as e:
-        logger.error(f"保存共享反代配置失败: {e}")
-        return SharedProxyResponse(success=False, message="保存共享反代配置失败")
     finally:
         db.close()
 
 
-@router.post("/shared-proxy/enable", response_model=SharedProxyResponse)
+@router.post("/shared-proxy", response_model=SharedProxyResponse)
 @require_telegram_auth
-async def enable_shared_proxy(
+async def save_shared_proxy(
     request: Request,
+    data: SharedProxyRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """启用共享反代线路。"""
+    """保存共享反代域名并执行连通性校验。"""
     tg_id = telegram_user.id
+    try:
+        host, port = normalize_shared_proxy_domain(data.domain)
+        verified, error_message = await verify_shared_proxy_target(host, port)
+        return await run_db(_save_shared_proxy, tg_id, host, port, verified, error_message)
+    except SharedProxyValidationError as e:
+        return SharedProxyResponse(success=False, message=str(e))
+    except Exception as e:
+        logger.error(f"保存共享反代配置失败: {e}")
+        return SharedProxyResponse(success=False, message="保存共享反代配置失败")
+
+
+def _get_shared_proxy_row(tg_id: int):
+    """读取共享反代配置（同步，在数据库线程池中运行）"""
     db = DB()
     try:
-        profile_row = db.get_shared_proxy_profile(tg_id)
-        if not profile_row:
-            return SharedProxyResponse(success=False, message="请先保存共享反代域名")
+        return db.get_shared_proxy_profile(tg_id)
+    finally:
+        db.close()
 
-        profile = build_shared_proxy_profile(profile_row)
-        verified, error_message = await verify_shared_proxy_target(
-            profile["domain"], profile["port"]
-        )
+
+def _enable_shared_proxy(tg_id: int, verified: bool, error_message: Optional[str]):
+    """根据校验结果启用共享反代线路（同步，在数据库线程池中运行）"""
+    db = DB()
+    try:
         if not verified:
             db.set_shared_proxy_enabled(
                 tg_id,
@@ -506,20 +522,35 @@ async def enable_shared_proxy(
             message=_append_route_sync_notice("共享反代已启用", sync_errors),
             shared_proxy=build_shared_proxy_profile(db.get_shared_proxy_profile(tg_id)),
         )
-    except Exception as e:
-        logger.error(f"启用共享反代失败: {e}")
-        return SharedProxyResponse(success=False, message="启用共享反代失败")
     finally:
         db.close()
 
 
-@router.post("/shared-proxy/disable", response_model=SharedProxyResponse)
+@router.post("/shared-proxy/enable", response_model=SharedProxyResponse)
 @require_telegram_auth
-async def disable_shared_proxy(
+async def enable_shared_proxy(
     request: Request,
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """停用共享反代线路，恢复用户原有 Plex / Emby 线路选择。"""
+    """启用共享反代线路。"""
+    tg_id = telegram_user.id
+    try:
+        profile_row = await run_db(_get_shared_proxy_row, tg_id)
+        if not profile_row:
+            return SharedProxyResponse(success=False, message="请先保存共享反代域名")
+
+        profile = build_shared_proxy_profile(profile_row)
+        verified, error_message = await verify_shared_proxy_target(
+            profile["domain"], profile["port"]
+        )
+        return await run_db(_enable_shared_proxy, tg_id, verified, error_message)
+    except Exception as e:
+        logger.error(f"启用共享反代失败: {e}")
+        return SharedProxyResponse(success=False, message="启用共享反代失败")
+
+
+def _disable_shared_proxy(telegram_user: TelegramUser):
+    """停用共享反代线路，恢复用户原有 Plex / Emby 线路选择（同步，在数据库线程池中运行）"""
     tg_id = telegram_user.id
     db = DB()
     try:
@@ -543,14 +574,18 @@ async def disable_shared_proxy(
         db.close()
 
 
-@router.get("/recent-activities")
+@router.post("/shared-proxy/disable", response_model=SharedProxyResponse)
 @require_telegram_auth
-async def get_recent_activities(
+async def disable_shared_proxy(
     request: Request,
-    user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 10,
+    telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取用户当天的活动记录（包含转盘、21点、竞拍等）"""
+    """停用共享反代线路，恢复用户原有 Plex / Emby 线路选择。"""
+    return await run_db(_disable_shared_proxy, telegram_user)
+
+
+def _get_recent_activities(user: TelegramUser, limit: int):
+    """获取用户当天的活动记录（包含转盘、21点、竞拍等），同步，在媒体服务线程池中运行"""
     from datetime import datetime
 
     user_id = user.id
@@ -740,14 +775,19 @@ async def get_recent_activities(
         db.close()
 
 
-@router.get("/recent-games")
+@router.get("/recent-activities")
 @require_telegram_auth
-async def get_recent_games(
+async def get_recent_activities(
     request: Request,
     user: TelegramUser = Depends(get_telegram_user),
-    limit: int = 2,
+    limit: int = 10,
 ):
-    """获取用户最近玩过的游戏类型（最多2个）"""
+    """获取用户当天的活动记录（包含转盘、21点、竞拍等）"""
+    return await run_blocking(_get_recent_activities, user, limit)
+
+
+def _get_recent_games(user: TelegramUser, limit: int):
+    """获取用户最近玩过的游戏类型（最多2个），同步，在数据库线程池中运行"""
     from datetime import datetime
 
     user_id = user.id
@@ -837,14 +877,19 @@ async def get_recent_games(
         db.close()
 
 
-@router.post("/bind/plex", response_model=BaseResponse)
+@router.get("/recent-games")
 @require_telegram_auth
-async def bind_plex_account(
+async def get_recent_games(
     request: Request,
-    data: BindPlexRequest = Body(...),
-    telegram_user: TelegramUser = Depends(get_telegram_user),
+    user: TelegramUser = Depends(get_telegram_user),
+    limit: int = 2,
 ):
-    """绑定Plex账户"""
+    """获取用户最近玩过的游戏类型（最多2个）"""
+    return await run_db(_get_recent_games, user, limit)
+
+
+def _bind_plex_account(data: BindPlexRequest, telegram_user: TelegramUser):
+    """绑定Plex账户（同步，在媒体服务线程池中运行）"""
     tg_id = telegram_user.id
     email = data.email
 
@@ -965,14 +1010,19 @@ async def bind_plex_account(
         logger.debug("数据库连接已关闭")
 
 
-@router.post("/bind/emby", response_model=BaseResponse)
+@router.post("/bind/plex", response_model=BaseResponse)
 @require_telegram_auth
-async def bind_emby_account(
+async def bind_plex_account(
     request: Request,
-    data: BindEmbyRequest = Body(...),
+    data: BindPlexRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """绑定Emby账户"""
+    """绑定Plex账户"""
+    return await run_blocking(_bind_plex_account, data, telegram_user)
+
+
+def _bind_emby_account(data: BindEmbyRequest, telegram_user: TelegramUser):
+    """绑定Emby账户（同步，在媒体服务线程池中运行）"""
     tg_id = telegram_user.id
     emby_username = data.username
 
@@ -1048,13 +1098,19 @@ async def bind_emby_account(
         logger.debug("数据库连接已关闭")
 
 
-@router.get("/emby_lines", response_model=EmbyLinesResponse)
+@router.post("/bind/emby", response_model=BaseResponse)
 @require_telegram_auth
-async def get_emby_lines(
+async def bind_emby_account(
     request: Request,
+    data: BindEmbyRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取可用的Emby线路列表"""
+    """绑定Emby账户"""
+    return await run_blocking(_bind_emby_account, data, telegram_user)
+
+
+def _get_emby_lines(telegram_user: TelegramUser):
+    """获取可用的Emby线路列表（同步，在数据库线程池中运行）"""
     db = DB()
     # 获取 emby 用户信息，确认是否是 premium 用户
     emby_info = db.get_emby_info_by_tg_id(telegram_user.id)
@@ -1070,18 +1126,23 @@ async def get_emby_lines(
     # 基础线路
     available_lines = settings.STREAM_BACKEND.copy()
     line_infos = []
+    line_tags = get_lines_tags([*available_lines, *settings.PREMIUM_STREAM_BACKEND])
 
     # 添加基础线路信息
     for line in available_lines:
         line_infos.append(
-            EmbyLineInfo(name=line, tags=get_line_tags(line), is_premium=False)
+            EmbyLineInfo(
+                name=line, tags=line_tags.get(line, []), is_premium=False
+            )
         )
 
     # 如果是premium用户，直接添加所有高级线路
     if is_premium:
         for line in settings.PREMIUM_STREAM_BACKEND:
             line_infos.append(
-                EmbyLineInfo(name=line, tags=get_line_tags(line), is_premium=True)
+                EmbyLineInfo(
+                    name=line, tags=line_tags.get(line, []), is_premium=True
+                )
             )
     # 如果不是premium用户，检查免费高级线路
     elif settings.PREMIUM_FREE:
@@ -1090,11 +1151,14 @@ async def get_emby_lines(
 
         free_premium_lines = free_premium_lines_cache.get("free_lines")
         free_premium_lines = free_premium_lines.split(",") if free_premium_lines else []
+        line_tags.update(
+            get_lines_tags(line for line in free_premium_lines if line not in line_tags)
+        )
 
         for line in free_premium_lines:
             line_infos.append(
                 EmbyLineInfo(
-                    name=line, tags=get_line_tags(line) + ["PREMIUM"], is_premium=True
+                    name=line, tags=line_tags.get(line, []) + ["PREMIUM"], is_premium=True
                 )
             )
 
@@ -1103,14 +1167,18 @@ async def get_emby_lines(
     )
 
 
-@router.post("/bind/emby_line", response_model=BaseResponse)
+@router.get("/emby_lines", response_model=EmbyLinesResponse)
 @require_telegram_auth
-async def bind_emby_line(
+async def get_emby_lines(
     request: Request,
-    data: EmbyLineRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """绑定Emby线路"""
+    """获取可用的Emby线路列表"""
+    return await run_db(_get_emby_lines, telegram_user)
+
+
+def _bind_emby_line(data: EmbyLineRequest, telegram_user: TelegramUser):
+    """绑定Emby线路（同步，在数据库线程池中运行）"""
     tg_id = telegram_user.id
     line = data.line
 
@@ -1193,13 +1261,19 @@ async def bind_emby_line(
         logger.debug("数据库连接已关闭")
 
 
-@router.post("/unbind/emby_line", response_model=BaseResponse)
+@router.post("/bind/emby_line", response_model=BaseResponse)
 @require_telegram_auth
-async def unbind_emby_line(
+async def bind_emby_line(
     request: Request,
+    data: EmbyLineRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """解绑Emby线路（恢复自动选择）"""
+    """绑定Emby线路"""
+    return await run_db(_bind_emby_line, data, telegram_user)
+
+
+def _unbind_emby_line(telegram_user: TelegramUser):
+    """解绑Emby线路（恢复自动选择），同步，在数据库线程池中运行"""
     tg_id = telegram_user.id
 
     logger.info(f"用户 {get_user_name_from_tg_id(tg_id)} 尝试解绑 Emby 线路")
@@ -1245,15 +1319,18 @@ async def unbind_emby_line(
         logger.debug("数据库连接已关闭")
 
 
-@router.get("/nsfw-info")
+@router.post("/unbind/emby_line", response_model=BaseResponse)
 @require_telegram_auth
-async def get_nsfw_info(
+async def unbind_emby_line(
     request: Request,
-    service: str,
-    operation: str,
-    user: TelegramUser = Depends(get_telegram_user),
+    telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取NSFW操作所需积分或可退回积分"""
+    """解绑Emby线路（恢复自动选择）"""
+    return await run_db(_unbind_emby_line, telegram_user)
+
+
+def _get_nsfw_info(service: str, operation: str, user: TelegramUser):
+    """获取NSFW操作所需积分或可退回积分（同步，在数据库线程池中运行）"""
     tg_id = user.id
 
     if service not in ["plex", "emby"]:
@@ -1290,15 +1367,20 @@ async def get_nsfw_info(
         _db.close()
 
 
-@router.post("/nsfw/{operation}")
+@router.get("/nsfw-info")
 @require_telegram_auth
-async def nsfw_operation(
+async def get_nsfw_info(
     request: Request,
+    service: str,
     operation: str,
-    data: dict = Body(...),
     user: TelegramUser = Depends(get_telegram_user),
 ):
-    """执行NSFW权限操作"""
+    """获取NSFW操作所需积分或可退回积分"""
+    return await run_db(_get_nsfw_info, service, operation, user)
+
+
+def _nsfw_operation(operation: str, data: dict, user: TelegramUser):
+    """执行NSFW权限操作（同步，在媒体服务线程池中运行）"""
     if operation not in ["unlock", "lock"]:
         raise HTTPException(status_code=400, detail="不支持的操作类型")
 
@@ -1484,13 +1566,20 @@ async def nsfw_operation(
         _db.close()
 
 
-@router.get("/plex_lines", response_model=PlexLinesResponse)
+@router.post("/nsfw/{operation}")
 @require_telegram_auth
-async def get_plex_lines(
+async def nsfw_operation(
     request: Request,
-    telegram_user: TelegramUser = Depends(get_telegram_user),
+    operation: str,
+    data: dict = Body(...),
+    user: TelegramUser = Depends(get_telegram_user),
 ):
-    """获取可用的Plex线路列表"""
+    """执行NSFW权限操作"""
+    return await run_blocking(_nsfw_operation, operation, data, user)
+
+
+def _get_plex_lines(telegram_user: TelegramUser):
+    """获取可用的Plex线路列表（同步，在数据库线程池中运行）"""
     db = DB()
     try:
         # 获取 plex 用户信息，确认是否绑定
@@ -1510,11 +1599,14 @@ async def get_plex_lines(
         available_lines = settings.STREAM_BACKEND.copy()
         premium_lines = settings.PREMIUM_STREAM_BACKEND.copy()
         line_infos = []
+        line_tags = get_lines_tags([*available_lines, *settings.PREMIUM_STREAM_BACKEND])
 
         # 添加基础线路信息
         for line in available_lines:
             line_infos.append(
-                PlexLineInfo(name=line, tags=get_line_tags(line), is_premium=False)
+                PlexLineInfo(
+                    name=line, tags=line_tags.get(line, []), is_premium=False
+                )
             )
 
         # 根据用户权限添加高级线路信息
@@ -1522,7 +1614,9 @@ async def get_plex_lines(
             # 高级用户可以看到所有高级线路
             for line in premium_lines:
                 line_infos.append(
-                    PlexLineInfo(name=line, tags=get_line_tags(line), is_premium=True)
+                    PlexLineInfo(
+                        name=line, tags=line_tags.get(line, []), is_premium=True
+                    )
                 )
         elif settings.PREMIUM_FREE:
             # 普通用户在免费开放期间可以看到免费的高级线路
@@ -1537,7 +1631,7 @@ async def get_plex_lines(
                 if line in premium_lines:
                     line_infos.append(
                         PlexLineInfo(
-                            name=line, tags=get_line_tags(line), is_premium=True
+                            name=line, tags=line_tags.get(line, []), is_premium=True
                         )
                     )
 
@@ -1548,14 +1642,18 @@ async def get_plex_lines(
         db.close()
 
 
-@router.post("/bind/plex_line", response_model=BaseResponse)
+@router.get("/plex_lines", response_model=PlexLinesResponse)
 @require_telegram_auth
-async def bind_plex_line(
+async def get_plex_lines(
     request: Request,
-    data: PlexLineRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """绑定Plex线路"""
+    """获取可用的Plex线路列表"""
+    return await run_db(_get_plex_lines, telegram_user)
+
+
+def _bind_plex_line(data: PlexLineRequest, telegram_user: TelegramUser):
+    """绑定Plex线路（同步，在数据库线程池中运行）"""
     tg_id = telegram_user.id
     line = data.line
 
@@ -1652,13 +1750,19 @@ async def bind_plex_line(
         logger.debug("数据库连接已关闭")
 
 
-@router.post("/unbind/plex_line", response_model=BaseResponse)
+@router.post("/bind/plex_line", response_model=BaseResponse)
 @require_telegram_auth
-async def unbind_plex_line(
+async def bind_plex_line(
     request: Request,
+    data: PlexLineRequest = Body(...),
     telegram_user: TelegramUser = Depends(get_telegram_user),
 ):
-    """解绑Plex线路（恢复自动选择）"""
+    """绑定Plex线路"""
+    return await run_db(_bind_plex_line, data, telegram_user)
+
+
+def _unbind_plex_line(telegram_user: TelegramUser):
+    """解绑Plex线路（恢复自动选择），同步，在数据库线程池中运行"""
     tg_id = telegram_user.id
 
     logger.info(f"用户 {get_user_name_from_tg_id(tg_id)} 尝试解绑 Plex 线路")
@@ -1704,6 +1808,16 @@ async def unbind_plex_line(
         logger.debug("数据库连接已关闭")
 
 
+@router.post("/unbind/plex_line", response_model=BaseResponse)
+@require_telegram_auth
+async def unbind_plex_line(
+    request: Request,
+    telegram_user: TelegramUser = Depends(get_telegram_user),
+):
+    """解绑Plex线路（恢复自动选择）"""
+    return await run_db(_unbind_plex_line, telegram_user)
+
+
 # ==================== 通用线路管理API ====================
 
 
@@ -1787,25 +1901,40 @@ async def auth_bind_line(
         f"用户 {get_user_name_from_tg_id(tg_id)} 尝试认证并绑定 {service} 线路 {line}"
     )
 
+    try:
+        return await run_blocking(
+            _auth_bind_line, service, tg_id, telegram_user, username, line, password, token
+        )
+    except Exception as e:
+        logger.error(f"认证绑定{service}线路时发生错误: {str(e)}")
+        return BaseResponse(success=False, message=f"认证绑定失败: {str(e)}")
+
+
+def _auth_bind_line(
+    service: str,
+    tg_id: int,
+    telegram_user: TelegramUser,
+    username: str,
+    line: str,
+    password: Optional[str],
+    token: Optional[str],
+) -> BaseResponse:
+    """认证并绑定线路（同步，在媒体服务线程池中运行）"""
     db = DB()
     try:
         if service == "emby":
-            return await _auth_bind_emby_line(
+            return _auth_bind_emby_line(
                 db, tg_id, telegram_user, username, password, line
             )
-        else:
-            return await _auth_bind_plex_line(
-                db, tg_id, telegram_user, username, line, token=token, password=password
-            )
-    except Exception as e:
-        logger.error(f"认证绑定{service}线路时发生错误: {str(e)}")
-        return BaseResponse(success=False, message=f"认证绑定失败: {str(e)}")
+        return _auth_bind_plex_line(
+            db, tg_id, telegram_user, username, line, token=token, password=password
+        )
     finally:
         db.close()
         logger.debug("数据库连接已关闭")
 
 
-async def _auth_bind_emby_line(
+def _auth_bind_emby_line(
     db: DB,
     tg_id: int,
     telegram_user: TelegramUser,
@@ -1878,7 +2007,7 @@ async def _auth_bind_emby_line(
     )
 
 
-async def _auth_bind_plex_line(
+def _auth_bind_plex_line(
     db: DB,
     tg_id: int,
     telegram_user: TelegramUser,
@@ -1957,13 +2086,8 @@ async def _auth_bind_plex_line(
     )
 
 
-@router.post("/lines/emby/available", response_model=EmbyLinesResponse)
-@require_telegram_auth
-async def get_emby_lines_by_user(
-    request: Request,
-    data: dict = Body(...),
-):
-    """基于用户名获取可用的Emby线路列表（无需认证，仅查询数据库中的用户信息）"""
+def _get_emby_lines_by_user(data: dict):
+    """基于用户名获取可用的Emby线路列表（无需认证，仅查询数据库中的用户信息），同步，在数据库线程池中运行"""
     username = data.get("username")
 
     if not username:
@@ -1984,18 +2108,23 @@ async def get_emby_lines_by_user(
         # 基础线路
         available_lines = settings.STREAM_BACKEND.copy()
         line_infos = []
+        line_tags = get_lines_tags([*available_lines, *settings.PREMIUM_STREAM_BACKEND])
 
         # 添加基础线路信息
         for line in available_lines:
             line_infos.append(
-                EmbyLineInfo(name=line, tags=get_line_tags(line), is_premium=False)
+                EmbyLineInfo(
+                    name=line, tags=line_tags.get(line, []), is_premium=False
+                )
             )
 
         # 如果是premium用户，直接添加所有高级线路
         if is_premium:
             for line in settings.PREMIUM_STREAM_BACKEND:
                 line_infos.append(
-                    EmbyLineInfo(name=line, tags=get_line_tags(line), is_premium=True)
+                    EmbyLineInfo(
+                        name=line, tags=line_tags.get(line, []), is_premium=True
+                    )
                 )
         # 如果不是premium用户，检查免费高级线路
         elif settings.PREMIUM_FREE:
@@ -2011,7 +2140,7 @@ async def get_emby_lines_by_user(
                 if line in settings.PREMIUM_STREAM_BACKEND:
                     line_infos.append(
                         EmbyLineInfo(
-                            name=line, tags=get_line_tags(line), is_premium=True
+                            name=line, tags=line_tags.get(line, []), is_premium=True
                         )
                     )
 
@@ -2029,13 +2158,18 @@ async def get_emby_lines_by_user(
         db.close()
 
 
-@router.post("/lines/plex/available", response_model=PlexLinesResponse)
+@router.post("/lines/emby/available", response_model=EmbyLinesResponse)
 @require_telegram_auth
-async def get_plex_lines_by_user(
+async def get_emby_lines_by_user(
     request: Request,
     data: dict = Body(...),
 ):
-    """基于邮箱获取可用的Plex线路列表（无需认证，仅查询数据库中的用户信息）"""
+    """基于用户名获取可用的Emby线路列表（无需认证，仅查询数据库中的用户信息）"""
+    return await run_db(_get_emby_lines_by_user, data)
+
+
+def _get_plex_lines_by_user(data: dict):
+    """基于邮箱获取可用的Plex线路列表（无需认证，仅查询数据库中的用户信息），同步，在数据库线程池中运行"""
     email = data.get("email")
 
     if not email:
@@ -2058,11 +2192,14 @@ async def get_plex_lines_by_user(
         available_lines = settings.STREAM_BACKEND.copy()
         premium_lines = settings.PREMIUM_STREAM_BACKEND.copy()
         line_infos = []
+        line_tags = get_lines_tags([*available_lines, *settings.PREMIUM_STREAM_BACKEND])
 
         # 添加基础线路信息
         for line in available_lines:
             line_infos.append(
-                PlexLineInfo(name=line, tags=get_line_tags(line), is_premium=False)
+                PlexLineInfo(
+                    name=line, tags=line_tags.get(line, []), is_premium=False
+                )
             )
 
         # 根据用户权限添加高级线路信息
@@ -2070,7 +2207,9 @@ async def get_plex_lines_by_user(
             # 高级用户可以看到所有高级线路
             for line in premium_lines:
                 line_infos.append(
-                    PlexLineInfo(name=line, tags=get_line_tags(line), is_premium=True)
+                    PlexLineInfo(
+                        name=line, tags=line_tags.get(line, []), is_premium=True
+                    )
                 )
         elif settings.PREMIUM_FREE:
             # 普通用户在免费开放期间可以看到免费的高级线路
@@ -2085,7 +2224,7 @@ async def get_plex_lines_by_user(
                 if line in premium_lines:
                     line_infos.append(
                         PlexLineInfo(
-                            name=line, tags=get_line_tags(line), is_premium=True
+                            name=line, tags=line_tags.get(line, []), is_premium=True
                         )
                     )
 
@@ -2103,6 +2242,98 @@ async def get_plex_lines_by_user(
         db.close()
 
 
+@router.post("/lines/plex/available", response_model=PlexLinesResponse)
+@require_telegram_auth
+async def get_plex_lines_by_user(
+    request: Request,
+    data: dict = Body(...),
+):
+    """基于邮箱获取可用的Plex线路列表（无需认证，仅查询数据库中的用户信息）"""
+    return await run_db(_get_plex_lines_by_user, data)
+
+
+def _transfer_credits(
+    sender_id: int, target_tg_id: int, amount: float, note: Optional[str]
+) -> tuple[CreditsTransferResponse, Optional[str]]:
+    """执行积分转移（同步，在数据库线程池中运行），成功时同时返回发送方名称用于通知"""
+    _db = DB()
+
+    try:
+        # 获取发送方当前积分
+        sender_stats = _db.get_stats_by_tg_id(sender_id)
+        if not sender_stats:
+            return CreditsTransferResponse(
+                success=False, message="您尚未绑定 Plex/Emby 账户"
+            ), None
+
+        sender_credits = sender_stats[2]
+
+        # 计算手续费 (5%)
+        fee_amount = amount * 0.05
+        total_deduction = amount + fee_amount
+
+        # 检查余额是否足够
+        if sender_credits < total_deduction:
+            return CreditsTransferResponse(
+                success=False,
+                message=f"积分不足，需要 {total_deduction:.2f} 积分（包含 {fee_amount:.2f} 手续费）",
+            ), None
+
+        # 获取接收方信息
+        target_stats = _db.get_stats_by_tg_id(target_tg_id)
+        if not target_stats:
+            return CreditsTransferResponse(
+                success=False, message="目标用户不存在或未绑定账户"
+            ), None
+
+        target_credits = target_stats[2]
+
+        # 执行转移
+        new_sender_credits = sender_credits - total_deduction
+        new_target_credits = target_credits + amount
+
+        # 更新发送方积分
+        sender_success = _db.update_user_credits(
+            new_sender_credits, tg_id=sender_id
+        )
+        if not sender_success:
+            return CreditsTransferResponse(
+                success=False, message="更新发送方积分失败，请稍后再试"
+            ), None
+
+        # 更新接收方积分
+        target_success = _db.update_user_credits(
+            new_target_credits, tg_id=target_tg_id
+        )
+        if not target_success:
+            # 如果接收方更新失败，回滚发送方积分
+            _db.update_user_credits(sender_credits, tg_id=sender_id)
+            return CreditsTransferResponse(
+                success=False, message="更新接收方积分失败，操作已回滚"
+            ), None
+
+        # 记录转移日志
+        sender_name = get_user_name_from_tg_id(sender_id)
+        target_name = get_user_name_from_tg_id(target_tg_id)
+
+        logger.info(
+            f"积分转移成功: {sender_name}({sender_id}) -> {target_name}({target_tg_id}), "
+            f"金额: {amount}, 手续费: {fee_amount:.2f}"
+            + (f", 备注: {note}" if note else "")
+        )
+
+        return CreditsTransferResponse(
+            success=True,
+            message=f"成功转移 {amount} 积分给用户 {target_name}",
+            transferred_amount=amount,
+            fee_amount=fee_amount,
+            current_credits=new_sender_credits,
+        ), sender_name
+
+    finally:
+        _db.close()
+
+
 @router.post("/transfer-credits", response_model=CreditsTransferResponse)
 @require_telegram_auth
 async def transfer_credits(
@@ -2140,97 +2371,26 @@ async def transfer_credits(
                 success=False, message="单次转移积分不能超过10000"
             )
 
-        _db = DB()
+        response, sender_name = await run_db(
+            _transfer_credits, sender_id, target_tg_id, amount, note
+        )
+        if not response.success:
+            return response
 
+        # 可以在这里发送通知给接收方用户
         try:
-            # 获取发送方当前积分
-            sender_stats = _db.get_stats_by_tg_id(sender_id)
-            if not sender_stats:
-                return CreditsTransferResponse(
-                    success=False, message="您尚未绑定 Plex/Emby 账户"
-                )
-
-            sender_credits = sender_stats[2]
-
-            # 计算手续费 (5%)
-            fee_amount = amount * 0.05
-            total_deduction = amount + fee_amount
-
-            # 检查余额是否足够
-            if sender_credits < total_deduction:
-                return CreditsTransferResponse(
-                    success=False,
-                    message=f"积分不足，需要 {total_deduction:.2f} 积分（包含 {fee_amount:.2f} 手续费）",
-                )
-
-            # 获取接收方信息
-            target_stats = _db.get_stats_by_tg_id(target_tg_id)
-            if not target_stats:
-                return CreditsTransferResponse(
-                    success=False, message="目标用户不存在或未绑定账户"
-                )
-
-            target_credits = target_stats[2]
-
-            # 执行转移
-            new_sender_credits = sender_credits - total_deduction
-            new_target_credits = target_credits + amount
-
-            # 更新发送方积分
-            sender_success = _db.update_user_credits(
-                new_sender_credits, tg_id=sender_id
-            )
-            if not sender_success:
-                return CreditsTransferResponse(
-                    success=False, message="更新发送方积分失败，请稍后再试"
-                )
-
-            # 更新接收方积分
-            target_success = _db.update_user_credits(
-                new_target_credits, tg_id=target_tg_id
-            )
-            if not target_success:
-                # 如果接收方更新失败，回滚发送方积分
-                _db.update_user_credits(sender_credits, tg_id=sender_id)
-                return CreditsTransferResponse(
-                    success=False, message="更新接收方积分失败，操作已回滚"
-                )
-
-            # 记录转移日志
-            from app.utils.utils import get_user_name_from_tg_id
-
-            sender_name = get_user_name_from_tg_id(sender_id)
-            target_name = get_user_name_from_tg_id(target_tg_id)
-
-            logger.info(
-                f"积分转移成功: {sender_name}({sender_id}) -> {target_name}({target_tg_id}), "
-                f"金额: {amount}, 手续费: {fee_amount:.2f}"
-                + (f", 备注: {note}" if note else "")
-            )
-
-            # 可以在这里发送通知给接收方用户
-            try:
-                await send_message_by_url(
-                    chat_id=target_tg_id,
-                    text=f"""
+            await send_message_by_url(
+                chat_id=target_tg_id,
+                text=f"""
 您收到了来自 {sender_name} 的积分转移: {amount} 积分
 """
-                    + (f"""备注: {note}""" if note else ""),
-                    parse_mode="HTML",
-                )
-            except Exception as e:
-                logger.warning(f"发送积分转移通知失败: {str(e)}")
-
-            return CreditsTransferResponse(
-                success=True,
-                message=f"成功转移 {amount} 积分给用户 {target_name}",
-                transferred_amount=amount,
-                fee_amount=fee_amount,
-                current_credits=new_sender_credits,
+                + (f"""备注: {note}""" if note else ""),
+                parse_mode="HTML",
             )
+        except Exception as e:
+            logger.warning(f"发送积分转移通知失败: {str(e)}")
 
-        finally:
-            _db.close()
+        return response
 
     except Exception as e:
         logger.error(f"积分转移失败: {str(e)}")
@@ -2239,12 +2399,8 @@ async def transfer_credits(
         )
 
 
-@router.get("/users")
-@require_telegram_auth
-async def get_all_users(
-    request: Request, user: TelegramUser = Depends(get_telegram_user)
-):
-    """获取所有用户信息（用于用户选择）- 只返回有账号的用户"""
+def _get_all_users(user: TelegramUser):
+    """获取所有用户信息（用于用户选择）- 只返回有账号的用户（同步，在数据库线程池中运行）"""
 
     db = DB()
     try:
@@ -2290,14 +2446,17 @@ async def get_all_users(
         db.close()
 
 
-@router.post("/lines/{service}/current", response_model=CurrentLineResponse)
+@router.get("/users")
 @require_telegram_auth
-async def get_current_bound_line(
-    service: str,
-    request: Request,
-    data: dict = Body(...),
+async def get_all_users(
+    request: Request, user: TelegramUser = Depends(get_telegram_user)
 ):
-    """获取用户当前绑定的线路信息（基于用户名/邮箱）"""
+    """获取所有用户信息（用于用户选择）- 只返回有账号的用户"""
+    return await run_db(_get_all_users, user)
+
+
+def _get_current_bound_line(service: str, data: dict):
+    """获取用户当前绑定的线路信息（基于用户名/邮箱），同步，在数据库线程池中运行"""
     if service not in ["emby", "plex"]:
         raise HTTPException(status_code=400, detail="服务类型必须是 'emby' 或 'plex'")
 
@@ -2358,3 +2517,14 @@ async def get_current_bound_line(
         )
     finally:
         db.close()
+
+
+@router.post("/lines/{service}/current", response_model=CurrentLineResponse)
+@require_telegram_auth
+async def get_current_bound_line(
+    service: str,
+    request: Request,
+    data: dict = Body(...),
+):
+    """获取用户当前绑定的线路信息（基于用户名/邮箱）"""
+    return await run_db(_get_current_bound_line, service, data)
@@ -1,16 +1,35 @@
 from contextlib import asynccontextmanager
 
+from app.db import DB, close_pools, get_pool
+from app.executors import run_db, shutdown_executors
 from app.log import logger
+from app.shared_proxy import sync_all_media_routes
 from app.utils.utils import cleanup_http_resources
 from fastapi import FastAPI
 
 
+def _backfill_media_routes():
+    """启动时回填 Redis 路由，Redis 不可用时不影响启动"""
+    db = DB()
+    try:
+        sync_all_media_routes(db)
+    except Exception as e:
+        logger.error(f"启动时回填媒体路由失败: {e}")
+    finally:
+        db.close()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
         logger.info("Application startup")
+        # 启动时完成建表/迁移并初始化连接池
+        get_pool()
+        await run_db(_backfill_media_routes)
         yield
     finally:
         # 清理全局 HTTP 资源
         await cleanup_http_resources()
+        shutdown_executors(wait=False)
+        close_pools()
         logger.info("Application shutdown")
@@ -11,6 +11,7 @@ pytest 配置和通用 fixtures
 import os
 import sys
 import tempfile
+from datetime import timedelta, timezone
 from pathlib import Path
 from typing import Generator
 from unittest.mock import MagicMock, patch
@@ -46,6 +47,7 @@ def mock_settings(temp_dir: Path):
     mock_config.EMBY_ENTRY_URL = "https://emby.example.com"
     mock_config.WEBAPP_URL = "https://webapp.example.com"
     mock_config.LOG_LEVEL = "INFO"
+    mock_config.TZ = timezone(timedelta(hours=8))
 
     with patch("app.config.settings", mock_config):
         yield mock_config
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""每日积分结算引擎测试"""
+
+from datetime import date, timedelta
+
+import pytest
+
+from app import credit_settlement
+from app.credit_settlement import CreditSettlement
+
+
+@pytest.fixture
+def settlement_settings(monkeypatch):
+    monkeypatch.setattr(credit_settlement.settings, "DUAL_BIND_MULTIPLIER", 1.5)
+    monkeypatch.setattr(credit_settlement.settings, "ABUSE_WATCH_THRESHOLD", 16)
+    monkeypatch.setattr(credit_settlement.settings, "TG_ADMIN_CHAT_ID", [999])
+
+
+def _credits(db, tg_id):
+    return db.cur.execute(
+        "SELECT credits FROM statistics WHERE tg_id=?", (tg_id,)
+    ).fetchone()[0]
+
+
+def test_settlement_shares_balance_across_services(test_db, settlement_settings):
+    test_db.add_user_data(tg_id=10001, credits=10, donation=0)
+    for offset in range(3):
+        test_db.add_checkin(
+            tg_id=10001,
+            checkin_date=(date(2026, 1, 1) + timedelta(days=offset)).isoformat(),
+            streak=offset + 1,
+            month="2026-01",
+            credits_earned=1.0,
+        )
+    test_db.sync_checkin_total_rank_medals()
+    test_db.add_plex_user(plex_id=1, tg_id=10001, plex_username="alice", watched_time=5)
+    test_db.add_emby_user("alice-emby", emby_id="e1", tg_id=10001, emby_watched_time=1.0)
+    # 没有 statistics 记录的 Emby 用户，结算时创建记录并转移 Emby 账号积分
+    test_db.add_emby_user("bob", emby_id="e2", tg_id=10002, emby_credits=3.0)
+
+    settlement = CreditSettlement(test_db)
+    settlement.settle("plex", {1: 2.0})
+    settlement.settle("emby", {"e1": 3 * 3600, "e2": 3600})
+    assert settlement.apply()
+
+    # 双账号 1.5 × 签到第一勋章 1.5
+    assert _credits(test_db, 10001) == pytest.approx(10 + 2 * 2.25 + 2 * 2.25)
+    assert _credits(test_db, 10002) == pytest.approx(4.0)
+    assert test_db.cur.execute(
+        "SELECT watched_time FROM user WHERE plex_id=1"
+    ).fetchone()[0] == pytest.approx(7.0)
+    assert tuple(
+        test_db.cur.execute(
+            "SELECT emby_watched_time, emby_credits FROM emby_user WHERE emby_id='e2'"
+        ).fetchone()
+    ) == (1.0, 0)
+    assert [tg_id for tg_id, _ in settlement.notifications] == [10001, 10001, 10002]
+
+
+def test_settlement_zeroes_abusive_watch_and_alerts_admins(test_db, settlement_settings):
+    test_db.add_user_data(tg_id=20001, credits=5, donation=0)
+    test_db.add_plex_user(plex_id=2, tg_id=20001, plex_username="carol")
+
+    settlement = CreditSettlement(test_db)
+    settlement.settle("plex", {2: 20.0})
+    settlement.apply()
+
+    assert _credits(test_db, 20001) == 5
+    assert settlement.deltas[0].is_abusive
+    assert [chat_id for chat_id, _ in settlement.notifications] == [20001, 999]
+
+
+def test_settlement_clears_debt_when_balance_recovers(test_db, settlement_settings):
+    test_db.add_user_data(tg_id=30001, credits=-1, donation=0)
+    test_db.cur.execute("UPDATE statistics SET debt_since=1 WHERE tg_id=30001")
+    test_db.con.commit()
+    test_db.add_plex_user(plex_id=3, tg_id=30001, plex_username="dave")
+
+    settlement = CreditSettlement(test_db)
+    settlement.settle("plex", {3: 2.0})
+    settlement.apply()
+
+    assert tuple(
+        test_db.cur.execute(
+            "SELECT credits, debt_since FROM statistics WHERE tg_id=30001"
+        ).fetchone()
+    ) == (1.0, None)
+
+
+def test_settlement_failure_rolls_back_only_that_service(test_db, settlement_settings):
+    test_db.add_user_data(tg_id=40001, credits=0, donation=0)
+    test_db.add_plex_user(plex_id=4, tg_id=40001, plex_username="erin")
+    test_db.add_emby_user("erin-emby", emby_id="e4", tg_id=40001)
+
+    settlement = CreditSettlement(test_db)
+    settlement.settle("plex", {4: 1.0})
+    with pytest.raises(ValueError):
+        settlement.settle("emby", {"e4": "broken"})
+    settlement.apply()
+
+    assert _credits(test_db, 40001) == pytest.approx(1.5)
+    assert [delta.service for delta in settlement.deltas] == ["plex"]
+
+
+def test_dry_run_does_not_write(test_db, settlement_settings):
+    test_db.add_user_data(tg_id=50001, credits=0, donation=0)
+    test_db.add_plex_user(plex_id=5, tg_id=50001, plex_username="frank")
+
+    settlement = CreditSettlement(test_db, dry_run=True)
+    settlement.settle("plex", {5: 3.0})
+    settlement.apply()
+
+    assert _credits(test_db, 50001) == 0
+    assert "frank" in settlement.format_delta_table()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""积分实时同步到 Redis 测试"""
+
+from app import credits_cache
+from app.cache import RedisCache
+
+
+class FakeCreditsCache:
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.writes = []
+        self.deleted = []
+
+    def put_many(self, items, ttl_seconds=None, raise_errors=False):
+        self.writes.append(dict(items))
+        self.values.update({key: str(value) for key, value in items.items()})
+
+    def delete_many(self, keys):
+        self.deleted.extend(keys)
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def get_all_key_values(self):
+        return dict(self.values)
+
+
+def _fake_cache(monkeypatch, values=None):
+    fake = FakeCreditsCache(values)
+    monkeypatch.setattr(credits_cache, "user_credits_cache", fake)
+    monkeypatch.setattr(credits_cache, "_suspended_until", 0.0)
+    return fake
+
+
+def _seed_users(db):
+    db.add_user_data(tg_id=1, credits=50, donation=0)
+    db.add_plex_user(plex_id=11, tg_id=1, plex_username="Alice", credits=999)
+    db.add_emby_user("AliceEmby", emby_id="e1", tg_id=1, emby_credits=999)
+    db.add_plex_user(plex_id=12, plex_username="Bob", credits=7)
+    # 未接受邀请的 Plex 用户不写入缓存
+    db.add_plex_user(plex_id=None, plex_username="Pending", credits=3)
+
+
+def test_update_user_credits_publishes_bound_accounts(test_db, monkeypatch):
+    _seed_users(test_db)
+    fake = _fake_cache(monkeypatch)
+
+    assert test_db.update_user_credits(80, tg_id=1)
+    assert fake.writes == [{"plex:alice": 80, "emby:aliceemby": 80}]
+
+    assert test_db.update_user_credits(9, plex_id=12)
+    assert fake.writes[-1] == {"plex:bob": 9}
+
+
+def test_publish_failure_suspends_sync(test_db, monkeypatch):
+    _seed_users(test_db)
+    fake = _fake_cache(monkeypatch)
+
+    def broken_put_many(items, ttl_seconds=None, raise_errors=False):
+        raise ConnectionError("redis down")
+
+    monkeypatch.setattr(fake, "put_many", broken_put_many)
+    # Redis 故障不影响积分写入
+    assert test_db.update_user_credits(80, tg_id=1)
+    assert test_db.get_user_credits(1) == (True, 80)
+
+    monkeypatch.setattr(fake, "put_many", FakeCreditsCache.put_many.__get__(fake))
+    assert credits_cache.publish_user_credits(test_db, tg_ids=[1]) == 0
+    assert fake.writes == []
+
+
+class BrokenRedis:
+    def pipeline(self, transaction=True):
+        raise ConnectionError("redis down")
+
+
+def test_redis_cache_failure_suspends_sync(test_db, monkeypatch):
+    _seed_users(test_db)
+    redis_cache = RedisCache(cache_key_prefix="user_credits:")
+    monkeypatch.setattr(redis_cache, "redis_client", BrokenRedis())
+    monkeypatch.setattr(credits_cache, "user_credits_cache", redis_cache)
+    monkeypatch.setattr(credits_cache, "_suspended_until", 0.0)
+
+    # RedisCache 的写入异常传到 publish_user_credits，触发暂停
+    assert credits_cache.publish_user_credits(test_db, tg_ids=[1]) == 0
+    assert credits_cache._suspended_until > 0
+
+
+def test_reconcile_writes_only_differences(test_db, monkeypatch):
+    _seed_users(test_db)
+    fake = _fake_cache(
+        monkeypatch,
+        {"plex:alice": "50.0", "emby:aliceemby": "40", "plex:gone": "1"},
+    )
+
+    assert credits_cache.reconcile_user_credits(test_db) == (2, 1)
+    assert fake.writes == [{"emby:aliceemby": 50, "plex:bob": 7}]
+    assert fake.deleted == ["plex:gone"]
+
+    # 已一致时不再写入
+    assert credits_cache.reconcile_user_credits(test_db) == (0, 0)
+    assert len(fake.writes) == 1
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""数据库连接池测试"""
+
+from app.db import DB
+from app.db.pool import ConnectionPool
+
+
+def test_schema_is_created_once_per_process(tmp_path, monkeypatch):
+    db_path = tmp_path / "pool.db"
+    calls = []
+    real_create_table = DB.create_table
+
+    def counting_create_table(self):
+        calls.append(1)
+        return real_create_table(self)
+
+    monkeypatch.setattr(DB, "create_table", counting_create_table)
+
+    pool = ConnectionPool(db_path, size=2)
+    with pool.db() as db:
+        assert db.get_credits_rank() == []
+    DB(db=db_path).close()
+
+    assert len(calls) == 1
+    pool.close()
+
+
+def test_pool_reuses_connections_and_rolls_back_uncommitted_work(tmp_path):
+    pool = ConnectionPool(tmp_path / "pool.db", size=1)
+
+    with pool.connection() as con:
+        first = con
+        con.execute("INSERT INTO statistics (tg_id, credits) VALUES (1, 10)")
+
+    with pool.db() as db:
+        assert db.con is first
+        assert db.cur.execute("SELECT COUNT(*) FROM statistics").fetchone()[0] == 0
+        db.close()
+        assert db.con.execute("SELECT 1").fetchone()[0] == 1
+
+    pool.close()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""Emby 用户信息内存索引测试"""
+
+from app import emby
+from app.emby_user_index import EmbyUserIndex
+
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def json(self):
+        return self.payload
+
+    def raise_for_status(self):
+        pass
+
+
+def _item(index: int) -> dict:
+    return {
+        "Id": f"id{index}",
+        "Name": f"user{index}",
+        "PrimaryImageTag": "tag" if index % 2 else "",
+        "DateCreated": f"2026-01-{index + 1:02d}T00:00:00Z",
+    }
+
+
+def _fake_emby(monkeypatch, tmp_path, items):
+    index = EmbyUserIndex(lambda: tmp_path / "emby_user_info.db")
+    calls = []
+
+    def fake_get(url, params=None, headers=None):
+        calls.append(dict(params))
+        if "NameStartsWithOrGreater" in params:
+            matched = [item for item in items if item["Name"] >= params["NameStartsWithOrGreater"]]
+            return FakeResponse({"Items": sorted(matched, key=lambda item: item["Name"])[:1]})
+        start, limit = params["StartIndex"], params["Limit"]
+        return FakeResponse({"Items": items[start : start + limit], "TotalRecordCount": len(items)})
+
+    monkeypatch.setattr(emby, "emby_user_index", index)
+    monkeypatch.setattr(emby.requests, "get", fake_get)
+    monkeypatch.setattr(emby.Emby, "USER_PAGE_SIZE", 2)
+    return emby.Emby(base_url="https://emby.example.com", api_token="token"), index, calls
+
+
+def test_refresh_loads_all_pages_into_index(monkeypatch, tmp_path):
+    items = [_item(i) for i in range(5)]
+    client, index, calls = _fake_emby(monkeypatch, tmp_path, items)
+
+    assert client.refresh_user_index() == 5
+    assert [params["StartIndex"] for params in calls] == [0, 2, 4]
+
+    calls.clear()
+    assert client.get_uid_from_username("user3") == "id3"
+    assert client.get_user_avatar_by_username("user1", from_emby=False).startswith(
+        "https://emby.example.com/Users/id1/Images/Primary?tag=tag"
+    )
+    assert client.get_user_avatar_by_username("user2") == ""
+    assert client.get_user_info_from_username("user4")["date_created"] == "2026-01-05T00:00:00Z"
+    assert calls == []
+
+    # 其他进程读取持久化文件得到同样的数据
+    other = EmbyUserIndex(lambda: tmp_path / "emby_user_info.db")
+    assert other.snapshot() == index.snapshot()
+
+    # 已删除的用户在下次全量刷新后移出索引
+    del items[1]
+    assert client.refresh_user_index() == 4
+    assert client.get_user_info_from_username("user1", from_emby=False) == {}
+    assert "user1" not in other.snapshot()
+
+
+def test_index_miss_falls_back_to_single_lookup(monkeypatch, tmp_path):
+    items = [_item(i) for i in range(3)]
+    client, index, calls = _fake_emby(monkeypatch, tmp_path, items)
+
+    assert client.get_user_info_from_username("user1", from_emby=False) == {}
+    assert client.get_uid_from_username("user1") == "id1"
+    assert client.get_uid_from_username("missing") is None
+    assert len(calls) == 2
+
+    calls.clear()
+    assert client.get_uid_from_username("user1") == "id1"
+    assert calls == []
+    assert set(EmbyUserIndex(lambda: tmp_path / "emby_user_info.db").snapshot()) == {"user1"}
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""群组成员状态对账测试"""
+
+import time
+
+from app import update_db
+from app.db import DB
+
+
+def _setup(test_db, temp_dir, monkeypatch, memberships):
+    monkeypatch.setattr(update_db, "DB", lambda: DB(db=temp_dir / "test_data.db"))
+    monkeypatch.setattr(update_db.settings, "TG_GROUP", "-100123")
+    monkeypatch.setattr(update_db.settings, "TG_ADMIN_CHAT_ID", ["4"])
+    monkeypatch.setattr(update_db.settings, "TG_PRIVILEGED_USERS", [])
+    monkeypatch.setattr(update_db, "enqueue_notifications", lambda tasks: len(tasks))
+    checked = []
+
+    async def fake_check_group_memberships(tg_ids, group_id):
+        tg_ids = sorted(tg_ids)
+        checked.append(tg_ids)
+        return {tg_id: memberships[tg_id] for tg_id in tg_ids if tg_id in memberships}
+
+    monkeypatch.setattr(update_db, "check_group_memberships", fake_check_group_memberships)
+
+    test_db.add_plex_user(plex_id=11, tg_id=1, plex_username="a")
+    test_db.add_emby_user("b", emby_id="e2", tg_id=2)
+    test_db.add_plex_user(plex_id=13, tg_id=3, plex_username="c")
+    test_db.add_plex_user(plex_id=14, tg_id=4, plex_username="admin")
+    return checked
+
+
+async def test_sweep_only_rechecks_unknown_or_stale_members(test_db, temp_dir, monkeypatch):
+    checked = _setup(test_db, temp_dir, monkeypatch, {2: False, 3: True, 5: True})
+    test_db.update_group_member_statuses([(1, True)], source="event")
+    test_db.update_group_member_statuses([(2, True)])
+    test_db.cur.execute(
+        "UPDATE group_member_status SET checked_at = ? WHERE tg_id = 2",
+        (int(time.time()) - 48 * 3600,),
+    )
+    test_db.con.commit()
+
+    await update_db.process_left_group_members()
+
+    # 1 的状态来自实时事件，4 是管理员，都不需要复核
+    assert checked == [[2, 3]]
+    statuses = test_db.get_group_member_statuses()
+    assert statuses[2][0] is False
+    assert statuses[3][0] is True
+    left = test_db.cur.execute("SELECT tg_id FROM group_member_left_status").fetchall()
+    assert [row[0] for row in left] == [2]
+
+    # 有未处理离开记录的用户每次都复核，避免漏收加入事件
+    await update_db.process_left_group_members()
+    assert checked[-1] == [2]
+
+
+async def test_sweep_clears_left_record_when_member_rejoined(test_db, temp_dir, monkeypatch):
+    checked = _setup(test_db, temp_dir, monkeypatch, {1: True})
+    test_db.update_group_member_statuses(
+        [(1, False), (2, True), (3, True)], source="event"
+    )
+    test_db.add_group_member_left_record(tg_id=1, left_time=int(time.time()))
+
+    await update_db.process_left_group_members()
+
+    assert checked == [[1]]
+    assert test_db.get_group_member_statuses()[1][0] is True
+    assert test_db.cur.execute("SELECT COUNT(*) FROM group_member_left_status").fetchone()[0] == 0
+
+
+async def test_sweep_skips_pending_left_record_when_recheck_fails(test_db, temp_dir, monkeypatch):
+    checked = _setup(test_db, temp_dir, monkeypatch, {})
+    test_db.update_group_member_statuses(
+        [(1, False), (2, True), (3, True)], source="event"
+    )
+    left_time = int(time.time()) - 80 * 3600
+    test_db.add_group_member_left_record(tg_id=1, left_time=left_time)
+    deactivated = []
+
+    async def fake_deactivate(tg_id, *args, **kwargs):
+        deactivated.append(tg_id)
+
+    monkeypatch.setattr(update_db, "deactivate_user_accounts", fake_deactivate)
+
+    await update_db.process_left_group_members()
+
+    # 复核失败时不能沿用旧的离开状态去警告或注销
+    assert checked == [[1]]
+    assert deactivated == []
+    row = test_db.cur.execute(
+        "SELECT is_processed FROM group_member_left_status WHERE tg_id = 1"
+    ).fetchone()
+    assert row[0] == 0
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""流量归属身份缓存测试"""
+
+import pytest
+
+from app import update_db
+from app.identity_cache import IdentityCache, traffic_identity_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_identity_cache():
+    traffic_identity_cache.clear()
+    yield
+    traffic_identity_cache.clear()
+
+
+def test_identity_cache_expires_negative_entries_sooner_and_evicts_lru():
+    now = [0.0]
+    cache = IdentityCache(maxsize=2, ttl=100, negative_ttl=10, clock=lambda: now[0])
+
+    cache.put("token-a", ("alice", "1"))
+    cache.put("token-b", (None, None))
+    assert cache.get("token-b") == (True, (None, None))
+
+    now[0] = 11
+    assert cache.get("token-b") == (False, None)
+    assert cache.get("token-a") == (True, ("alice", "1"))
+
+    cache.put("token-c", ("carol", "3"))
+    cache.put("token-d", ("dave", "4"))
+    assert cache.get("token-a") == (False, None)
+    assert cache.stats()["negative_hits"] == 1
+
+
+async def test_emby_segment_burst_resolves_identity_once(monkeypatch, test_db):
+    test_db.add_emby_user(emby_username="embyuser", emby_id="emby-user-1")
+    api_calls = []
+
+    async def fake_get_emby_username_from_api_key(self, api_key):
+        api_calls.append(api_key)
+        return "embyuser"
+
+    monkeypatch.setattr(update_db.emby_api_key_cache, "get", lambda key: None)
+    monkeypatch.setattr(
+        update_db.Emby,
+        "get_emby_username_from_api_key",
+        fake_get_emby_username_from_api_key,
+    )
+
+    for index in range(200):
+        username, user_id = await update_db._resolve_emby_identity(
+            test_db,
+            f"/emby/videos/1/hls1/main/{index}.ts?api_key=emby-api-key",
+            {},
+        )
+        assert (username, user_id) == ("embyuser", "emby-user-1")
+
+    assert api_calls == ["emby-api-key"]
+    assert traffic_identity_cache.stats()["hits"] >= 398
+
+
+async def test_unresolvable_plex_token_is_negatively_cached(monkeypatch, test_db):
+    token_calls = []
+
+    async def fake_resolve_plex_token_identity(_db, token):
+        token_calls.append(token)
+        return None, None
+
+    async def fake_resolve_from_tautulli(_db, **kwargs):
+        return None, None
+
+    monkeypatch.setattr(
+        update_db, "_resolve_plex_token_identity", fake_resolve_plex_token_identity
+    )
+    monkeypatch.setattr(
+        update_db, "_resolve_plex_identity_from_tautulli", fake_resolve_from_tautulli
+    )
+
+    for _ in range(50):
+        assert await update_db._resolve_plex_identity(
+            test_db,
+            "/library/parts/1/file.mkv?X-Plex-Token=bad-token",
+            remote_addr="1.1.1.1",
+            user_agent="Plex/1.0",
+        ) == (None, None)
+
+    assert token_calls == ["bad-token"]
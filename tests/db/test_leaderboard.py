@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""Redis 排行榜测试"""
+
+from datetime import date, timedelta
+
+from app import leaderboard
+from app.leaderboard import (
+    CHECKIN_TOTAL,
+    CREDITS,
+    DONATION,
+    PLEX_WATCHED_TIME,
+    member_rank,
+    plex_watched_time_rank,
+    top_entries,
+)
+
+
+class FakeZsetRedis:
+    def __init__(self):
+        self.hashes = {}
+        self.zsets = {}
+        self.rebuilds = 0
+        self.broken = False
+
+    def pipeline(self, transaction=True):
+        return FakeZsetPipeline(self)
+
+    def _ordered(self, key):
+        # 与 ZREVRANGE 一致：分数降序，同分按成员字典序降序
+        return sorted(self.zsets.get(key, {}).items(), key=lambda item: (item[1], item[0]), reverse=True)
+
+    def hexists(self, key, field):
+        return field in self.hashes.get(key, {})
+
+    def hset(self, key, field, value):
+        self.hashes.setdefault(key, {})[field] = value
+
+    def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    def zrem(self, key, *members):
+        for member in members:
+            self.zsets.get(key, {}).pop(member, None)
+
+    def zrevrange(self, key, start, end, withscores=False):
+        return self._ordered(key)[start : end + 1]
+
+    def zrevrank(self, key, member):
+        members = [item[0] for item in self._ordered(key)]
+        return members.index(member) if member in members else None
+
+    def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    def delete(self, *keys):
+        for key in keys:
+            self.zsets.pop(key, None)
+
+    def rename(self, source, target):
+        if source.endswith(":rebuild"):
+            self.rebuilds += 1
+        self.zsets[target] = self.zsets.pop(source)
+
+
+class FakeZsetPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+        return lambda *args, **kwargs: self.commands.append(lambda: method(*args, **kwargs))
+
+    def execute(self):
+        if self.redis.broken:
+            raise ConnectionError("redis down")
+        return [command() for command in self.commands]
+
+
+def _fake_redis(monkeypatch):
+    redis = FakeZsetRedis()
+    monkeypatch.setattr(leaderboard, "_redis_client", redis)
+    monkeypatch.setattr(leaderboard, "_suspended_until", 0.0)
+    monkeypatch.setattr(leaderboard, "_stale_boards", set())
+    return redis
+
+
+def _seed_users(db):
+    for tg_id, credits in ((1, 50), (2, 80), (3, 20), (4, 999)):
+        db.add_user_data(tg_id=tg_id, credits=credits, donation=0)
+        db.add_plex_user(plex_id=10 + tg_id, tg_id=tg_id, plex_username=f"user{tg_id}", watched_time=tg_id)
+    # 没有媒体账号的用户不上积分榜
+    db.cur.execute("DELETE FROM user WHERE tg_id = 4")
+    db.con.commit()
+
+
+def test_writes_update_board_without_rebuilding(test_db, monkeypatch):
+    _seed_users(test_db)
+    redis = _fake_redis(monkeypatch)
+
+    assert top_entries(test_db, CREDITS, 10) == [(2, 80.0), (1, 50.0), (3, 20.0)]
+    assert redis.rebuilds == 1
+
+    assert test_db.update_user_credits(100, tg_id=3)
+    assert test_db.update_user_donation(30, tg_id=1)
+
+    assert top_entries(test_db, CREDITS, 2) == [(3, 100.0), (2, 80.0)]
+    assert member_rank(test_db, CREDITS, 1) == (3, 50.0)
+    assert member_rank(test_db, CREDITS, 4) is None
+    # 捐赠榜尚未构建，首次读取时重建，之后的写入只增量更新
+    assert top_entries(test_db, DONATION, 10) == [(1, 30.0)]
+    assert test_db.update_user_donation(0, tg_id=1)
+    assert top_entries(test_db, DONATION, 10) == []
+    assert redis.rebuilds == 2
+
+
+def test_checkin_board_keeps_earlier_checkin_first(test_db, monkeypatch):
+    _fake_redis(monkeypatch)
+    start = date(2026, 4, 1)
+    for offset in range(3):
+        current = start + timedelta(days=offset)
+        for tg_id in (5001, 5002):
+            test_db.add_checkin(tg_id, current.isoformat(), offset + 1, current.strftime("%Y-%m"), 1.0)
+    assert [row["tg_id"] for row in test_db.get_checkin_total_leaderboard(limit=2)] == [5001, 5002]
+
+    current = start + timedelta(days=3)
+    test_db.add_checkin(5002, current.isoformat(), 4, current.strftime("%Y-%m"), 1.0)
+
+    rows = test_db.get_checkin_total_leaderboard(limit=2)
+    assert [(row["tg_id"], row["total_days"]) for row in rows] == [(5002, 4), (5001, 3)]
+    last_id = test_db.cur.execute("SELECT MAX(id) FROM checkin_stats WHERE tg_id = 5002").fetchone()[0]
+    assert rows[0]["last_checkin_id"] == last_id
+    assert test_db.get_checkin_total_rank(5001) == 2
+
+
+def test_redis_outage_falls_back_to_database(test_db, monkeypatch):
+    _seed_users(test_db)
+    redis = _fake_redis(monkeypatch)
+    assert [row[0] for row in plex_watched_time_rank(test_db, 2)] == [13, 12]
+
+    redis.broken = True
+    # Redis 故障时写入不受影响，读取改为查询数据库
+    assert test_db.update_user_credits(5, tg_id=2)
+    test_db.cur.execute("UPDATE user SET watched_time = 9 WHERE plex_id = 11")
+    test_db.con.commit()
+    leaderboard.refresh_members(test_db, PLEX_WATCHED_TIME, [11])
+    assert top_entries(test_db, CREDITS, 10) == [(1, 50.0), (3, 20.0), (2, 5.0)]
+    assert member_rank(test_db, CHECKIN_TOTAL, 1) is None
+
+    # 恢复后重建故障期间漏写的榜单
+    redis.broken = False
+    monkeypatch.setattr(leaderboard, "_suspended_until", 0.0)
+    assert [row[0] for row in plex_watched_time_rank(test_db, 2)] == [11, 13]
+    assert top_entries(test_db, CREDITS, 10) == [(1, 50.0), (3, 20.0), (2, 5.0)]
@@ -1,7 +1,21 @@
 #!/usr/bin/env python3
 """流量排行榜兜底采集测试"""
 
+import json
+
+import pytest
+
 from app import update_db
+from app.db import DB
+from app.identity_cache import traffic_identity_cache
+from app.nginx_traffic_state import NginxTrafficState
+
+
+@pytest.fixture(autouse=True)
+def clear_identity_cache():
+    traffic_identity_cache.clear()
+    yield
+    traffic_identity_cache.clear()
 
 
 def test_parse_nginx_access_log_line_extracts_expected_fields():
@@ -46,20 +60,81 @@ def test_extract_plex_metadata_id_from_transcode_request():
     ) == "37999"
 
 
+def test_read_new_log_lines_keeps_partial_line_and_respects_limit(tmp_path):
+    path = tmp_path / "emby_access.log"
+    path.write_bytes(b"first\nskip\nsecond\nthird\npart")
+
+    lines, state = update_db._read_new_log_lines(
+        path,
+        {},
+        limit=2,
+        prefilter=lambda line: line != b"skip",
+    )
+    assert lines == ["first", "second"]
+    assert state["offset"] == len(b"first\nskip\nsecond\n")
+
+    lines, state = update_db._read_new_log_lines(path, state, limit=10)
+    assert lines == ["third"]
+
+    with open(path, "ab") as handle:
+        handle.write(b"ial\n")
+    lines, state = update_db._read_new_log_lines(path, state, limit=10)
+    assert lines == ["partial"]
+    assert state["offset"] == path.stat().st_size
+
+
+def test_log_prefilters_only_drop_lines_the_parser_would_reject():
+    stream = (
+        b'1.1.1.1 - - [04/Apr/2026:10:00:00 +0800] "GET /emby/videos/1/0.ts HTTP/2.0" 206 123456'
+    )
+    small = b'1.1.1.1 - - [04/Apr/2026:10:00:00 +0800] "GET /emby/System/Info HTTP/2.0" 200 512'
+    error = b'1.1.1.1 - - [04/Apr/2026:10:00:00 +0800] "GET /emby/videos/1/0.ts HTTP/2.0" 404 2048'
+    assert update_db._prefilter_access_log_line(stream)
+    assert not update_db._prefilter_access_log_line(small)
+    assert not update_db._prefilter_access_log_line(error)
+
+    assert update_db._prefilter_plex_json_line(
+        b'{"request_uri":"/library/parts/1/file.mkv","status":206,"bytes_sent":4096}'
+    )
+    assert not update_db._prefilter_plex_json_line(
+        b'{"request_uri":"/library/metadata/1","status":200,"bytes_sent":4096}'
+    )
+    assert not update_db._prefilter_plex_json_line(
+        b'{"request_uri":"/library/parts/1/file.mkv","status":"200","bytes_sent":"12"}'
+    )
+
+
 async def test_update_line_traffic_stats_uses_nginx_fallback_when_redis_is_empty(
     monkeypatch,
+    tmp_path,
 ):
     class DummyDB:
+        def create_line_traffic_entries(self, rows):
+            self.rows = list(rows)
+            return True
+
         def close(self):
             self.closed = True
 
     db = DummyDB()
-    saved_state = {}
+    state_path = tmp_path / "nginx_traffic_state.db"
     processed_payloads = []
 
-    async def fake_process_traffic_log_entry(_db, log_data, *, emby_play_sessions):
+    def fake_collect_fallback_traffic_logs(max_records, state):
+        state.set_file_state("plex_json", {"offset": 128})
+        return [
+            {
+                "@timestamp": "2026-04-04T10:00:00+08:00",
+                "service": "plex",
+                "request_uri": "/library/parts/1/file.mkv?X-Plex-Token=test-token",
+                "status": 206,
+                "bytes_sent": 4096,
+            }
+        ]
+
+    async def fake_build_traffic_row(_db, log_data, *, emby_play_sessions):
         processed_payloads.append((log_data, dict(emby_play_sessions)))
-        return True
+        return ("http-plex", 4096, "plex", "plexuser", "1", log_data["@timestamp"])
 
     monkeypatch.setattr(update_db.settings, "NGINX_TRAFFIC_FALLBACK_ENABLED", True)
     monkeypatch.setattr(
@@ -71,40 +146,111 @@ async def test_update_line_traffic_stats_uses_nginx_fallback_when_redis_is_empty
     monkeypatch.setattr(
         update_db,
         "_collect_fallback_traffic_logs",
-        lambda max_records: (
-            [
-                {
-                    "@timestamp": "2026-04-04T10:00:00+08:00",
-                    "service": "plex",
-                    "request_uri": "/library/parts/1/file.mkv?X-Plex-Token=test-token",
-                    "status": 206,
-                    "bytes_sent": 4096,
-                }
-            ],
-            {
-                "files": {"plex_json": {"offset": 128}},
-                "emby_play_sessions": {},
-            },
-        ),
-    )
-    monkeypatch.setattr(
-        update_db,
-        "_process_traffic_log_entry",
-        fake_process_traffic_log_entry,
-    )
-    monkeypatch.setattr(
-        update_db,
-        "_save_nginx_traffic_state",
-        lambda state: saved_state.update(state),
+        fake_collect_fallback_traffic_logs,
     )
+    monkeypatch.setattr(update_db, "_build_traffic_row", fake_build_traffic_row)
+    opened = []
+
+    def open_state():
+        opened.append(state_path)
+        return NginxTrafficState(state_path)
+
+    monkeypatch.setattr(update_db, "_open_nginx_traffic_state", open_state)
+    monkeypatch.setattr(update_db, "_nginx_traffic_state", None)
 
     processed = await update_db.update_line_traffic_stats(count=10)
 
     assert processed == 1
     assert len(processed_payloads) == 1
+    assert len(db.rows) == 1
     assert processed_payloads[0][0]["service"] == "plex"
-    assert saved_state["files"]["plex_json"]["offset"] == 128
-    assert saved_state["emby_play_sessions"] == {}
+    saved_state = NginxTrafficState(state_path)
+    assert saved_state.file_state("plex_json")["offset"] == 128
+    assert len(saved_state.play_sessions) == 0
+    saved_state.close()
+
+    # 下一轮复用进程内的状态，不再重新打开和全量加载
+    await update_db.update_line_traffic_stats(count=10)
+    assert len(opened) == 1
+    update_db._discard_nginx_traffic_state()
+
+
+class FakeTrafficRedis:
+    """只实现流量任务用到的 list 操作"""
+
+    def __init__(self, values):
+        self.lists = {"filebeat_nginx_stream_logs": list(values)}
+
+    def lpop(self, key, count=None):
+        items = self.lists.get(key, [])
+        popped, self.lists[key] = items[:count], items[count:]
+        return popped or None
+
+    def pipeline(self):
+        return FakeTrafficPipeline(self)
+
+
+class FakeTrafficPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def rpush(self, key, *values):
+        self.commands.append(lambda: self.redis.lists.setdefault(key, []).extend(values))
+
+    def ltrim(self, key, start, end):
+        def trim():
+            items = self.redis.lists.get(key, [])
+            self.redis.lists[key] = items[start:] if end == -1 else items[start : end + 1]
+
+        self.commands.append(trim)
+
+    def execute(self):
+        for command in self.commands:
+            command()
+
+
+async def test_update_line_traffic_stats_writes_batch_and_dead_letters_failures(
+    monkeypatch,
+    tmp_path,
+):
+    good_log = {
+        "@timestamp": "2026-04-04T10:00:00+08:00",
+        "service": "plex",
+        "request_uri": "/library/parts/1/file.mkv?X-Plex-Token=test-token",
+        "status": 206,
+        "bytes_sent": 4096,
+    }
+    fake_redis = FakeTrafficRedis(
+        [json.dumps(good_log), json.dumps(good_log), "not-json"]
+    )
+    db_path = tmp_path / "traffic.db"
+    monkeypatch.setattr(update_db.stream_traffic_cache, "redis_client", fake_redis)
+    monkeypatch.setattr(update_db, "DB", lambda: DB(db=db_path))
+
+    async def fake_resolve_plex_identity(_db, request_uri, **kwargs):
+        return "plexuser", "plex-user-1"
+
+    monkeypatch.setattr(update_db, "_resolve_plex_identity", fake_resolve_plex_identity)
+
+    single_writes = []
+    monkeypatch.setattr(
+        DB,
+        "create_line_traffic_entry",
+        lambda self, *row: single_writes.append(row),
+    )
+
+    processed = await update_db.update_line_traffic_stats(count=10)
+
+    assert processed == 2
+    assert single_writes == []
+    db = DB(db=db_path)
+    count = db.cur.execute("SELECT COUNT(*) FROM line_traffic_stats").fetchone()[0]
+    db.close()
+    assert count == 2
+    dead_letters = fake_redis.lists["filebeat_nginx_stream_logs:dead"]
+    assert len(dead_letters) == 1
+    assert json.loads(dead_letters[0])["raw"] == "not-json"
 
 
 async def test_process_traffic_log_entry_skips_non_stream_plex_request(monkeypatch, test_db):
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""线路流量小时汇总表测试"""
+
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.db import DB
+
+
+def _now_iso(**delta) -> str:
+    return (datetime.now(settings.TZ) - timedelta(**delta)).isoformat()
+
+
+def test_create_line_traffic_entry_updates_hourly_rollup(test_db):
+    timestamp = _now_iso()
+    test_db.create_line_traffic_entry("line-a", 100, "emby", "alice", "1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 50, "emby", "alice", "1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 30, "plex", "bob", "2", timestamp)
+
+    rows = test_db.cur.execute(
+        "SELECT service, username, bucket, send_bytes FROM line_traffic_rollup ORDER BY service"
+    ).fetchall()
+
+    bucket = DB._traffic_bucket(timestamp)
+    assert [tuple(row) for row in rows] == [
+        ("emby", "alice", bucket, 150),
+        ("plex", "bob", bucket, 30),
+    ]
+
+
+def test_line_statistics_are_served_from_rollup(test_db):
+    timestamp = _now_iso()
+    for username, send_bytes in (("alice", 300), ("bob", 200), ("alice", 100)):
+        test_db.create_line_traffic_entry(
+            "line-a", send_bytes, "emby", username, username, timestamp
+        )
+    test_db.create_line_traffic_entry("line-b", 70, "plex", "carol", "carol", timestamp)
+    # 原始表被清空后统计结果不变，说明读取只依赖汇总表
+    for partition in test_db._traffic_partitions():
+        test_db.cur.execute(f"DELETE FROM {partition}")
+    test_db.con.commit()
+
+    stats = {item["line"]: item for item in test_db.get_all_lines_traffic_statistics()}
+
+    assert set(stats) == {"line-a", "line-b"}
+    assert stats["line-a"]["today_traffic"] == 600
+    assert stats["line-a"]["month_traffic"] == 600
+    assert stats["line-a"]["active_users"] == 2
+    assert stats["line-a"]["top_users"] == [
+        {"username": "alice", "traffic": 400},
+        {"username": "bob", "traffic": 200},
+    ]
+
+    overview = test_db.get_traffic_statistics()
+    assert overview["today"]["total"] == 670
+    assert overview["today"]["emby"] == 600
+    assert overview["today"]["plex"] == 70
+
+
+def test_rollup_is_backfilled_from_existing_raw_rows(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    db = DB(db=db_path)
+    db.create_line_traffic_entries(
+        [
+            ("line-a", 10, "emby", "alice", "1", "2026-04-04T10:15:00+08:00"),
+            ("line-a", 20, "emby", "alice", "1", "2026-04-04T10:45:00+08:00"),
+        ]
+    )
+    db.cur.execute("DROP TABLE line_traffic_rollup")
+    db.con.commit()
+
+    db._migrate_line_traffic_rollup()
+
+    rows = db.cur.execute(
+        "SELECT line, username, bucket, send_bytes FROM line_traffic_rollup"
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [
+        ("line-a", "alice", DB._traffic_bucket("2026-04-04T10:00:00+08:00"), 30)
+    ]
+    db.close()
@@ -81,3 +81,47 @@ def test_sync_checkin_total_rank_medals_updates_when_rank_changes(test_db):
     assert [medal["code"] for medal in test_db.get_user_medals(30001)] == ["checkin_top_2_ox"]
     assert [medal["code"] for medal in test_db.get_user_medals(30002)] == ["checkin_top_3_ox"]
     assert test_db.get_user_medals(30003) == []
+
+
+def test_checkin_outside_top3_does_not_rewrite_rank_medals(test_db):
+    start = date(2026, 3, 1)
+    for tg_id, days in ((40001, 5), (40002, 4), (40003, 3)):
+        _add_checkins(test_db, tg_id, days, start)
+
+    # 签到本身会维护总榜勋章，无需读取时同步
+    assert [medal["code"] for medal in test_db.get_user_medals(40003)] == ["checkin_top_3_ox"]
+
+    version = test_db.get_medal_version()
+    _add_checkins(test_db, 40004, 2, start)
+    test_db.sync_checkin_total_rank_medals()
+    assert test_db.get_medal_version() == version
+
+    _add_checkins(test_db, 40004, 2, start + timedelta(days=2))
+    assert [medal["code"] for medal in test_db.get_user_medals(40004)] == ["checkin_top_3_ox"]
+    assert test_db.get_user_medals(40003) == []
+
+
+def test_medal_cache_invalidated_by_medal_writes(test_db, monkeypatch):
+    from app import medal_cache
+
+    monkeypatch.setattr(medal_cache, "_version", None)
+    monkeypatch.setattr(medal_cache, "_medals", {})
+    queried = []
+    original = test_db.get_users_medals_map
+
+    def counting_medals_map(tg_ids):
+        queried.append(list(tg_ids))
+        return original(tg_ids)
+
+    monkeypatch.setattr(test_db, "get_users_medals_map", counting_medals_map)
+    _add_checkins(test_db, 50001, 3, date(2026, 3, 1))
+
+    first = medal_cache.get_users_medals_map(test_db, [50001, 50002])
+    assert [medal["code"] for medal in first[50001]] == ["checkin_top_1_ox"]
+    assert medal_cache.get_users_medals_map(test_db, [50002, 50001]) == first
+    assert queried == [[50001, 50002]]
+
+    _add_checkins(test_db, 50002, 3, date(2026, 3, 1))
+    second = medal_cache.get_users_medals_map(test_db, [50001, 50002])
+    assert [medal["code"] for medal in second[50002]] == ["checkin_top_2_ox"]
+    assert len(queried) == 2
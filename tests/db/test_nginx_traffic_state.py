@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Nginx 日志补采状态存储测试"""
+
+import json
+import sqlite3
+from time import time
+
+from app.nginx_traffic_state import NginxTrafficState, PlaySessionStore
+
+
+def test_play_session_store_expires_oldest_sessions_first():
+    now = int(time())
+    sessions = PlaySessionStore()
+    sessions["old"] = {"username": "a", "updated_at": now - 7 * 60 * 60}
+    sessions["mid"] = {"username": "b", "updated_at": now - 60}
+    sessions["new"] = {"username": "c", "updated_at": now}
+    # 更新已有会话后会移到末尾
+    sessions["mid"] = {"username": "b", "updated_at": now}
+
+    sessions.expire(limit=1)
+
+    assert list(sessions) == ["mid"]
+    assert sessions.removed == {"old", "new"}
+
+
+def test_state_saves_only_changed_sessions(tmp_path):
+    path = tmp_path / "state.db"
+    state = NginxTrafficState(path)
+    state.set_file_state("emby_access", {"offset": 10, "inode": 1})
+    for index in range(3):
+        state.play_sessions[f"s{index}"] = {
+            "username": f"user{index}",
+            "user_id": str(index),
+            "updated_at": int(time()),
+        }
+    state.save()
+    assert not state.play_sessions.dirty
+
+    state.play_sessions["s1"] = {"username": "renamed", "user_id": "1", "updated_at": int(time()) + 1}
+    assert list(state.play_sessions.dirty) == ["s1"]
+    state.save()
+    state.close()
+
+    reloaded = NginxTrafficState(path)
+    assert reloaded.file_state("emby_access")["offset"] == 10
+    assert reloaded.play_sessions["s1"]["username"] == "renamed"
+    assert list(reloaded.play_sessions) == ["s0", "s2", "s1"]
+    reloaded.close()
+
+
+def test_upserted_session_reloads_in_write_order(tmp_path):
+    path = tmp_path / "state.db"
+    now = int(time())
+    state = NginxTrafficState(path)
+    for session_id in ("a", "b", "c"):
+        state.play_sessions[session_id] = {"username": session_id, "updated_at": now}
+    state.save()
+    # 同一秒内更新已有会话，rowid 不变，但写入顺序在最后
+    state.play_sessions["a"] = {"username": "a2", "updated_at": now}
+    state.save()
+    state.close()
+
+    reloaded = NginxTrafficState(path)
+    assert list(reloaded.play_sessions) == ["b", "c", "a"]
+    reloaded.close()
+
+
+def test_state_reloads_only_after_external_write(tmp_path):
+    path = tmp_path / "state.db"
+    state = NginxTrafficState(path)
+    state.set_file_state("emby_access", {"offset": 10})
+    state.save()
+    assert not state.reload_if_changed()
+
+    other = NginxTrafficState(path)
+    other.set_file_state("emby_access", {"offset": 20})
+    other.save()
+    other.close()
+
+    assert state.reload_if_changed()
+    assert state.file_state("emby_access")["offset"] == 20
+    state.close()
+
+
+def test_state_migrates_legacy_json(tmp_path):
+    legacy_path = tmp_path / "nginx_traffic_state.json"
+    legacy_path.write_text(
+        json.dumps(
+            {
+                "files": {"plex_json": {"offset": 42, "inode": 7}},
+                "emby_play_sessions": {
+                    "s1": {"username": "embyuser", "user_id": "1", "updated_at": int(time())},
+                    "stale": {"username": "old", "updated_at": 0},
+                },
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    state = NginxTrafficState(tmp_path / "state.db")
+    assert state.migrate_from_json(legacy_path)
+    state.close()
+
+    reloaded = NginxTrafficState(tmp_path / "state.db")
+    assert reloaded.file_state("plex_json")["offset"] == 42
+    assert list(reloaded.play_sessions) == ["s1"]
+    assert not legacy_path.exists()
+    reloaded.close()
+
+
+def test_state_adds_seq_to_existing_database(tmp_path):
+    path = tmp_path / "state.db"
+    con = sqlite3.connect(path)
+    con.executescript(
+        """
+        CREATE TABLE emby_play_sessions (
+            session_id TEXT PRIMARY KEY,
+            username TEXT NOT NULL,
+            user_id TEXT,
+            updated_at INTEGER NOT NULL
+        );
+        INSERT INTO emby_play_sessions VALUES ('x', 'u1', '1', 100), ('y', 'u2', '2', 100);
+        """
+    )
+    con.commit()
+    con.close()
+
+    state = NginxTrafficState(path)
+    assert list(state.play_sessions) == ["x", "y"]
+    state.play_sessions["x"] = {"username": "u1", "updated_at": 100}
+    state.save()
+    state.close()
+
+    reloaded = NginxTrafficState(path)
+    assert list(reloaded.play_sessions) == ["y", "x"]
+    reloaded.close()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""通知发送队列测试"""
+
+from app.notifier import NotificationDispatcher, NotificationQueue
+
+
+class RecordingSender:
+    def __init__(self, responses=None):
+        self.calls = []
+        self.responses = list(responses or [])
+
+    async def __call__(self, chat_id, text, options):
+        self.calls.append((chat_id, text, options))
+        if self.responses:
+            return self.responses.pop(0)
+        return {"ok": True}
+
+
+def _dispatcher(queue, sender, **kwargs):
+    kwargs.setdefault("chat_interval", 0)
+    return NotificationDispatcher(queue, sender=sender, rate=1000, **kwargs)
+
+
+async def test_dispatcher_coalesces_messages_per_chat(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    queue.enqueue_many([(1, "Plex 报告"), (2, "其他用户"), (1, "Emby 报告")])
+    queue.enqueue_many([(1, "静默通知")], disable_notification=True)
+    sender = RecordingSender()
+    dispatcher = _dispatcher(queue, sender)
+
+    assert await dispatcher.dispatch_once() == 2
+    assert sender.calls == [("1", "Plex 报告\n\nEmby 报告", {}), ("2", "其他用户", {})]
+
+    # 不同发送参数的通知不合并，下一轮单独发送
+    assert await dispatcher.dispatch_once() == 1
+    assert sender.calls[-1] == ("1", "静默通知", {"disable_notification": True})
+    assert queue.backlog() == 0
+    assert dispatcher.metrics["coalesced"] == 1
+    queue.close()
+
+
+async def test_dispatcher_paces_each_chat(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    queue.enqueue_many([(1, "a")])
+    queue.enqueue_many([(1, "b")], parse_mode="HTML")
+    sender = RecordingSender()
+    dispatcher = _dispatcher(queue, sender, chat_interval=60)
+
+    assert await dispatcher.dispatch_once() == 1
+    # 同一会话在间隔内不再发送
+    assert await dispatcher.dispatch_once() == 0
+    assert queue.backlog() == 1
+    queue.close()
+
+
+async def test_dispatcher_serves_other_chats_behind_one_chat_backlog(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    # 每条都接近消息长度上限，无法合并
+    queue.enqueue_many([(1, f"{i} " + "x" * 3000) for i in range(200)])
+    queue.enqueue_many([(chat_id, "hello") for chat_id in range(2, 7)])
+    sender = RecordingSender()
+    dispatcher = NotificationDispatcher(queue, sender=sender, rate=10, chat_interval=60)
+
+    assert await dispatcher.dispatch_once() == 1
+    # 会话 1 仍在间隔内，下一轮越过它的积压发送其他会话
+    assert await dispatcher.dispatch_once() == 5
+    assert [call[0] for call in sender.calls] == ["1", "2", "3", "4", "5", "6"]
+    assert queue.backlog() == 199
+    queue.close()
+
+
+async def test_dispatcher_honors_retry_after(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    queue.enqueue_many([(1, "hello")])
+    sender = RecordingSender(
+        [{"ok": False, "error_code": 429, "parameters": {"retry_after": 30}}]
+    )
+    dispatcher = _dispatcher(queue, sender)
+
+    await dispatcher.dispatch_once()
+
+    assert dispatcher.metrics["rate_limited"] == 1
+    assert queue.due(10) == []
+    assert queue.backlog() == 1
+    (row,) = queue.due(10, now=10**12)
+    # 限流不计入重试次数
+    assert row["attempts"] == 0
+    queue.close()
+
+
+async def test_dispatcher_drops_permanent_errors_and_retries_transient(tmp_path):
+    queue = NotificationQueue(tmp_path / "queue.db")
+    queue.enqueue_many([(1, "blocked"), (2, "flaky")])
+    sender = RecordingSender(
+        [
+            {"ok": False, "error_code": 403, "description": "bot was blocked by the user"},
+            {"ok": False, "error_code": 502},
+        ]
+    )
+    dispatcher = _dispatcher(queue, sender)
+
+    await dispatcher.dispatch_once()
+
+    (row,) = queue.due(10, now=10**12)
+    assert row["chat_id"] == "2"
+    assert row["attempts"] == 1
+    assert dispatcher.metrics["failed"] == 1
+    assert dispatcher.metrics["retried"] == 1
+    queue.close()
+
+
+def test_queue_persists_across_reopen(tmp_path):
+    path = tmp_path / "queue.db"
+    queue = NotificationQueue(path)
+    assert queue.enqueue_many([(1, "hello"), (None, "no chat"), (2, "  ")]) == 1
+    queue.close()
+
+    reopened = NotificationQueue(path)
+    assert [row["text"] for row in reopened.due(10)] == ["hello"]
+    reopened.close()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Plex 共享客户端与用户列表缓存测试"""
+
+from types import SimpleNamespace
+
+from app import plex
+from app.utils.utils import SingletonMeta
+
+
+class FakeAccount:
+    def __init__(self):
+        self.id = 1
+        self.username = "admin"
+        self.email = "admin@example.com"
+        self.friends = [SimpleNamespace(id=2, username="alice", email="alice@example.com")]
+        self.users_calls = 0
+        self.removed = []
+        self.invited = []
+
+    def users(self):
+        self.users_calls += 1
+        return list(self.friends)
+
+    def user(self, user_id):
+        raise AssertionError("应从缓存中获取用户")
+
+    def removeFriend(self, user):
+        self.removed.append(user.id)
+        self.friends = [friend for friend in self.friends if friend.id != user.id]
+
+    def inviteFriend(self, email, server, sections=None):
+        self.invited.append(email)
+        self.friends.append(SimpleNamespace(id=3, username="bob", email=email))
+
+
+def _fake_plex(monkeypatch):
+    account = FakeAccount()
+    servers = []
+
+    def fake_server(baseurl, token):
+        servers.append(baseurl)
+        return SimpleNamespace(myPlexAccount=lambda: account, friendlyName="server")
+
+    monkeypatch.setattr(SingletonMeta, "_instances", {})
+    monkeypatch.setattr(plex, "PlexServer", fake_server)
+    return account, servers
+
+
+def test_plex_client_is_shared_and_directory_cached(monkeypatch):
+    account, servers = _fake_plex(monkeypatch)
+
+    assert plex.Plex() is plex.Plex()
+    assert len(servers) == 1
+
+    client = plex.Plex()
+    assert client.get_username_by_user_id(2) == "alice"
+    assert client.get_user_id_by_email("admin@example.com") == 1
+    assert set(client.users_info) == {"alice", "admin"}
+    assert len(plex.Plex().users_by_id) == 2
+    assert account.users_calls == 1
+
+
+def test_directory_refreshes_after_ttl_and_invalidation(monkeypatch):
+    account, _ = _fake_plex(monkeypatch)
+    now = [1000.0]
+    monkeypatch.setattr(plex, "monotonic", lambda: now[0])
+    monkeypatch.setattr(plex.settings, "PLEX_USER_DIRECTORY_TTL", 300)
+    client = plex.Plex()
+
+    assert 3 not in client.users_by_id
+    assert client.invite_friend("bob@example.com", libs=["Movies"])
+    assert client.users_by_email["bob@example.com"][0] == 3
+    assert account.users_calls == 2
+
+    ok, _ = client.remove_friend(2)
+    assert ok and account.removed == [2]
+    assert 2 not in client.users_by_id
+    assert account.users_calls == 3
+
+    account.friends.append(SimpleNamespace(id=4, username="carol", email="carol@example.com"))
+    now[0] += 299
+    assert 4 not in client.users_by_id
+    now[0] += 1
+    assert client.get_username_by_user_id(4) == "carol"
+    assert account.users_calls == 4
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""RedisCache 批量接口测试"""
+
+from app import cache
+from app.cache import RedisCache, get_lines_tags
+
+
+class FakeRedis:
+    """只实现 RedisCache 批量接口用到的命令，记录往返次数"""
+
+    def __init__(self):
+        self.values = {}
+        self.ttls = {}
+        self.zsets = {}
+        self.sets = {}
+        self.hashes = {}
+        self.round_trips = 0
+        self.scans = 0
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.values.get(key) for key in keys]
+
+    def zcard(self, key):
+        self.round_trips += 1
+        return len(self.zsets.get(key, {}))
+
+    def zrange(self, key, start, end):
+        self.round_trips += 1
+        ordered = sorted(self.zsets.get(key, {}).items(), key=lambda item: item[1])
+        return [member for member, _ in ordered[start : end + 1]]
+
+    def get(self, key):
+        self.round_trips += 1
+        return self.values.get(key)
+
+    def set(self, key, value, ex=None):
+        self.round_trips += 1
+        self.values[key] = value
+        self.ttls[key] = ex
+
+    def delete(self, *keys):
+        self.round_trips += 1
+        return sum(self.values.pop(key, None) is not None for key in keys)
+
+    def sadd(self, key, *members):
+        self.round_trips += 1
+        self.sets.setdefault(key, set()).update(members)
+
+    def srem(self, key, *members):
+        self.round_trips += 1
+        self.sets.setdefault(key, set()).difference_update(members)
+
+    def smembers(self, key):
+        self.round_trips += 1
+        return set(self.sets.get(key, set()))
+
+    def hexists(self, key, field):
+        self.round_trips += 1
+        return field in self.hashes.get(key, {})
+
+    def hset(self, key, field, value):
+        self.round_trips += 1
+        self.hashes.setdefault(key, {})[field] = value
+
+    def scan_iter(self, match, count=None, _type=None):
+        self.scans += 1
+        prefix = match.removesuffix("*")
+        return iter([key for key in self.values if key.startswith(prefix)])
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    def register_script(self, script):
+        return FakeScript(self, script)
+
+
+class FakeScript:
+    """用 Python 模拟 RedisCache 的 Lua 脚本语义"""
+
+    def __init__(self, redis, script):
+        self.redis = redis
+        self.run = self._touch if script == cache._TOUCH_SCRIPT else self._put
+
+    def __call__(self, keys, args, client=None):
+        if isinstance(client, FakePipeline):
+            client.commands.append(lambda: self.run(keys, args))
+            return client
+        self.redis.round_trips += 1
+        return self.run(keys, args)
+
+    def _touch(self, keys, args):
+        member, now, ttl = args
+        value = self.redis.values.get(keys[0])
+        if value is not None:
+            if len(keys) > 1:
+                self.redis.zsets.setdefault(keys[1], {})[member] = now
+            if ttl:
+                self.redis.ttls[keys[0]] = ttl
+        return value
+
+    def _put(self, keys, args):
+        cache_key, usage_key, index_key = (keys + [None])[:3]
+        member, value, ttl, capacity, now, prefix = args
+        usage = self.redis.zsets.setdefault(usage_key, {})
+        evicted = 0
+        if capacity > 0 and member not in usage:
+            overflow = len(usage) - capacity + 1
+            for old in sorted(usage, key=usage.get)[: max(overflow, 0)]:
+                self.redis.values.pop(prefix + old, None)
+                usage.pop(old)
+                if index_key:
+                    self.redis.sets.setdefault(index_key, set()).discard(old)
+                evicted += 1
+        self.redis.values[cache_key] = value
+        self.redis.ttls[cache_key] = ttl or None
+        usage[member] = now
+        if index_key:
+            self.redis.sets.setdefault(index_key, set()).add(member)
+        return evicted
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        def command():
+            self.redis.values[key] = value
+            self.redis.ttls[key] = ex
+            return True
+
+        self.commands.append(command)
+
+    def expire(self, key, seconds):
+        self.commands.append(lambda: self.redis.ttls.__setitem__(key, seconds))
+
+    def delete(self, *keys):
+        self.commands.append(
+            lambda: sum(self.redis.values.pop(key, None) is not None for key in keys)
+        )
+
+    def zadd(self, key, mapping):
+        self.commands.append(lambda: self.redis.zsets.setdefault(key, {}).update(mapping))
+
+    def sadd(self, key, *members):
+        self.commands.append(lambda: self.redis.sets.setdefault(key, set()).update(members))
+
+    def srem(self, key, *members):
+        self.commands.append(
+            lambda: self.redis.sets.setdefault(key, set()).difference_update(members)
+        )
+
+    def zrem(self, key, *members):
+        zset = self.redis.zsets.setdefault(key, {})
+        self.commands.append(lambda: [zset.pop(member, None) for member in members])
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+def _cache(monkeypatch, **kwargs):
+    redis_cache = RedisCache(cache_key_prefix="test:", **kwargs)
+    monkeypatch.setattr(redis_cache, "redis_client", FakeRedis())
+    return redis_cache
+
+
+def test_put_many_and_get_many_use_few_round_trips(monkeypatch):
+    redis_cache = _cache(monkeypatch, ttl_seconds=60, cache_usage_track=True)
+    fake = redis_cache.redis_client
+    items = {f"user{i}": str(i) for i in range(2500)}
+
+    redis_cache.put_many(items)
+    # 每 1000 个键一个 pipeline
+    assert fake.round_trips == 3
+    assert fake.ttls["test:user0"] == 60
+    assert len(fake.zsets["test_usage"]) == 2500
+
+    fake.round_trips = 0
+    found = redis_cache.get_many(["user1", "user2", "missing", "user1"])
+    assert found == {"user1": "1", "user2": "2"}
+    # 读取和刷新访问时间、过期时间在同一个 pipeline 中
+    assert fake.round_trips == 1
+
+
+def test_put_many_evicts_oldest_atomically(monkeypatch):
+    redis_cache = _cache(monkeypatch, capacity=3, cache_usage_track=True)
+    fake = redis_cache.redis_client
+    redis_cache.put_many({"a": "1", "b": "2", "c": "3"})
+    fake.zsets["test_usage"] = {"a": 1.0, "b": 2.0, "c": 3.0}
+
+    redis_cache.put_many({"d": "4", "e": "5"})
+
+    assert sorted(key.removeprefix("test:") for key in fake.values) == ["c", "d", "e"]
+    assert set(fake.zsets["test_usage"]) == {"c", "d", "e"}
+
+
+def test_get_and_put_are_single_round_trips(monkeypatch):
+    redis_cache = _cache(
+        monkeypatch, capacity=2, ttl_seconds=60, cache_usage_track=True
+    )
+    fake = redis_cache.redis_client
+
+    redis_cache.put("a", "1")
+    redis_cache.put("b", "2")
+    assert redis_cache.get("a") == "1"
+    redis_cache.put("c", "3")
+    assert fake.round_trips == 4
+
+    # 读取刷新了 a 的访问时间，淘汰的是 b
+    assert redis_cache.get("b") is None
+    assert set(fake.zsets["test_usage"]) == {"a", "c"}
+    # 覆盖已存在的键不触发淘汰
+    redis_cache.put("a", "10")
+    assert set(fake.zsets["test_usage"]) == {"a", "c"}
+
+
+def test_delete_many_returns_deleted_count(monkeypatch):
+    redis_cache = _cache(monkeypatch, cache_usage_track=True)
+    redis_cache.put_many({"a": "1", "b": "2"})
+
+    assert redis_cache.delete_many(["a", "b", "missing"]) == 2
+    assert redis_cache.redis_client.values == {}
+    assert redis_cache.redis_client.zsets["test_usage"] == {}
+
+
+def test_get_lines_tags_reads_all_lines_at_once(monkeypatch):
+    line_tags_cache = _cache(monkeypatch)
+    line_tags_cache.put_many({"hk": "低延迟, 4K", "jp": ""})
+    monkeypatch.setattr(cache, "line_tags_cache", line_tags_cache)
+    line_tags_cache.redis_client.round_trips = 0
+
+    assert get_lines_tags(["hk", "jp", "us"]) == {"hk": ["低延迟", "4K"], "jp": [], "us": []}
+    assert line_tags_cache.redis_client.round_trips == 1
+
+
+def test_enumeration_reads_membership_index(monkeypatch):
+    redis_cache = _cache(monkeypatch)
+    fake = redis_cache.redis_client
+    # 建立索引前写入的旧数据，以及其他命名空间的键
+    fake.values.update({"test:old": "0", "other:x": "x"})
+
+    redis_cache.put("a", "1")
+    redis_cache.put_many({"b": "2", "c": "3"})
+    assert redis_cache.get_all_key_values() == {"old": "0", "a": "1", "b": "2", "c": "3"}
+    assert fake.scans == 1
+
+    # 过期的键在读取时从索引中移除
+    fake.values.pop("test:b")
+    redis_cache.delete_many(["c"])
+    assert sorted(redis_cache.get_all()) == ["0", "1"]
+    assert fake.sets["cache_index:test:"] == {"old", "a"}
+    assert redis_cache.get_stats()["active_entries"] == 2
+    assert fake.scans == 1
+
+    redis_cache.clear()
+    assert fake.values == {"other:x": "x"}
+
+
+def test_unindexed_cache_does_not_grow_index(monkeypatch):
+    redis_cache = _cache(monkeypatch, ttl_seconds=1800, indexed=False)
+    fake = redis_cache.redis_client
+
+    redis_cache.put("game1", "{}")
+    redis_cache.put_many({"game2": "{}", "game3": "{}"})
+    assert fake.sets == {}
+    assert redis_cache.get("game1") == "{}"
+
+    # 枚举退回 SCAN
+    fake.values.pop("test:game3")
+    assert redis_cache.get_all_key_values() == {"game1": "{}", "game2": "{}"}
+    redis_cache.clear()
+    assert fake.values == {}
+
+
+def test_delete_removes_index_member_of_expired_key(monkeypatch):
+    redis_cache = _cache(monkeypatch, cache_usage_track=True)
+    fake = redis_cache.redis_client
+    redis_cache.put("a", "1")
+    # 键已过期，索引和使用记录中仍有成员
+    fake.values.pop("test:a")
+
+    redis_cache.delete("a")
+
+    assert fake.sets["cache_index:test:"] == set()
+    assert fake.zsets["test_usage"] == {}
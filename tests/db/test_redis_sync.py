@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""路由变更事件测试
+
+StandInRedis 代替真实 Redis 执行路由写入和发布脚本，RouteCacheModel 按
+openresty/lua/route_cache.lua 的规则消费事件，用来验证事件能让本地缓存正确失效。
+"""
+
+import json
+
+from app import redis_sync
+from app.redis_sync import ROUTE_CHANNEL, ROUTE_VERSION_KEY, RedisLineSync
+
+
+class StandInRedis:
+    def __init__(self):
+        self.values = {}
+        self.subscribers = []
+        self.round_trips = 0
+
+    def get(self, key):
+        self.round_trips += 1
+        return self.values.get(key)
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return StandInPipeline(self)
+
+    def register_script(self, script):
+        assert script == redis_sync._PUBLISH_SCRIPT
+        return StandInPublishScript(self)
+
+    def publish(self, channel, message):
+        for subscriber in self.subscribers:
+            subscriber(channel, message)
+
+
+class StandInPublishScript:
+    def __init__(self, redis):
+        self.redis = redis
+
+    def __call__(self, keys, args, client=None):
+        client.commands.append(lambda: self._run(keys, args))
+        return client
+
+    def _run(self, keys, args):
+        version = int(self.redis.values.get(keys[0], 0)) + 1
+        self.redis.values[keys[0]] = str(version)
+        self.redis.publish(args[0], json.dumps({"version": version, "keys": list(args[1:])}))
+        return version
+
+
+class StandInPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def set(self, key, value):
+        self.commands.append(lambda: self.redis.values.__setitem__(key, value))
+
+    def mset(self, mapping):
+        self.commands.append(lambda: self.redis.values.update(mapping))
+
+    def delete(self, *keys):
+        self.commands.append(lambda: [self.redis.values.pop(key, None) for key in keys])
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+class RouteCacheModel:
+    """route_cache.lua 的 Python 版本：读穿缓存，按事件失效，版本不连续时清空"""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.cache = {}
+        self.version = int(redis.values.get(ROUTE_VERSION_KEY, 0))
+        self.flushes = 0
+        redis.subscribers.append(self.on_message)
+
+    def get(self, key):
+        if key not in self.cache:
+            self.cache[key] = self.redis.get(key)
+        return self.cache[key]
+
+    def on_message(self, channel, message):
+        assert channel == ROUTE_CHANNEL
+        event = json.loads(message)
+        if event["version"] != self.version + 1:
+            self.cache.clear()
+            self.flushes += 1
+        for key in event["keys"]:
+            self.cache.pop(key, None)
+        self.version = event["version"]
+
+
+def _line_sync(monkeypatch):
+    redis = StandInRedis()
+    line_sync = RedisLineSync()
+    monkeypatch.setattr(line_sync, "_get_client", lambda: redis)
+    return line_sync, redis
+
+
+def test_route_changes_invalidate_cached_routes(monkeypatch):
+    line_sync, redis = _line_sync(monkeypatch)
+    route_cache = RouteCacheModel(redis)
+
+    assert line_sync.sync_emby_line("emby-1", "hk.example.com:443")
+    assert route_cache.get("emby_line:emby-1") == "hk.example.com:443"
+
+    # 命中本地缓存时不访问 Redis
+    redis.round_trips = 0
+    for _ in range(10):
+        route_cache.get("emby_line:emby-1")
+    assert redis.round_trips == 0
+
+    assert line_sync.sync_emby_line("emby-1", "sg.example.com:443")
+    assert route_cache.get("emby_line:emby-1") == "sg.example.com:443"
+    assert line_sync.sync_emby_line("emby-1", None)
+    assert route_cache.get("emby_line:emby-1") is None
+    assert redis.values[ROUTE_VERSION_KEY] == "3"
+    assert route_cache.flushes == 0
+
+
+def test_reconcile_publishes_one_event_per_batch(monkeypatch):
+    line_sync, redis = _line_sync(monkeypatch)
+    redis.values.update({"plex_id:1": "hk.example.com:443", "plex_id:2": "old:443"})
+    events = []
+    redis.subscribers.append(lambda channel, message: events.append(json.loads(message)))
+
+    summary = line_sync.reconcile(
+        {"plex_id:1": "hk.example.com:443", "plex_id:2": None, "plex_id:3": "jp.example.com:443"}
+    )
+
+    assert summary == {"total": 3, "set": 1, "deleted": 1, "unchanged": 1}
+    assert events == [{"version": 1, "keys": ["plex_id:3", "plex_id:2"]}]
+
+    # 没有变化时不发布事件
+    line_sync.reconcile({"plex_id:1": "hk.example.com:443"})
+    assert len(events) == 1
+
+
+def test_missed_events_flush_route_cache(monkeypatch):
+    line_sync, redis = _line_sync(monkeypatch)
+    route_cache = RouteCacheModel(redis)
+    line_sync.sync_emby_line("emby-1", "hk.example.com:443")
+    line_sync.sync_emby_line("emby-2", "hk.example.com:443")
+    route_cache.get("emby_line:emby-1")
+    route_cache.get("emby_line:emby-2")
+
+    # 模拟订阅断开期间漏收了一条事件
+    redis.subscribers.remove(route_cache.on_message)
+    line_sync.sync_emby_line("emby-1", "sg.example.com:443")
+    redis.subscribers.append(route_cache.on_message)
+    line_sync.sync_emby_line("emby-3", "jp.example.com:443")
+
+    assert route_cache.flushes == 1
+    assert route_cache.get("emby_line:emby-1") == "sg.example.com:443"
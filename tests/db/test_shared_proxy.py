@@ -10,6 +10,7 @@ from app.shared_proxy import (
     build_shared_proxy_profile,
     normalize_shared_proxy_domain,
     _resolve_bound_line_target,
+    sync_all_media_routes,
     sync_user_media_routes,
 )
 
@@ -123,6 +124,90 @@ def test_sync_user_media_routes_prefers_shared_proxy(test_db, monkeypatch):
     assert ("emby", "emby-9001", "proxy.example.net:443") in calls
 
 
+class FakeRouteRedis:
+    def __init__(self, values):
+        self.values = dict(values)
+        self.round_trips = 0
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.values.get(key) for key in keys]
+
+    def pipeline(self, transaction=True):
+        return FakeRoutePipeline(self)
+
+    def register_script(self, script):
+        def publish(keys, args, client=None):
+            client.commands.append(lambda: len(args) - 1)
+
+        return publish
+
+
+class FakeRoutePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def mset(self, mapping):
+        self.commands.append(lambda: self.redis.values.update(mapping))
+
+    def delete(self, *keys):
+        self.commands.append(lambda: [self.redis.values.pop(key, None) for key in keys])
+
+    def execute(self):
+        self.redis.round_trips += 1
+        return [command() for command in self.commands]
+
+
+def test_sync_all_media_routes_applies_only_diff(test_db, monkeypatch):
+    test_db.add_plex_user(
+        plex_id=9001,
+        tg_id=1,
+        plex_email="Plex@Example.com",
+        plex_username="PlexUser",
+        plex_line="hk.stream.example.com",
+    )
+    test_db.add_emby_user("EmbyUser", emby_id="emby-1", tg_id=1)
+    test_db.add_emby_user("Proxied", emby_id="emby-2", tg_id=2, emby_line="sg.stream.example.com")
+    test_db.save_shared_proxy_profile(
+        tg_id=2,
+        domain="proxy.example.net",
+        port=8443,
+        enabled=True,
+        verification_status="verified",
+        verified_at=1234567890,
+        last_error=None,
+    )
+    # 未绑定 TG 的用户不参与同步
+    test_db.add_emby_user("Unbound", emby_id="emby-3", emby_line="sg.stream.example.com")
+
+    fake = FakeRouteRedis(
+        {
+            "plex_id:9001": "hk.stream.example.com:443",
+            "emby_line:emby-1": "old.example.com:443",
+            "emby_line:emby-2": "sg.stream.example.com:443",
+        }
+    )
+    monkeypatch.setattr("app.shared_proxy.redis_line_sync._get_client", lambda: fake)
+
+    summary = sync_all_media_routes(test_db)
+
+    assert summary == {"total": 7, "set": 4, "deleted": 1, "unchanged": 2}
+    assert fake.values == {
+        "plex_id:9001": "hk.stream.example.com:443",
+        "plex_email:plexuser": "hk.stream.example.com:443",
+        "plex_email:plex@example.com": "hk.stream.example.com:443",
+        "emby_line:emby-2": "proxy.example.net:8443",
+        "emby_username:proxied": "proxy.example.net:8443",
+    }
+    # 一次 MGET + 一个写入 pipeline
+    assert fake.round_trips == 2
+
+    fake.round_trips = 0
+    assert sync_all_media_routes(test_db)["unchanged"] == 7
+    assert fake.round_trips == 1
+
+
 def test_transfer_tg_binding_assets_moves_shared_proxy(test_db):
     old_tg_id = 60001
     new_tg_id = 60002
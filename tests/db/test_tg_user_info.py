@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""TG 用户信息内存索引测试"""
+
+import os
+import pickle
+
+from app.tg_user_info import TGUserInfoIndex
+
+
+def _write_cache(path, data, mtime_ns):
+    with open(path, "wb") as f:
+        pickle.dump(data, f)
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_index_only_reloads_when_mtime_changes(tmp_path, monkeypatch):
+    cache_path = tmp_path / "tg_user_info.cache"
+    _write_cache(cache_path, {1: {"first_name": "Alice"}}, 1_000_000_000)
+    index = TGUserInfoIndex(cache_path=lambda: cache_path)
+
+    loads = []
+    real_load = pickle.load
+
+    def counting_load(f):
+        loads.append(1)
+        return real_load(f)
+
+    monkeypatch.setattr(pickle, "load", counting_load)
+
+    assert index.get_many([1, 2]) == {1: {"first_name": "Alice"}, 2: {}}
+    assert index.get(1)["first_name"] == "Alice"
+    assert len(loads) == 1
+
+    _write_cache(cache_path, {1: {"first_name": "Bob"}}, 2_000_000_000)
+
+    assert index.get(1)["first_name"] == "Bob"
+    assert len(loads) == 2
+
+
+def test_feed_skips_reload_of_written_file(tmp_path, monkeypatch):
+    cache_path = tmp_path / "tg_user_info.cache"
+    data = {7: {"username": "carol", "photo_url": "https://example.com/7.jpg"}}
+    _write_cache(cache_path, data, 3_000_000_000)
+    index = TGUserInfoIndex(cache_path=lambda: cache_path)
+
+    index.feed(data)
+    monkeypatch.setattr(pickle, "load", lambda f: (_ for _ in ()).throw(AssertionError))
+
+    assert index.get(7)["photo_url"] == "https://example.com/7.jpg"
+
+
+def test_missing_cache_returns_empty(tmp_path):
+    index = TGUserInfoIndex(cache_path=lambda: tmp_path / "missing.cache")
+
+    assert index.get(1) == {}
+    assert index.get_many([1]) == {1: {}}
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""TG 用户信息批量刷新测试"""
+
+from time import time
+from types import SimpleNamespace
+
+from app.tg_user_info import TGUserInfoIndex
+from app.utils import utils
+
+
+class DummyCursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def execute(self, *_args):
+        return self
+
+    def fetchall(self):
+        return self.rows
+
+
+class DummyDB:
+    def __init__(self, tg_ids):
+        self.cur = DummyCursor([(tg_id,) for tg_id in tg_ids])
+
+    def close(self):
+        return None
+
+
+async def test_refresh_skips_unchanged_avatar_and_writes_once_per_batch(
+    tmp_path, monkeypatch
+):
+    pics_dir = tmp_path / "pics"
+    pics_dir.mkdir()
+    (pics_dir / "1.jpg").write_bytes(b"old")
+    index = TGUserInfoIndex(cache_path=lambda: tmp_path / "tg_user_info.cache")
+    index.save(
+        {
+            1: {"first_name": "A", "added": 0, "photo_file_unique_id": "same"},
+            3: {"first_name": "C", "added": time()},
+        }
+    )
+
+    fake_settings = SimpleNamespace(
+        TG_USER_PROFILE_CACHE_PATH=pics_dir,
+        WEBAPP_URL="https://webapp.example.com/",
+        TG_API_RATE_LIMIT=1000,
+        TG_USER_INFO_REFRESH_CONCURRENCY=4,
+        TG_USER_INFO_REFRESH_BATCH_SIZE=10,
+    )
+    monkeypatch.setattr(utils, "settings", fake_settings)
+    monkeypatch.setattr(utils, "tg_user_info_index", index)
+    monkeypatch.setattr(utils, "DB", lambda: DummyDB([1, 2, 3]))
+
+    async def fake_session():
+        return None
+
+    monkeypatch.setattr(utils, "get_thread_safe_session", fake_session)
+
+    requested = []
+
+    async def fake_api_get(_session, _limiter, url, *, raw=False, retry=3):
+        requested.append(url)
+        if "getChat" in url:
+            tg_id = int(url.rsplit("=", 1)[1])
+            return {"result": {"first_name": f"user{tg_id}"}}
+        if "getUserProfilePhotos" in url:
+            unique_id = "same" if "user_id=1&" in url else "new"
+            return {
+                "result": {
+                    "total_count": 1,
+                    "photos": [[{"file_id": "fid", "file_unique_id": unique_id}]],
+                }
+            }
+        if "getFile" in url:
+            return {"ok": True, "result": {"file_path": "photos/file.jpg"}}
+        return b"new-avatar"
+
+    monkeypatch.setattr(utils, "_tg_api_get", fake_api_get)
+    saves = []
+    real_save = index.save
+    monkeypatch.setattr(index, "save", lambda data: saves.append(1) or real_save(data))
+
+    await utils.refresh_tg_user_info(token="token")
+
+    assert not any("chat_id=3" in url for url in requested)
+    assert sum("getFile" in url for url in requested) == 1
+    assert (pics_dir / "1.jpg").read_bytes() == b"old"
+    assert (pics_dir / "2.jpg").read_bytes() == b"new-avatar"
+    assert len(saves) == 1
+
+    info = index.get_many([1, 2])
+    assert info[1]["first_name"] == "user1"
+    assert info[1]["photo_url"] == "https://webapp.example.com/pics/1.jpg"
+    assert info[2]["photo_file_unique_id"] == "new"
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""流量日志常驻消费者测试"""
+
+import json
+
+import pytest
+
+from app import traffic_consumer
+from app.traffic_consumer import TrafficStreamConsumer
+
+
+class FakeAsyncRedis:
+    """只实现消费者用到的 list 命令"""
+
+    def __init__(self, queue):
+        self.lists = {"queue": list(queue)}
+        self.values = {}
+
+    async def lrange(self, key, start, end):
+        items = self.lists.get(key, [])
+        return items[start : None if end == -1 else end + 1]
+
+    def _lmove(self, source, destination):
+        items = self.lists.get(source, [])
+        if not items:
+            return None
+        item = items.pop(0)
+        self.lists.setdefault(destination, []).append(item)
+        return item
+
+    async def blmove(self, source, destination, timeout, src, dest):
+        return self._lmove(source, destination)
+
+    async def lmove(self, source, destination, src, dest):
+        return self._lmove(source, destination)
+
+    async def set(self, key, value, ex=None):
+        self.values[key] = value
+
+    async def exists(self, key):
+        return int(key in self.values)
+
+    async def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        for key in list(self.lists):
+            if key.startswith(prefix):
+                yield key
+
+    def pipeline(self, transaction=True):
+        return FakeAsyncPipeline(self)
+
+    async def close(self):
+        pass
+
+
+class FakeAsyncPipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def lmove(self, source, destination, src, dest):
+        self.commands.append(lambda: self.redis._lmove(source, destination))
+
+    def ltrim(self, key, start, end):
+        def command():
+            items = self.redis.lists.get(key, [])[start : None if end == -1 else end + 1]
+            if items:
+                self.redis.lists[key] = items
+            else:
+                self.redis.lists.pop(key, None)
+            return True
+
+        self.commands.append(command)
+
+    def set(self, key, value, ex=None):
+        self.commands.append(lambda: self.redis.values.__setitem__(key, value))
+
+    def llen(self, key):
+        self.commands.append(lambda: len(self.redis.lists.get(key, [])))
+
+    async def execute(self):
+        return [command() for command in self.commands]
+
+
+def _log(index):
+    return json.dumps({"@timestamp": "2026-04-04T10:00:00+08:00", "index": index})
+
+
+class RecordingIngest:
+    def __init__(self):
+        self.batches = []
+        self.fail = False
+
+    async def __call__(self, _db, values, *, emby_play_sessions):
+        if self.fail:
+            raise RuntimeError("database is locked")
+        self.batches.append(list(values))
+        return len(values)
+
+
+@pytest.fixture
+def ingest(monkeypatch):
+    recorder = RecordingIngest()
+
+    class DummyDB:
+        def close(self):
+            pass
+
+    monkeypatch.setattr(traffic_consumer, "ingest_traffic_logs", recorder)
+    monkeypatch.setattr(traffic_consumer, "DB", DummyDB)
+    return recorder
+
+
+async def test_consumer_batches_queue_and_acks_after_write(ingest):
+    redis = FakeAsyncRedis([_log(i) for i in range(5)])
+    consumer = TrafficStreamConsumer(
+        redis, queue_key="queue", consumer_id="c1", batch_size=3
+    )
+
+    for _ in range(3):
+        batch = await consumer._next_batch()
+        if batch:
+            await consumer._handle_batch(batch)
+
+    assert [len(batch) for batch in ingest.batches] == [3, 2]
+    assert redis.lists["queue"] == []
+    assert "queue:processing:c1" not in redis.lists
+    assert consumer.metrics["processed"] == 5
+    assert consumer.metrics["backlog"] == 0
+
+
+async def test_consumer_replays_unacked_batch_after_failure(ingest):
+    redis = FakeAsyncRedis([_log(i) for i in range(2)])
+    consumer = TrafficStreamConsumer(
+        redis, queue_key="queue", consumer_id="c1", batch_size=10
+    )
+
+    ingest.fail = True
+    batch = await consumer._next_batch()
+    with pytest.raises(RuntimeError):
+        await consumer._handle_batch(batch)
+    assert len(redis.lists["queue:processing:c1"]) == 2
+
+    # 新的消费者实例（模拟进程重启）先重放未确认的日志
+    ingest.fail = False
+    restarted = TrafficStreamConsumer(
+        redis, queue_key="queue", consumer_id="c1", batch_size=10
+    )
+    await restarted._handle_batch(await restarted._next_batch())
+
+    assert ingest.batches == [[_log(0), _log(1)]]
+    assert "queue:processing:c1" not in redis.lists
+
+
+async def test_consumer_recovers_processing_list_of_dead_consumer(ingest):
+    redis = FakeAsyncRedis([_log(i) for i in range(3)])
+    # 容器重建前的消费者移出了日志但没有确认
+    old = TrafficStreamConsumer(redis, queue_key="queue", consumer_id="old-host", batch_size=2)
+    await old._next_batch()
+    assert len(redis.lists["queue:processing:old-host"]) == 2
+
+    # 存活的消费者的 processing 列表不会被接管
+    redis.lists["queue:processing:alive"] = [_log(9)]
+    redis.values["queue:consumer:alive"] = 1
+    # 旧消费者的心跳过期
+    redis.values.pop("queue:consumer:old-host")
+
+    new = TrafficStreamConsumer(redis, queue_key="queue", consumer_id="new-host", batch_size=10)
+    await new._handle_batch(await new._next_batch())
+    await new._handle_batch(await new._next_batch())
+
+    assert ingest.batches == [[_log(0), _log(1)], [_log(2)]]
+    assert "queue:processing:old-host" not in redis.lists or not redis.lists["queue:processing:old-host"]
+    assert redis.lists["queue:processing:alive"] == [_log(9)]
+    assert "queue:consumer:new-host" in redis.values
+
+
+async def test_consumer_replays_recovered_lists_in_capped_batches(ingest):
+    redis = FakeAsyncRedis([])
+    # 两个已退出的消费者遗留了共 5 条日志
+    redis.lists["queue:processing:old-a"] = [_log(i) for i in range(3)]
+    redis.lists["queue:processing:old-b"] = [_log(i) for i in range(3, 5)]
+
+    consumer = TrafficStreamConsumer(redis, queue_key="queue", consumer_id="c1", batch_size=2)
+    for _ in range(4):
+        batch = await consumer._next_batch()
+        if batch:
+            await consumer._handle_batch(batch)
+
+    assert [len(batch) for batch in ingest.batches] == [2, 2, 1]
+    assert sum(ingest.batches, []) == [_log(i) for i in range(5)]
+    assert "queue:processing:c1" not in redis.lists
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""流量记录按月分区测试"""
+
+import sqlite3
+
+from app.db import DB
+
+
+def test_entries_are_routed_to_month_partitions(test_db):
+    # 北京时间 5 月 1 日 00:30 对应 UTC 4 月 30 日 16:30，应写入 5 月分区
+    test_db.create_line_traffic_entries(
+        [
+            ("line-a", 10, "emby", "Alice", "1", "2026-04-30T23:30:00+08:00"),
+            ("line-a", 20, "emby", "Alice", "1", "2026-04-30T16:30:00+00:00"),
+            ("line-a", 30, "emby", "Alice", "1", "2026-05-02T08:00:00+08:00"),
+        ]
+    )
+
+    assert {"line_traffic_stats_202604", "line_traffic_stats_202605"} <= set(
+        test_db._traffic_partitions()
+    )
+    april = test_db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats_202604").fetchone()[0]
+    may = test_db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats_202605").fetchone()[0]
+    assert (april, may) == (10, 50)
+
+    rows = test_db.cur.execute(
+        "SELECT ts, username_norm FROM line_traffic_stats WHERE ts >= ? ORDER BY ts",
+        (DB._traffic_epoch("2026-05-01T00:00:00+08:00"),),
+    ).fetchall()
+    assert [tuple(row) for row in rows] == [
+        (DB._traffic_epoch("2026-05-01T00:30:00+08:00"), "alice"),
+        (DB._traffic_epoch("2026-05-02T08:00:00+08:00"), "alice"),
+    ]
+
+
+def test_cleanup_drops_aggregated_month_partition(test_db):
+    test_db.create_line_traffic_entries(
+        [
+            ("line-a", 100, "plex", "bob", "2", "2026-03-10T12:00:00+08:00"),
+            ("line-a", 50, "plex", "bob", "2", "2026-03-31T23:59:59+08:00"),
+            ("line-a", 70, "plex", "bob", "2", "2026-04-01T00:00:00+08:00"),
+        ]
+    )
+
+    ok, _ = test_db.cleanup_monthly_traffic_data("2026-03")
+    assert not ok  # 未聚合的月份不能清理
+    assert test_db.aggregate_monthly_traffic_data("2026-03")[0]
+    total = test_db.cur.execute(
+        "SELECT total_bytes FROM line_traffic_monthly_stats WHERE year_month = '2026-03'"
+    ).fetchone()[0]
+    assert total == 150
+
+    ok, message = test_db.cleanup_monthly_traffic_data("2026-03")
+    assert ok and "2 条" in message
+    assert "line_traffic_stats_202603" not in test_db._traffic_partitions()
+    assert test_db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats").fetchone()[0] == 70
+    rollup_buckets = {
+        row[0] for row in test_db.cur.execute("SELECT bucket FROM line_traffic_rollup")
+    }
+    assert rollup_buckets == {DB._traffic_bucket("2026-04-01T00:00:00+08:00")}
+
+
+def test_legacy_table_is_migrated_to_partitions(tmp_path):
+    db_path = tmp_path / "legacy.db"
+    con = sqlite3.connect(db_path)
+    con.executescript(
+        """
+        CREATE TABLE line_traffic_stats(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            line TEXT NOT NULL,
+            send_bytes INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            username TEXT NOT NULL,
+            user_id TEXT DEFAULT NULL,
+            timestamp TEXT NOT NULL
+        );
+        CREATE INDEX idx_line_traffic_service_timestamp ON line_traffic_stats(service, timestamp);
+        -- 不同时区偏移的记录按字符串比较时顺序错误
+        INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp) VALUES
+            ('line-a', 10, 'emby', 'Carol', '3', '2026-05-31T23:00:00+08:00'),
+            ('line-a', 20, 'emby', 'CAROL', '3', '2026-05-31T16:30:00+00:00'),
+            ('line-a', 30, 'emby', 'carol', '3', '2026-06-01T00:15:00+08:00'),
+            ('line-a', 40, 'emby', 'carol', '3', 'not a timestamp');
+        """
+    )
+    con.commit()
+    con.close()
+
+    db = DB(db=db_path)
+    try:
+        kind = db.cur.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'line_traffic_stats'"
+        ).fetchone()[0]
+        assert kind == "view"
+        # 初始化只改名不复制，迁移前查询同时读取旧表
+        assert db.legacy_traffic_pending()
+        assert db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats").fetchone()[0] == 100
+        june_start = DB._traffic_epoch("2026-06-01T00:00:00+08:00")
+        source = db._traffic_source("send_bytes, ts", june_start, june_start + 3600)
+        assert db.cur.execute(
+            f"SELECT SUM(send_bytes) FROM {source} WHERE ts >= ?", (june_start,)
+        ).fetchone()[0] == 50
+        assert not db.aggregate_monthly_traffic_data("2026-05")[0]
+        assert db.cur.execute("SELECT COUNT(*) FROM line_traffic_rollup").fetchone()[0] == 0
+
+        assert db.migrate_legacy_traffic(batch_size=2, pause=0) == 3
+        assert not db.legacy_traffic_pending()
+        may = db.cur.execute(
+            "SELECT SUM(send_bytes) FROM line_traffic_stats_202605"
+        ).fetchone()[0]
+        june = db.cur.execute(
+            "SELECT SUM(send_bytes), MIN(username_norm), MAX(username_norm) FROM line_traffic_stats_202606"
+        ).fetchone()
+        assert may == 10
+        assert tuple(june) == (50, "carol", "carol")
+        assert db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats").fetchone()[0] == 60
+        # 初始化时不扫描旧表，汇总表随迁移逐批累加
+        rollup_total = db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_rollup").fetchone()[0]
+        assert rollup_total == 60
+    finally:
+        db.close()
+
+
+def test_failed_rename_is_retried_when_view_is_rebuilt(tmp_path, monkeypatch):
+    db_path = tmp_path / "leftover.db"
+    con = sqlite3.connect(db_path)
+    con.executescript(
+        """
+        CREATE TABLE line_traffic_stats(
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            line TEXT NOT NULL,
+            send_bytes INTEGER NOT NULL,
+            service TEXT NOT NULL,
+            username TEXT NOT NULL,
+            user_id TEXT DEFAULT NULL,
+            timestamp TEXT NOT NULL
+        );
+        INSERT INTO line_traffic_stats (line, send_bytes, service, username, user_id, timestamp)
+        VALUES ('line-a', 10, 'plex', 'Dan', '4', '2026-02-01T10:00:00+08:00');
+        """
+    )
+    con.commit()
+    con.close()
+
+    def broken_adopt(self):
+        raise sqlite3.OperationalError("database is locked")
+
+    # 初始化时改名失败，line_traffic_stats 仍是旧表
+    monkeypatch.setattr(DB, "_adopt_legacy_traffic_table", broken_adopt)
+    db = DB(db=db_path)
+    monkeypatch.undo()
+    try:
+        kind = db.cur.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'line_traffic_stats'"
+        ).fetchone()[0]
+        assert kind == "table"
+
+        # 之后任何一次重建视图都会先完成改名，而不是在 CREATE VIEW 时失败
+        db.cur.execute("BEGIN IMMEDIATE")
+        db._rebuild_traffic_view()
+        db.con.commit()
+        assert db.legacy_traffic_pending()
+        assert db.cur.execute("SELECT SUM(send_bytes) FROM line_traffic_stats").fetchone()[0] == 10
+
+        assert db.migrate_legacy_traffic(pause=0) == 1
+        assert "line_traffic_stats_202602" in db._traffic_partitions()
+        assert not db.legacy_traffic_pending()
+    finally:
+        db.close()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""流量记录小写用户名列测试"""
+
+from datetime import datetime, timedelta, timezone
+
+TZ = timezone(timedelta(hours=8))
+
+
+def _now_iso() -> str:
+    return datetime.now(TZ).isoformat()
+
+
+def test_daily_traffic_matches_username_case_insensitively(test_db):
+    timestamp = _now_iso()
+    test_db.create_line_traffic_entry("line-a", 100, "plex", "Alice", "1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 50, "plex", "ALICE", "1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 30, "emby", "alice", "2", timestamp)
+
+    assert test_db.get_user_daily_traffic("alice", "plex") == 150
+    assert test_db.get_user_daily_traffic("aLiCe", "emby") == 30
+    norms = {row[0] for row in test_db.cur.execute("SELECT username_norm FROM line_traffic_stats")}
+    assert norms == {"alice"}
+
+
+def test_traffic_rank_joins_users_case_insensitively(test_db):
+    test_db.add_plex_user(plex_id=1, tg_id=101, plex_username="Carol")
+    test_db.add_emby_user(emby_username="Dave", emby_id="e1", tg_id=102)
+    timestamp = _now_iso()
+    for username, send_bytes in (("carol", 300), ("CAROL", 200), ("erin", 100)):
+        test_db.create_line_traffic_entry("line-a", send_bytes, "plex", username, "1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 70, "emby", "DAVE", "e1", timestamp)
+    test_db.create_line_traffic_entry("line-a", 90, "plex", "", "1", timestamp)
+
+    assert [tuple(row) for row in test_db.get_plex_traffic_rank()] == [
+        ("Carol", "1", 500, 0, 101),
+        (None, "1", 100, 0, None),
+    ]
+    emby_rank = test_db.get_emby_traffic_rank()
+    assert [(row[0], row[2], row[4]) for row in emby_rank] == [("Dave", 70, 102)]
+
+
+def test_traffic_queries_use_normalized_indexes(test_db):
+    now = int(datetime.now(TZ).timestamp())
+    partition = test_db._traffic_partition_name(now)
+    source = test_db._traffic_source("send_bytes, service, username_norm, ts, line", now - 60, now)
+    plan = " ".join(
+        row[-1]
+        for row in test_db.cur.execute(
+            f"EXPLAIN QUERY PLAN SELECT SUM(send_bytes) FROM {source} "
+            "WHERE username_norm = LOWER(?) AND service = ? AND ts >= ? AND ts < ?",
+            ("alice", "plex", now - 60, now),
+        )
+    )
+    assert f"COVERING INDEX idx_{partition}_service_norm_ts" in plan
+
+    plan = " ".join(
+        row[-1]
+        for row in test_db.cur.execute(
+            "EXPLAIN QUERY PLAN SELECT tg_id FROM user WHERE LOWER(plex_username) = ?",
+            ("carol",),
+        )
+    )
+    assert "idx_user_plex_username_lower" in plan
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""WebApp 路由阻塞调用线程池执行测试"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fastapi import Request
+
+from app import executors
+from app.db import DB
+from app.webapp.routers import invitation
+from app.webapp.routers.activities import auction
+from app.webapp.schemas import PlaceBidRequest, RedeemInviteCodeRequest, TelegramUser
+
+
+class FakeEmby:
+    def __init__(self):
+        self.threads = []
+
+    def get_uid_from_username(self, username):
+        self.threads.append(threading.get_ident())
+        return None
+
+    def add_user(self, username, password):
+        self.threads.append(threading.get_ident())
+        return True, "emby-new"
+
+
+async def test_redeem_emby_code_runs_blocking_calls_off_loop(test_db, temp_dir, monkeypatch):
+    db_threads = []
+
+    def make_db():
+        db_threads.append(threading.get_ident())
+        return DB(db=temp_dir / "test_data.db")
+
+    fake_emby = FakeEmby()
+    sent = []
+
+    async def fake_send_message_by_url(**kwargs):
+        sent.append(kwargs["chat_id"])
+
+    monkeypatch.setattr(invitation, "DB", make_db)
+    monkeypatch.setattr(invitation, "AsyncEmby", lambda: executors.AsyncEmby(fake_emby))
+    monkeypatch.setattr(invitation, "send_message_by_url", fake_send_message_by_url)
+    monkeypatch.setattr(invitation, "get_user_name_from_tg_id", str)
+    monkeypatch.setattr(invitation.settings, "EMBY_REGISTER", True)
+    monkeypatch.setattr(invitation.settings, "PRIVILEGED_CODES", [])
+    monkeypatch.setattr(invitation.settings, "TG_ADMIN_CHAT_ID", [1])
+    test_db.add_invitation_code(code="invite-1", owner=7)
+
+    request = Request({"type": "http", "headers": []})
+    request.state.telegram_data = {}
+    response = await invitation.redeem_emby_code(
+        request,
+        data=RedeemInviteCodeRequest(
+            code="invite-1", username="newbie", password="secret", bindToTelegram=True
+        ),
+        telegram_user=TelegramUser(id=42, first_name="new"),
+    )
+
+    assert response.success and response.telegram_bound
+    assert sent == [1]
+    loop_thread = threading.get_ident()
+    assert db_threads and loop_thread not in db_threads
+    assert len(fake_emby.threads) == 2 and loop_thread not in fake_emby.threads
+    assert test_db.get_emby_info_by_tg_id(42)[0] == "newbie"
+    assert test_db.verify_invitation_code_is_used("invite-1")[0]
+
+
+async def test_place_bid_runs_db_off_loop_and_notifies_on_loop(test_db, temp_dir, monkeypatch):
+    # DB 的线程本地连接不区分库文件，换一个新的数据库线程池，避免复用上一个用例的连接
+    db_executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setitem(executors._executors, "db", db_executor)
+    db_threads = []
+
+    def make_db():
+        db_threads.append(threading.get_ident())
+        return DB(db=temp_dir / "test_data.db")
+
+    sent = []
+
+    async def fake_send_message_by_url(**kwargs):
+        sent.append((threading.get_ident(), kwargs["chat_id"]))
+
+    monkeypatch.setattr(auction, "DB", make_db)
+    monkeypatch.setattr(auction, "send_message_by_url", fake_send_message_by_url)
+    monkeypatch.setattr(auction.settings, "TG_GROUP", "-100")
+    test_db.add_user_data(tg_id=42, credits=100, donation=0)
+    test_db.create_auction(
+        title="海报", description="", starting_price=10,
+        end_time=int(time.time()) + 3600, created_by=1,
+    )
+    auction_id = test_db.get_active_auctions()[0]["id"]
+
+    request = Request({"type": "http", "headers": []})
+    request.state.telegram_data = {}
+    try:
+        response = await auction.place_bid(
+            PlaceBidRequest(auction_id=auction_id, bid_amount=20),
+            request,
+            current_user=TelegramUser(id=42, first_name="bidder"),
+        )
+    finally:
+        db_executor.shutdown(wait=True)
+
+    loop_thread = threading.get_ident()
+    assert response.success and response.current_price == 20
+    assert db_threads and loop_thread not in db_threads
+    assert sent == [(loop_thread, "-100")]
+    assert test_db.get_auction_by_id(auction_id)["current_price"] == 20